@@ -17,3 +17,8 @@ admin.site.register(Artcam, ArtcamAdmin)
 class ArtcamPhotoAdmin(StyledModelAdmin):
 	list_display = ('image', 'created', 'thumb')
 admin.site.register(ArtcamPhoto, ArtcamPhotoAdmin)	
+
+class ArtcamTimelapseAdmin(StyledModelAdmin):
+	list_display = ('artcam', 'format', 'begin', 'end', 'frame_count', 'last_frame')
+	readonly_fields = ('file', 'frame_count', 'last_frame')
+admin.site.register(ArtcamTimelapse, ArtcamTimelapseAdmin)
@@ -7,7 +7,7 @@ import traceback
 from django.conf import settings
 from django.db.models import Q
 from django.template import Context, loader
-from django.http import HttpResponse, Http404, HttpResponseServerError, HttpResponseRedirect, HttpResponsePermanentRedirect
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotFound, Http404, HttpResponseServerError, HttpResponseRedirect, HttpResponsePermanentRedirect
 from django.shortcuts import render_to_response, get_object_or_404
 from django.contrib import auth
 from django.contrib.auth.models import User
@@ -30,6 +30,20 @@ from art_server.hydration import dehydrate_to_list_xml, dehydrate_to_xml
 
 IMAGE_COMMENT = '<!-- tack the image name onto http://%s/media/ to get the full URL -->' % Site.objects.get_current().domain
 
+DEFAULT_PHOTO_LIMIT = 100
+MAX_PHOTO_LIMIT = 500
+CURSOR_FORMATS = ['%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S']
+
+def parse_cursor(value):
+	"""Parses a photo's created timestamp like 2011-06-01T12:05:00.123456 (the T may be a space and the microseconds are optional)"""
+	value = value.strip().replace('T', ' ')
+	for cursor_format in CURSOR_FORMATS:
+		try:
+			return datetime.datetime.strptime(value, cursor_format)
+		except ValueError:
+			continue
+	raise ValueError('Could not parse the cursor: %s' % value)
+
 def artcams(request):
 	return HttpResponse(dehydrate_to_list_xml(Artcam.objects.all()), content_type="text/xml")
 
@@ -38,8 +52,27 @@ def artcam(request, id):
 	return HttpResponse(dehydrate_to_xml(artcam), content_type="text/xml")
 
 def photos(request, artcam_id):
+	"""Returns a page of photos, newest first.
+	Pass the created timestamp and id of the last photo as the before and before_id parameters to fetch the next page, and limit to set the page size.
+	Photos taken in the same instant are ordered by id, so the id keeps them from being skipped at a page boundary."""
 	artcam = get_object_or_404(Artcam, pk=artcam_id)
-	return HttpResponse(dehydrate_to_list_xml(ArtcamPhoto.objects.filter(artcam__id=artcam_id)) + IMAGE_COMMENT, content_type="text/xml")
+	try:
+		limit = min(int(request.GET.get('limit', DEFAULT_PHOTO_LIMIT)), MAX_PHOTO_LIMIT)
+		if limit < 1: raise ValueError('The limit must be positive')
+		photos = ArtcamPhoto.objects.filter(artcam=artcam).order_by('-created', '-id')
+		if request.GET.get('before', None):
+			before = parse_cursor(request.GET.get('before'))
+			if request.GET.get('before_id', None):
+				photos = photos.filter(Q(created__lt=before) | Q(created=before, id__lt=int(request.GET.get('before_id'))))
+			else:
+				photos = photos.filter(created__lt=before)
+	except ValueError:
+		return HttpResponseBadRequest('Use a positive integer limit, a before parameter like 2011-06-01T12:05:00 and an integer before_id', content_type="text/plain")
+	photos = list(photos[:limit])
+	response = HttpResponse(dehydrate_to_list_xml(photos) + IMAGE_COMMENT, content_type="text/xml")
+	if len(photos) == limit:
+		response['Link'] = '<%s?before=%s&before_id=%s&limit=%s>; rel="next"' % (request.path, photos[-1].created.isoformat(), photos[-1].id, limit)
+	return response
 
 def photo(request, artcam_id, photo_id):
 	photo = get_object_or_404(ArtcamPhoto, pk=photo_id)
@@ -47,6 +80,6 @@ def photo(request, artcam_id, photo_id):
 	return HttpResponse(dehydrate_to_xml(photo) + IMAGE_COMMENT, content_type="text/xml")
 
 def latest_photo(request, artcam_id):
-	photos = ArtcamPhoto.objects.filter(artcam__id=artcam_id)
-	if len(photos) == 0: raise Http404
+	photos = list(ArtcamPhoto.objects.filter(artcam__id=artcam_id).order_by('-created', '-id')[:1])
+	if len(photos) == 0: return HttpResponseNotFound('That artcam has no photos', content_type="text/plain")
 	return HttpResponse(dehydrate_to_xml(photos[0]) + IMAGE_COMMENT, content_type="text/xml")
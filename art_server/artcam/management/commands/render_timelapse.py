@@ -0,0 +1,55 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+import time
+import traceback
+from datetime import datetime, timedelta
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+class Command(BaseCommand):
+	help = "Renders or appends to artcam timelapses. With no arguments every timelapse is updated, otherwise a timelapse is created or updated for the artcam and range."
+	args = "[artcam_id start_date [end_date]]"
+	option_list = BaseCommand.option_list + (
+		make_option('--format', dest='format', default='mjpeg', help='mjpeg or sheet (default: mjpeg)'),
+		make_option('--step', dest='step', type='int', default=1, help='Use every Nth photo (default: 1)'),
+		make_option('--threads', dest='threads', type='int', default=4, help='The number of cameras to render in parallel (default: 4)'),
+		make_option('--rebuild', action='store_true', default=False, help='Render from scratch instead of appending new frames (default: False)'),
+	)
+
+	def parse_date(self, value):
+		try:
+			return datetime(*(time.strptime(value, TIMESTAMP_FORMAT))[0:6])
+		except:
+			example_date = (datetime.now() - timedelta(days=1)).isoformat().split('.')[0]
+			raise CommandError('Could not parse the date "%s".  Enter it like so: %s' % (value, example_date))
+
+	def handle(self, *labels, **options):
+		from artcam.models import Artcam, ArtcamTimelapse
+		from artcam.timelapse import update_timelapse, update_timelapses
+
+		if len(labels) == 0:
+			timelapses = ArtcamTimelapse.objects.all()
+			if options['rebuild']:
+				for timelapse in timelapses: print '%s: %s frames' % (timelapse, update_timelapse(timelapse, rebuild=True))
+				return
+			results = update_timelapses(timelapses, options['threads'])
+			for timelapse in timelapses:
+				if results.has_key(timelapse.id): print '%s: %s frames appended' % (timelapse, results[timelapse.id])
+			return
+
+		if len(labels) not in (2, 3): raise CommandError('Enter no arguments, or an artcam id, a start date, and an optional end date.')
+		if options['format'] not in [choice[0] for choice in ArtcamTimelapse.FORMAT_CHOICES]: raise CommandError('Unknown format: %s' % options['format'])
+		try:
+			artcam = Artcam.objects.get(pk=int(labels[0]))
+		except (ValueError, Artcam.DoesNotExist):
+			raise CommandError('There is no artcam with the id %s' % labels[0])
+		begin = self.parse_date(labels[1])
+		end = None
+		if len(labels) == 3: end = self.parse_date(labels[2])
+
+		timelapse, created = ArtcamTimelapse.objects.get_or_create(artcam=artcam, format=options['format'], begin=begin, end=end, frame_step=max(1, options['step']))
+		appended = update_timelapse(timelapse, rebuild=options['rebuild'])
+		print '%s: %s frames appended, %s total: %s' % (timelapse, appended, timelapse.frame_count, timelapse.file.path)
@@ -0,0 +1,60 @@
+# encoding: utf-8
+import os
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+from django.conf import settings
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+
+        # Adding field 'ArtcamTimelapse.file_size'
+        db.add_column('artcam_artcamtimelapse', 'file_size', self.gf('django.db.models.fields.BigIntegerField')(default=0), keep_default=False)
+
+        # The existing Motion JPEG files are taken to be complete
+        if not db.dry_run:
+            for timelapse in orm['artcam.ArtcamTimelapse'].objects.filter(format='mjpeg').exclude(file=''):
+                path = os.path.join(settings.MEDIA_ROOT, timelapse.file.name)
+                if os.path.exists(path): orm['artcam.ArtcamTimelapse'].objects.filter(pk=timelapse.pk).update(file_size=os.path.getsize(path))
+
+
+    def backwards(self, orm):
+
+        # Deleting field 'ArtcamTimelapse.file_size'
+        db.delete_column('artcam_artcamtimelapse', 'file_size')
+
+
+    models = {
+        'artcam.artcam': {
+            'Meta': {'ordering': "['name']", 'object_name': 'Artcam'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ip': ('django.db.models.fields.IPAddressField', [], {'max_length': '15', 'null': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024', 'null': 'True', 'blank': 'True'}),
+            'port': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'artcam.artcamphoto': {
+            'Meta': {'ordering': "['-created']", 'object_name': 'ArtcamPhoto'},
+            'artcam': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['artcam.Artcam']"}),
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image': ('django.db.models.fields.files.ImageField', [], {'max_length': '100'})
+        },
+        'artcam.artcamtimelapse': {
+            'Meta': {'ordering': "['-begin']", 'object_name': 'ArtcamTimelapse'},
+            'artcam': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['artcam.Artcam']"}),
+            'begin': ('django.db.models.fields.DateTimeField', [], {}),
+            'end': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'file': ('django.db.models.fields.files.FileField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'file_size': ('django.db.models.fields.BigIntegerField', [], {'default': '0'}),
+            'format': ('django.db.models.fields.CharField', [], {'default': "'mjpeg'", 'max_length': '12'}),
+            'frame_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'frame_step': ('django.db.models.fields.PositiveIntegerField', [], {'default': '1'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_frame': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'updated': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['artcam']
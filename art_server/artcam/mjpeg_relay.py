@@ -0,0 +1,266 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""Relays a camera's Motion JPEG stream to many viewers over a single upstream connection.
+
+The network cameras can only feed a handful of streams, so instead of each browser connecting to the camera
+one MJPEGRelay thread per camera reads the multipart stream and hands each frame to every MJPEGViewer.
+Each viewer holds a small buffer of the newest frames, so a slow viewer skips frames rather than holding up the others.
+The relay closes the upstream connection once it has had no viewers for idle_timeout seconds.
+The relays live in the process which serves the viewers, so a deployment with several web workers opens one upstream connection per worker
+(per camera) rather than one in all; run the streams from a single process if the camera can't feed that many.
+"""
+import time
+import base64
+import httplib
+import urlparse
+import logging
+import threading
+from collections import deque
+
+BOUNDARY = 'artserverframe'
+CONTENT_TYPE = 'multipart/x-mixed-replace; boundary=%s' % BOUNDARY
+
+def parse_boundary(content_type):
+	"""Returns the multipart boundary marker (including the leading dashes) from a Content-Type header"""
+	for param in content_type.split(';')[1:]:
+		if '=' not in param: continue
+		key, value = param.split('=', 1)
+		if key.strip().lower() == 'boundary':
+			value = value.strip().strip('"')
+			if value.startswith('--'): return value
+			return '--%s' % value
+	return None
+
+def read_part_headers(stream):
+	"""Reads the headers of a multipart part, returning a map of lower case header name to value or None at the end of the stream"""
+	headers = {}
+	while True:
+		line = stream.readline()
+		if not line: return None
+		line = line.strip()
+		if not line: return headers
+		if ':' not in line: continue
+		key, value = line.split(':', 1)
+		headers[key.strip().lower()] = value.strip()
+
+def read_frames(stream, boundary):
+	"""Yields each frame from a multipart MJPEG stream, using the part's Content-Length when the camera sends one"""
+	line = stream.readline()
+	while line:
+		if not line.startswith(boundary):
+			line = stream.readline()
+			continue
+		headers = read_part_headers(stream)
+		if headers == None: return
+		if headers.get('content-length', None):
+			length = int(headers['content-length'])
+			frame = stream.read(length)
+			if len(frame) < length: return
+			line = stream.readline()
+		else:
+			lines = []
+			line = stream.readline()
+			while line and not line.startswith(boundary):
+				lines.append(line)
+				line = stream.readline()
+			if not line: return # the stream ended part way through the frame
+			frame = ''.join(lines)
+			if frame.endswith('\r\n'): frame = frame[:-2] # the CRLF before the boundary belongs to the boundary
+		yield frame
+
+def format_frame(frame):
+	return '--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %s\r\n\r\n%s\r\n' % (BOUNDARY, len(frame), frame)
+
+class MJPEGViewer:
+	"""A downstream client of an MJPEGRelay.  Only the newest buffer_size frames are kept and older ones are dropped."""
+	def __init__(self, buffer_size=2):
+		self.frames = deque()
+		self.buffer_size = buffer_size
+		self.condition = threading.Condition()
+		self.dropped_frames = 0
+		self.closed = False
+
+	def put(self, frame):
+		self.condition.acquire()
+		try:
+			if len(self.frames) >= self.buffer_size:
+				self.frames.popleft()
+				self.dropped_frames += 1
+			self.frames.append(frame)
+			self.condition.notify()
+		finally:
+			self.condition.release()
+
+	def get(self, timeout=None):
+		"""Returns the oldest buffered frame, waiting up to timeout seconds for one.  Returns None on timeout or if the viewer is closed."""
+		self.condition.acquire()
+		try:
+			if len(self.frames) == 0 and not self.closed: self.condition.wait(timeout)
+			if len(self.frames) == 0: return None
+			return self.frames.popleft()
+		finally:
+			self.condition.release()
+
+	def close(self):
+		self.condition.acquire()
+		try:
+			self.closed = True
+			self.condition.notifyAll()
+		finally:
+			self.condition.release()
+
+class MJPEGRelay(threading.Thread):
+	"""Reads frames from a single upstream MJPEG connection and passes them to every viewer."""
+	def __init__(self, url, username=None, password=None, idle_timeout=30, timeout=10, buffer_size=2, reconnect_delay=2):
+		self.url = url
+		self.username = username
+		self.password = password
+		self.idle_timeout = idle_timeout
+		self.timeout = timeout
+		self.buffer_size = buffer_size
+		self.reconnect_delay = reconnect_delay
+		self.viewers = []
+		self.viewers_lock = threading.Lock()
+		self.last_viewed = time.time()
+		self.stopping = False
+		self.upstream = None
+		self.connection_count = 0
+		self.frame_count = 0
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def add_viewer(self):
+		"""Returns a new MJPEGViewer or None if the relay is shutting down"""
+		self.viewers_lock.acquire()
+		try:
+			if self.stopping: return None
+			viewer = MJPEGViewer(self.buffer_size)
+			self.viewers.append(viewer)
+			self.last_viewed = time.time()
+			return viewer
+		finally:
+			self.viewers_lock.release()
+
+	def remove_viewer(self, viewer):
+		self.viewers_lock.acquire()
+		try:
+			if viewer in self.viewers: self.viewers.remove(viewer)
+			self.last_viewed = time.time()
+		finally:
+			self.viewers_lock.release()
+		viewer.close()
+
+	def viewer_count(self): return len(self.viewers)
+
+	def is_idle(self):
+		"""Returns True, and marks the relay as stopping, if there have been no viewers for idle_timeout seconds"""
+		self.viewers_lock.acquire()
+		try:
+			if self.stopping: return True
+			if len(self.viewers) == 0 and time.time() - self.last_viewed > self.idle_timeout: self.stopping = True
+			return self.stopping
+		finally:
+			self.viewers_lock.release()
+
+	def stop(self):
+		self.viewers_lock.acquire()
+		try:
+			self.stopping = True
+		finally:
+			self.viewers_lock.release()
+
+	def open_upstream(self):
+		"""Connects to the camera and returns the HTTP response.
+		The frames are read from the response's socket file, as HTTPResponse.read blocks until its whole buffer is filled."""
+		url = urlparse.urlsplit(self.url)
+		connection = httplib.HTTPConnection(url.hostname, url.port, timeout=self.timeout)
+		headers = {}
+		if self.username:
+			headers['Authorization'] = 'Basic %s' % base64.b64encode('%s:%s' % (self.username, self.password))
+		path = url.path or '/'
+		if url.query: path = '%s?%s' % (path, url.query)
+		self.connection_count += 1
+		connection.request('GET', path, headers=headers)
+		response = connection.getresponse()
+		if response.status != 200:
+			connection.close()
+			raise IOError('The upstream returned %s: %s' % (response.status, self.url))
+		return response
+
+	def close_upstream(self):
+		if not self.upstream: return
+		try:
+			self.upstream.close()
+		except:
+			pass
+		self.upstream = None
+
+	def publish(self, frame):
+		self.frame_count += 1
+		self.viewers_lock.acquire()
+		try:
+			viewers = list(self.viewers)
+		finally:
+			self.viewers_lock.release()
+		for viewer in viewers: viewer.put(frame)
+
+	def run(self):
+		try:
+			while not self.is_idle():
+				try:
+					self.upstream = self.open_upstream()
+					boundary = parse_boundary(self.upstream.getheader('Content-Type', ''))
+					if not boundary: raise IOError('The upstream is not a multipart stream: %s' % self.url)
+					for frame in read_frames(self.upstream.fp, boundary):
+						self.publish(frame)
+						if self.is_idle(): break
+				except:
+					logging.exception('Error relaying %s' % self.url)
+					self.close_upstream()
+					time.sleep(self.reconnect_delay)
+				self.close_upstream()
+		finally:
+			self.stop()
+			self.close_upstream()
+			self.viewers_lock.acquire()
+			try:
+				viewers = self.viewers
+				self.viewers = []
+			finally:
+				self.viewers_lock.release()
+			for viewer in viewers: viewer.close()
+
+_relays = {}
+_relays_lock = threading.Lock()
+
+def get_relay(key, url, username=None, password=None, **kwargs):
+	"""Returns a running relay for key (e.g. the Artcam id), starting one if there isn't one or the old one is shutting down"""
+	_relays_lock.acquire()
+	try:
+		relay = _relays.get(key, None)
+		if relay == None or relay.stopping or not relay.isAlive():
+			relay = MJPEGRelay(url, username, password, **kwargs)
+			_relays[key] = relay
+			relay.start()
+		return relay
+	finally:
+		_relays_lock.release()
+
+def stream_frames(relay, viewer, keepalive_seconds=10):
+	"""A generator of multipart chunks for an HttpResponse, which removes the viewer from the relay when the response is closed.
+	While no frames arrive (e.g. the upstream is down) the last frame is sent again every keepalive_seconds, or a blank line before the first,
+	so that a viewer who has gone away is noticed when the write fails instead of holding its place indefinitely."""
+	last_frame = None
+	try:
+		while not viewer.closed:
+			frame = viewer.get(keepalive_seconds)
+			if frame == None:
+				if viewer.closed: break
+				if last_frame == None:
+					yield '\r\n' # multipart readers skip anything before the next boundary
+				else:
+					yield format_frame(last_frame)
+				continue
+			last_frame = frame
+			yield format_frame(frame)
+	finally:
+		relay.remove_viewer(viewer)
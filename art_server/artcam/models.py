@@ -29,6 +29,7 @@ from django.db.models.fields.files import ImageFieldFile
 from django.core.urlresolvers import reverse
 
 import art_server.front.templatetags.imagetags as imagetags
+import mjpeg_relay
 
 class Artcam(models.Model):
 	"""A network camera."""
@@ -49,10 +50,19 @@ class Artcam(models.Model):
 		photo.image.save(filename + '.jpg', File(image_file), save=False)
 		photo.save()
 		
+	def stream_url(self):
+		"""The camera's own Motion JPEG stream, which the mjpeg_relay reads on behalf of viewers"""
+		return 'http://%s/mjpg/video.mjpg' % self.domain
+
+	def get_stream_relay(self):
+		"""Returns the running MJPEGRelay for this camera, starting one if necessary"""
+		return mjpeg_relay.get_relay(self.id, self.stream_url(), settings.ARTCAM_PUBLIC_USERNAME, settings.ARTCAM_PUBLIC_PASSWORD,
+			idle_timeout=getattr(settings, 'ARTCAM_RELAY_IDLE_SECONDS', 30), buffer_size=getattr(settings, 'ARTCAM_RELAY_BUFFER_FRAMES', 2))
+
 	def latest_photo(self):
-		if ArtcamPhoto.objects.filter(artcam=self).count() > 0:
-			return ArtcamPhoto.objects.filter(artcam=self)[0]
-		return None
+		photos = list(ArtcamPhoto.objects.filter(artcam=self).order_by('-created', '-id')[:1])
+		if len(photos) == 0: return None
+		return photos[0]
 	def __unicode__(self):
 		return self.name
 	def get_update_url(self):
@@ -72,8 +82,8 @@ class ThumbnailedModel(models.Model):
 		try:
 			file = settings.MEDIA_URL + self.image.path[len(settings.MEDIA_ROOT):]
 			filename, miniature_filename, miniature_dir, miniature_url = imagetags.determine_resized_image_paths(file, "admin_thumb")
-			if not os.path.exists(miniature_dir): os.makedirs(miniature_dir)
-			if not os.path.exists(miniature_filename): imagetags.fit_crop(filename, 100, 100, miniature_filename)
+			if not imagetags.rendition_is_current(filename, miniature_filename):
+				imagetags.generate_rendition(filename, miniature_filename, miniature_dir, imagetags.fit_crop, 100, 100)
 			return """<img src="%s" /></a>""" % miniature_url
 		except:
 			traceback.print_exc()
@@ -83,7 +93,8 @@ class ThumbnailedModel(models.Model):
 		abstract = True
 
 class ArtcamPhoto(ThumbnailedModel):
-	"""A photo taked from an ArtCam."""
+	"""A photo taked from an ArtCam.
+	Photos are always fetched by artcam and created, so migration 0003 adds a composite index on (artcam_id, created)."""
 	image = models.ImageField(upload_to='artcam_photo', blank=False)
 	artcam = models.ForeignKey(Artcam, blank=False, null=False)
 	created = models.DateTimeField(auto_now_add=True)
@@ -100,3 +111,44 @@ class ArtcamPhoto(ThumbnailedModel):
 		nodes = ['image']
 	def __unicode__(self):
 		return str(self.image)
+
+class ArtcamTimelapse(models.Model):
+	"""A timelapse assembled from an Artcam's photos.
+	The photos from begin to end (or onward, if end is empty) are appended in capture order as they arrive, using every frame_step-th photo."""
+	FORMAT_CHOICES = (('mjpeg', 'Motion JPEG'), ('sheet', 'Contact Sheet'))
+	artcam = models.ForeignKey(Artcam, blank=False, null=False)
+	format = models.CharField(max_length=12, blank=False, null=False, choices=FORMAT_CHOICES, default='mjpeg')
+	begin = models.DateTimeField(blank=False, null=False)
+	end = models.DateTimeField(blank=True, null=True)
+	frame_step = models.PositiveIntegerField(blank=False, null=False, default=1)
+	file = models.FileField(upload_to='artcam_timelapse', blank=True, null=True, editable=False)
+	frame_count = models.IntegerField(blank=False, null=False, default=0, editable=False)
+	file_size = models.BigIntegerField(blank=False, null=False, default=0, editable=False) # the bytes of the file which hold frame_count frames
+	last_frame = models.DateTimeField(blank=True, null=True, editable=False)
+	updated = models.DateTimeField(auto_now=True)
+
+	def photos(self):
+		"""Returns all of the photos in this timelapse's range, oldest first"""
+		photos = ArtcamPhoto.objects.filter(artcam=self.artcam, created__gte=self.begin)
+		if self.end: photos = photos.filter(created__lte=self.end)
+		return photos.order_by('created', 'id')
+
+	def pending_photos(self):
+		"""Returns the photos in range which were taken after the last appended frame, oldest first"""
+		if not self.last_frame: return self.photos()
+		return self.photos().filter(created__gt=self.last_frame)
+
+	def is_complete(self): return self.end != None and self.last_frame != None and self.end <= self.last_frame
+
+	def update(self, rebuild=False):
+		"""Appends the pending photos to the timelapse file, or renders it from scratch if rebuild is True"""
+		from timelapse import update_timelapse
+		return update_timelapse(self, rebuild)
+
+	def __unicode__(self): return '%s timelapse %s' % (self.artcam, self.begin)
+	class Meta:
+		ordering = ['-begin']
+	class HydrationMeta:
+		attributes = ['id', 'format', 'begin', 'end', 'frame_step', 'frame_count', 'last_frame']
+		ref_attributes = ['artcam']
+		nodes = ['file']
@@ -14,6 +14,7 @@ class ArtcamTask(Task):
 		from django.contrib.sites.models import Site
 		from django.conf import settings
 		from models import Artcam
+		from front.templatetags.imagetags import forget_rendition
 		
 		site = Site.objects.get_current()
 		for artcam in Artcam.objects.all():
@@ -29,7 +30,8 @@ class ArtcamTask(Task):
 		youngest_date = int(time.time()) - 604800 # a week worth of seconds
 		for cd, path in files:
 			if cd < youngest_date:
-				os.unlink(path)				
+				forget_rendition(path)
+				os.unlink(path)
 
 	def resized_files(self):
 		"""Returns an array of info about resized image files in the form (creation_date, path), sorted in chronological order by modified date"""
@@ -47,3 +49,19 @@ class ArtcamTask(Task):
 		# leave only regular files, insert creation date
 		return sorted(((stat[ST_MTIME], path) for stat, path in entries if S_ISREG(stat[ST_MODE])))
 
+
+class ArtcamTimelapseTask(Task):
+	"""The schedule task which appends new photos to the artcam timelapses."""
+	def __init__(self, loopdelay=600, initdelay=60, thread_count=4):
+		self.thread_count = thread_count
+		Task.__init__(self, self.do_it, loopdelay, initdelay)
+	def do_it(self):
+		from models import ArtcamTimelapse
+		from timelapse import update_timelapses
+		try:
+			results = update_timelapses(ArtcamTimelapse.objects.all(), self.thread_count)
+		except:
+			logging.exception('Could not update the artcam timelapses')
+			return
+		failures = [str(id) for id, appended in results.items() if appended == None]
+		if failures: self.send_alert('ArtCam Timelapse Failure', 'Could not update these timelapses: %s' % ', '.join(failures))
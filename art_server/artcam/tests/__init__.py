@@ -0,0 +1,3 @@
+from test_timelapse import *
+from test_api import *
+from test_mjpeg_relay import *
\ No newline at end of file
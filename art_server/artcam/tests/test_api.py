@@ -0,0 +1,62 @@
+import datetime
+from lxml import etree
+
+from django.test import TestCase
+from django.test.client import Client
+
+from artcam.models import Artcam, ArtcamPhoto
+
+class PhotoAPITest(TestCase):
+	def setUp(self):
+		self.client = Client()
+		self.artcam = Artcam.objects.create(name='Test Cam', ip='127.0.0.1')
+		start = datetime.datetime(2011, 6, 1, 12, 0)
+		self.photo_ids = []
+		for i in range(5):
+			photo = ArtcamPhoto.objects.create(artcam=self.artcam, image='artcam_photo/test-%s.jpg' % i)
+			ArtcamPhoto.objects.filter(pk=photo.id).update(created=start + datetime.timedelta(minutes=5 * i))
+			self.photo_ids.insert(0, photo.id)
+
+	def test_paging(self):
+		photos_url = '/api/artcam/%s/photo/' % self.artcam.id
+		response = self.client.get(photos_url)
+		self.failUnlessEqual(response.status_code, 200, 'status was %s' % response.status_code)
+		self.failUnlessEqual([int(element.get('id')) for element in etree.fromstring(response.content)], self.photo_ids)
+		self.failIf(response.has_header('Link'))
+
+		response = self.client.get(photos_url, {'limit':2})
+		self.failUnlessEqual([int(element.get('id')) for element in etree.fromstring(response.content)], self.photo_ids[0:2])
+		self.failUnless(response['Link'].endswith('rel="next"'))
+
+		before = ArtcamPhoto.objects.get(pk=self.photo_ids[1]).created.isoformat()
+		response = self.client.get(photos_url, {'limit':2, 'before':before})
+		self.failUnlessEqual([int(element.get('id')) for element in etree.fromstring(response.content)], self.photo_ids[2:4])
+
+		before = ArtcamPhoto.objects.get(pk=self.photo_ids[3]).created.isoformat()
+		response = self.client.get(photos_url, {'limit':2, 'before':before})
+		self.failUnlessEqual([int(element.get('id')) for element in etree.fromstring(response.content)], self.photo_ids[4:])
+		self.failIf(response.has_header('Link'))
+
+		# photos which share a timestamp across a page boundary are all returned, following the Link
+		created = ArtcamPhoto.objects.get(pk=self.photo_ids[0]).created
+		ArtcamPhoto.objects.filter(pk__in=self.photo_ids[0:3]).update(created=created)
+		response = self.client.get(photos_url, {'limit':2})
+		self.failUnlessEqual([int(element.get('id')) for element in etree.fromstring(response.content)], self.photo_ids[0:2])
+		next_url = response['Link'][1:response['Link'].index('>')]
+		self.failUnless('before_id=%s' % self.photo_ids[1] in next_url)
+		response = self.client.get(next_url)
+		self.failUnlessEqual([int(element.get('id')) for element in etree.fromstring(response.content)], self.photo_ids[2:4])
+
+		self.failUnlessEqual(self.client.get(photos_url, {'before':'yesterday'}).status_code, 400)
+		self.failUnlessEqual(self.client.get(photos_url, {'before':before, 'before_id':'last'}).status_code, 400)
+		self.failUnlessEqual(self.client.get(photos_url, {'limit':0}).status_code, 400)
+
+	def test_latest(self):
+		self.failUnlessEqual(self.artcam.latest_photo().id, self.photo_ids[0])
+		response = self.client.get('/api/artcam/%s/photo/latest/' % self.artcam.id)
+		self.failUnlessEqual(response.status_code, 200, 'status was %s' % response.status_code)
+		self.failUnlessEqual(int(etree.fromstring(response.content).get('id')), self.photo_ids[0])
+
+		empty_artcam = Artcam.objects.create(name='Empty Cam', ip='127.0.0.1')
+		self.failUnlessEqual(empty_artcam.latest_photo(), None)
+		self.failUnlessEqual(self.client.get('/api/artcam/%s/photo/latest/' % empty_artcam.id).status_code, 404)
@@ -0,0 +1,165 @@
+import time
+import base64
+import socket
+import threading
+import StringIO
+import BaseHTTPServer
+import SocketServer
+
+from django.test import TestCase
+
+from artcam.mjpeg_relay import MJPEGRelay, MJPEGViewer, read_frames, parse_boundary, format_frame, stream_frames
+
+class MockMJPEGHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	def do_GET(self):
+		camera = self.server.camera
+		if self.headers.get('Authorization', None) != 'Basic %s' % base64.b64encode('%s:%s' % (camera.username, camera.password)):
+			self.send_response(401)
+			self.end_headers()
+			return
+		camera.connection_count += 1
+		self.send_response(200)
+		self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=myboundary')
+		self.end_headers()
+		try:
+			while camera.running:
+				camera.frame_number += 1
+				frame = 'frame %s' % camera.frame_number
+				self.wfile.write('--myboundary\r\nContent-Type: image/jpeg\r\nContent-Length: %s\r\n\r\n%s\r\n' % (len(frame), frame))
+				self.wfile.flush()
+				time.sleep(camera.frame_delay)
+		except socket.error:
+			pass # the relay hung up
+
+	def finish(self):
+		try:
+			BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+		except socket.error:
+			pass
+
+	def log_message(self, format, *args): pass
+
+class MockMJPEGServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+
+class MockMJPEGCamera(threading.Thread):
+	"""A localhost HTTP server which streams numbered frames in the multipart format of the Axis cameras"""
+	def __init__(self):
+		self.username = 'user'
+		self.password = 'pass'
+		self.frame_delay = 0.01
+		self.frame_number = 0
+		self.connection_count = 0
+		self.running = False
+		self.server = MockMJPEGServer(('127.0.0.1', 0), MockMJPEGHandler)
+		self.server.camera = self
+		self.port = self.server.server_address[1]
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def url(self): return 'http://127.0.0.1:%s/mjpg/video.mjpg' % self.port
+
+	def run(self):
+		self.running = True
+		self.server.serve_forever(poll_interval=0.1)
+
+	def stop(self):
+		self.running = False
+		self.server.shutdown()
+		self.server.server_close()
+
+class MJPEGRelayTest(TestCase):
+	def setUp(self):
+		self.camera = MockMJPEGCamera()
+		self.camera.start()
+		self.relays = []
+
+	def tearDown(self):
+		for relay in self.relays:
+			relay.stop()
+			relay.join(5)
+		self.camera.stop()
+
+	def start_relay(self, **kwargs):
+		relay = MJPEGRelay(self.camera.url(), self.camera.username, self.camera.password, reconnect_delay=0.1, **kwargs)
+		self.relays.append(relay)
+		relay.start()
+		return relay
+
+	def test_parsing(self):
+		self.failUnlessEqual('--myboundary', parse_boundary('multipart/x-mixed-replace; boundary=myboundary'))
+		self.failUnlessEqual('--myboundary', parse_boundary('multipart/x-mixed-replace;boundary="--myboundary"'))
+		self.failUnlessEqual(None, parse_boundary('image/jpeg'))
+		stream = StringIO.StringIO(
+			'--b\r\nContent-Type: image/jpeg\r\nContent-Length: 8\r\n\r\nfirst\r\n1\r\n'
+			'--b\r\nContent-Type: image/jpeg\r\n\r\nsecond\r\nframe\r\n'
+			'--b\r\nContent-Type: image/jpeg\r\n\r\ntruncated'
+		)
+		self.failUnlessEqual(['first\r\n1', 'second\r\nframe'], list(read_frames(stream, '--b')))
+		self.failUnlessEqual(['a frame'], list(read_frames(StringIO.StringIO(format_frame('a frame')), '--artserverframe')))
+
+	def test_viewer_buffer(self):
+		viewer = MJPEGViewer(buffer_size=2)
+		for i in range(5): viewer.put(i)
+		self.failUnlessEqual(3, viewer.dropped_frames)
+		self.failUnlessEqual(3, viewer.get(0))
+		self.failUnlessEqual(4, viewer.get(0))
+		self.failUnlessEqual(None, viewer.get(0.01))
+		viewer.close()
+		self.failUnlessEqual(None, viewer.get())
+
+	def test_fan_out(self):
+		relay = self.start_relay()
+		viewers = [relay.add_viewer() for i in range(5)]
+		for viewer in viewers:
+			frames = [viewer.get(5) for i in range(3)]
+			self.failIf(None in frames)
+			self.failUnless(frames[0].startswith('frame '))
+		self.failUnlessEqual(1, self.camera.connection_count)
+
+		# a viewer which stops reading holds no more than its buffer and drops the rest
+		slow = relay.add_viewer()
+		time.sleep(0.3)
+		self.failUnlessEqual(relay.buffer_size, len(slow.frames))
+		self.failUnless(slow.dropped_frames > 0)
+
+		# the response generator removes its viewer when the response is closed
+		chunks = stream_frames(relay, viewers[0])
+		self.failUnless(chunks.next().startswith('--artserverframe\r\n'))
+		chunks.close()
+		self.failIf(viewers[0] in relay.viewers)
+		self.failUnless(viewers[0].closed)
+
+	def test_keepalive(self):
+		# with no frames coming the stream keeps writing, so a viewer who has gone away is noticed
+		relay = MJPEGRelay('http://127.0.0.1:1/')
+		viewer = relay.add_viewer()
+		chunks = stream_frames(relay, viewer, keepalive_seconds=0.05)
+		self.failUnlessEqual('\r\n', chunks.next())
+		viewer.put('frame 1')
+		self.failUnlessEqual(format_frame('frame 1'), chunks.next())
+		self.failUnlessEqual(format_frame('frame 1'), chunks.next())
+		chunks.close()
+		self.failIf(viewer in relay.viewers)
+
+	def test_idle_teardown(self):
+		relay = self.start_relay(idle_timeout=0.2)
+		viewer = relay.add_viewer()
+		self.failIf(viewer.get(5) == None)
+		relay.remove_viewer(viewer)
+		relay.join(5)
+		self.failIf(relay.isAlive())
+		self.failUnless(relay.stopping)
+		self.failUnlessEqual(None, relay.add_viewer())
+		self.failUnlessEqual(1, self.camera.connection_count)
+
+	def test_reconnect(self):
+		relay = self.start_relay()
+		viewer = relay.add_viewer()
+		self.failIf(viewer.get(5) == None)
+		relay.upstream.close() # as if the camera dropped the connection
+		deadline = time.time() + 5
+		while self.camera.connection_count < 2 and time.time() < deadline: time.sleep(0.05)
+		self.failUnlessEqual(2, self.camera.connection_count)
+		while viewer.get(0): pass
+		self.failIf(viewer.get(5) == None)
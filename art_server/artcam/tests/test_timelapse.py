@@ -0,0 +1,100 @@
+import os
+import tempfile
+import datetime
+import Image
+
+from django.test import TestCase
+from django.core.files import File
+
+from artcam.models import Artcam, ArtcamPhoto, ArtcamTimelapse
+from artcam import timelapse as timelapse_module
+from artcam.timelapse import SHEET_COLUMNS, SHEET_TILE_SIZE, sheet_page_path, remove_timelapse_files
+
+class TimelapseTest(TestCase):
+	def setUp(self):
+		self.artcam = Artcam.objects.create(name='Test Cam', ip='127.0.0.1')
+		self.start = datetime.datetime(2011, 6, 1, 12, 0)
+		self.photos = []
+		self.timelapses = []
+
+	def tearDown(self):
+		for photo in self.photos: photo.image.delete(save=False)
+		for timelapse in self.timelapses:
+			if timelapse.file: remove_timelapse_files(timelapse.file.path)
+
+	def add_photos(self, count):
+		for i in range(count):
+			handle, path = tempfile.mkstemp('.jpg')
+			os.close(handle)
+			Image.new('RGB', (320, 240), (len(self.photos) * 10, 0, 0)).save(path, 'JPEG')
+			photo = ArtcamPhoto(artcam=self.artcam)
+			photo.image.save(os.path.basename(path), File(open(path, 'rb')), save=False)
+			photo.save()
+			os.unlink(path)
+			ArtcamPhoto.objects.filter(pk=photo.id).update(created=self.start + datetime.timedelta(minutes=5 * len(self.photos)))
+			self.photos.append(photo)
+
+	def test_mjpeg(self):
+		self.add_photos(5)
+		timelapse = ArtcamTimelapse.objects.create(artcam=self.artcam, begin=self.start)
+		self.timelapses.append(timelapse)
+		self.failUnlessEqual(timelapse.update(), 5)
+		self.failUnlessEqual(timelapse.frame_count, 5)
+		self.failUnlessEqual(os.path.getsize(timelapse.file.path), sum([os.path.getsize(photo.image.path) for photo in self.photos]))
+
+		# only the new photos are appended
+		self.failUnlessEqual(timelapse.update(), 0)
+		self.add_photos(2)
+		self.failUnlessEqual(timelapse.update(), 2)
+		self.failUnlessEqual(ArtcamTimelapse.objects.get(pk=timelapse.id).frame_count, 7)
+		self.failUnlessEqual(os.path.getsize(timelapse.file.path), sum([os.path.getsize(photo.image.path) for photo in self.photos]))
+
+		self.failUnlessEqual(timelapse.update(rebuild=True), 7)
+		self.failUnlessEqual(os.path.getsize(timelapse.file.path), sum([os.path.getsize(photo.image.path) for photo in self.photos]))
+		self.failUnlessEqual(timelapse.file_size, os.path.getsize(timelapse.file.path))
+
+		# an append which crashed before the frame count was saved is cut off rather than repeated
+		output = open(timelapse.file.path, 'ab')
+		output.write(open(self.photos[0].image.path, 'rb').read()[:100])
+		output.close()
+		self.add_photos(1)
+		self.failUnlessEqual(timelapse.update(), 1)
+		self.failUnlessEqual(os.path.getsize(timelapse.file.path), sum([os.path.getsize(photo.image.path) for photo in self.photos]))
+
+		# a file which lost recorded frames is rebuilt
+		output = open(timelapse.file.path, 'r+b')
+		output.truncate(100)
+		output.close()
+		self.failUnlessEqual(timelapse.update(), 8)
+		self.failUnlessEqual(os.path.getsize(timelapse.file.path), sum([os.path.getsize(photo.image.path) for photo in self.photos]))
+
+	def test_sheet(self):
+		self.add_photos(10)
+		timelapse = ArtcamTimelapse.objects.create(artcam=self.artcam, format='sheet', begin=self.start, frame_step=2)
+		self.timelapses.append(timelapse)
+		self.failUnlessEqual(timelapse.update(), 5)
+		self.add_photos(10)
+		self.failUnlessEqual(timelapse.update(), 5)
+		self.failUnlessEqual(timelapse.frame_count, 10)
+		self.failUnlessEqual(Image.open(timelapse.file.path).size, (SHEET_COLUMNS * SHEET_TILE_SIZE[0], 2 * SHEET_TILE_SIZE[1]))
+
+		# a sheet which outgrows a page continues on the next
+		page_rows = timelapse_module.SHEET_PAGE_ROWS
+		timelapse_module.SHEET_PAGE_ROWS = 1
+		try:
+			self.failUnlessEqual(timelapse_module.update_timelapse(timelapse, rebuild=True), 10)
+			self.add_photos(4)
+			self.failUnlessEqual(timelapse_module.update_timelapse(timelapse), 2)
+		finally:
+			timelapse_module.SHEET_PAGE_ROWS = page_rows
+		self.failUnlessEqual(Image.open(timelapse.file.path).size, (SHEET_COLUMNS * SHEET_TILE_SIZE[0], SHEET_TILE_SIZE[1]))
+		self.failUnlessEqual(Image.open(sheet_page_path(timelapse.file.path, 1)).size, (SHEET_COLUMNS * SHEET_TILE_SIZE[0], SHEET_TILE_SIZE[1]))
+		self.failIf(os.path.exists(sheet_page_path(timelapse.file.path, 2)))
+		self.failUnlessEqual(timelapse.update(rebuild=True), 12)
+		self.failIf(os.path.exists(sheet_page_path(timelapse.file.path, 1)))
+
+		# a closed range stops growing
+		closed = ArtcamTimelapse.objects.create(artcam=self.artcam, begin=self.start, end=self.start + datetime.timedelta(minutes=20))
+		self.timelapses.append(closed)
+		self.failUnlessEqual(closed.update(), 5)
+		self.failUnless(closed.is_complete())
@@ -0,0 +1,203 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""Assembles ArtcamPhoto frames into timelapse files.
+
+Motion JPEG timelapses are the camera's JPEGs concatenated in capture order, which players like VLC or ffmpeg (-f mjpeg) read directly.
+Contact sheets are a PNG grid of small tiles, one per frame, split into pages of SHEET_PAGE_ROWS rows: the timelapse's file is the first page
+and the rest sit beside it (sheet_page_path).  An append only loads and rewrites the pages it adds tiles to.
+
+Frames are read from disk one at a time and the photos are fetched from the database with an iterator,
+so memory use doesn't grow with the length of the range.  New frames are appended to the existing file instead of re-rendering it.
+A Motion JPEG append is synced to disk before the timelapse records its new frame count and file_size,
+and the next append cuts the file back to file_size, so frames written by an append which never finished aren't repeated.
+"""
+import os
+import shutil
+import threading
+import Queue
+import traceback
+import logging
+import Image
+
+from django.conf import settings
+from django.db import connection
+
+SHEET_COLUMNS = 8
+SHEET_TILE_SIZE = (160, 120)
+SHEET_BACKGROUND = (0, 0, 0)
+SHEET_PAGE_ROWS = 16
+COPY_BUFFER_SIZE = 64 * 1024
+
+def timelapse_file_name(timelapse):
+	"""Returns the media relative name of the file for this timelapse"""
+	if timelapse.format == 'sheet':
+		extension = 'png'
+	else:
+		extension = 'mjpeg'
+	return 'artcam_timelapse/%s-%s.%s' % (timelapse.artcam.id, timelapse.id, extension)
+
+def frames_to_append(timelapse, until):
+	"""Yields the pending photos taken no later than until, skipping so that every frame_step-th photo in the whole range is used"""
+	step = max(1, timelapse.frame_step)
+	index = 0
+	if step > 1 and timelapse.last_frame:
+		# count the photos which were already considered so that the step continues where it left off
+		index = timelapse.photos().filter(created__lte=timelapse.last_frame).count()
+	for photo in timelapse.pending_photos().filter(created__lte=until).iterator():
+		if index % step == 0: yield photo
+		index += 1
+
+def append_mjpeg(path, photos, offset=0):
+	"""Appends each photo's JPEG data to the first offset bytes of the file at path, cutting off anything after them.
+	Returns the photos which were appended and the new size of the file, which has been synced to disk."""
+	appended = []
+	if os.path.exists(path):
+		output = open(path, 'r+b')
+	else:
+		output = open(path, 'wb')
+	try:
+		output.truncate(offset)
+		output.seek(offset)
+		for photo in photos:
+			try:
+				frame = open(photo.image.path, 'rb')
+			except IOError:
+				logging.exception('Could not read the frame %s' % photo.image.path)
+				continue
+			try:
+				shutil.copyfileobj(frame, output, COPY_BUFFER_SIZE)
+			finally:
+				frame.close()
+			appended.append(photo)
+		output.flush()
+		os.fsync(output.fileno())
+		size = output.tell()
+	finally:
+		output.close()
+	return appended, size
+
+def sheet_page_path(path, page):
+	"""Returns the path of the given page of the contact sheet whose first page is at path"""
+	if page == 0: return path
+	root, extension = os.path.splitext(path)
+	return '%s-%s%s' % (root, page, extension)
+
+def remove_timelapse_files(path):
+	"""Deletes the timelapse file at path and any further contact sheet pages"""
+	page = 0
+	while os.path.exists(sheet_page_path(path, page)):
+		os.unlink(sheet_page_path(path, page))
+		page += 1
+
+def make_room(page, rows):
+	"""Returns the page image, or a copy of it grown to the given number of rows if it is shorter"""
+	tile_width, tile_height = SHEET_TILE_SIZE
+	if page and page.size[1] >= rows * tile_height: return page
+	grown = Image.new('RGB', (SHEET_COLUMNS * tile_width, rows * tile_height), SHEET_BACKGROUND)
+	if page: grown.paste(page, (0, 0))
+	return grown
+
+def save_sheet_page(path, page):
+	temp_path = '%s.%s.tmp.png' % (path, os.getpid())
+	page.save(temp_path, 'PNG')
+	os.rename(temp_path, path)
+
+def append_sheet(path, photos, frame_count):
+	"""Adds a tile for each photo to the contact sheet at path, which already holds frame_count tiles, returning the photos which were added.
+	Tiles are pasted as they are read, so no more than one page is held in memory."""
+	tile_width, tile_height = SHEET_TILE_SIZE
+	page_size = SHEET_COLUMNS * SHEET_PAGE_ROWS
+	appended = []
+	page_number = None
+	page = None
+	position = frame_count
+	for photo in photos:
+		try:
+			tile = Image.open(photo.image.path)
+			tile.thumbnail(SHEET_TILE_SIZE, Image.ANTIALIAS)
+		except IOError:
+			logging.exception('Could not read the frame %s' % photo.image.path)
+			continue
+		index = position % page_size
+		if page_number != position / page_size:
+			if page: save_sheet_page(sheet_page_path(path, page_number), page)
+			page_number = position / page_size
+			page = None
+			# a page which already holds tiles is added to, otherwise it starts empty
+			if index > 0 and os.path.exists(sheet_page_path(path, page_number)): page = Image.open(sheet_page_path(path, page_number))
+		page = make_room(page, index / SHEET_COLUMNS + 1)
+		left = (index % SHEET_COLUMNS) * tile_width + (tile_width - tile.size[0]) / 2
+		top = (index / SHEET_COLUMNS) * tile_height + (tile_height - tile.size[1]) / 2
+		page.paste(tile, (left, top))
+		appended.append(photo)
+		position += 1
+	if page: save_sheet_page(sheet_page_path(path, page_number), page)
+	return appended
+
+def update_timelapse(timelapse, rebuild=False):
+	"""Appends the pending frames to the timelapse's file (or starts over if rebuild is True) and returns the number of frames appended"""
+	if not timelapse.id: timelapse.save()
+	if timelapse.file and timelapse.format != 'sheet' and timelapse.frame_count > 0:
+		path = os.path.join(settings.MEDIA_ROOT, timelapse.file.name)
+		if not os.path.exists(path) or os.path.getsize(path) < timelapse.file_size:
+			logging.error('The timelapse file %s is shorter than the %s bytes recorded for it, so it is being rebuilt' % (path, timelapse.file_size))
+			rebuild = True
+	if rebuild or not timelapse.file:
+		timelapse.file.name = timelapse_file_name(timelapse)
+		timelapse.frame_count = 0
+		timelapse.file_size = 0
+		timelapse.last_frame = None
+	path = os.path.join(settings.MEDIA_ROOT, timelapse.file.name)
+	if not os.path.exists(os.path.dirname(path)): os.makedirs(os.path.dirname(path))
+	if timelapse.frame_count == 0: remove_timelapse_files(path)
+
+	# photos which arrive while we work are left for the next update
+	latest = list(timelapse.pending_photos().order_by('-created', '-id')[:1])
+	if len(latest) == 0:
+		timelapse.save()
+		return 0
+	until = latest[0].created
+
+	if timelapse.format == 'sheet':
+		appended = append_sheet(path, frames_to_append(timelapse, until), timelapse.frame_count)
+	else:
+		appended, timelapse.file_size = append_mjpeg(path, frames_to_append(timelapse, until), timelapse.file_size)
+
+	# the last frame moves past skipped photos too, so they aren't considered again
+	timelapse.last_frame = until
+	timelapse.frame_count += len(appended)
+	timelapse.save()
+	return len(appended)
+
+def update_timelapses(timelapses, thread_count=4):
+	"""Updates the timelapses, working on up to thread_count cameras in parallel.
+	Each camera's timelapses are updated in order by a single thread.
+	Returns a map of timelapse id to the number of frames appended, or None if the update failed."""
+	by_artcam = {}
+	for timelapse in timelapses:
+		if timelapse.is_complete(): continue
+		by_artcam.setdefault(timelapse.artcam_id, []).append(timelapse)
+
+	work = Queue.Queue()
+	for artcam_timelapses in by_artcam.values(): work.put(artcam_timelapses)
+	results = {}
+	def worker():
+		try:
+			while True:
+				try:
+					artcam_timelapses = work.get_nowait()
+				except Queue.Empty:
+					return
+				for timelapse in artcam_timelapses:
+					try:
+						results[timelapse.id] = update_timelapse(timelapse)
+					except:
+						logging.exception('Could not update the timelapse %s' % timelapse.id)
+						traceback.print_exc()
+						results[timelapse.id] = None
+		finally:
+			connection.close()
+
+	threads = [threading.Thread(target=worker) for i in range(min(thread_count, len(by_artcam)))]
+	for thread in threads: thread.start()
+	for thread in threads: thread.join()
+	return results
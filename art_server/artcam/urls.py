@@ -8,5 +8,6 @@ urlpatterns = patterns('',
 	(r'^(?P<id>[\d]+)/$', 'artcam.views.artcam'),
 	(r'^(?P<artcam_id>[\d]+)/photo/(?P<photo_id>[\d]+)/$', 'artcam.views.artcam_photo'),
 	(r'^(?P<id>[\d]+)/video/$', 'artcam.views.artcam_video'),
+	(r'^(?P<id>[\d]+)/video/stream/$', 'artcam.views.artcam_stream'),
 	(r'^$', 'artcam.views.index'),
 )
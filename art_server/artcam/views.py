@@ -25,6 +25,7 @@ from django.template.loader import render_to_string
 from django.utils import feedgenerator
 
 from models import *
+import mjpeg_relay
 from forms import *
 
 def index(request):
@@ -34,6 +35,18 @@ def artcam_video(request, id):
 	artcam = get_object_or_404(Artcam, pk=id)
 	return render_to_response('artcam/artcam_video.html', { 'artcam':artcam }, context_instance=RequestContext(request))
 
+def artcam_stream(request, id):
+	"""Relays the camera's Motion JPEG stream, sharing one connection to the camera between all viewers"""
+	artcam = get_object_or_404(Artcam, pk=id)
+	for attempt in range(2): # the relay may be shutting down as we join it, in which case a new one is started
+		relay = artcam.get_stream_relay()
+		viewer = relay.add_viewer()
+		if viewer: break
+	if not viewer: return HttpResponseServerError('Could not relay the artcam stream')
+	response = HttpResponse(mjpeg_relay.stream_frames(relay, viewer), mimetype=mjpeg_relay.CONTENT_TYPE)
+	response['Cache-Control'] = 'no-cache'
+	return response
+
 def artcam(request, id):
 	artcam = get_object_or_404(Artcam, pk=id)
 	if request.GET.get('action', None) == 'update':
@@ -1,11 +1,20 @@
 import os
 import re
+import time
+import hashlib
+import thread
+import threading
 import traceback
 import Image
+try:
+	import fcntl
+except ImportError:
+	fcntl = None # no file locks (e.g. on Windows), so only threads in this process are kept apart
 from django.template import Library
 from django import template
 from django.utils.html import linebreaks
 from django.conf import settings
+from django.core.cache import cache
 
 register = template.Library()
 
@@ -13,6 +22,105 @@ SCALE_WIDTH = 'w'
 SCALE_HEIGHT = 'h'
 RESIZED_IMAGE_DIR = 'resized_image'
 
+# How long a known-good rendition is trusted before its source and miniature are stat'ed again
+RENDITION_CHECK_SECONDS = getattr(settings, 'RESIZED_IMAGE_CHECK_SECONDS', 60)
+# Set RESIZED_IMAGE_SHARED_INDEX = True to share the rendition index between processes via the cache backend
+RENDITION_SHARED_INDEX = getattr(settings, 'RESIZED_IMAGE_SHARED_INDEX', False)
+RENDITION_CACHE_PREFIX = 'imagetags-rendition-'
+
+# miniature filename -> (source mtime, time the entry was last verified)
+_rendition_index = {}
+
+# renditions are hashed onto this fixed set of locks so that two threads never generate the same miniature
+_rendition_locks = [threading.Lock() for i in range(32)]
+# and onto as many lock files in this directory so that two processes never do
+RENDITION_LOCK_DIR = os.path.join(settings.MEDIA_ROOT, RESIZED_IMAGE_DIR, '.locks')
+
+def rendition_cache_key(miniature_filename):
+	return RENDITION_CACHE_PREFIX + hashlib.md5(miniature_filename).hexdigest()
+
+def record_rendition(miniature_filename, source_mtime):
+	"""Remember that the miniature is up to date with a source which has the given mtime"""
+	_rendition_index[miniature_filename] = (source_mtime, time.time())
+	if RENDITION_SHARED_INDEX: cache.set(rendition_cache_key(miniature_filename), source_mtime, RENDITION_CHECK_SECONDS)
+
+def forget_rendition(miniature_filename):
+	"""Drop the miniature from the rendition index, for example when it is deleted"""
+	_rendition_index.pop(miniature_filename, None)
+	if RENDITION_SHARED_INDEX: cache.delete(rendition_cache_key(miniature_filename))
+
+def rendition_is_current(filename, miniature_filename):
+	"""Returns True if the miniature exists and is at least as new as its source.
+	Recently verified renditions are answered from the index with a stat of the source alone, so a replaced source is noticed at once.
+	A miniature which is older than its source is deleted so that it will be regenerated."""
+	now = time.time()
+	try:
+		source_mtime = os.path.getmtime(filename)
+	except OSError:
+		return False
+	entry = _rendition_index.get(miniature_filename, None)
+	if entry and entry[0] == source_mtime and now - entry[1] < RENDITION_CHECK_SECONDS: return True
+	if RENDITION_SHARED_INDEX:
+		if cache.get(rendition_cache_key(miniature_filename)) == source_mtime:
+			_rendition_index[miniature_filename] = (source_mtime, now)
+			return True
+
+	if not os.path.isfile(miniature_filename):
+		forget_rendition(miniature_filename)
+		return False
+	if source_mtime > os.path.getmtime(miniature_filename):
+		forget_rendition(miniature_filename)
+		os.unlink(miniature_filename)
+		return False
+	record_rendition(miniature_filename, source_mtime)
+	return True
+
+def rendition_lock_index(miniature_filename): return int(hashlib.md5(miniature_filename).hexdigest(), 16) % len(_rendition_locks)
+
+def rendition_lock(miniature_filename): return _rendition_locks[rendition_lock_index(miniature_filename)]
+
+def rendition_lock_filename(miniature_filename):
+	if not os.path.isdir(RENDITION_LOCK_DIR):
+		try:
+			os.makedirs(RENDITION_LOCK_DIR)
+		except OSError:
+			if not os.path.isdir(RENDITION_LOCK_DIR): raise
+	return os.path.join(RENDITION_LOCK_DIR, 'rendition-%s.lock' % rendition_lock_index(miniature_filename))
+
+def generate_rendition(filename, miniature_filename, miniature_dir, render_function, *args):
+	"""Writes the miniature by calling render_function(filename, *args, save_as=<path>), unless another thread or process beats us to it.
+	The rendition is locked within this process and, where available, with one of a fixed set of lock files shared by every worker.
+	The image is written to a temporary file and renamed into place, so a reader never sees a partially written miniature."""
+	if not os.path.isdir(miniature_dir):
+		try:
+			os.makedirs(miniature_dir)
+		except OSError:
+			if not os.path.isdir(miniature_dir): raise # otherwise another worker just created it
+	lock = rendition_lock(miniature_filename)
+	lock.acquire()
+	try:
+		lock_file = None
+		if fcntl:
+			lock_file = open(rendition_lock_filename(miniature_filename), 'a')
+			fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+		try:
+			# the miniature may have been generated while we waited for the lock
+			if rendition_is_current(filename, miniature_filename): return
+			basename, extension = os.path.splitext(miniature_filename)
+			temp_filename = '%s.%s-%s.tmp%s' % (basename, os.getpid(), thread.get_ident(), extension)
+			try:
+				render_function(filename, *args, **{ 'save_as':temp_filename })
+				os.rename(temp_filename, miniature_filename)
+			finally:
+				if os.path.exists(temp_filename): os.unlink(temp_filename)
+			record_rendition(miniature_filename, os.path.getmtime(filename))
+		finally:
+			if lock_file:
+				fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+				lock_file.close()
+	finally:
+		lock.release()
+
 def calc_scale(max_x, pair):
 	x, y = pair
 	new_y = (float(max_x) / x) * y
@@ -26,14 +134,8 @@ def crop(file, size_param="300x255"):
 		height = int(height_param)
 
 		filename, miniature_filename, miniature_dir, miniature_url = determine_resized_image_paths(file, size_param)
-		if not os.path.exists(miniature_dir): os.makedirs(miniature_dir)
-		if os.path.exists(miniature_filename) and os.path.getmtime(filename) > os.path.getmtime(miniature_filename): os.unlink(miniature_filename)
-
-		if not os.path.exists(miniature_filename):
-			if os.path.exists(filename):
-				image = Image.open(filename)
-				image.save(miniature_filename, image.format)
-				fit_crop(miniature_filename, width, height)
+		if rendition_is_current(filename, miniature_filename): return miniature_url
+		if os.path.exists(filename): generate_rendition(filename, miniature_filename, miniature_dir, fit_crop, width, height)
 		return miniature_url
 	except:
 		print 'Could not crop file: %s' % file
@@ -46,15 +148,11 @@ def squarecrop(file, size_param='100'):
 		size = int(size_param.strip())
 
 		filename, miniature_filename, miniature_dir, miniature_url = determine_resized_image_paths(file, "sq" + size_param)
+		if rendition_is_current(filename, miniature_filename): return miniature_url
 		if os.path.isdir(miniature_filename): return ''
-		if not os.path.exists(miniature_dir): os.makedirs(miniature_dir)
-		if os.path.exists(miniature_filename) and os.path.getmtime(filename) > os.path.getmtime(miniature_filename): os.unlink(miniature_filename)
-
-		# if the image wasn't already resized, resize it
-		if not os.path.exists(miniature_filename):
-			image = Image.open(filename)
-			image.save(miniature_filename, image.format)
-			fit_crop(miniature_filename, size, size)
+
+		# the image wasn't already resized, so resize it
+		generate_rendition(filename, miniature_filename, miniature_dir, fit_crop, size, size)
 		return miniature_url
 	except:
 		print 'Could not squarecrop file: %s' % file
@@ -70,18 +168,13 @@ def fit_image(file, size_param="300x300"):
 		height = int(height_param)
 
 		filename, miniature_filename, miniature_dir, miniature_url = determine_resized_image_paths(file, 'fit_' + size_param)
+		if rendition_is_current(filename, miniature_filename): return miniature_url
 		if os.path.isdir(miniature_filename): return ''
-		if not os.path.exists(miniature_dir): os.makedirs(miniature_dir)
-		if os.path.exists(miniature_filename) and os.path.getmtime(filename) > os.path.getmtime(miniature_filename): 
-			os.unlink(miniature_filename)
-
-		if not os.path.exists(miniature_filename):
-			image = Image.open(filename)
-			image.save(miniature_filename, image.format)
-			fit(miniature_filename, width, height)
+
+		generate_rendition(filename, miniature_filename, miniature_dir, fit, width, height)
 		return miniature_url
 	except:
-		print "Could not fit_image %s" % filename
+		print "Could not fit_image %s" % file
 		return ''
 register.filter('fit_image', fit_image)
 
@@ -96,22 +189,13 @@ def thumbnail(file, size='300w'):
 		max_size = int(size.strip())
 
 		filename, miniature_filename, miniature_dir, miniature_url = determine_resized_image_paths(file, size)
+		if rendition_is_current(filename, miniature_filename): return miniature_url
 		if os.path.isdir(miniature_filename): return ''
-		if not os.path.exists(miniature_dir): os.makedirs(miniature_dir)
-		if os.path.exists(miniature_filename) and os.path.getmtime(filename) > os.path.getmtime(miniature_filename): os.unlink(miniature_filename)
-
-		if not os.path.exists(miniature_filename):
-			image = Image.open(filename)
-			image_x, image_y = image.size  
-			if mode == SCALE_HEIGHT:
-				image_y, image_x = calc_scale(max_size, (image_y, image_x))
-			else:
-				image_x, image_y = calc_scale(max_size, (image_x, image_y))
-			image = image.resize((image_x, image_y), Image.ANTIALIAS) # .convert("L") is the Black and White hack
-			image.save(miniature_filename, image.format)		
+
+		generate_rendition(filename, miniature_filename, miniature_dir, scale, max_size, mode)
 		return miniature_url
 	except:
-		print "Could not load image %s" % filename
+		print "Could not load image %s" % file
 		return ''
 register.filter('thumbnail', thumbnail)
 
@@ -132,20 +216,35 @@ def determine_resized_image_paths(file, size_mark):
 	miniature_url = settings.MEDIA_URL + RESIZED_IMAGE_DIR + '/' + miniature_nomedia
 	return (filename, miniature_filename, miniature_dir, miniature_url)
 
+def scale(file_path, max_size, mode=SCALE_WIDTH, save_as=None):
+	"""Resize an image so that its width (or height, if mode is SCALE_HEIGHT) is max_size"""
+	image = Image.open(file_path)
+	format = image.format
+	image_x, image_y = image.size
+	if mode == SCALE_HEIGHT:
+		image_y, image_x = calc_scale(max_size, (image_y, image_x))
+	else:
+		image_x, image_y = calc_scale(max_size, (image_x, image_y))
+	image = image.resize((image_x, image_y), Image.ANTIALIAS) # .convert("L") is the Black and White hack
+	image.save(save_as or file_path, format)
+	return True
+
 # taken from django example at http://code.djangoproject.com/attachment/wiki/CustomUploadAndFilters/imaging.py
 
 def fit(file_path, max_width=None, max_height=None, save_as=None):
     img = Image.open(file_path)
+    format = img.format
     w, h = img.size
     w = int(max_width or w)
     h = int(max_height or h)
     img.thumbnail((w, h), Image.ANTIALIAS)
-    img.save(save_as or file_path)
+    img.save(save_as or file_path, format)
     
     return True
 
 def fit_crop(file_path, max_width=None, max_height=None, save_as=None):
     img = Image.open(file_path)
+    format = img.format
     w, h = float(img.size[0]), float(img.size[1])
     max_width = float(max_width or w)
     max_height = float(max_height or h)
@@ -161,5 +260,5 @@ def fit_crop(file_path, max_width=None, max_height=None, save_as=None):
     right = int(left + max_width)
     bottom = int(top + max_height)
     img = img.crop( (left, top, right, bottom) )
-    img.save(save_as or file_path)
+    img.save(save_as or file_path, format)
     return True
@@ -1,2 +1,3 @@
 from test_front import *
-from test_event import *
\ No newline at end of file
+from test_event import *
+from test_imagetags import *
\ No newline at end of file
@@ -0,0 +1,90 @@
+import os
+import time
+import shutil
+import threading
+import Image
+
+from django.test import TestCase
+from django.conf import settings
+
+import front.templatetags.imagetags as imagetags
+
+TEST_IMAGE_DIR = 'imagetags_test'
+
+class RenditionIndexTest(TestCase):
+	def setUp(self):
+		self.source_dir = os.path.join(settings.MEDIA_ROOT, TEST_IMAGE_DIR)
+		if not os.path.exists(self.source_dir): os.makedirs(self.source_dir)
+		self.source_path = os.path.join(self.source_dir, 'source.jpg')
+		Image.new('RGB', (400, 300), (255, 0, 0)).save(self.source_path, 'JPEG')
+		self.source_url = '%s%s/source.jpg' % (settings.MEDIA_URL, TEST_IMAGE_DIR)
+
+	def tearDown(self):
+		shutil.rmtree(self.source_dir, True)
+		shutil.rmtree(os.path.join(settings.MEDIA_ROOT, imagetags.RESIZED_IMAGE_DIR, TEST_IMAGE_DIR), True)
+		shutil.rmtree(imagetags.RENDITION_LOCK_DIR, True)
+
+	def test_index(self):
+		filename, miniature_filename, miniature_dir, miniature_url = imagetags.determine_resized_image_paths(self.source_url, '100')
+		self.failIf(imagetags.rendition_is_current(filename, miniature_filename))
+
+		self.failUnlessEqual(imagetags.thumbnail(self.source_url, '100w'), miniature_url)
+		self.failUnless(os.path.exists(miniature_filename))
+		self.failUnless(miniature_filename in imagetags._rendition_index)
+		self.failUnlessEqual(Image.open(miniature_filename).size, (100, 75))
+
+		# a known rendition is answered from the index, even if the disk changes underneath it
+		os.unlink(miniature_filename)
+		self.failUnless(imagetags.rendition_is_current(filename, miniature_filename))
+
+		# once the index entry is too old the disk is checked again
+		source_mtime, checked = imagetags._rendition_index[miniature_filename]
+		imagetags._rendition_index[miniature_filename] = (source_mtime, checked - imagetags.RENDITION_CHECK_SECONDS)
+		self.failIf(imagetags.rendition_is_current(filename, miniature_filename))
+		self.failIf(miniature_filename in imagetags._rendition_index)
+
+		# a source which is newer than its rendition causes the rendition to be regenerated
+		self.failUnlessEqual(imagetags.thumbnail(self.source_url, '100w'), miniature_url)
+		os.utime(miniature_filename, (time.time() - 100, time.time() - 100))
+		imagetags.forget_rendition(miniature_filename)
+		self.failIf(imagetags.rendition_is_current(filename, miniature_filename))
+		self.failIf(os.path.exists(miniature_filename))
+		self.failUnlessEqual(imagetags.thumbnail(self.source_url, '100w'), miniature_url)
+		self.failUnless(imagetags.rendition_is_current(filename, miniature_filename))
+
+		# a replaced source is noticed even while the index entry is fresh
+		Image.new('RGB', (200, 300), (0, 255, 0)).save(self.source_path, 'JPEG')
+		os.utime(self.source_path, (time.time() + 10, time.time() + 10))
+		self.failIf(imagetags.rendition_is_current(filename, miniature_filename))
+		self.failIf(os.path.exists(miniature_filename))
+		self.failUnlessEqual(imagetags.thumbnail(self.source_url, '100w'), miniature_url)
+		self.failUnlessEqual(Image.open(miniature_filename).size, (100, 150))
+
+	def test_concurrent_generation(self):
+		filename, miniature_filename, miniature_dir, miniature_url = imagetags.determine_resized_image_paths(self.source_url, 'fit_50x50')
+		renders = []
+		def counting_fit(file_path, max_width, max_height, save_as):
+			renders.append(save_as)
+			time.sleep(0.1)
+			return imagetags.fit(file_path, max_width, max_height, save_as)
+
+		threads = [threading.Thread(target=imagetags.generate_rendition, args=(filename, miniature_filename, miniature_dir, counting_fit, 50, 50)) for i in range(8)]
+		for thread in threads: thread.start()
+		for thread in threads: thread.join()
+		self.failUnlessEqual(len(renders), 1)
+		self.failIfEqual(renders[0], miniature_filename) # it was written to a temp file and renamed
+		self.failIf(os.path.exists(renders[0]))
+		self.failUnlessEqual(Image.open(miniature_filename).size, (50, 37))
+		self.failUnlessEqual(imagetags.fit_image(self.source_url, '50x50'), miniature_url)
+		self.failUnlessEqual(len(renders), 1)
+		# the lock files are kept apart from the miniatures, one for each lock
+		self.failIf([name for name in os.listdir(miniature_dir) if name.endswith('.lock')])
+		self.failUnlessEqual(os.listdir(imagetags.RENDITION_LOCK_DIR), [os.path.basename(imagetags.rendition_lock_filename(miniature_filename))])
+
+	def test_source_without_extension(self):
+		source_path = os.path.join(self.source_dir, 'no_extension')
+		shutil.copy(self.source_path, source_path)
+		source_url = '%s%s/no_extension' % (settings.MEDIA_URL, TEST_IMAGE_DIR)
+		filename, miniature_filename, miniature_dir, miniature_url = imagetags.determine_resized_image_paths(source_url, '100')
+		self.failUnlessEqual(imagetags.thumbnail(source_url, '100w'), miniature_url)
+		self.failUnlessEqual(Image.open(miniature_filename).format, 'JPEG')
@@ -0,0 +1,32 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+import traceback
+
+from django.conf import settings
+from django.http import HttpResponse, Http404, HttpResponseServerError, HttpResponseBadRequest
+from django.shortcuts import get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
+
+from models import IBootDevice
+from art_server.hydration import dehydrate_to_list_xml
+from iboot_state import get_iboot_statuses, power_iboots
+from iboot_fleet import POWER_ACTIONS
+
+@staff_member_required
+def iboots(request):
+	"""Returns the cached status of every iBoot, or of those whose ids are in the id parameters.
+	POST an action of on, off, or cycle with the ids of the iBoots to run it on them at once; each status then says whether its iBoot did it.
+	The ids are required for a POST so a missing parameter can't switch every iBoot."""
+	devices = IBootDevice.objects.all()
+	ids = request.REQUEST.getlist('id')
+	if ids:
+		try:
+			devices = devices.filter(id__in=[int(id) for id in ids])
+		except ValueError:
+			return HttpResponseBadRequest('The ids must be numbers')
+	devices = list(devices)
+	command_results = {}
+	if request.method == 'POST' and request.POST.get('action', None):
+		if request.POST.get('action') not in POWER_ACTIONS: return HttpResponseBadRequest('Unknown action: %s' % request.POST.get('action'))
+		if not ids: return HttpResponseBadRequest('POST the id of each iBoot to %s' % request.POST.get('action'))
+		command_results = power_iboots(devices, request.POST.get('action'))
+	return HttpResponse(dehydrate_to_list_xml(get_iboot_statuses(devices, command_results)), content_type="text/xml")
@@ -1,58 +1,145 @@
 # Copyright 2009 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
 """A control library for Dataprobe iBoot Network Attached Remote Power Controllers.
-	The TCP protocol is passed over the same port as the iBoot uses for HTTP, which defaults to 80."""
-import telnetlib
-import pprint
-import traceback
+	The TCP protocol is passed over the same port as the iBoot uses for HTTP, which defaults to 80.
+	An iBoot answers each command with a single word (ON, OFF, BUSY, or CYCLE) and usually hangs up, but the answer may arrive in pieces,
+	so read_response collects it until it is complete instead of trusting the first recv."""
+import time
+import select
 import socket
+import logging
+
+def parse_response(buffer):
+	"""Returns the answer at the start of buffer once it is complete, or None if more is to come.
+	The answers are single words, none of which begins another, so a known answer is complete as soon as it arrives.
+	Anything else is complete at the end of its line."""
+	text = buffer.lstrip()
+	if text.strip() in IBootControl.RESPONSES: return text.strip()
+	for terminator in ('\r', '\n'):
+		if terminator in text: return text.split(terminator, 1)[0].strip()
+	return None
 
 class IBootControl:
 	"""A control object for Dataprobe's iBoot network attached remote power controller"""
-	def __init__(self,  password, host, port=80):
-		"""The port should be the telnet port, not the http or heartbeat port"""
+	QUERY = 'q'
+	TURN_ON = 'n'
+	TURN_OFF = 'f'
+	CYCLE = 'c'
+
+	ON = 'ON'
+	OFF = 'OFF'
+	BUSY = 'BUSY'
+	CYCLE_RESPONSE = 'CYCLE'
+	RESPONSES = (ON, OFF, BUSY, CYCLE_RESPONSE)
+
+	def __init__(self,  password, host, port=80, status_port=None, timeout=15):
+		"""The port should be the telnet port, not the http or heartbeat port.
+		If the iBoot answers queries on a second port, such as its heartbeat port, pass it as status_port and the queries will go there."""
 		self.password = password
 		self.host = host
 		self.port = port
+		self.status_port = status_port
+		self.timeout = timeout
+		self.last_latency = None # the seconds the last call took, or None if it failed
 
 	def query_iboot_state(self):
 		"""Returns True if it is on, False if it is off, None if it could not be reached"""
-		result = self.send_command('q')
-		if result == None or result == 'BUSY': return None
-		return result == 'ON'
+		result = self.send_command(IBootControl.QUERY, self.status_port or self.port)
+		if result == None or result == IBootControl.BUSY: return None
+		return result == IBootControl.ON
 
 	def toggle(self):
-		state = self.query_iboot_state()
-		if state == None: return None
-		if state:
-			return self.turn_off()
-		else:
-			return self.turn_on()
+		"""Queries the iBoot and turns it off if it is on or on if it is off.
+		The second command reuses the query's connection if the iBoot leaves it open, otherwise it reconnects.
+		Returns True if the iBoot did it, False if it refused, or None if it could not be reached."""
+		start = time.time()
+		self.last_latency = None
+		sock = None
+		try:
+			sock = self.connect(self.port)
+			state = self.exchange(sock, IBootControl.QUERY)
+			if state not in (IBootControl.ON, IBootControl.OFF): return None
+			if state == IBootControl.ON:
+				command, expected = IBootControl.TURN_OFF, IBootControl.OFF
+			else:
+				command, expected = IBootControl.TURN_ON, IBootControl.ON
+			result = None
+			if self.is_open(sock):
+				try:
+					result = self.exchange(sock, command)
+				except socket.error:
+					pass
+			if result == None:
+				# the iBoot hung up rather than answer on the same connection, and turning on or off twice does no harm, so send it again
+				sock.close()
+				sock = self.connect(self.port)
+				result = self.exchange(sock, command)
+			if result == None: return None
+			self.last_latency = time.time() - start
+			return result == expected
+		except (socket.error, socket.timeout), e:
+			logging.error('Could not toggle the iBoot at %s:%s: %s' % (self.host, self.port, e))
+			return None
+		finally:
+			if sock: sock.close()
 
-	def turn_on(self): return self.send_command('n') == 'ON'
+	def turn_on(self): return self.send_command(IBootControl.TURN_ON) == IBootControl.ON
 
-	def turn_off(self): return self.send_command('f') == 'OFF'
+	def turn_off(self): return self.send_command(IBootControl.TURN_OFF) == IBootControl.OFF
 
-	def cycle_power(self): return self.send_command('c') == 'CYCLE'
+	def cycle_power(self): return self.send_command(IBootControl.CYCLE) == IBootControl.CYCLE_RESPONSE
 
-	def send_command(self, command):
+	def send_command(self, command, port=None):
 		"Sends a command to the device.  Returns the result code or None if it can't control the device."
+		start = time.time()
+		self.last_latency = None
+		sock = None
+		try:
+			sock = self.connect(port or self.port)
+			result = self.exchange(sock, command)
+			if result != None: self.last_latency = time.time() - start
+			return result
+		except (socket.error, socket.timeout), e:
+			logging.error('Could not send %s to the iBoot at %s:%s: %s' % (command, self.host, port or self.port, e))
+			return None
+		finally:
+			if sock: sock.close()
+
+	def connect(self, port):
 		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		sock.settimeout(15)
+		sock.settimeout(self.timeout)
 		try:
-			sock.connect((self.host, self.port))
-			msg = self.format_command(command)
-			sock.send(msg)
-			value = sock.recv(1024)
-			if value == '': 
-				sock.close()
-				return None
-			sock.close()
-			return value
+			sock.connect((self.host, port))
 		except:
-			print pprint.pformat(traceback.format_exc()) 
-		sock.close()
-		return None
+			sock.close()
+			raise
+		return sock
+
+	def exchange(self, sock, command):
+		"""Sends the command on the connected socket and returns the answer, or None if the iBoot hung up without answering"""
+		sock.sendall(self.format_command(command))
+		return self.read_response(sock)
+
+	def read_response(self, sock):
+		"""Reads until parse_response finds a complete answer or the iBoot hangs up, raising socket.timeout if it takes more than timeout seconds"""
+		deadline = time.time() + self.timeout
+		buffer = ''
+		while True:
+			response = parse_response(buffer)
+			if response != None: return response
+			remaining = deadline - time.time()
+			if remaining <= 0: raise socket.timeout('No complete response within %s seconds' % self.timeout)
+			sock.settimeout(remaining)
+			data = sock.recv(1024)
+			if not data: return buffer.strip() or None
+			buffer += data
+
+	def is_open(self, sock):
+		"""Returns False if the iBoot has hung up on the socket"""
+		try:
+			if not select.select([sock], [], [], 0)[0]: return True
+			return sock.recv(1, socket.MSG_PEEK) != ''
+		except socket.error:
+			return False
 
 	def format_command(self, action):
 		return '\x1b%s\x1b%s\x0d' % (self.password, action)
-
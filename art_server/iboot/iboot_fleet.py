@@ -0,0 +1,170 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""Sends iBoot commands to many devices at once.
+
+Each IBootExchange is a non-blocking conversation with one iBoot (connect, send the command, read the answer) like the one IBootControl has.
+run_exchanges multiplexes the exchanges with select in the calling thread, keeping no more than concurrency connections open
+and giving each device its own deadline, so one iBoot which is down doesn't hold up the rest.
+"""
+import time
+import errno
+import socket
+import select
+import logging
+
+from iboot_control import IBootControl, parse_response
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 5
+
+class IBootExchange:
+	"""Sends one command to one iBoot.  When the exchange is done either error is set or response holds the iBoot's answer
+	and latency holds the seconds from connecting to the answer."""
+	CONNECTING = 'connecting'
+	SENDING = 'sending'
+	RECEIVING = 'receiving'
+	DONE = 'done'
+
+	def __init__(self, key, host, port, password, command, timeout=DEFAULT_TIMEOUT):
+		self.key = key
+		self.host = host
+		self.port = port
+		self.password = password
+		self.command = command
+		self.timeout = timeout
+		self.sock = None
+		self.state = None
+		self.deadline = None
+		self.write_buffer = IBootControl(password, host, port).format_command(command)
+		self.read_buffer = ''
+		self.started = None
+		self.response = None
+		self.latency = None
+		self.error = None
+
+	def fileno(self): return self.sock.fileno()
+
+	def is_done(self): return self.state == IBootExchange.DONE
+
+	def wants_write(self): return self.state == IBootExchange.CONNECTING or self.state == IBootExchange.SENDING
+
+	def start(self):
+		self.started = time.time()
+		self.deadline = self.started + self.timeout
+		try:
+			if not self.host: raise socket.error('The iBoot has no address')
+			address = socket.getaddrinfo(self.host, self.port, socket.AF_INET, socket.SOCK_STREAM)[0][4]
+			self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			self.sock.setblocking(0)
+			result = self.sock.connect_ex(address)
+			if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK): raise socket.error(result, errno.errorcode.get(result, 'connect failed'))
+			self.state = IBootExchange.CONNECTING
+		except Exception, e:
+			self.finish(e)
+
+	def finish(self, error=None):
+		self.error = error
+		self.state = IBootExchange.DONE
+		if self.sock:
+			try:
+				self.sock.close()
+			except socket.error:
+				pass
+			self.sock = None
+
+	def answered(self, response):
+		self.response = response
+		self.latency = time.time() - self.started
+		self.finish()
+
+	def check_deadline(self, now):
+		if now >= self.deadline: self.finish(socket.timeout('No response from %s:%s within %s seconds' % (self.host, self.port, self.timeout)))
+
+	def on_writable(self):
+		try:
+			if self.state == IBootExchange.CONNECTING:
+				result = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+				if result != 0: raise socket.error(result, errno.errorcode.get(result, 'connect failed'))
+				self.state = IBootExchange.SENDING
+			sent = self.sock.send(self.write_buffer)
+			self.write_buffer = self.write_buffer[sent:]
+			if len(self.write_buffer) == 0: self.state = IBootExchange.RECEIVING
+		except Exception, e:
+			self.finish(e)
+
+	def on_readable(self):
+		try:
+			data = self.sock.recv(1024)
+			if not data:
+				# the iBoot hangs up after answering, so whatever it sent is its answer
+				if not self.read_buffer.strip(): raise socket.error('%s:%s closed the connection without answering' % (self.host, self.port))
+				self.answered(self.read_buffer.strip())
+				return
+			self.read_buffer += data
+			response = parse_response(self.read_buffer)
+			if response != None: self.answered(response)
+		except Exception, e:
+			self.finish(e)
+
+def run_exchanges(exchanges, concurrency=DEFAULT_CONCURRENCY):
+	"""Runs the exchanges with up to concurrency connections open at once and returns them once all are done"""
+	waiting = list(exchanges)
+	waiting.reverse()
+	active = []
+	while waiting or active:
+		while waiting and len(active) < concurrency:
+			exchange = waiting.pop()
+			exchange.start()
+			if not exchange.is_done(): active.append(exchange)
+		if not active: continue
+
+		now = time.time()
+		timeout = max(0, min([exchange.deadline for exchange in active]) - now)
+		readers = [exchange for exchange in active if not exchange.wants_write()]
+		writers = [exchange for exchange in active if exchange.wants_write()]
+		readable, writable, errored = select.select(readers, writers, [], timeout)
+		for exchange in writable: exchange.on_writable()
+		for exchange in readable: exchange.on_readable()
+
+		now = time.time()
+		for exchange in active:
+			if not exchange.is_done(): exchange.check_deadline(now)
+		active = [exchange for exchange in active if not exchange.is_done()]
+	return exchanges
+
+def run_iboot_commands(devices, command, password, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, use_status_port=False):
+	"""Sends the command to each IBootDevice and returns a map of device id to its finished IBootExchange.
+	If use_status_port is True the devices with a status_port are sent the command there."""
+	def port(device):
+		if use_status_port and device.status_port: return device.status_port
+		return device.port
+	results = {}
+	for exchange in run_exchanges([IBootExchange(device.id, device.ip, port(device), password, command, timeout) for device in devices], concurrency):
+		if exchange.error: logging.error('Could not communicate with iBoot %s: %s' % (exchange.key, exchange.error))
+		results[exchange.key] = exchange
+	return results
+
+def exchange_state(exchange):
+	"""Returns True if the finished query exchange found its iBoot on, False if off, or None if it could not be reached, as IBootControl.query_iboot_state does"""
+	if exchange.error or exchange.response == IBootControl.BUSY: return None
+	return exchange.response == IBootControl.ON
+
+def query_exchanges(devices, password, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+	"""Queries each device on its status port if it has one, returning a map of device id to its finished IBootExchange"""
+	return run_iboot_commands(devices, IBootControl.QUERY, password, concurrency, timeout, use_status_port=True)
+
+def query_all(devices, password, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+	"""Returns a map of device id to True if it is on, False if it is off, or None if it could not be reached"""
+	return dict([(key, exchange_state(exchange)) for key, exchange in query_exchanges(devices, password, concurrency, timeout).items()])
+
+# The command for each bulk action and the answer which means the iBoot did it
+POWER_ACTIONS = {
+	'on':(IBootControl.TURN_ON, IBootControl.ON),
+	'off':(IBootControl.TURN_OFF, IBootControl.OFF),
+	'cycle':(IBootControl.CYCLE, IBootControl.CYCLE_RESPONSE),
+}
+
+def power_all(devices, action, password, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+	"""Runs the action ('on', 'off', or 'cycle') on every device and returns a map of device id to True if the iBoot did it"""
+	command, expected = POWER_ACTIONS[action]
+	exchanges = run_iboot_commands(devices, command, password, concurrency, timeout)
+	return dict([(key, exchange.error == None and exchange.response == expected) for key, exchange in exchanges.items()])
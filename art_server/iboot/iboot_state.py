@@ -0,0 +1,101 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""A cache of the power state of each iBoot.
+
+The IBootPollTask queries every iBoot at once in the background (see iboot_fleet) and the views serve from the cache instead of waiting on the devices.
+When the cached state is older than IBOOT_STATE_MAX_AGE seconds it is still served, but a refresh is started in a background thread.
+The cache lives in the CACHE_BACKEND, so it needs to be shared (e.g. memcached) for the scheduler's polls to reach the web workers.
+"""
+import datetime
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+import iboot_fleet
+
+STATE_CACHE_PREFIX = 'iboot-state-'
+
+class IBootState:
+	"""An iBoot's power as of fetched: is_on is True or False, or None if it couldn't be reached.  latency is the seconds the query took."""
+	def __init__(self, is_on, latency=None):
+		self.is_on = is_on
+		self.latency = latency
+		self.fetched = datetime.datetime.now()
+		self.age = 0
+
+	@property
+	def reachable(self): return self.is_on != None
+
+class IBootStatus:
+	"""An iBoot's identity, its cached IBootState (if any) and the result of a bulk command, for dehydration"""
+	def __init__(self, device, state, command_ok=None):
+		self.id = device.id
+		self.name = device.name
+		self.is_on = state and state.is_on
+		self.reachable = state != None and state.reachable
+		self.fetched = state and state.fetched
+		self.age = state and state.age
+		self.latency = state and state.latency
+		self.command_ok = command_ok
+
+	@property
+	def command_description(self):
+		if self.command_ok == None: return ''
+		return self.command_ok and 'done' or 'failed'
+
+	class HydrationMeta:
+		attributes = ['id', 'name', 'is_on', 'reachable', 'fetched', 'age', 'latency', 'command_ok']
+
+def max_age(): return getattr(settings, 'IBOOT_STATE_MAX_AGE', 60)
+
+def state_cache_key(device_id): return '%s%s' % (STATE_CACHE_PREFIX, device_id)
+
+def cached_iboot_state(device):
+	"""Returns the cached IBootState with its age set, or None if there is none"""
+	state = cache.get(state_cache_key(device.id))
+	if state == None: return None
+	delta = datetime.datetime.now() - state.fetched
+	state.age = delta.days * 86400 + delta.seconds
+	return state
+
+def store_iboot_state(device_id, state):
+	cache.set(state_cache_key(device_id), state, getattr(settings, 'IBOOT_STATE_CACHE_SECONDS', 24 * 60 * 60))
+
+def poll_iboots(devices, concurrency=iboot_fleet.DEFAULT_CONCURRENCY, timeout=iboot_fleet.DEFAULT_TIMEOUT):
+	"""Queries the iBoots concurrently and caches their states, returning a map of device id to IBootState"""
+	states = {}
+	for device_id, exchange in iboot_fleet.query_exchanges(devices, settings.IBOOT_POWER_PASSWORD, concurrency=concurrency, timeout=timeout).items():
+		states[device_id] = IBootState(iboot_fleet.exchange_state(exchange), exchange.latency)
+		store_iboot_state(device_id, states[device_id])
+	return states
+
+def get_iboot_states(devices, concurrency=iboot_fleet.DEFAULT_CONCURRENCY, timeout=iboot_fleet.DEFAULT_TIMEOUT):
+	"""Returns a map of device id to IBootState, from the cache where there are entries.
+	iBoots without a cache entry are polled concurrently and stale entries are refreshed in a background thread."""
+	states = {}
+	missing = []
+	stale = []
+	for device in devices:
+		states[device.id] = cached_iboot_state(device)
+		if states[device.id] == None:
+			missing.append(device)
+		elif states[device.id].age > max_age():
+			stale.append(device)
+	if missing: states.update(poll_iboots(missing, concurrency, timeout))
+	if stale:
+		thread = threading.Thread(target=poll_iboots, args=(stale, concurrency, timeout))
+		thread.setDaemon(True)
+		thread.start()
+	return states
+
+def get_iboot_statuses(devices, command_results={}):
+	"""Returns an IBootStatus for each device, from get_iboot_states"""
+	states = get_iboot_states(devices)
+	return [IBootStatus(device, states.get(device.id, None), command_results.get(device.id, None)) for device in devices]
+
+def power_iboots(devices, action, concurrency=iboot_fleet.DEFAULT_CONCURRENCY, timeout=iboot_fleet.DEFAULT_TIMEOUT):
+	"""Runs the bulk action ('on', 'off', or 'cycle') on the iBoots concurrently, then refreshes their cached states.
+	Returns a map of device id to True if the iBoot did it."""
+	results = iboot_fleet.power_all(devices, action, settings.IBOOT_POWER_PASSWORD, concurrency=concurrency, timeout=timeout)
+	poll_iboots(devices, concurrency, timeout)
+	return results
@@ -0,0 +1,44 @@
+
+from south.db import db
+from django.db import models
+from art_server.iboot.models import *
+
+class Migration:
+    
+    def forwards(self, orm):
+        
+        # Adding field 'IBootDevice.status_port'
+        db.add_column('iboot_ibootdevice', 'status_port', orm['iboot.ibootdevice:status_port'])
+        
+    
+    
+    def backwards(self, orm):
+        
+        # Deleting field 'IBootDevice.status_port'
+        db.delete_column('iboot_ibootdevice', 'status_port')
+        
+    
+    
+    models = {
+        'iboot.ibootdevice': {
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ip': ('django.db.models.fields.IPAddressField', [], {'max_length': '15', 'null': 'True'}),
+            'mac_address': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'port': ('django.db.models.fields.IntegerField', [], {'default': '80'}),
+            'status_port': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'iboot.ibootevent': {
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True', 'blank': 'True'}),
+            'command': ('django.db.models.fields.CharField', [], {'default': "'cycle'", 'max_length': '12'}),
+            'days': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'device': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['iboot.IBootDevice']"}),
+            'hours': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_run': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'minutes': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '120', 'null': 'True', 'blank': 'True'}),
+            'tries': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        }
+    }
+    
+    complete_apps = ['iboot']
@@ -35,6 +35,8 @@ class IBootDevice(models.Model):
 	name = models.CharField(max_length=1024, null=False, blank=False)
 	mac_address = models.CharField(max_length=1024, null=False, blank=False, help_text="e.g. 00-0D-AD-01-94-6F")
 	ip = models.IPAddressField(blank=False, null=True)
+	port = models.IntegerField(null=False, blank=False, default=80, help_text="The iBoot's HTTP port, which also carries its TCP protocol")
+	status_port = models.IntegerField(null=True, blank=True, help_text="A second port on which the iBoot answers status queries, e.g. its heartbeat port, or blank to query on the port above")
 	@models.permalink
 	def get_absolute_url(self): return ('iboot.views.iboot', (), { 'id':self.id })
 	def __unicode__(self): return '%s' % self.name
@@ -52,7 +54,7 @@ class IBootEvent(EventModel):
 
 	def execute(self):
 		try:
-			control = IBootControl(settings.IBOOT_POWER_PASSWORD, self.device.ip)
+			control = IBootControl(settings.IBOOT_POWER_PASSWORD, self.device.ip, self.device.port, self.device.status_port)
 			print 'running ', self
 			if self.command == 'cycle':
 				control.cycle_power()
@@ -15,3 +15,13 @@ class IBootEventTask(Task):
 		from models import IBootEvent
 		for event in IBootEvent.objects.all():
 			if event.due_for_execution(): event.execute()
+
+class IBootPollTask(Task):
+	"""The task which refreshes the cached power state of every iBoot."""
+	def __init__(self, loopdelay=60, initdelay=5):
+		Task.__init__(self, self.do_it, loopdelay, initdelay)
+
+	def do_it(self):
+		from models import IBootDevice
+		from iboot_state import poll_iboots
+		poll_iboots(IBootDevice.objects.all())
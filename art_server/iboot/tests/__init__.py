@@ -0,0 +1,5 @@
+"""Tests for the iboot module"""
+from django.conf import settings
+
+from test_iboot import *
+if getattr(settings, 'RUN_BENCHMARKS', False): from benchmark_iboot import *
\ No newline at end of file
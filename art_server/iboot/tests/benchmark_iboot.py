@@ -0,0 +1,76 @@
+"""Benchmarks of the iBoot client against a fleet of mock iBoots.
+
+They only run when RUN_BENCHMARKS is True in the settings, on a small fleet.  Set IBOOT_BENCHMARK_DEVICES (e.g. 200) and IBOOT_BENCHMARK_LATENCY (seconds per answer)
+in the settings to measure a realistic installation.  Each timing is written to stderr as a 'benchmark' line.
+"""
+import sys
+import time
+
+from django.conf import settings
+from django.test import TestCase
+from django.core.cache import cache
+
+from iboot.models import *
+from iboot import iboot_fleet
+from iboot.iboot_control import IBootControl
+from iboot.iboot_state import poll_iboots
+from iboot.tests.mock_iboot import MockIBootFleet
+
+def report(name, size, seconds):
+	sys.stderr.write('benchmark %-40s %5s iboots %8.3f seconds\n' % (name, size, seconds))
+
+class IBootBenchmark(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.fleets = []
+
+	def tearDown(self):
+		for fleet in self.fleets: fleet.stop()
+
+	def start_fleet(self, keep_alive=False):
+		fleet = MockIBootFleet(getattr(settings, 'IBOOT_BENCHMARK_DEVICES', 20), password=settings.IBOOT_POWER_PASSWORD, latency=getattr(settings, 'IBOOT_BENCHMARK_LATENCY', 0.005), keep_alive=keep_alive)
+		fleet.start()
+		self.fleets.append(fleet)
+		return fleet, fleet.create_iboots()
+
+	def timed(self, name, size, function, *args, **kwargs):
+		start = time.time()
+		result = function(*args, **kwargs)
+		report(name, size, time.time() - start)
+		return result
+
+	def controls(self, entries): return [IBootControl(settings.IBOOT_POWER_PASSWORD, entry.ip, entry.port, timeout=5) for entry in entries]
+
+	def test_query(self):
+		fleet, entries = self.start_fleet()
+		controls = self.controls(entries)
+		results = self.timed('IBootControl queries, one at a time', len(fleet), lambda: [control.query_iboot_state() for control in controls])
+		self.failUnlessEqual(results, [False] * len(fleet))
+		latencies = [control.last_latency for control in controls]
+		report('IBootControl mean latency', len(fleet), sum(latencies) / len(latencies))
+		report('IBootControl max latency', len(fleet), max(latencies))
+
+		states = self.timed('poll_iboots', len(fleet), poll_iboots, entries)
+		self.failUnlessEqual([states[entry.id].is_on for entry in entries], [False] * len(fleet))
+		latencies = [state.latency for state in states.values()]
+		report('poll_iboots mean latency', len(fleet), sum(latencies) / len(latencies))
+		report('poll_iboots max latency', len(fleet), max(latencies))
+
+	def test_toggle(self):
+		fleet, entries = self.start_fleet()
+		results = self.timed('toggle, reconnecting', len(fleet), lambda: [control.toggle() for control in self.controls(entries)])
+		self.failUnlessEqual(results, [True] * len(fleet))
+		self.failUnlessEqual(fleet.connection_count(), len(fleet) * 2)
+
+		fleet, entries = self.start_fleet(keep_alive=True)
+		results = self.timed('toggle, one connection', len(fleet), lambda: [control.toggle() for control in self.controls(entries)])
+		self.failUnlessEqual(results, [True] * len(fleet))
+		self.failUnlessEqual(fleet.connection_count(), len(fleet))
+		self.failUnlessEqual(fleet.power_states(), [True] * len(fleet))
+
+	def test_power_all(self):
+		fleet, entries = self.start_fleet()
+		for action, is_on in (('on', True), ('off', False), ('cycle', True)):
+			results = self.timed('power_all %s' % action, len(fleet), iboot_fleet.power_all, entries, action, settings.IBOOT_POWER_PASSWORD)
+			self.failUnlessEqual(results.values(), [True] * len(fleet))
+			self.failUnlessEqual(fleet.power_states(), [is_on] * len(fleet))
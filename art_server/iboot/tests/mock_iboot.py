@@ -0,0 +1,181 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""Simulated iBoots for the tests.
+
+A MockIBoot serves each client connection in its own thread, answering one command ('\\x1bpassword\\x1bX\\r') and hanging up as an iBoot does,
+or answering commands until the client hangs up if keep_alive is set.  It can be slowed down (latency), made to send its answers a byte at a time (fragment),
+given a status port which only answers queries, or made to fail in one of the FAILURE_MODES.  A MockIBootFleet runs many of them on localhost at once.
+"""
+import time
+import select
+import socket
+import threading
+
+from iboot.models import IBootDevice
+from iboot.iboot_control import IBootControl
+
+REFUSE = 'refuse' # close each connection as soon as it is accepted
+SILENT = 'silent' # accept connections but never send a byte
+FAILURE_MODES = (REFUSE, SILENT)
+
+class MockIBoot(threading.Thread):
+	"""This creates a localhost server socket which speaks the iBoot TCP protocol"""
+	def __init__(self, password='iboot', latency=0, failure=None, keep_alive=False, fragment=False, status_port=False):
+		self.backlog = 32
+		self.buffer_size = 1024
+		self.server = None
+		self.status_server = None
+		self.running = False
+		self.stopped = False
+		self.port = 0 # 0 indicates that the server should use any open socket
+
+		self.password = password
+		self.is_on = False
+		self.latency = latency # seconds to wait before each response
+		self.failure = failure # None or one of the FAILURE_MODES
+		self.keep_alive = keep_alive
+		self.fragment = fragment
+		self.has_status_port = status_port
+
+		self.connection_count = 0
+		self.command_count = 0
+		self.status_query_count = 0
+		self.lock = threading.Lock()
+
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def stop_server(self):
+		self.stopped = True
+		self.running = False
+		if self.server: self.server.close()
+		if self.status_server: self.status_server.close()
+
+	def wait_until_running(self, seconds_to_wait=5):
+		deadline = time.time() + seconds_to_wait
+		while self.running == False and time.time() < deadline: time.sleep(0.01)
+		return self.running
+
+	def address(self): return self.server.getsockname()
+
+	def status_address(self): return self.status_server.getsockname()
+
+	def run(self):
+		if self.running or self.stopped: return
+		self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.server.bind(('127.0.0.1', self.port))
+		self.server.listen(self.backlog)
+		servers = [self.server]
+		if self.has_status_port:
+			self.status_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			self.status_server.bind(('127.0.0.1', 0))
+			self.status_server.listen(self.backlog)
+			servers.append(self.status_server)
+		self.running = not self.stopped
+		while self.running:
+			try:
+				readable = select.select(servers, [], [], 0.1)[0]
+				if not readable: continue
+				server = readable[0]
+				client, address = server.accept()
+			except (select.error, socket.error):
+				if self.running: continue
+				break
+			self.connection_count += 1
+			if self.failure == REFUSE:
+				client.close()
+				continue
+			thread = threading.Thread(target=self._serve_client, args=(client, server is self.status_server))
+			thread.setDaemon(True)
+			thread.start()
+		for server in servers:
+			try:
+				server.close()
+			except socket.error:
+				pass
+
+	def _serve_client(self, client, status_only=False):
+		try:
+			if self.failure == SILENT:
+				while self.running and client.recv(self.buffer_size): pass
+			else:
+				while self.running:
+					if not self._serve_command(client, status_only): break
+					if not self.keep_alive: break
+		except socket.error:
+			pass
+		client.close()
+
+	def _read_command(self, client):
+		"""Returns the command letter, or None if the password is wrong or the client hangs up first.
+		The clients send one command and wait for its answer, so nothing is read past the carriage return."""
+		buffer = ''
+		while not buffer.endswith('\r'):
+			data = client.recv(1)
+			if not data: return None
+			buffer += data
+		fields = buffer[:-1].split('\x1b')
+		if len(fields) != 3 or fields[1] != self.password: return None
+		return fields[2]
+
+	def answer(self, command):
+		"""Carries out the command and returns the iBoot's answer"""
+		if command == IBootControl.TURN_ON:
+			self.is_on = True
+		elif command == IBootControl.TURN_OFF:
+			self.is_on = False
+		elif command == IBootControl.CYCLE:
+			self.is_on = True
+			return IBootControl.CYCLE_RESPONSE
+		elif command != IBootControl.QUERY:
+			return None
+		return self.is_on and IBootControl.ON or IBootControl.OFF
+
+	def _serve_command(self, client, status_only=False):
+		"""Answers one command, returning False if the client should be hung up on"""
+		command = self._read_command(client)
+		if command == None: return False
+		if status_only and command != IBootControl.QUERY: return False
+		self.lock.acquire()
+		try:
+			self.command_count += 1
+			if status_only: self.status_query_count += 1
+			response = self.answer(command)
+		finally:
+			self.lock.release()
+		if self.latency: time.sleep(self.latency)
+		if response == None: return False
+		if self.fragment:
+			for character in response:
+				client.sendall(character)
+				time.sleep(0.01)
+		else:
+			client.sendall(response)
+		return True
+
+class MockIBootFleet:
+	"""Runs count MockIBoots on localhost"""
+	def __init__(self, count, password='iboot', latency=0, keep_alive=False):
+		self.password = password
+		self.iboots = [MockIBoot(password, latency, keep_alive=keep_alive) for i in range(count)]
+		self.entries = []
+
+	def __len__(self): return len(self.iboots)
+
+	def start(self):
+		for iboot in self.iboots: iboot.start()
+		for iboot in self.iboots: iboot.wait_until_running()
+
+	def stop(self):
+		for iboot in self.iboots: iboot.stop_server()
+
+	def create_iboots(self, name_prefix='Mock iBoot'):
+		"""Creates and returns an IBootDevice for each mock iBoot, in the same order"""
+		self.entries = []
+		for index, iboot in enumerate(self.iboots):
+			host, port = iboot.address()
+			self.entries.append(IBootDevice.objects.create(name='%s %s' % (name_prefix, index), mac_address='00-0D-AD-00-00-%02X' % index, ip=host, port=port))
+		return self.entries
+
+	def connection_count(self): return sum([iboot.connection_count for iboot in self.iboots])
+
+	def power_states(self): return [iboot.is_on for iboot in self.iboots]
@@ -0,0 +1,177 @@
+from django.test import TestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.test.client import Client
+from django.contrib.auth.models import User
+import time
+import socket
+import datetime
+
+from iboot.models import *
+from iboot import iboot_fleet, iboot_state
+from iboot.iboot_state import get_iboot_states, get_iboot_statuses, cached_iboot_state, state_cache_key, poll_iboots, power_iboots
+from iboot.iboot_control import IBootControl, parse_response
+from iboot.tests.mock_iboot import MockIBoot, MockIBootFleet, REFUSE, SILENT
+
+class IBootFleetTest(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.fleet = MockIBootFleet(6, password=settings.IBOOT_POWER_PASSWORD, latency=0.2)
+		self.fleet.start()
+		self.entries = self.fleet.create_iboots()
+		self.down_entry = IBootDevice.objects.create(name='Down', mac_address='00-0D-AD-00-00-FF', ip='127.0.0.1', port=1)
+
+	def tearDown(self):
+		self.fleet.stop()
+
+	def test_fleet(self):
+		self.fleet.iboots[1].is_on = True
+		start = time.time()
+		results = iboot_fleet.query_all(self.entries + [self.down_entry], settings.IBOOT_POWER_PASSWORD, timeout=2)
+		self.failUnless(time.time() - start < 1, 'the slow iBoots were queried one after another') # 6 x 0.2 seconds if they were serial
+		self.failUnlessEqual(results[self.entries[0].id], False)
+		self.failUnlessEqual(results[self.entries[1].id], True)
+		self.failUnlessEqual(results[self.down_entry.id], None)
+
+		results = iboot_fleet.power_all(self.entries[:3], 'on', settings.IBOOT_POWER_PASSWORD, timeout=2)
+		self.failUnlessEqual(results.values(), [True, True, True])
+		self.failUnlessEqual(self.fleet.power_states(), [True, True, True, False, False, False])
+		self.failUnlessEqual(iboot_fleet.power_all(self.entries[3:4], 'cycle', settings.IBOOT_POWER_PASSWORD, timeout=2), { self.entries[3].id:True })
+
+		# a bad password or a silent iBoot fails that iBoot alone
+		self.fleet.iboots[4].password = 'badPassword'
+		self.fleet.iboots[5].failure = SILENT
+		start = time.time()
+		results = iboot_fleet.power_all(self.entries, 'off', settings.IBOOT_POWER_PASSWORD, timeout=1)
+		self.failUnless(time.time() - start < 2)
+		self.failUnlessEqual([results[entry.id] for entry in self.entries], [True, True, True, True, False, False])
+
+	def test_cache(self):
+		self.failUnlessEqual(cached_iboot_state(self.entries[0]), None)
+		states = get_iboot_states(self.entries + [self.down_entry], timeout=1)
+		self.failUnlessEqual(states[self.entries[0].id].is_on, False)
+		self.failUnless(states[self.entries[0].id].reachable)
+		self.failIf(states[self.down_entry.id].reachable)
+		self.failUnlessEqual(cached_iboot_state(self.down_entry).is_on, None)
+
+		# fresh entries are served without talking to the iBoots
+		connection_count = self.fleet.connection_count()
+		self.fleet.iboots[0].is_on = True
+		statuses = get_iboot_statuses(self.entries)
+		self.failUnlessEqual([status.is_on for status in statuses], [False] * len(self.entries))
+		self.failUnlessEqual(self.fleet.connection_count(), connection_count)
+
+		# stale entries are served while a background refresh brings them up to date
+		state = cached_iboot_state(self.entries[0])
+		state.fetched = datetime.datetime.now() - datetime.timedelta(seconds=iboot_state.max_age() + 10)
+		cache.set(state_cache_key(self.entries[0].id), state)
+		self.failUnlessEqual(get_iboot_states([self.entries[0]])[self.entries[0].id].is_on, False)
+		deadline = time.time() + 5
+		while cached_iboot_state(self.entries[0]).is_on != True and time.time() < deadline: time.sleep(0.1)
+		self.failUnlessEqual(cached_iboot_state(self.entries[0]).is_on, True)
+
+		# bulk power actions refresh the cache
+		results = power_iboots(self.entries[2:4], 'on', timeout=2)
+		self.failUnlessEqual(results, { self.entries[2].id:True, self.entries[3].id:True })
+		statuses = get_iboot_statuses(self.entries[2:4], results)
+		self.failUnlessEqual([(status.is_on, status.command_description) for status in statuses], [(True, 'done'), (True, 'done')])
+
+	def test_api(self):
+		User.objects.create_user('staff', 'staff@example.com', 'password')
+		User.objects.filter(username='staff').update(is_staff=True)
+		client = Client()
+		self.failUnless(client.login(username='staff', password='password'))
+
+		# an action needs the ids of the iBoots it's for
+		response = client.post('/api/iboot/', { 'action':'on' })
+		self.failUnlessEqual(response.status_code, 400, 'status was %s' % response.status_code)
+		self.failUnlessEqual(self.fleet.power_states(), [False] * len(self.entries))
+		response = client.post('/api/iboot/', { 'action':'on', 'id':[self.entries[0].id, self.entries[2].id] })
+		self.failUnlessEqual(response.status_code, 200, 'status was %s' % response.status_code)
+		self.failUnlessEqual(self.fleet.power_states(), [True, False, True, False, False, False])
+
+class IBootControlTest(TestCase):
+	def setUp(self):
+		self.iboots = []
+
+	def tearDown(self):
+		for iboot in self.iboots: iboot.stop_server()
+
+	def start_iboot(self, **kwargs):
+		iboot = MockIBoot(settings.IBOOT_POWER_PASSWORD, **kwargs)
+		iboot.start()
+		self.failUnless(iboot.wait_until_running())
+		self.iboots.append(iboot)
+		return iboot
+
+	def control(self, iboot, **kwargs):
+		host, port = iboot.address()
+		return IBootControl(settings.IBOOT_POWER_PASSWORD, host, port, timeout=2, **kwargs)
+
+	def test_framing(self):
+		self.failUnlessEqual(parse_response(''), None)
+		self.failUnlessEqual(parse_response('O'), None)
+		self.failUnlessEqual(parse_response('ON'), 'ON')
+		self.failUnlessEqual(parse_response('\r\nOFF'), 'OFF')
+		self.failUnlessEqual(parse_response('BU'), None)
+		self.failUnlessEqual(parse_response('HUH?\r\n'), 'HUH?')
+
+		# an answer which arrives a byte at a time is read whole
+		iboot = self.start_iboot(fragment=True, latency=0.05)
+		control = self.control(iboot)
+		self.failUnlessEqual(control.query_iboot_state(), False)
+		self.failUnless(control.last_latency >= 0.05)
+		self.failUnless(control.turn_on())
+		self.failUnlessEqual(control.query_iboot_state(), True)
+
+		entry = IBootDevice.objects.create(name='Fragmented', mac_address='00-0D-AD-00-00-01', ip=iboot.address()[0], port=iboot.address()[1])
+		exchanges = iboot_fleet.query_exchanges([entry], settings.IBOOT_POWER_PASSWORD, timeout=2)
+		self.failUnlessEqual(exchanges[entry.id].response, IBootControl.ON)
+		self.failUnless(exchanges[entry.id].latency >= 0.05)
+		self.failUnless(poll_iboots([entry])[entry.id].latency >= 0.05)
+
+		# nothing is reachable on a closed port
+		control = IBootControl(settings.IBOOT_POWER_PASSWORD, '127.0.0.1', 1, timeout=1)
+		self.failUnlessEqual(control.query_iboot_state(), None)
+		self.failUnlessEqual(control.toggle(), None)
+		self.failUnlessEqual(control.last_latency, None)
+
+		# nor is anything from an iBoot which never answers
+		control = self.control(self.start_iboot(failure=SILENT))
+		control.timeout = 0.5
+		self.failUnlessEqual(control.query_iboot_state(), None)
+
+	def test_toggle(self):
+		# an iBoot which hangs up after each answer takes a second connection
+		iboot = self.start_iboot()
+		control = self.control(iboot)
+		self.failUnless(control.toggle())
+		self.failUnless(iboot.is_on)
+		self.failUnlessEqual(iboot.connection_count, 2)
+		self.failUnless(control.last_latency != None)
+
+		# one which keeps the connection open takes one
+		iboot = self.start_iboot(keep_alive=True)
+		control = self.control(iboot)
+		self.failUnless(control.toggle())
+		self.failUnless(iboot.is_on)
+		self.failUnless(control.toggle())
+		self.failIf(iboot.is_on)
+		self.failUnlessEqual(iboot.connection_count, 2)
+		self.failUnlessEqual(iboot.command_count, 4)
+
+	def test_status_port(self):
+		iboot = self.start_iboot(status_port=True)
+		control = self.control(iboot, status_port=iboot.status_address()[1])
+		self.failUnlessEqual(control.query_iboot_state(), False)
+		self.failUnlessEqual(iboot.status_query_count, 1)
+		self.failUnless(control.turn_on())
+		self.failUnlessEqual(control.query_iboot_state(), True)
+		self.failUnlessEqual(iboot.status_query_count, 2)
+
+		host, port = iboot.address()
+		entry = IBootDevice.objects.create(name='Status Port', mac_address='00-0D-AD-00-00-01', ip=host, port=port, status_port=iboot.status_address()[1])
+		self.failUnlessEqual(iboot_fleet.query_all([entry], settings.IBOOT_POWER_PASSWORD, timeout=2), { entry.id:True })
+		self.failUnlessEqual(iboot.status_query_count, 3)
+		self.failUnlessEqual(iboot_fleet.power_all([entry], 'off', settings.IBOOT_POWER_PASSWORD, timeout=2), { entry.id:True })
+		self.failUnlessEqual(iboot.status_query_count, 3)
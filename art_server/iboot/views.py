@@ -27,19 +27,29 @@ from django.utils import feedgenerator
 from models import IBootDevice, IBootEvent
 from forms import IBootEventForm
 from iboot_control import IBootControl
+from iboot_state import get_iboot_states, get_iboot_statuses, poll_iboots, power_iboots
+from iboot_fleet import POWER_ACTIONS
 
 @staff_member_required
 def index(request):
-	return render_to_response('iboot/index.html', { 'iboots':IBootDevice.objects.all() }, context_instance=RequestContext(request))
+	"""Lists the iBoots with their cached power states.  POST an action and the ids of the selected iBoots to power them all at once."""
+	devices = list(IBootDevice.objects.all())
+	command_results = {}
+	if request.method == 'POST' and request.POST.get('action', None) in POWER_ACTIONS:
+		selected_ids = [int(id) for id in request.POST.getlist('id') if id.isdigit()]
+		selected = [device for device in devices if device.id in selected_ids]
+		if selected: command_results = power_iboots(selected, request.POST.get('action'))
+	return render_to_response('iboot/index.html', { 'statuses':get_iboot_statuses(devices, command_results), 'actions':POWER_ACTIONS.keys() }, context_instance=RequestContext(request))
 
 @staff_member_required
 def iboot(request, id):
 	iboot = get_object_or_404(IBootDevice, pk=id)
-	control = IBootControl(settings.IBOOT_POWER_PASSWORD, iboot.ip)
+	control = IBootControl(settings.IBOOT_POWER_PASSWORD, iboot.ip, iboot.port, iboot.status_port)
 	if request.method == 'POST':
 		new_event_form = IBootEventForm(request.POST)
 		if request.POST.get('action', None) == 'toggle':
 			control.toggle()
+			poll_iboots([iboot])
 			new_event_form = IBootEventForm(initial={ 'device':iboot.id, 'command':'cycle' })
 		elif request.POST.get('action', None) == 'delete' and request.POST.get('event_id', None):
 			event = IBootEvent.objects.get(pk=int(request.POST.get('event_id', None)))
@@ -52,5 +62,5 @@ def iboot(request, id):
 			print 'not valid:', new_event_form.data
 	else:
 		new_event_form = IBootEventForm(initial={ 'device':iboot.id, 'command':'cycle' })
-	status = control.query_iboot_state()
-	return render_to_response('iboot/iboot.html', { 'iboot':iboot, 'status':status, 'events':IBootEvent.objects.filter(device=iboot), 'new_event_form':new_event_form }, context_instance=RequestContext(request))
+	state = get_iboot_states([iboot])[iboot.id]
+	return render_to_response('iboot/iboot.html', { 'iboot':iboot, 'status':state.is_on, 'state':state, 'events':IBootEvent.objects.filter(device=iboot), 'new_event_form':new_event_form }, context_instance=RequestContext(request))
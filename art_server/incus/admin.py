@@ -22,3 +22,12 @@ admin.site.register(ABChannel, ABChannelAdmin)
 class ABChannelGroupAdmin(StyledModelAdmin):
 	pass
 admin.site.register(ABChannelGroup, ABChannelGroupAdmin)
+
+class ABPresetLevelInline(admin.TabularInline):
+	model = ABPresetLevel
+	extra = 0
+
+class ABPresetAdmin(StyledModelAdmin):
+	inlines = [ABPresetLevelInline]
+admin.site.register(ABPreset, ABPresetAdmin)
+
@@ -27,9 +27,12 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.template.loader import render_to_string
 from django.utils import feedgenerator
 
+import simplejson as json
+
 from models import *
 from art_server.hydration import dehydrate_to_list_xml, dehydrate_to_xml
 from incus.soundman_control import SoundManControl
+from incus.group_gain import shared_gain_engine
 from front.management.commands.send_alert import Command as SendAlertCommand
 
 def emergency(request):
@@ -42,15 +45,20 @@ def emergency(request):
 
 			if settings.AUDIO_EMERGENCY_CODE == code:
 				control_error = False
-				for group in ABChannelGroup.objects.all():
-					for channel in group.channels.all():
-						try:
-							control = SoundManControl(channel.audioBoxDevice.ip, channel.audioBoxDevice.port)
-							result = control.mute(channel.short_name)
-							print 'muted', channel, result
-						except:
-							traceback.print_exc()
+				# every grouped channel on a device is muted with one command per channel type
+				device_channels = {}
+				for channel in ABChannel.objects.filter(channel_group__isnull=False).select_related('audioBoxDevice'):
+					device_channels.setdefault(channel.audioBoxDevice, []).append(channel.short_name)
+				ABChannel.objects.filter(channel_group__isnull=False).update(mute=True) # so a restarted SoundMan server comes back muted
+				for device, channel_names in device_channels.items():
+					try:
+						if device.control().mute_channels(channel_names):
+							print 'muted', device, channel_names
+						else:
 							control_error = True
+					except:
+						traceback.print_exc()
+						control_error = True
 				emergency_message = "Someone activated the emergency audio system."
 				if control_error: emergency_message += " Also, there was an error communicating with the audio server."
 				alert_command = SendAlertCommand()
@@ -73,31 +81,79 @@ def ab_group(request, id):
 	group = get_object_or_404(ABChannelGroup, pk=id)
 	return HttpResponse(dehydrate_to_xml(group.wrap()), content_type="text/xml")
 
+def request_duration(request):
+	"""Returns the seconds of the ramp in the POST's duration parameter, or 0 for an immediate change"""
+	try:
+		return max(0.0, float(request.POST.get('duration', 0)))
+	except ValueError:
+		return 0.0
+
 def ab_group_gain(request, id):
+	"""POST a gain, and optionally a duration in seconds, to ramp the group's channels to their gains under that master gain"""
 	group = get_object_or_404(ABChannelGroup, pk=id)
 	if request.method == 'POST' and request.POST.get('gain', None):
-		print 'This is where we should communicate with the AB64 to set the master gain'
-		group.master_gain = float(request.POST.get('gain'))
+		master_gain = float(request.POST.get('gain'))
+		shared_gain_engine().ramp_group(group, master_gain, request_duration(request))
+		group.master_gain = master_gain
 		group.save()
 	return HttpResponse(group.master_gain, content_type="text/plain")
 
+def ab_device_state(request, id):
+	"""Returns the device's channel state as JSON like {"version":"9f86d081884c", "state":{"gains":{"o1":0.5, ...}, "mutes":{"o1":false, ...}, "vu":{"o1":0.25, ...}}}
+	without waiting for it to change.  The version changes whenever the state does, so pages polling every AUDIO_STATE_INTERVAL seconds can skip redrawing."""
+	device = get_object_or_404(ABDevice, pk=id)
+	version, state = device.state().snapshot()
+	return HttpResponse(json.dumps({ 'version':version, 'state':state }), mimetype='application/json')
+
 def ab_channel_mute(request, id):
 	channel = get_object_or_404(ABChannel, pk=id)
-	control = SoundManControl(channel.audioBoxDevice.ip, channel.audioBoxDevice.port)
-	if request.method == 'POST' and request.POST.get('mute', None) == 'toggle':
-		control.toggle_mute(channel.short_name)
-	elif request.method == 'POST' and request.POST.get('mute', None) == 'on':
-		control.mute(channel.short_name)
-	elif request.method == 'POST' and request.POST.get('mute', None) == 'off':
-		control.unmute(channel.short_name)
-	return HttpResponse(control.get_mute(channel.short_name), content_type="text/plain")
+	state = channel.audioBoxDevice.state()
+	mute = request.method == 'POST' and request.POST.get('mute', None) or None
+	if mute == 'toggle':
+		muted = state.is_muted(channel.short_name)
+		mute = muted != None and (muted and 'off' or 'on') or None
+	if mute in ('on', 'off'):
+		control = channel.audioBoxDevice.control()
+		if control.set_channels([channel.short_name], 'MUTE', mute.upper()): state.record(channel.short_name, mute=mute == 'on')
+		channel.mute = mute == 'on'
+		channel.save()
+	return HttpResponse(str(state.is_muted(channel.short_name)), content_type="text/plain")
 
 def ab_channel_gain(request, id):
-	channel = get_object_or_404(ABChannel, pk=id)
+	channel = get_object_or_404(ABChannel.objects.select_related('audioBoxDevice', 'channel_group'), pk=id) # so the gain engine's thread doesn't query for them
 	if request.method == 'POST' and request.POST.get('gain', None):
-		gain = float(request.POST.get('gain'))
-		control = SoundManControl(channel.audioBoxDevice.ip, channel.audioBoxDevice.port)
-		control.set_gain(channel.short_name, gain)
-		channel.gain = gain
+		start_gain = channel.effective_gain
+		channel.gain = float(request.POST.get('gain'))
+		shared_gain_engine().ramp([(channel, start_gain, channel.effective_gain)], request_duration(request))
 		channel.save()
 	return HttpResponse(channel.gain, content_type="text/plain")
+
+def preset_info(preset):
+	return { 'id':preset.id, 'name':preset.name, 'levels':[{ 'channel_id':level.channel_id, 'gain':level.gain, 'mute':level.mute } for level in preset.levels.all()] }
+
+def ab_presets(request):
+	"""Lists the presets as JSON.  POST a name to capture the live devices into the preset of that name, creating it if need be."""
+	if request.method == 'POST' and request.POST.get('name', None):
+		preset, created = ABPreset.objects.get_or_create(name=request.POST.get('name'))
+		missing = preset.capture()
+		if missing: return HttpResponseServerError('Could not read %s' % ', '.join([unicode(channel) for channel in missing]), content_type="text/plain")
+		return HttpResponse(json.dumps(preset_info(preset)), mimetype='application/json')
+	return HttpResponse(json.dumps([{ 'id':preset.id, 'name':preset.name } for preset in ABPreset.objects.all()]), mimetype='application/json')
+
+def ab_preset(request, id):
+	"""Returns the preset's levels as JSON.  POST action=apply to set the devices to it, or action=capture to replace it with the live levels."""
+	preset = get_object_or_404(ABPreset, pk=id)
+	if request.method == 'POST' and request.POST.get('action', None) == 'apply':
+		if not preset.apply(): return HttpResponseServerError('Could not apply every level of %s' % preset, content_type="text/plain")
+	elif request.method == 'POST' and request.POST.get('action', None) == 'capture':
+		missing = preset.capture()
+		if missing: return HttpResponseServerError('Could not read %s' % ', '.join([unicode(channel) for channel in missing]), content_type="text/plain")
+	return HttpResponse(json.dumps(preset_info(preset)), mimetype='application/json')
+
+def ab_restore(request):
+	"""POST to set every device's channels to the gains and mutes last set through the art server"""
+	if request.method != 'POST': return HttpResponse('This is the audio restore API. POST to restore the last known state.', content_type="text/plain")
+	failed = [device for device in ABDevice.objects.all() if not device.restore_last_known_state()]
+	if failed: return HttpResponseServerError('Could not restore %s' % ', '.join([unicode(device) for device in failed]), content_type="text/plain")
+	return HttpResponse('Restored', content_type="text/plain")
+
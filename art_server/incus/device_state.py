@@ -0,0 +1,189 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""Mirrors each AudioBox device's channel gains, mutes and VU levels in memory, so pages read them without sending SoundMan commands.
+
+An ABDeviceState thread sweeps the device's channels every AUDIO_STATE_INTERVAL seconds (5 by default) with a GET CHAN GAIN and a GET CHAN MUTE
+for each channel type (see channel_id_lists), and the views record the values they set so the mirror doesn't wait for the next sweep.
+Like the Crestron status poller it only sweeps while someone has asked for the state in the last idle_seconds.
+
+While the state is being watched a VUMeter thread keeps a session of its own open to the server, sends GET VU once and publishes the periodic
+responses as they arrive.  That session stays out of the SoundManPool because its responses never stop and would be taken for the answers to other commands,
+but it takes one of the pool's SessionSlots so it counts against the machine's limit.
+Each process keeps its own mirror, so each process serving the pages runs a sweep and a VU session of its own.
+The pages poll the snapshot every AUDIO_STATE_INTERVAL seconds and are answered straight from the mirror, with a version digested from the state
+so that it means the same thing whichever process answers.
+"""
+import time
+import select
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+
+from soundman_control import SoundManSession, channel_id_lists
+
+def state_version(state):
+	"""Returns a short digest of a snapshot's state, which changes whenever any of its values do"""
+	return hashlib.md5(repr(sorted([(key, sorted(values.items())) for key, values in state.items()]))).hexdigest()[:12]
+
+class VUMeter(threading.Thread):
+	"""Reads the periodic GET VU responses from the server, which look like the GET CHAN responses ('VU o1=0.25 o2=0.5;'), into the state"""
+	def __init__(self, state, host, port, timeout=10, slots=None):
+		self.state = state
+		self.host = host
+		self.port = port
+		self.timeout = timeout
+		self.slots = slots
+		self.session = None
+		self.response_count = 0
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def run(self):
+		self.session = SoundManSession(self.host, self.port, self.timeout, self.slots)
+		try:
+			self.session.open()
+			self.session.sock.sendall('GET VU\r\n')
+			while self.state.is_watched():
+				response = self.session.reader.next_response()
+				if response == None:
+					if select.select([self.session.sock], [], [], 1)[0]: self.session.receive()
+					continue
+				levels = self.state.control.parse_values(response.text, 'vu', float)
+				if levels == None: continue
+				self.response_count += 1
+				self.state.publish(vu=levels)
+		except:
+			logging.exception('Could not read the VU levels from %s:%s' % (self.host, self.port))
+		self.session.close()
+		self.state.publish(vu={})
+
+class ABDeviceState(threading.Thread):
+	"""Keeps the latest gains, mutes, and VU levels of a device's channels"""
+	def __init__(self, control, channel_names, interval=5, idle_seconds=60, vu_enabled=True):
+		self.control = control
+		self.channel_names = channel_names
+		self.interval = interval
+		self.idle_seconds = idle_seconds
+		self.vu_enabled = vu_enabled
+		self.gains = {} # channel name to gain
+		self.mutes = {} # channel name to True if muted
+		self.vu = {} # channel name to level, while the VU meter is running
+		self.swept = None # when the last sweep finished, or None before the first
+		self.last_request = 0
+		self.sweep_count = 0
+		self.vu_meter = None
+		self.condition = threading.Condition()
+		self.running = False
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def publish(self, gains=None, mutes=None, vu=None):
+		"""Merges in the given maps of channel name to value"""
+		self.condition.acquire()
+		try:
+			for values, new_values in ((self.gains, gains), (self.mutes, mutes)):
+				if new_values == None: continue
+				for name, value in new_values.items(): values[name.lower()] = value
+			if vu != None: self.vu = dict([(name.lower(), value) for name, value in vu.items()])
+		finally:
+			self.condition.release()
+
+	def record(self, channel_name, gain=None, mute=None):
+		"""Records a value which was just set on the server"""
+		if gain != None: self.publish(gains={channel_name:gain})
+		if mute != None: self.publish(mutes={channel_name:mute})
+
+	def sweep(self):
+		"""Reads every channel's gain and mute with one GET of each for each channel type"""
+		self.sweep_count += 1
+		for id_list in channel_id_lists(self.channel_names):
+			gains, response = self.control.get_gains(id_list)
+			mutes, response = self.control.get_mutes(id_list)
+			self.publish(gains=gains, mutes=mutes)
+		self.swept = time.time()
+
+	def touch(self):
+		"""Notes that someone wants the state, waking the idle sweeper and starting the VU meter"""
+		self.condition.acquire()
+		try:
+			if not self.is_watched(): self.condition.notifyAll()
+			self.last_request = time.time()
+		finally:
+			self.condition.release()
+		if self.vu_enabled and self.running and (self.vu_meter == None or not self.vu_meter.isAlive()):
+			self.vu_meter = VUMeter(self, self.control.host, self.control.port, slots=self.control.pool.slots)
+			self.vu_meter.start()
+
+	def is_watched(self): return self.running and time.time() - self.last_request <= self.idle_seconds
+
+	def read(self, values, channel_name):
+		"""Returns the channel's value from values, sweeping first if the mirror is older than two intervals"""
+		self.touch()
+		self.sweep_if_stale()
+		return values.get(channel_name.lower(), None)
+
+	def sweep_if_stale(self):
+		if self.swept == None or time.time() - self.swept > self.interval * 2: self.sweep()
+
+	def gain(self, channel_name): return self.read(self.gains, channel_name)
+
+	def is_muted(self, channel_name):
+		"""Returns True if muted, False if not, or None if the mute couldn't be read"""
+		return self.read(self.mutes, channel_name)
+
+	def snapshot(self):
+		"""Returns (version, {'gains':..., 'mutes':..., 'vu':...}) from the mirror, sweeping first if it's older than two intervals"""
+		self.touch()
+		self.sweep_if_stale()
+		self.condition.acquire()
+		try:
+			state = { 'gains':dict(self.gains), 'mutes':dict(self.mutes), 'vu':dict(self.vu) }
+		finally:
+			self.condition.release()
+		return (state_version(state), state)
+
+	def stop(self):
+		self.condition.acquire()
+		try:
+			self.running = False
+			self.condition.notifyAll()
+		finally:
+			self.condition.release()
+
+	def run(self):
+		self.running = True
+		while self.running:
+			self.condition.acquire()
+			try:
+				while self.running and not self.is_watched(): self.condition.wait()
+			finally:
+				self.condition.release()
+			if not self.running: break
+			started = time.time()
+			try:
+				self.sweep()
+			except:
+				logging.exception('Could not sweep the channels of the SoundMan server at %s:%s' % (self.control.host, self.control.port))
+			self.condition.acquire()
+			try:
+				while self.running and time.time() < started + self.interval: self.condition.wait(started + self.interval - time.time())
+			finally:
+				self.condition.release()
+
+_states = {}
+_states_lock = threading.Lock()
+
+def shared_device_state(device):
+	"""Returns the process's running ABDeviceState for the ABDevice, starting it the first time and again if the device's address changes"""
+	channel_names = [channel.short_name for channel in device.abchannel_set.all()]
+	key = (device.id, device.ip, device.port)
+	_states_lock.acquire()
+	try:
+		if key not in _states:
+			_states[key] = ABDeviceState(device.control(), channel_names, interval=getattr(settings, 'AUDIO_STATE_INTERVAL', 5), vu_enabled=getattr(settings, 'AUDIO_VU_ENABLED', True))
+			_states[key].start()
+		_states[key].channel_names = channel_names
+		return _states[key]
+	finally:
+		_states_lock.release()
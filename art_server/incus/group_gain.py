@@ -0,0 +1,171 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""Pushes the channel groups' gains to the AudioBox devices, ramping them over time on the server.
+
+A grouped channel plays at its effective gain, which is its own gain multiplied by its group's master gain.
+The GroupGainEngine thread steps every ramping channel's effective gain (INCUS_GAIN_FRAME_RATE frames a second, 10 by default)
+and sends each device the channels which changed with SoundManControl.set_gains, so channels which share a gain share a command.
+Within a ramp the engine remembers the last gain sent to each channel and doesn't send it again until it moves.
+A new ramp always sends its channels, as another process or the device itself may have changed them since.
+"""
+import time
+import logging
+import threading
+
+from django.conf import settings
+
+class GainRamp:
+	"""One channel's change from start_gain to end_gain over duration seconds"""
+	def __init__(self, channel, start_gain, end_gain, start_time, duration):
+		self.channel = channel
+		self.start_gain = float(start_gain)
+		self.end_gain = float(end_gain)
+		self.start_time = start_time
+		self.duration = duration
+
+	def finished(self, now): return now >= self.start_time + self.duration
+
+	def gain_at(self, now):
+		if self.duration <= 0 or self.finished(now): return self.end_gain
+		progress = max(0.0, (now - self.start_time) / self.duration)
+		return self.start_gain + (self.end_gain - self.start_gain) * progress
+
+class GroupGainEngine(threading.Thread):
+	"""Runs the ramps, sending a frame of changed gains frame_rate times a second while any channel is ramping.
+	Gains are rounded to resolution, and a ramping channel whose rounded gain is what its last frame sent is skipped."""
+	def __init__(self, frame_rate=10, resolution=0.001):
+		self.frame_rate = frame_rate
+		self.resolution = resolution
+		self.ramps = {} # channel id to GainRamp
+		self.sent = {} # channel id to the last gain sent
+		self.condition = threading.Condition()
+		self.running = False
+		self.frame_count = 0
+		self.request_count = 0 # one per device per frame
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def current_gain(self, channel, now=None):
+		"""Returns the gain the channel is ramping through or was last sent, or None if the engine hasn't touched it"""
+		if now == None: now = time.time()
+		self.condition.acquire()
+		try:
+			if channel.id in self.ramps: return self.ramps[channel.id].gain_at(now)
+			return self.sent.get(channel.id, None)
+		finally:
+			self.condition.release()
+
+	def ramp(self, channel_gains, duration):
+		"""Starts ramping each channel in the list of (channel, start gain, end gain) to its end gain over duration seconds.
+		A channel the engine has already set starts from wherever it has got to rather than the given start gain.
+		The gains last sent to the channels are forgotten, so the ramp's frames are sent even if they match them."""
+		now = time.time()
+		self.condition.acquire()
+		try:
+			for channel, start_gain, end_gain in channel_gains:
+				current = self.current_gain(channel, now)
+				if current == None: current = start_gain
+				self.ramps[channel.id] = GainRamp(channel, current, end_gain, now, duration)
+				if channel.id in self.sent: del self.sent[channel.id]
+			self.condition.notify()
+		finally:
+			self.condition.release()
+
+	def forget(self, channels):
+		"""Forgets the gains last sent to the channels, which have been set some other way, so the next ramp to them is sent whatever it was"""
+		self.condition.acquire()
+		try:
+			for channel in channels:
+				if channel.id in self.sent: del self.sent[channel.id]
+		finally:
+			self.condition.release()
+
+	def ramp_group(self, group, master_gain, duration=0):
+		"""Starts ramping the group's channels from their effective gains under its current master gain to those under master_gain.
+		The caller saves the group's new master gain."""
+		self.ramp([(channel, channel.gain * group.master_gain, channel.gain * master_gain) for channel in group.channels.select_related('audioBoxDevice')], duration)
+
+	def is_ramping(self, channel=None):
+		if channel == None: return len(self.ramps) > 0
+		return channel.id in self.ramps
+
+	def wait(self, timeout=None):
+		"""Waits until every ramp has finished or timeout seconds have passed, returning whether they finished"""
+		deadline = timeout != None and time.time() + timeout or None
+		self.condition.acquire()
+		try:
+			while self.ramps:
+				if deadline != None and time.time() >= deadline: return False
+				self.condition.wait(deadline != None and min(0.1, deadline - time.time()) or 0.1)
+			return True
+		finally:
+			self.condition.release()
+
+	def stop(self):
+		self.condition.acquire()
+		try:
+			self.running = False
+			self.condition.notify()
+		finally:
+			self.condition.release()
+
+	def run(self):
+		self.running = True
+		period = 1.0 / self.frame_rate
+		while self.running:
+			self.condition.acquire()
+			try:
+				while self.running and not self.ramps: self.condition.wait()
+			finally:
+				self.condition.release()
+			if not self.running: break
+			frame_start = time.time()
+			try:
+				self.frame(frame_start)
+			except:
+				logging.exception('Could not send a frame of channel gains')
+			time.sleep(max(0, frame_start + period - time.time()))
+
+	def frame(self, now=None):
+		"""Sends each ramping channel's gain for the time now, then drops the ramps which have finished"""
+		if now == None: now = time.time()
+		self.condition.acquire()
+		try:
+			ramps = self.ramps.values()
+		finally:
+			self.condition.release()
+		device_gains = {} # device id to a list of (channel, gain)
+		for ramp in ramps:
+			gain = round(ramp.gain_at(now) / self.resolution) * self.resolution
+			if self.sent.get(ramp.channel.id, None) == gain: continue
+			device_gains.setdefault(ramp.channel.audioBoxDevice_id, []).append((ramp.channel, gain))
+		for channel_gains in device_gains.values():
+			control = channel_gains[0][0].audioBoxDevice.control()
+			self.request_count += 1
+			if control.set_gains(dict([(channel.short_name, gain) for channel, gain in channel_gains])):
+				for channel, gain in channel_gains: self.sent[channel.id] = gain
+			else:
+				logging.error('Could not set the gains of %s' % ', '.join([unicode(channel) for channel, gain in channel_gains]))
+		self.frame_count += 1
+		self.condition.acquire()
+		try:
+			for ramp in ramps:
+				# a ramp whose last frame failed is dropped too, rather than hammering a device which isn't answering
+				if ramp.finished(now) and self.ramps.get(ramp.channel.id, None) is ramp: del self.ramps[ramp.channel.id]
+			self.condition.notifyAll()
+		finally:
+			self.condition.release()
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def shared_gain_engine():
+	"""Returns the process's running GroupGainEngine, starting it the first time"""
+	global _engine
+	_engine_lock.acquire()
+	try:
+		if _engine == None:
+			_engine = GroupGainEngine(frame_rate=getattr(settings, 'INCUS_GAIN_FRAME_RATE', 10))
+			_engine.start()
+		return _engine
+	finally:
+		_engine_lock.release()
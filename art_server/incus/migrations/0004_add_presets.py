@@ -0,0 +1,89 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+
+        # Adding field 'ABChannel.mute'
+        db.add_column('incus_abchannel', 'mute', self.gf('django.db.models.fields.BooleanField')(default=False), keep_default=False)
+
+        # Adding model 'ABPreset'
+        db.create_table('incus_abpreset', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('name', self.gf('django.db.models.fields.CharField')(max_length=1024)),
+        ))
+        db.send_create_signal('incus', ['ABPreset'])
+
+        # Adding model 'ABPresetLevel'
+        db.create_table('incus_abpresetlevel', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('preset', self.gf('django.db.models.fields.related.ForeignKey')(related_name='levels', to=orm['incus.ABPreset'])),
+            ('channel', self.gf('django.db.models.fields.related.ForeignKey')(related_name='preset_levels', to=orm['incus.ABChannel'])),
+            ('gain', self.gf('django.db.models.fields.FloatField')(default=1)),
+            ('mute', self.gf('django.db.models.fields.BooleanField')(default=False)),
+        ))
+        db.send_create_signal('incus', ['ABPresetLevel'])
+
+        # Adding unique constraint on 'ABPresetLevel', fields ['preset', 'channel']
+        db.create_unique('incus_abpresetlevel', ['preset_id', 'channel_id'])
+
+
+    def backwards(self, orm):
+
+        # Removing unique constraint on 'ABPresetLevel', fields ['preset', 'channel']
+        db.delete_unique('incus_abpresetlevel', ['preset_id', 'channel_id'])
+
+        # Deleting model 'ABPresetLevel'
+        db.delete_table('incus_abpresetlevel')
+
+        # Deleting model 'ABPreset'
+        db.delete_table('incus_abpreset')
+
+        # Deleting field 'ABChannel.mute'
+        db.delete_column('incus_abchannel', 'mute')
+
+
+    models = {
+        'incus.abchannel': {
+            'Meta': {'ordering': "['number']", 'object_name': 'ABChannel'},
+            'audioBoxDevice': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['incus.ABDevice']"}),
+            'channel_group': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'channels'", 'null': 'True', 'to': "orm['incus.ABChannelGroup']"}),
+            'channel_type': ('django.db.models.fields.CharField', [], {'default': "'o'", 'max_length': '1'}),
+            'gain': ('django.db.models.fields.FloatField', [], {'default': '1'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'mute': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'number': ('django.db.models.fields.IntegerField', [], {})
+        },
+        'incus.abchannelgroup': {
+            'Meta': {'object_name': 'ABChannelGroup'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'master_gain': ('django.db.models.fields.FloatField', [], {'default': '0'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'})
+        },
+        'incus.abdevice': {
+            'Meta': {'object_name': 'ABDevice'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ip': ('django.db.models.fields.IPAddressField', [], {'max_length': '15'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'port': ('django.db.models.fields.IntegerField', [], {'default': '55128'})
+        },
+        'incus.abpreset': {
+            'Meta': {'ordering': "['name']", 'object_name': 'ABPreset'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'})
+        },
+        'incus.abpresetlevel': {
+            'Meta': {'unique_together': "(('preset', 'channel'),)", 'object_name': 'ABPresetLevel'},
+            'channel': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'preset_levels'", 'to': "orm['incus.ABChannel']"}),
+            'gain': ('django.db.models.fields.FloatField', [], {'default': '1'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'mute': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'preset': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'levels'", 'to': "orm['incus.ABPreset']"})
+        }
+    }
+
+    complete_apps = ['incus']
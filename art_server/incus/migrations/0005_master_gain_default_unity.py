@@ -0,0 +1,64 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+
+        # Changing field 'ABChannelGroup.master_gain'
+        db.alter_column('incus_abchannelgroup', 'master_gain', self.gf('django.db.models.fields.FloatField')(default=1))
+
+        # Until the master gain scaled the channels it was only ever the unused default of 0, so the groups start at unity
+        if not db.dry_run:
+            orm['incus.ABChannelGroup'].objects.filter(master_gain=0).update(master_gain=1)
+
+
+    def backwards(self, orm):
+
+        # Changing field 'ABChannelGroup.master_gain'
+        db.alter_column('incus_abchannelgroup', 'master_gain', self.gf('django.db.models.fields.FloatField')(default=0))
+
+
+    models = {
+        'incus.abchannel': {
+            'Meta': {'ordering': "['number']", 'object_name': 'ABChannel'},
+            'audioBoxDevice': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['incus.ABDevice']"}),
+            'channel_group': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'channels'", 'null': 'True', 'to': "orm['incus.ABChannelGroup']"}),
+            'channel_type': ('django.db.models.fields.CharField', [], {'default': "'o'", 'max_length': '1'}),
+            'gain': ('django.db.models.fields.FloatField', [], {'default': '1'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'mute': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'number': ('django.db.models.fields.IntegerField', [], {})
+        },
+        'incus.abchannelgroup': {
+            'Meta': {'object_name': 'ABChannelGroup'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'master_gain': ('django.db.models.fields.FloatField', [], {'default': '1'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'})
+        },
+        'incus.abdevice': {
+            'Meta': {'object_name': 'ABDevice'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ip': ('django.db.models.fields.IPAddressField', [], {'max_length': '15'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'port': ('django.db.models.fields.IntegerField', [], {'default': '55128'})
+        },
+        'incus.abpreset': {
+            'Meta': {'ordering': "['name']", 'object_name': 'ABPreset'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'})
+        },
+        'incus.abpresetlevel': {
+            'Meta': {'unique_together': "(('preset', 'channel'),)", 'object_name': 'ABPresetLevel'},
+            'channel': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'preset_levels'", 'to': "orm['incus.ABChannel']"}),
+            'gain': ('django.db.models.fields.FloatField', [], {'default': '1'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'mute': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'preset': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'levels'", 'to': "orm['incus.ABPreset']"})
+        }
+    }
+
+    complete_apps = ['incus']
@@ -15,8 +15,12 @@ from django.dispatch import dispatcher
 from django.core.mail import send_mail
 from django.utils.encoding import force_unicode
 from django.db.models import Q
+from django.core.cache import cache
 
 from art_server.incus_client import ABDeviceInfo, ABChannelGroupInfo, ABChannelInfo
+from soundman_control import SoundManControl, shared_pool
+from device_state import shared_device_state
+from group_gain import shared_gain_engine
 
 class ABDevice(models.Model):
 	"""Represents an AudioBox device."""
@@ -25,6 +29,41 @@ class ABDevice(models.Model):
 	port = models.IntegerField(blank=False, null=False, default=55128)
 	def channel_groups(self): return ABChannelGroup.objects.filter(channels__audioBoxDevice=self).distinct()
 	def wrap(self): return ABDeviceInfo(self.id, self.name, self.ip, self.port, [group.wrap() for group in self.channel_groups()])
+	def control(self):
+		"""Returns a SoundManControl which shares the process's pool of sessions to this device's SoundMan server.
+		SOUNDMAN_MAX_SESSIONS limits the sessions every process on the machine opens to the server together, counted with lock files in SOUNDMAN_LOCK_DIR."""
+		pool = shared_pool(self.ip, self.port, max_sessions=getattr(settings, 'SOUNDMAN_PROCESS_MAX_SESSIONS', None), server_max_sessions=getattr(settings, 'SOUNDMAN_MAX_SESSIONS', None), lock_dir=getattr(settings, 'SOUNDMAN_LOCK_DIR', None))
+		control = SoundManControl(self.ip, self.port, pool=pool)
+		if getattr(settings, 'SOUNDMAN_RESTORE_ON_RECONNECT', True): control.pool.reconnect_listener = self.restore_on_reconnect
+		return control
+	def state(self):
+		"""Returns the process's in memory mirror of this device's channel gains, mutes, and VU levels"""
+		return shared_device_state(self)
+	def push_levels(self, levels):
+		"""Sets the gain and mute of each (channel, gain, mute) in levels with batched commands, returning True if every command succeeded"""
+		if not levels: return True
+		control = self.control()
+		succeeded = control.set_gains(dict([(channel.short_name, gain) for channel, gain, mute in levels]))
+		if not control.mute_channels([channel.short_name for channel, gain, mute in levels if mute]): succeeded = False
+		if not control.unmute_channels([channel.short_name for channel, gain, mute in levels if not mute]): succeeded = False
+		shared_gain_engine().forget([channel for channel, gain, mute in levels])
+		state = self.state()
+		for channel, gain, mute in levels: state.record(channel.short_name, gain=gain, mute=mute)
+		return succeeded
+	def restore_last_known_state(self):
+		"""Sets every channel to the effective gain and mute last set through the art server, as after the SoundMan server restarts"""
+		return self.push_levels([(channel, channel.effective_gain, channel.mute) for channel in self.abchannel_set.select_related('channel_group')])
+	def restore_on_reconnect(self, pool):
+		"""Called in a thread of its own when the pool to this device's server reconnects after the server couldn't be reached.
+		Every process's pool sees the restart, so the first to claim it in the cache restores the state and the others leave it alone."""
+		if not cache.add('soundman-restore-%s-%s' % (self.ip, self.port), True, getattr(settings, 'SOUNDMAN_RESTORE_SECONDS', 60)): return
+		try:
+			if ABDevice.objects.get(pk=self.id).restore_last_known_state():
+				logging.info('Restored the last known state of %s' % self)
+			else:
+				logging.error('Could not restore the last known state of %s' % self)
+		except:
+			logging.exception('Could not restore the last known state of %s' % self)
 	class Meta:
 		verbose_name = 'AudioBox device'
 		verbose_name_plural = 'AudioBox devices'
@@ -35,7 +74,7 @@ class ABDevice(models.Model):
 class ABChannelGroup(models.Model):
 	"""A set of channels whose gain can be controlled as a group, each with relative gain changes."""
 	name = models.CharField(max_length=1024, null=False, blank=False)
-	master_gain = models.FloatField(null=False, default=0)
+	master_gain = models.FloatField(null=False, default=1)
 	def wrap(self): return ABChannelGroupInfo(self.id, self.name, self.master_gain, [channel.wrap() for channel in self.channels.all()])
 	class Meta:
 		verbose_name = 'channel group'
@@ -50,12 +89,26 @@ class ABChannel(models.Model):
 	number = models.IntegerField(blank=False, null=False)
 	channel_group = models.ForeignKey(ABChannelGroup, blank=True, null=True, related_name="channels")
 	gain = models.FloatField(null=False, default=1)
+	mute = models.BooleanField(default=False)
 	CHANNEL_TYPES = (('o','Output'), ('i','Input'), ('p','Playback'))
 	channel_type = models.CharField(max_length=1, null=False, blank=False, default='o', choices=CHANNEL_TYPES)
 
 	@property
 	def short_name(self): return '%s%s' % (self.channel_type, self.number)
 
+	@property
+	def effective_gain(self):
+		"""The gain the channel plays at, which for a grouped channel is its gain multiplied by the group's master gain"""
+		if self.channel_group == None: return self.gain
+		return self.gain * self.channel_group.master_gain
+
+	def set_effective_gain(self, effective_gain):
+		"""Sets the gain so the channel plays at effective_gain under its group's master gain, when the master gain allows it"""
+		if self.channel_group == None:
+			self.gain = effective_gain
+		elif self.channel_group.master_gain != 0:
+			self.gain = effective_gain / self.channel_group.master_gain
+
 	def wrap(self): return ABChannelInfo(self.id, self.number, self.gain, self.channel_type)
 
 	class Meta:
@@ -64,3 +117,57 @@ class ABChannel(models.Model):
 		ordering = ['number']
 
 	def __unicode__(self): return '%s %s%s' % (self.audioBoxDevice.__unicode__(), self.channel_type, self.number)
+
+class ABPreset(models.Model):
+	"""A named mix: the gain and mute of every channel on every AudioBox device."""
+	name = models.CharField(max_length=1024, null=False, blank=False)
+
+	def capture(self):
+		"""Replaces the levels with those of the live devices, read with one sweep of each, and returns the channels which couldn't be read"""
+		missing = []
+		for device in ABDevice.objects.all():
+			state = device.state()
+			state.sweep()
+			for channel in device.abchannel_set.all():
+				gain = state.gains.get(channel.short_name.lower(), None)
+				mute = state.mutes.get(channel.short_name.lower(), None)
+				if gain == None or mute == None:
+					missing.append(channel)
+					continue
+				level, created = ABPresetLevel.objects.get_or_create(preset=self, channel=channel, defaults={ 'gain':gain, 'mute':mute })
+				if not created:
+					level.gain = gain
+					level.mute = mute
+					level.save()
+		return missing
+
+	def apply(self):
+		"""Sets the devices to the preset's levels with batched commands and makes them the channels' last known state, returning True if every command succeeded"""
+		device_levels = {}
+		for level in self.levels.select_related('channel', 'channel__audioBoxDevice', 'channel__channel_group'):
+			device_levels.setdefault(level.channel.audioBoxDevice, []).append((level.channel, level.gain, level.mute))
+		succeeded = True
+		for device, levels in device_levels.items():
+			if not device.push_levels(levels): succeeded = False
+			for channel, gain, mute in levels:
+				channel.set_effective_gain(gain)
+				channel.mute = mute
+				channel.save()
+		return succeeded
+
+	class Meta:
+		verbose_name = 'audio preset'
+		verbose_name_plural = 'audio presets'
+		ordering = ['name']
+	def __unicode__(self): return self.name
+
+class ABPresetLevel(models.Model):
+	"""The gain and mute of one channel in an ABPreset."""
+	preset = models.ForeignKey(ABPreset, blank=False, null=False, related_name='levels')
+	channel = models.ForeignKey(ABChannel, blank=False, null=False, related_name='preset_levels')
+	gain = models.FloatField(null=False, default=1)
+	mute = models.BooleanField(default=False)
+	class Meta:
+		unique_together = (('preset', 'channel'),)
+	def __unicode__(self): return '%s %s: %s%s' % (self.preset, self.channel, self.gain, self.mute and ' (muted)' or '')
+
@@ -3,7 +3,8 @@
 This code connects over TCP to the SoundMan server and communicates using the "SoundMan-Script" protocol.
 Information on the protocol is here: http://www.richmondsounddesign.com/soundman-script.html
 
-NOTE: The SoundMan server allows only 16 concurrent connections, so all clients should judiciously close connections.
+NOTE: The SoundMan server allows only 16 concurrent connections, so each process shares a small pool of open sessions to each server (see SoundManPool)
+and every process on the machine takes a lock file slot for each session it opens, so together they stay under the limit (see SessionSlots).
 
 - this library only uses TCP (Richmond charges extra for UDP)
 
@@ -23,6 +24,7 @@ Commands, responses, and tokens:
 - responses may be multiple lines
 - command control responses are first-come-first-served and synchronous
 - except for the periodic responses to commands like GET VU
+- SoundManResponseReader frames these into SoundManResponses as the bytes arrive
 
 Opening welcome:
 
@@ -58,6 +60,7 @@ IDs:
 - Ranges: INPUT4-11, O 3-9, PB1 TO 6, X1.2-16
 - Mixes: I6-23 26 30-43, 
 - commas can be used instead of spaces: I 6-23,26,30-43 (but not for X or PX, which it looking for periods)
+- channel_id_lists builds these from channel names so one SET can cover many channels
 
 Gains:
 
@@ -66,21 +69,375 @@ Gains:
 - 2 is double normal, so be careful about clipping
 
 """
+import os
+import re
+import fcntl
+import tempfile
+import collections
 import telnetlib
 import pprint
 import traceback
+import threading
 import socket
+import time
 import sys
 
-class SoundManControl:
-	def __init__(self, host, port=20000):
+# Each process keeps at most this many sessions open to a SoundMan server
+MAX_SESSIONS = 4
+
+# Every process on the machine together keeps at most this many sessions open to a SoundMan server, leaving room under its limit of 16 for other clients
+SERVER_MAX_SESSIONS = 12
+
+# Matches the name=value pairs of responses like 'GAIN o1=0.5 o2=1', allowing spaces around the =
+VALUE_PATTERN = re.compile(r'([^\s=]+)\s*=\s*([^\s=]+)')
+
+class SoundManResponse:
+	"""One response from the server.  The kind is one of the constants below, lines holds its lines without their endings or terminators,
+	and error_code is the number from an ERROR line (or None if the server didn't give one)."""
+	OK = 'OK'
+	ERROR = 'ERROR'
+	VALUE = 'VALUE' # a single line ending with a semi-colon, like the answer to a GET
+	MULTILINE = 'MULTILINE' # lines ended by a line holding just a period, like the answer to an inquiry or the greeting
+
+	def __init__(self, kind, lines, error_code=None):
+		self.kind = kind
+		self.lines = lines
+		self.error_code = error_code
+
+	@property
+	def is_error(self): return self.kind == SoundManResponse.ERROR
+
+	@property
+	def text(self):
+		"""The response as one string: the line of a single line response without its semi-colon, or the lines of a multi-line one joined by CRLF"""
+		return '\r\n'.join(self.lines)
+
+	def __repr__(self): return 'SoundManResponse(%s, %r, %s)' % (self.kind, self.lines, self.error_code)
+
+class SoundManResponseReader:
+	"""Frames the bytes from the server into SoundManResponses as they arrive, in time linear in the bytes however they're split up.
+	The first response is the greeting, which is kept as greeting rather than handed out by next_response."""
+	def __init__(self, expect_greeting=True):
+		self.buffer = bytearray()
+		self.scanned = 0 # how far into the buffer is known to hold no line ending
+		self.multiline = None # the lines so far of an unfinished multi-line response
+		self.responses = collections.deque()
+		self.expect_greeting = expect_greeting
+		self.greeting = None
+
+	def feed(self, data):
+		"""Adds data from the server, framing any responses it completes"""
+		self.buffer.extend(data)
+		start = 0
+		while True:
+			end = self.buffer.find('\n', max(start, self.scanned))
+			if end == -1: break
+			self.add_line(str(self.buffer[start:end]).strip())
+			start = end + 1
+		del self.buffer[:start]
+		self.scanned = len(self.buffer)
+
+	def add_line(self, line):
+		if self.multiline != None:
+			if line == '.':
+				self.add_response(SoundManResponse(SoundManResponse.MULTILINE, self.multiline))
+				self.multiline = None
+			else:
+				self.multiline.append(line)
+		elif not line:
+			return
+		elif self.expect_greeting:
+			self.multiline = [line] # the greeting's OK lines end with a period like other multi-line responses
+		elif line.upper() == 'OK' or line.upper().startswith('OK '):
+			self.add_response(SoundManResponse(SoundManResponse.OK, [line]))
+		elif line.upper().startswith('ERROR'):
+			tokens = line.split()
+			error_code = len(tokens) > 1 and tokens[1].isdigit() and int(tokens[1]) or None
+			self.add_response(SoundManResponse(SoundManResponse.ERROR, [line], error_code))
+		elif line.endswith(';'):
+			self.add_response(SoundManResponse(SoundManResponse.VALUE, [line[:-1].rstrip()]))
+		else:
+			self.multiline = [line]
+
+	def add_response(self, response):
+		if self.expect_greeting:
+			self.expect_greeting = False
+			self.greeting = response
+		else:
+			self.responses.append(response)
+
+	def next_response(self):
+		"""Returns the oldest complete response which hasn't been handed out, or None"""
+		if not self.responses: return None
+		return self.responses.popleft()
+
+class SessionSlots:
+	"""Limits the sessions which all of the processes on this machine have open to one SoundMan server, with a lock file for each of max_sessions slots.
+	Each open session holds an exclusive flock on one of the files, and the kernel lets go of the locks of a process which exits or dies."""
+	def __init__(self, host, port, max_sessions=SERVER_MAX_SESSIONS, lock_dir=None):
+		self.max_sessions = max_sessions
+		if lock_dir == None: lock_dir = os.path.join(tempfile.gettempdir(), 'soundman-sessions')
+		self.lock_dir = lock_dir
+		self.paths = [os.path.join(lock_dir, '%s-%s-%s.lock' % (host, port, index)) for index in range(max_sessions)]
+
+	def acquire(self):
+		"""Returns the open file of a free slot, now locked, or None if every slot is taken"""
+		if not os.path.exists(self.lock_dir):
+			try:
+				os.makedirs(self.lock_dir)
+			except OSError:
+				pass # another process made it first
+		for path in self.paths:
+			slot = open(path, 'a')
+			try:
+				fcntl.flock(slot.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+				return slot
+			except IOError:
+				slot.close()
+		return None
+
+	def wait(self, timeout):
+		"""Returns a locked slot, waiting up to timeout seconds for another session (perhaps in another process) to close if they're all taken"""
+		deadline = time.time() + timeout
+		slot = self.acquire()
+		while slot == None:
+			if time.time() >= deadline: raise Exception('All %s sessions to the SoundMan server are open in this machine\'s processes' % self.max_sessions)
+			time.sleep(0.05)
+			slot = self.acquire()
+		return slot
+
+	def release(self, slot): slot.close() # which unlocks it
+
+class SoundManSession:
+	"""One open connection to a SoundMan server whose greeting has been read, so commands can be sent over it one after another.
+	With slots the session holds one of the SessionSlots from when it opens until it closes."""
+	def __init__(self, host, port, timeout=10, slots=None):
 		self.host = host
 		self.port = port
+		self.timeout = timeout
+		self.slots = slots
+		self.slot = None
 		self.receive_size = 1024 * 5
+		self.sock = None
+		self.reader = None
+		self.last_used = 0
+		self.command_count = 0
+
+	def open(self):
+		if self.slots != None: self.slot = self.slots.wait(self.timeout)
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.sock.settimeout(self.timeout)
+		self.reader = SoundManResponseReader()
+		try:
+			self.sock.connect((self.host, self.port))
+			while self.reader.greeting == None: self.receive()
+		except:
+			self.close()
+			raise
+		self.last_used = time.time()
+
+	def close(self):
+		if self.slot != None:
+			self.slots.release(self.slot)
+			self.slot = None
+		if self.sock == None: return
+		try:
+			self.sock.shutdown(socket.SHUT_RDWR)
+		except socket.error:
+			pass
+		self.sock.close()
+		self.sock = None
+
+	def receive(self):
+		"""Waits for data from the server and feeds it to the reader"""
+		value = self.sock.recv(self.receive_size)
+		if not value: raise socket.error('The SoundMan server at %s:%s closed the connection' % (self.host, self.port))
+		self.reader.feed(value)
+
+	def read_response(self):
+		"""Returns the next response from the server, waiting for it if it hasn't arrived"""
+		response = self.reader.next_response()
+		while response == None:
+			self.receive()
+			response = self.reader.next_response()
+		return response
+
+	def execute(self, command):
+		"""Sends the command and returns its SoundManResponse"""
+		self.sock.sendall('%s\r\n' % command)
+		response = self.read_response()
+		self.last_used = time.time()
+		self.command_count += 1
+		return response
+
+class SoundManPool:
+	"""A thread safe set of sessions to one SoundMan server which are kept open and shared by every caller in the process.
+	At most max_sessions are open at once, and with slots no more than the SessionSlots allow across every process; callers wait for a free session when they're all busy.
+	Sessions idle for longer than idle_timeout are closed, and a session which fails is closed and its command retried once on a new session.
+	When a session opens after new sessions failed to, as when the server restarts, reconnect_listener (if set) is called with the pool in a thread of its own.
+	Open sessions which break (timeouts, or the server dropping idle connections) aren't taken for a restart as long as new sessions still open."""
+	def __init__(self, host, port=20000, max_sessions=MAX_SESSIONS, timeout=10, idle_timeout=60, slots=None):
+		self.host = host
+		self.port = port
+		self.slots = slots
+		if slots != None: max_sessions = min(max_sessions, slots.max_sessions)
+		self.max_sessions = max_sessions
+		self.timeout = timeout
+		self.idle_timeout = idle_timeout
+		self.idle_sessions = []
+		self.session_count = 0
+		self.opened_count = 0
+		self.lost = False # True once a new session has failed to open, until one does
+		self.reconnect_listener = None
+		self.condition = threading.Condition()
+
+	def acquire(self):
+		"""Returns an idle session or a newly opened one, waiting up to timeout seconds if max_sessions are busy"""
+		deadline = time.time() + self.timeout
+		self.condition.acquire()
+		try:
+			self.close_idle_sessions()
+			while not self.idle_sessions and self.session_count >= self.max_sessions:
+				remaining = deadline - time.time()
+				if remaining <= 0: raise Exception('All %s sessions to the SoundMan server at %s:%s are busy' % (self.max_sessions, self.host, self.port))
+				self.condition.wait(remaining)
+			if self.idle_sessions: return self.idle_sessions.pop()
+			self.session_count += 1
+		finally:
+			self.condition.release()
+		session = SoundManSession(self.host, self.port, self.timeout, self.slots)
+		try:
+			session.open()
+		except:
+			self.release(session, broken=True, lost=True)
+			raise
+		self.opened_count += 1
+		self.condition.acquire()
+		try:
+			reconnected = self.lost
+			self.lost = False
+		finally:
+			self.condition.release()
+		if reconnected and self.reconnect_listener:
+			thread = threading.Thread(target=self.reconnect_listener, args=(self,))
+			thread.setDaemon(True)
+			thread.start()
+		return session
+
+	def release(self, session, broken=False, lost=False):
+		"""Returns the session to the pool, or closes it if it's broken.  lost means the server couldn't be reached at all."""
+		self.condition.acquire()
+		try:
+			if broken:
+				session.close()
+				self.session_count -= 1
+				if lost: self.lost = True
+			else:
+				self.idle_sessions.append(session)
+			self.condition.notify()
+		finally:
+			self.condition.release()
+
+	def close_idle_sessions(self, idle_timeout=None):
+		"""Closes the sessions which have been idle for longer than idle_timeout (which defaults to the pool's), or all of them if it's 0"""
+		if idle_timeout == None: idle_timeout = self.idle_timeout
+		self.condition.acquire()
+		try:
+			for session in [session for session in self.idle_sessions if time.time() - session.last_used >= idle_timeout]:
+				self.idle_sessions.remove(session)
+				session.close()
+				self.session_count -= 1
+			self.condition.notifyAll()
+		finally:
+			self.condition.release()
+
+	def close(self): self.close_idle_sessions(0)
+
+	def execute(self, command):
+		"""Runs the command on a pooled session and returns its SoundManResponse"""
+		for attempt in range(2):
+			session = self.acquire()
+			reused = session.command_count > 0
+			try:
+				result = session.execute(command)
+			except:
+				self.release(session, broken=True)
+				if reused and attempt == 0:
+					# the server may have restarted or dropped sessions which sat idle, so the command gets a second try on a fresh session
+					self.close_idle_sessions(0)
+					continue
+				raise
+			self.release(session)
+			return result
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def shared_pool(host, port=20000, max_sessions=None, server_max_sessions=None, lock_dir=None):
+	"""Returns the process's SoundManPool for the server, creating it the first time with SessionSlots shared by every process on the machine"""
+	_pools_lock.acquire()
+	try:
+		if (host, port) not in _pools:
+			slots = SessionSlots(host, port, server_max_sessions or SERVER_MAX_SESSIONS, lock_dir)
+			_pools[(host, port)] = SoundManPool(host, port, max_sessions or MAX_SESSIONS, slots=slots)
+		return _pools[(host, port)]
+	finally:
+		_pools_lock.release()
+
+def split_channel_name(channel_name):
+	"""Splits a channel name like 'o12' into its type and number, ('o', 12)"""
+	channel_name = channel_name.strip()
+	index = 0
+	while index < len(channel_name) and not channel_name[index].isdigit(): index += 1
+	return (channel_name[:index].strip(), int(channel_name[index:]))
+
+def channel_id_lists(channel_names):
+	"""Returns the channels as SoundMan ID lists with ranges, one per channel type, so ['i6', 'i7', 'i8', 'i26', 'o2'] becomes ['i6-8 26', 'o2']"""
+	numbers = {}
+	for channel_name in channel_names:
+		channel_type, number = split_channel_name(channel_name)
+		numbers.setdefault(channel_type, set()).add(number)
+	id_lists = []
+	for channel_type in sorted(numbers.keys()):
+		ranges = []
+		for number in sorted(numbers[channel_type]):
+			if ranges and ranges[-1][1] == number - 1:
+				ranges[-1][1] = number
+			else:
+				ranges.append([number, number])
+		ids = [first == last and '%s' % first or '%s-%s' % (first, last) for first, last in ranges]
+		id_lists.append('%s%s' % (channel_type, ' '.join(ids)))
+	return id_lists
+
+class SoundManControl:
+	"""Sends commands over the process's shared SoundManPool for the server, unless it's given a pool of its own"""
+	def __init__(self, host, port=20000, max_sessions=None, pool=None):
+		self.host = host
+		self.port = port
+		if pool == None: pool = shared_pool(host, port, max_sessions)
+		self.pool = pool
 	
 	def set_gains(self, gain_map):
-		"""gain_map is of types {'o1':1.0 } channel name and gain float"""
-		for (name, gain) in gain_map.items(): self.set_gain(name, gain)
+		"""gain_map is of types {'o1':1.0 } channel name and gain float
+		Channels which share a gain are set together, so there is a command for each distinct gain and channel type rather than for each channel.
+		Returns True if every command succeeded."""
+		channels_by_gain = {}
+		for (name, gain) in gain_map.items(): channels_by_gain.setdefault(float(gain), []).append(name)
+		succeeded = True
+		for gain, names in sorted(channels_by_gain.items()):
+			if not self.set_channels(names, 'GAIN', gain): succeeded = False
+		return succeeded
+
+	def set_channels(self, channel_names, property_name, value):
+		"""Sets the property of many channels with one SET command per channel type, returning True if every command succeeded"""
+		succeeded = True
+		for id_list in channel_id_lists(channel_names):
+			if self.is_an_error_response(self.send_command('SET CHAN %s %s %s' % (id_list, property_name, value))): succeeded = False
+		return succeeded
+
+	def mute_channels(self, channel_names): return self.set_channels(channel_names, 'MUTE', 'ON')
+
+	def unmute_channels(self, channel_names): return self.set_channels(channel_names, 'MUTE', 'OFF')
 
 	def set_gain(self, channel_name, gain): return self.send_command('SET CHAN %s GAIN %s' % (channel_name, gain))
 
@@ -105,63 +462,39 @@ class SoundManControl:
 		response = self.send_command('GET CHAN %s GAIN' % channel_list)
 		return (self.parse_gains(response), response)
 
-	def parse_gains(self, response):
-		#print response
-		tokens = response.split(' ')
-		if tokens[0].lower() != 'gain': return None
-		results = {}
-		for token in tokens[1:]:
-			key, val = token.split('=')
-			#print token, key, val
-			results[key] = float(val)
-		return results
+	def get_mutes(self, channel_list):
+		response = self.send_command('GET CHAN %s MUTE' % channel_list)
+		return (self.parse_mutes(response), response)
+
+	def parse_gains(self, response): return self.parse_values(response, 'gain', float)
+
+	def parse_mutes(self, response): return self.parse_values(response, 'mute', lambda value: value.upper() == 'ON')
+
+	def parse_values(self, response, property_name, convert):
+		"""Parses a response like 'GAIN o1=0.5 o2=1' into {'o1':0.5, 'o2':1.0}, returning None if it isn't for the property"""
+		if response == None: return None
+		tokens = response.split(None, 1)
+		if not tokens or tokens[0].lower() != property_name: return None
+		if len(tokens) == 1: return {}
+		return dict([(key, convert(val)) for key, val in VALUE_PATTERN.findall(tokens[1])])
 
 	def is_an_error_response(self, response): return response == None or len(response) == 0 or response.startswith('ERROR')
 
-	def read_result(self, sock):
-		result = ''
-		finished_header = False
-		while True:
-			value = sock.recv(self.receive_size)
-			#print 'RECV: %s' % repr(value)
-			if value == None or len(value) == 0: break
-			if not finished_header:
-				header_end = value.find("\r\n.\r\n")
-				if header_end != -1:
-					finished_header = True
-					value = value[header_end + 5:]
-
-			if finished_header:	
-				result = result + value
-				#print 'RESULT %s' % repr(result)
-				if result.endswith("\r\n.\r\n") or result.endswith("OK\r\n") or result == 'OK' or result.startswith('ERROR ') or result.endswith(';\r\n'): break
-
-		if not finished_header: raise Exception("Did not find the end of the SoundMan greeting: %s" % value)
-		result = result.strip()
-		if result.endswith(';'):result = result[0:-1]
-		return result
+	def close(self): self.pool.close()
 
 	def send_command(self, command):
 		"Sends a command to the device.  Returns the result code or None if it can't control the device."
-		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		sock.settimeout(10)
+		response = self.send_request(command)
+		if response == None or response.text == '': return None
+		return response.text
+
+	def send_request(self, command):
+		"""Sends a command to the device.  Returns its SoundManResponse or None if it can't control the device."""
 		try:
-			sock.connect((self.host, self.port))
-			sock.send('%s\r\n' % command)
-			value = self.read_result(sock)
-			if value == '': 
-				sock.shutdown(socket.SHUT_RDWR)
-				sock.close()
-				return None
-			sock.shutdown(socket.SHUT_RDWR)
-			sock.close()
-			return value
+			return self.pool.execute(command)
 		except:
-			value = None
 			traceback.print_exc() 
-			sock.shutdown(socket.SHUT_RDWR)
-			sock.close()
-			return value
+			return None
 
 def main(sm_control):
 	while True:
@@ -3,7 +3,8 @@ This script should be run once the machine running the SoundMan server has boote
 
 It will set up the interface and set the playback matrix to diagonal 1.
 
-It will then iterate over all of the art server defined channel groups and set the gains accordingly.
+It will then ask the art server to restore the last known gains and mutes of every channel with batched commands,
+or if the art server can't do that, set the channel gains from its device list itself, again with batched commands.
 """
 import traceback, sys, urllib, urllib2
 from lxml import etree
@@ -25,6 +26,10 @@ def get_gains(incus_host, port=80):
 	parsed_xml = etree.fromstring(devices_xml)
 	return [(channel.attrib['channel_type'], channel.attrib['number'], channel.attrib['gain']) for channel in parsed_xml.xpath('//abchannel')]
 	
+def restore(incus_host, port=80):
+	"""Asks the art server to push the last known state of every channel, raising an exception if it couldn't"""
+	return urllib2.urlopen('http://%s:%s/api/audio/restore/' % (incus_host, port), urllib.urlencode({ 'restore':'all' })).read()
+
 def main():
 	if len(sys.argv) != 3:
 		print_usage()
@@ -36,7 +41,11 @@ def main():
 	soundman_control.send_command('config set interface 0')
 	soundman_control.send_command('set matrix pb diagonal gain 1;')
 
-	for gain in get_gains(incus_host):
-		soundman_control.set_gain('%s%s' % (gain[0], gain[1]), gain[2])
+	try:
+		print restore(incus_host)
+	except:
+		traceback.print_exc()
+		print 'Setting the gains from the art server device list instead'
+		soundman_control.set_gains(dict([('%s%s' % (channel_type, number), gain) for (channel_type, number, gain) in get_gains(incus_host)]))
 
 if __name__ == '__main__': main()
@@ -0,0 +1,17 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+from scripts.scheduler import Task
+import traceback
+import logging
+
+class SoundManWatchTask(Task):
+	"""The task which asks each AudioBox device's SoundMan server for a channel's mute, so a restarted server is noticed and has its last known state restored.
+	The loopdelay should stay below the pool's idle timeout (60 seconds) so the watched session is still open when the server restarts."""
+	def __init__(self, loopdelay=30, initdelay=5):
+		Task.__init__(self, self.do_it, loopdelay, initdelay)
+
+	def do_it(self):
+		from models import ABDevice
+		for device in ABDevice.objects.all():
+			channels = list(device.abchannel_set.all()[:1])
+			if not channels: continue
+			if device.control().send_request('GET CHAN %s MUTE' % channels[0].short_name) == None: logging.info('Could not reach the SoundMan server of %s' % device)
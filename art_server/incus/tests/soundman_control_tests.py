@@ -1,12 +1,18 @@
-import socket, select, time, traceback
+import socket, select, time, traceback, random
 import threading
+import shutil
+import tempfile
 
 from django.test import TestCase
 from django.test.client import Client
 from django.contrib.auth.models import User
 from django.core import mail
+from django.core.cache import cache
 
-from incus.soundman_control import SoundManControl
+from incus.models import *
+from incus.soundman_control import SoundManControl, SoundManPool, SessionSlots, SoundManSession, SoundManResponse, SoundManResponseReader, channel_id_lists
+from incus.group_gain import GroupGainEngine
+from incus.device_state import ABDeviceState
 
 class MockChannel:
 	def __init__(self, id, channel_type='i', gain=0, mute=False):
@@ -14,14 +20,17 @@ class MockChannel:
 		self.id = id
 		self.gain = gain
 		self.mute = mute
+		self.vu = 0.0
 
 	@property
 	def name(self): return '%s%s' % (self.channel_type, self.id)
 
 class MockSoundManServer(threading.Thread):
-	"""This creates a single threaded localhost server socket which speaks the SoundMan protocol"""
+	"""This creates a localhost server socket which speaks the SoundMan protocol.
+	Each connection is served in its own thread and, like the real server, it refuses connections beyond the 16th."""
 
 	GREETING = """OK                      *********************************\r\nOK                      ** Welcome to SoundMan-Server! **\r\nOK                      *********************************\r\n.\r\n"""
+	MAX_CONNECTIONS = 16
 
 	def __init__(self):
 		self.backlog = 5 
@@ -36,7 +45,17 @@ class MockSoundManServer(threading.Thread):
 		self.outputs = [MockChannel(i, 'o') for i in range(15)]
 		self.playbacks = [MockChannel(i, 'p') for i in range(5)]
 
+		self.clients = []
+		self.connection_count = 0
+		self.max_concurrent_connections = 0
+		self.refused_count = 0
+		self.refuse_connections = False # set to True to hang up on new connections, as the server does while it restarts
+		self.command_count = 0
+		self.lock = threading.Lock()
+		self.started = threading.Event()
+
 		threading.Thread.__init__(self)
+		self.setDaemon(True)
 
 	def strip_int(self, raw): return int(''.join([c for c in raw if c.isdigit()]))
 
@@ -47,8 +66,25 @@ class MockSoundManServer(threading.Thread):
 		if name.lower().startswith('p') and id < len(self.playbacks): return self.playbacks[id]
 		return None
 		
+	def address(self):
+		self.started.wait(5)
+		return self.server.getsockname()
+
+	def drop_connections(self):
+		"""Hangs up on every client, as the server does when it restarts"""
+		self.lock.acquire()
+		try:
+			for client in self.clients:
+				try:
+					client.shutdown(socket.SHUT_RDWR)
+				except socket.error:
+					pass
+		finally:
+			self.lock.release()
+
 	def stop_server(self):
 		self.running = False
+		self.drop_connections()
 		if self.server: self.server.close()
 	
 	def run(self): 
@@ -59,62 +95,126 @@ class MockSoundManServer(threading.Thread):
 		self.server.bind(('127.0.0.1',self.port)) 
 		self.server.listen(self.backlog)
 		self.running = True
+		self.started.set()
 		while self.running:
 			try:
 				client, address = self.server.accept()
 				client.setblocking(1)
-				client.send(MockSoundManServer.GREETING)
-				data = client.recv(self.buffer_size) 
-				if not data:
-					client.close()
-					continue
-				data = data.strip()
-				#print 'Received ', data
-				response = None
-				if data.startswith('ECHO '): # A fake command that we use for testing the parser
-					response = '%s;' % data[len('ECHO '):]
-				elif data.lower().startswith('get chan '):
-					channel_names, attributes = self.parse_chan_list(data)
-					response = attributes[0]
-					if attributes[0] == 'gain':
-						for channel_name in channel_names:
-							channel = self.get_channel(channel_name)
-							response += ' %s=%s' % (channel.name, channel.gain)
-					elif attributes[0] == 'mute':
-						for channel_name in channel_names:
-							channel = self.get_channel(channel_name)
-							if channel.mute:
-								response += ' %s=ON' % channel.name
-							else:
-								response += ' %s=OFF' % channel.name
-					else:
-						response = 'ERROR 4444'
-				elif data.lower().startswith('set chan '):
-					channel_names, attributes = self.parse_chan_list(data, end_token_count=2)
-					for channel_name in channel_names:
-						channel = self.get_channel(channel_name)
-						if attributes[0] == 'gain':
-							channel.gain = float(attributes[1])
-							response = 'OK'
-						elif attributes[0] == 'mute':
-							channel.mute = attributes[1] == 'on'
-							response = 'OK'
-						else:
-							response = 'ERROR 3333'
-				else:
-					response = 'ERROR 1234'
-				client.send(('%s\r\n' % response).encode())
-				client.close()
+				self.lock.acquire()
+				try:
+					if self.refuse_connections or len(self.clients) >= MockSoundManServer.MAX_CONNECTIONS:
+						self.refused_count += 1
+						client.close()
+						continue
+					self.clients.append(client)
+					self.connection_count += 1
+					self.max_concurrent_connections = max(self.max_concurrent_connections, len(self.clients))
+				finally:
+					self.lock.release()
+				thread = threading.Thread(target=self.serve, args=(client,))
+				thread.setDaemon(True)
+				thread.start()
 			except (socket.timeout):
 				continue
 			except:
-				traceback.print_exc()
+				if self.running: traceback.print_exc()
 		self.server.close()
 
+	def serve(self, client):
+		try:
+			client.send(MockSoundManServer.GREETING)
+			buffer = ''
+			while self.running:
+				data = client.recv(self.buffer_size) 
+				if not data: break
+				buffer += data
+				while '\n' in buffer:
+					line, buffer = buffer.split('\n', 1)
+					line = line.strip()
+					if not line: continue
+					self.command_count += 1
+					if line.lower() == 'get vu':
+						thread = threading.Thread(target=self.send_vu, args=(client,))
+						thread.setDaemon(True)
+						thread.start()
+						continue
+					client.sendall(('%s\r\n' % self.respond(line)).encode())
+		except socket.error:
+			pass
+		except:
+			traceback.print_exc()
+		self.lock.acquire()
+		try:
+			if client in self.clients: self.clients.remove(client)
+		finally:
+			self.lock.release()
+		client.close()
+
+	def send_vu(self, client, period=0.02):
+		"""Sends the output levels every period seconds, as the server does after a GET VU, until the client goes away"""
+		try:
+			while self.running and client in self.clients:
+				client.sendall('VU %s;\r\n' % ' '.join(['%s=%s' % (channel.name, channel.vu) for channel in self.outputs]))
+				time.sleep(period)
+		except socket.error:
+			pass
+
+	def respond(self, data):
+		"""Returns the response to one command line"""
+		#print 'Received ', data
+		response = None
+		if data.startswith('ECHO '): # A fake command that we use for testing the parser
+			response = '%s;' % data[len('ECHO '):]
+		elif data.startswith('LIST '): # A fake inquiry with a multi-line response of the given number of lines
+			response = '\r\n'.join(['Line %s of the inquiry' % index for index in range(int(data[len('LIST '):]))] + ['.'])
+		elif data.lower().startswith('get chan '):
+			channel_names, attributes = self.parse_chan_list(data)
+			response = attributes[0]
+			if attributes[0] == 'gain':
+				for channel_name in channel_names:
+					channel = self.get_channel(channel_name)
+					response += ' %s=%s' % (channel.name, channel.gain)
+			elif attributes[0] == 'mute':
+				for channel_name in channel_names:
+					channel = self.get_channel(channel_name)
+					if channel.mute:
+						response += ' %s=ON' % channel.name
+					else:
+						response += ' %s=OFF' % channel.name
+			else:
+				response = 'ERROR 4444'
+			if not response.startswith('ERROR'): response += ';'
+		elif data.lower().startswith('set chan '):
+			channel_names, attributes = self.parse_chan_list(data, end_token_count=2)
+			for channel_name in channel_names:
+				channel = self.get_channel(channel_name)
+				if attributes[0] == 'gain':
+					channel.gain = float(attributes[1])
+					response = 'OK'
+				elif attributes[0] == 'mute':
+					channel.mute = attributes[1] == 'on'
+					response = 'OK'
+				else:
+					response = 'ERROR 3333'
+		else:
+			response = 'ERROR 1234'
+		return response
+
 	def parse_chan_list(self, data, end_token_count=1):
+		"""Expands ID lists like 'i6-8 10,12 o2' into channel names, with each number taking the type of the last one which had a type"""
 		tokens = data.split(' ')
 		channels = []
-		for token in tokens[2:-1 * end_token_count]: channels.append(token)
+		channel_type = ''
+		for token in ','.join(tokens[2:-1 * end_token_count]).split(','):
+			if not token: continue
+			if not token[0].isdigit():
+				channel_type = ''.join([c for c in token if not c.isdigit() and c != '-'])
+				token = token[len(channel_type):]
+			if '-' in token:
+				first, last = token.split('-')
+				channels.extend(['%s%s' % (channel_type, number) for number in range(int(first), int(last) + 1)])
+			else:
+				channels.append('%s%s' % (channel_type, token))
 		return (channels, [token.lower() for token in tokens[-1 * end_token_count:]])
 		
 class SoundManControlTest(TestCase):
@@ -122,13 +222,14 @@ class SoundManControlTest(TestCase):
 	def setUp(self):
 		self.sm_server = MockSoundManServer()
 		self.sm_server.start()
-		time.sleep(1)
+		self.pool = SoundManPool(*self.sm_server.address())
 
 	def tearDown(self):
+		self.pool.close()
 		self.sm_server.stop_server()
 	
 	def test_control(self):
-		sm_control = SoundManControl(self.sm_server.server.getsockname()[0], self.sm_server.server.getsockname()[1])
+		sm_control = SoundManControl(self.sm_server.address()[0], self.sm_server.address()[1], pool=self.pool)
 		test_message = 'FOOF FOR THOUGHT'
 		result = sm_control.send_command('ECHO %s' % test_message)
 		self.failUnlessEqual(result, test_message)
@@ -166,3 +267,355 @@ class SoundManControlTest(TestCase):
 		response = sm_control.toggle_mute('p0')
 		self.failUnlessEqual(sm_control.get_mute('p0'), False)
 
+		# every command went over one session
+		self.failUnlessEqual(self.sm_server.connection_count, 1)
+
+	def test_batched_commands(self):
+		self.failUnlessEqual(channel_id_lists(['i6', 'i7', 'i8', 'i26', 'o2']), ['i6-8 26', 'o2'])
+		self.failUnlessEqual(channel_id_lists(['o3', 'o1', 'o2', 'o2', 'o5', 'p0']), ['o1-3 5', 'p0'])
+		self.failUnlessEqual(channel_id_lists([]), [])
+		self.failUnlessEqual(self.sm_server.parse_chan_list('SET CHAN i6-8 10,12 o2 MUTE ON', end_token_count=2), (['i6', 'i7', 'i8', 'i10', 'i12', 'o2'], ['mute', 'on']))
+
+		sm_control = SoundManControl(self.sm_server.address()[0], self.sm_server.address()[1], pool=self.pool)
+		channel_names = ['o%s' % index for index in range(len(self.sm_server.outputs)) if index != 7] + ['i%s' % index for index in range(len(self.sm_server.inputs))]
+		self.failUnless(sm_control.mute_channels(channel_names))
+		self.failUnlessEqual(self.sm_server.command_count, 2) # one command for the outputs and one for the inputs
+		self.failUnlessEqual([channel.mute for channel in self.sm_server.outputs], [index != 7 for index in range(len(self.sm_server.outputs))])
+		self.failUnlessEqual([channel.mute for channel in self.sm_server.inputs], [True] * len(self.sm_server.inputs))
+		self.failUnless(sm_control.unmute_channels(channel_names))
+		self.failUnlessEqual(len([channel for channel in self.sm_server.outputs + self.sm_server.inputs if channel.mute]), 0)
+
+		# channels which share a gain are set together
+		self.failUnless(sm_control.set_gains({'o1':-3, 'o2':-3, 'o3':-3, 'o5':-6, 'o6':-6, 'p2':-3}))
+		self.failUnlessEqual(self.sm_server.command_count, 7)
+		self.failUnlessEqual([channel.gain for channel in self.sm_server.outputs[:7]], [0, -3, -3, -3, 0, -6, -6])
+		self.failUnlessEqual(self.sm_server.playbacks[2].gain, -3)
+
+		self.failIf(sm_control.set_channels(['o1'], 'COLOUR', 'BLUE'))
+
+	def test_response_reader(self):
+		reader = SoundManResponseReader()
+		reader.feed(MockSoundManServer.GREETING[:40])
+		self.failUnlessEqual(reader.greeting, None)
+		reader.feed(MockSoundManServer.GREETING[40:] + 'OK\r\nERROR 1234\r\nGAIN o1=0.5 o2 = 1;\r\nInquiry\r\n\r\nmore\r\n.\r\nERROR\r\nGAIN o1=0.5')
+		self.failUnlessEqual(reader.greeting.kind, SoundManResponse.MULTILINE)
+		self.failUnlessEqual(len(reader.greeting.lines), 3)
+		self.failUnlessEqual(reader.next_response().kind, SoundManResponse.OK)
+		response = reader.next_response()
+		self.failUnless(response.is_error)
+		self.failUnlessEqual(response.error_code, 1234)
+		response = reader.next_response()
+		self.failUnlessEqual((response.kind, response.text), (SoundManResponse.VALUE, 'GAIN o1=0.5 o2 = 1'))
+		self.failUnlessEqual(SoundManControl('127.0.0.1', pool=self.pool).parse_gains(response.text), {'o1':0.5, 'o2':1.0})
+		response = reader.next_response()
+		self.failUnlessEqual((response.kind, response.lines), (SoundManResponse.MULTILINE, ['Inquiry', '', 'more']))
+		response = reader.next_response()
+		self.failUnlessEqual((response.kind, response.error_code), (SoundManResponse.ERROR, None))
+		self.failUnlessEqual(reader.next_response(), None)
+		reader.feed(';\n')
+		self.failUnlessEqual(reader.next_response().text, 'GAIN o1=0.5')
+
+		# any split of a stream of responses frames the same
+		generator = random.Random(64)
+		expected = []
+		stream = MockSoundManServer.GREETING
+		for index in range(500):
+			kind = generator.choice([SoundManResponse.OK, SoundManResponse.ERROR, SoundManResponse.VALUE, SoundManResponse.MULTILINE])
+			if kind == SoundManResponse.OK:
+				lines = ['OK']
+			elif kind == SoundManResponse.ERROR:
+				lines = ['ERROR %s' % generator.randint(1000, 9999)]
+			elif kind == SoundManResponse.VALUE:
+				lines = ['GAIN o%s=%s' % (index, generator.random())]
+			else:
+				lines = ['Line %s' % generator.randint(0, 100) for i in range(generator.randint(1, 20))]
+			expected.append((kind, lines))
+			stream += '\r\n'.join(lines + (kind == SoundManResponse.MULTILINE and ['.'] or [])) + (kind == SoundManResponse.VALUE and ';' or '') + '\r\n'
+		for trial in range(20):
+			reader = SoundManResponseReader()
+			index = 0
+			while index < len(stream):
+				size = generator.choice([1, 2, 3, 7, 64, 1500])
+				reader.feed(stream[index:index + size])
+				index += size
+			responses = []
+			response = reader.next_response()
+			while response:
+				responses.append((response.kind, response.lines))
+				response = reader.next_response()
+			self.failUnlessEqual(responses, expected)
+			self.failUnlessEqual(len(reader.buffer), 0)
+
+	def test_large_response(self):
+		sm_control = SoundManControl(self.sm_server.address()[0], self.sm_server.address()[1], pool=self.pool)
+		started = time.time()
+		response = sm_control.send_request('LIST 200000')
+		self.failUnlessEqual(response.kind, SoundManResponse.MULTILINE)
+		self.failUnlessEqual(len(response.lines), 200000)
+		self.failUnlessEqual(response.lines[-1], 'Line 199999 of the inquiry')
+		self.failUnless(time.time() - started < 10, 'Took %.2f seconds to read a 200000 line response' % (time.time() - started))
+
+		# a line which arrives a byte at a time is only scanned once
+		reader = SoundManResponseReader(expect_greeting=False)
+		line = 'GAIN %s;\r\n' % ' '.join(['o%s=1.0' % index for index in range(20000)])
+		started = time.time()
+		for character in line: reader.feed(character)
+		self.failUnlessEqual(len(SoundManControl('127.0.0.1', pool=self.pool).parse_gains(reader.next_response().text)), 20000)
+		self.failUnless(time.time() - started < 10, 'Took %.2f seconds to read a line a byte at a time' % (time.time() - started))
+
+	def test_pool(self):
+		host, port = self.sm_server.address()
+		pool = SoundManPool(host, port, max_sessions=3, timeout=5)
+		try:
+			sm_control = SoundManControl(host, port, pool=pool)
+			def set_gains(index):
+				for i in range(10): sm_control.set_gain('o%s' % index, i)
+			threads = [threading.Thread(target=set_gains, args=(index,)) for index in range(12)]
+			for thread in threads: thread.start()
+			for thread in threads: thread.join()
+			self.failUnlessEqual([self.sm_server.outputs[index].gain for index in range(12)], [9.0] * 12)
+			self.failUnless(self.sm_server.max_concurrent_connections <= 3)
+			self.failUnlessEqual(self.sm_server.refused_count, 0)
+			self.failUnlessEqual(pool.opened_count, self.sm_server.connection_count)
+
+			# broken sessions are replaced
+			self.sm_server.drop_connections()
+			time.sleep(0.1)
+			self.failUnlessEqual(sm_control.send_command('ECHO still here'), 'still here')
+
+			# dropped sessions which are replaced right away aren't a restart
+			reconnects = []
+			pool.reconnect_listener = reconnects.append
+			self.sm_server.drop_connections()
+			time.sleep(0.1)
+			self.failUnlessEqual(sm_control.send_command('ECHO connected'), 'connected')
+			self.failUnlessEqual(reconnects, [])
+
+			# a listener hears when the pool reconnects after the server couldn't be reached
+			self.sm_server.drop_connections()
+			self.sm_server.refuse_connections = True
+			time.sleep(0.1)
+			self.failUnlessEqual(sm_control.send_command('ECHO restarting'), None)
+			self.failUnlessEqual(reconnects, [])
+			self.sm_server.refuse_connections = False
+			self.failUnlessEqual(sm_control.send_command('ECHO reconnected'), 'reconnected')
+			deadline = time.time() + 5
+			while not reconnects and time.time() < deadline: time.sleep(0.01)
+			self.failUnlessEqual(reconnects, [pool])
+
+			# idle sessions are closed
+			pool.idle_timeout = 0
+			pool.close_idle_sessions()
+			self.failUnlessEqual(pool.session_count, 0)
+		finally:
+			pool.close()
+
+	def test_session_slots(self):
+		# pools in different processes share the machine's slots, and so does a session outside any pool like the VU meter's
+		host, port = self.sm_server.address()
+		lock_dir = tempfile.mkdtemp()
+		pools = [SoundManPool(host, port, max_sessions=4, timeout=0.3, slots=SessionSlots(host, port, 3, lock_dir)) for i in range(2)]
+		try:
+			self.failUnlessEqual(pools[0].max_sessions, 3)
+			sessions = [(pools[0], pools[0].acquire()), (pools[1], pools[1].acquire())]
+			vu_session = SoundManSession(host, port, 0.3, SessionSlots(host, port, 3, lock_dir))
+			vu_session.open()
+			self.failUnlessRaises(Exception, pools[0].acquire)
+			self.failUnlessEqual(pools[0].session_count, 1)
+			vu_session.close()
+			sessions.append((pools[0], pools[0].acquire()))
+			self.failUnlessEqual(self.sm_server.max_concurrent_connections, 3)
+
+			# closing the sessions gives their slots back
+			for pool, session in sessions: pool.release(session)
+			for pool in pools: pool.close()
+			slot = pools[1].slots.acquire()
+			self.failIfEqual(slot, None)
+			pools[1].slots.release(slot)
+		finally:
+			for pool in pools: pool.close()
+			shutil.rmtree(lock_dir)
+
+class ABDeviceTest(TestCase):
+
+	def setUp(self):
+		self.sm_server = MockSoundManServer()
+		self.sm_server.start()
+		host, port = self.sm_server.address()
+		self.device = ABDevice.objects.create(name='Test AudioBox', ip=host, port=port)
+		self.group = ABChannelGroup.objects.create(name='Gallery')
+		for number, gain in [(1, 1.0), (2, 1.0), (3, 0.5)]:
+			ABChannel.objects.create(audioBoxDevice=self.device, number=number, channel_group=self.group, gain=gain)
+
+	def tearDown(self):
+		self.device.control().close()
+		self.sm_server.stop_server()
+
+	def test_group_gain(self):
+		# a new group plays its channels at their own gains
+		channel = ABChannel.objects.get(number=3)
+		self.failUnlessEqual(self.group.master_gain, 1)
+		self.failUnlessEqual(channel.effective_gain, 0.5)
+		response = Client().post('/api/audio/ab-channel/%s/gain/' % channel.id, { 'gain':'0.75' })
+		self.failUnlessEqual(response.status_code, 200, 'status was %s' % response.status_code)
+		deadline = time.time() + 5
+		while self.sm_server.outputs[3].gain != 0.75 and time.time() < deadline: time.sleep(0.01)
+		self.failUnlessEqual(self.sm_server.outputs[3].gain, 0.75)
+		channel.gain = 0.5
+		channel.save()
+		command_count = self.sm_server.command_count
+
+		engine = GroupGainEngine()
+		engine.ramp_group(self.group, 2.0)
+		engine.frame()
+		self.failUnlessEqual([self.sm_server.outputs[number].gain for number in range(5)], [0, 2, 2, 1, 0])
+		self.failUnlessEqual(self.sm_server.command_count, command_count + 2) # o1-2 at 2 and o3 at 1
+		self.failIf(engine.is_ramping())
+		self.group.master_gain = 2.0
+		self.group.save()
+		self.failUnlessEqual(ABChannel.objects.get(number=3).effective_gain, 1)
+
+		# a new ramp is sent even to gains the engine last sent, as they may have been changed elsewhere
+		self.sm_server.outputs[3].gain = 0.25
+		engine.ramp_group(self.group, 2.0)
+		engine.frame()
+		self.failUnlessEqual(self.sm_server.command_count, command_count + 4)
+		self.failUnlessEqual(self.sm_server.outputs[3].gain, 1)
+
+		# unchanged gains aren't sent again within a ramp
+		engine.ramp([(channel, 1.0, 1.0)], 1)
+		engine.frame()
+		engine.frame()
+		self.failUnlessEqual(self.sm_server.command_count, command_count + 5)
+		del engine.ramps[channel.id]
+
+		# ramps are stepped by the clock
+		request_count = engine.request_count
+		engine.ramp_group(self.group, 0.0, duration=1)
+		start_time = engine.ramps[channel.id].start_time
+		engine.frame(start_time + 0.5)
+		self.failUnlessEqual([self.sm_server.outputs[number].gain for number in range(1, 4)], [1, 1, 0.5])
+		self.failUnlessEqual(engine.request_count, request_count + 1)
+		self.failUnless(engine.is_ramping(channel))
+
+		# a new ramp takes over from where the last one got to
+		engine.ramp([(channel, 5.0, 1.0)], 0)
+		self.failUnless(0.5 <= engine.ramps[channel.id].start_gain <= 1.0)
+		engine.frame()
+		self.failUnlessEqual(self.sm_server.outputs[3].gain, 1)
+
+		engine.start()
+		try:
+			engine.ramp_group(self.group, 0.0, duration=0.3)
+			self.failUnless(engine.wait(5))
+			self.failUnlessEqual([self.sm_server.outputs[number].gain for number in range(1, 4)], [0, 0, 0])
+			self.failUnless(engine.frame_count > 3)
+		finally:
+			engine.stop()
+
+	def test_device_state(self):
+		channel_names = [channel.short_name for channel in self.device.abchannel_set.all()] + ['i0', 'i1', 'i2', 'p1']
+		state = ABDeviceState(self.device.control(), channel_names, interval=0.1, idle_seconds=1)
+		self.sm_server.outputs[2].gain = 0.5
+		self.sm_server.inputs[1].mute = True
+
+		# reads are served from one sweep
+		self.failUnlessEqual(state.gain('o2'), 0.5)
+		self.failUnlessEqual(state.is_muted('i1'), True)
+		self.failUnlessEqual(state.is_muted('o3'), False)
+		self.failUnlessEqual(state.gain('p1'), 0)
+		self.failUnlessEqual(state.is_muted('o9'), None)
+		self.failUnlessEqual(state.sweep_count, 1)
+		self.failUnlessEqual(self.sm_server.command_count, 6) # a gain and a mute for each channel type
+
+		# recorded values change the version without a command
+		version, snapshot = state.snapshot()
+		state.record('o1', mute=True)
+		self.failUnlessEqual(state.is_muted('o1'), True)
+		self.failIfEqual(state.snapshot()[0], version)
+		self.failUnlessEqual(state.snapshot()[0], state.snapshot()[0])
+		self.failUnlessEqual(self.sm_server.command_count, 6)
+
+		state.start()
+		try:
+			# changes made elsewhere arrive with the next sweep
+			self.sm_server.outputs[3].gain = 2.0
+			deadline = time.time() + 5
+			while state.snapshot()[1]['gains'].get('o3', None) != 2.0 and time.time() < deadline: time.sleep(0.05)
+			self.failUnlessEqual(state.snapshot()[1]['gains']['o3'], 2.0)
+
+			# the VU levels stream in over a session of their own
+			self.sm_server.outputs[1].vu = 0.75
+			deadline = time.time() + 5
+			while state.snapshot()[1]['vu'].get('o1', None) != 0.75 and time.time() < deadline: time.sleep(0.05)
+			self.failUnlessEqual(state.snapshot()[1]['vu']['o1'], 0.75)
+			self.failUnless(state.vu_meter.response_count > 0)
+			self.failUnlessEqual(self.sm_server.max_concurrent_connections, 2)
+
+			# the VU session closes once nobody is watching
+			state.idle_seconds = 0
+			state.vu_meter.join(5)
+			self.failIf(state.vu_meter.isAlive())
+		finally:
+			state.stop()
+
+	def test_channel_mute_api(self):
+		channel = ABChannel.objects.get(number=2)
+		client = Client()
+		try:
+			response = client.post('/api/audio/ab-channel/%s/mute/' % channel.id, { 'mute':'on' })
+			self.failUnlessEqual(response.status_code, 200, 'status was %s' % response.status_code)
+			self.failUnlessEqual(response.content, 'True')
+			self.failUnless(self.sm_server.outputs[2].mute)
+			self.failUnless(ABChannel.objects.get(pk=channel.id).mute)
+			response = client.post('/api/audio/ab-channel/%s/mute/' % channel.id, { 'mute':'toggle' })
+			self.failUnlessEqual(response.status_code, 200, 'status was %s' % response.status_code)
+			self.failUnlessEqual(response.content, 'False')
+			self.failIf(self.sm_server.outputs[2].mute)
+			self.failIf(ABChannel.objects.get(pk=channel.id).mute)
+		finally:
+			# the API started the shared state, whose sweeps would otherwise outlive the mock server
+			state = self.device.state()
+			state.stop()
+			state.join(5)
+
+	def test_presets(self):
+		for number in range(1, 4):
+			self.sm_server.outputs[number].gain = number / 4.0
+		self.sm_server.outputs[2].mute = True
+		preset = ABPreset.objects.create(name='Opening')
+		self.failUnlessEqual(preset.capture(), [])
+		self.failUnlessEqual([(level.channel.number, level.gain, level.mute) for level in preset.levels.order_by('channel__number')], [(1, 0.25, False), (2, 0.5, True), (3, 0.75, False)])
+
+		# applying the preset sets every channel with a few batched commands and makes it the channels' last known state
+		self.group.master_gain = 1.0
+		self.group.save()
+		for number in range(1, 4):
+			self.sm_server.outputs[number].gain = 1
+			self.sm_server.outputs[number].mute = number == 3
+		command_count = self.sm_server.command_count
+		self.failUnless(preset.apply())
+		self.failUnlessEqual([(channel.gain, channel.mute) for channel in self.sm_server.outputs[1:4]], [(0.25, False), (0.5, True), (0.75, False)])
+		self.failUnlessEqual(self.sm_server.command_count - command_count, 5) # three gains, a mute and an unmute
+		self.failUnlessEqual(ABChannel.objects.get(number=2).mute, True)
+		self.failUnlessEqual(self.device.state().gains['o3'], 0.75)
+
+		# the last known state comes back after the SoundMan server restarts
+		self.group.master_gain = 0.5
+		self.group.save()
+		for channel in self.sm_server.outputs:
+			channel.gain = 0
+			channel.mute = False
+		self.failUnless(ABDevice.objects.get(pk=self.device.id).restore_last_known_state())
+		self.failUnlessEqual([(channel.gain, channel.mute) for channel in self.sm_server.outputs[1:4]], [(0.125, False), (0.25, True), (0.375, False)])
+
+		# every process's pool sees the restart, but only the first restores the state
+		cache.clear()
+		command_count = self.sm_server.command_count
+		self.device.restore_on_reconnect(None)
+		restore_commands = self.sm_server.command_count - command_count
+		self.failUnless(restore_commands > 0)
+		ABDevice.objects.get(pk=self.device.id).restore_on_reconnect(None)
+		self.failUnlessEqual(self.sm_server.command_count - command_count, restore_commands)
+		self.device.state().stop()
+
@@ -14,6 +14,19 @@ class BACNetLightAdmin(StyledModelAdmin):
 	list_display = ('name', )
 admin.site.register(BACNetLight, BACNetLightAdmin)	
 
+class LightSceneLevelInline(admin.TabularInline):
+	model = LightSceneLevel
+	extra = 3
+
+class LightSceneAdmin(StyledModelAdmin):
+	list_display = ('name', )
+	inlines = [LightSceneLevelInline]
+admin.site.register(LightScene, LightSceneAdmin)
+
+class LightSceneEventAdmin(StyledModelAdmin):
+	readonly_fields = ('tries', 'last_run')
+admin.site.register(LightSceneEvent, LightSceneEventAdmin)
+
 class ProjectorAdmin(StyledModelAdmin):
 	list_display = ('name', 'pjlink_host', 'pjlink_port')
 admin.site.register(Projector, ProjectorAdmin)	
@@ -21,3 +34,12 @@ admin.site.register(Projector, ProjectorAdmin)
 class ProjectorEventAdmin(StyledModelAdmin):
 	readonly_fields = ('tries', 'last_run')
 admin.site.register(ProjectorEvent, ProjectorEventAdmin)	
+
+class ProjectorGroupAdmin(StyledModelAdmin):
+	list_display = ('name', )
+	filter_horizontal = ('projectors', )
+admin.site.register(ProjectorGroup, ProjectorGroupAdmin)
+
+class ProjectorGroupEventAdmin(StyledModelAdmin):
+	readonly_fields = ('tries', 'last_run')
+admin.site.register(ProjectorGroupEvent, ProjectorGroupEventAdmin)
@@ -10,7 +10,7 @@ import sys
 from django.conf import settings
 from django.db.models import Q
 from django.template import Context, loader
-from django.http import HttpResponse, Http404, HttpResponseServerError, HttpResponseRedirect, HttpResponsePermanentRedirect
+from django.http import HttpResponse, Http404, HttpResponseServerError, HttpResponseBadRequest, HttpResponseRedirect, HttpResponsePermanentRedirect
 from django.shortcuts import render_to_response, get_object_or_404
 from django.contrib import auth
 from django.contrib.auth.models import User
@@ -30,32 +30,69 @@ from django.utils import feedgenerator
 from models import *
 from art_server.hydration import dehydrate_to_list_xml, dehydrate_to_xml
 from pjlink import PJLinkController, PJLinkProtocol
-from bacnet_control import BacnetControl
+from projector_state import ProjectorInfo, LampInfo, ProjectorStatus, ProjectorGroupInfo, get_projector_info, get_projector_infos, cached_projector_info, refresh_projector_info, poll_projectors, projector_controller
+import pjlink_fleet
+import projector_history
+from bacnet_control import BacnetControl, BACNetLightValue
+from fades import LightSceneInfo, shared_fade_engine
 
 def bacnet_lights(request):
 	return HttpResponse(dehydrate_to_list_xml(BACNetLight.objects.all()), content_type="text/xml")
 
+def bacnet_light_values(request):
+	lights = BACNetLight.objects.all()
+	values = BacnetControl().read_light_values(lights)
+	return HttpResponse(dehydrate_to_list_xml([BACNetLightValue(light, values[light.id]) for light in lights]), content_type="text/xml")
+
 def bacnet_light(request, id):
 	light = get_object_or_404(BACNetLight, pk=id)
 	return HttpResponse(dehydrate_to_xml(light), content_type="text/xml")
 
 def bacnet_light_value(request, id):
+	"""Returns the light's value, after setting it if there is a value parameter.
+	With a fade parameter the light fades to the new value over that many seconds and the value returned is where the fade starts."""
 	light = get_object_or_404(BACNetLight, pk=id)
-	control = BacnetControl(settings.BACNET_BIN_DIR)
+	control = BacnetControl()
 	if request.REQUEST.get('value', None):
 		new_value = request.REQUEST.get('value', None)
 		try:
-			control.write_analog_output_int(light.device_id, light.property_id, new_value)
+			fade_seconds = float(request.REQUEST.get('fade', None) or 0)
+			float(new_value)
+		except ValueError:
+			return HttpResponseBadRequest('The value parameter is a number and the fade parameter is a number of seconds', content_type="text/plain")
+		try:
+			if fade_seconds > 0:
+				shared_fade_engine().fade([(light, float(new_value))], fade_seconds)
+			else:
+				control.write_analog_output_int(light.device_id, light.property_id, new_value)
 		except:
 			logging.exception('Could not write the posted value (%s) for bacnet device %s property %s' % (new_value, light.device_id, light.property_id))
 			return HttpResponseServerError('Could not write the posted value (%s) for bacnet device %s property %s\n\n%s' % (new_value, light.device_id, light.property_id, sys.exc_info()[1]))
 	try:
-		value = float(control.read_analog_output(light.device_id, light.property_id)[1])
+		value = control.read_analog_output(light.device_id, light.property_id)
 		return HttpResponse(value.__repr__(), content_type="text/plain")
 	except:
 		logging.exception('Could not read the analog output for bacnet device %s property %s' % (light.device_id, light.property_id))
 		return HttpResponseServerError('Could not read the analog output for bacnet device %s property %s\n\n%s' % (light.device_id, light.property_id, sys.exc_info()[1]))
 
+def light_scenes(request):
+	return HttpResponse(dehydrate_to_list_xml(LightScene.objects.all()), content_type="text/xml")
+
+def light_scene(request, id):
+	"""Returns the scene and its levels, after starting a fade to it if there is a fade parameter (in seconds, 0 to jump straight to it)"""
+	scene = get_object_or_404(LightScene, pk=id)
+	if request.REQUEST.get('fade', None):
+		try:
+			fade_seconds = float(request.REQUEST.get('fade'))
+		except ValueError:
+			return HttpResponseBadRequest('The fade parameter is a number of seconds', content_type="text/plain")
+		try:
+			scene.fade_to(fade_seconds)
+		except:
+			logging.exception('Could not fade to light scene %s' % scene.id)
+			return HttpResponseServerError('Could not fade to light scene %s\n\n%s' % (scene.id, sys.exc_info()[1]))
+	return HttpResponse(dehydrate_to_xml(LightSceneInfo(scene)), content_type="text/xml")
+
 def projectors(request):
 	return HttpResponse(dehydrate_to_list_xml(Projector.objects.all()), content_type="text/xml")
 
@@ -63,47 +100,86 @@ def projector(request, id):
 	projector = get_object_or_404(Projector, pk=id)
 	return HttpResponse(dehydrate_to_xml(projector), content_type="text/xml")
 
-class LampInfo:
-	"""Wraps the projector's lamp info for dehydration"""
-	def __init__(self, lighting_hours, is_on):
-		self.lighting_hours = lighting_hours
-		self.is_on = is_on
-	class HydrationMeta:
-		attributes = ['lighting_hours', 'is_on']
-
-
-class ProjectorInfo:
-	"""Used to wrap the projector information for dehydration"""
-	def __init__(self, power_state, projector_name, manufacture_name, product_name, other_info, audio_mute, video_mute):
-		self.power_state = power_state
-		self.projector_name = projector_name
-		self.manufacture_name = manufacture_name
-		self.product_name = product_name
-		self.other_info = other_info
-		self.video_mute = video_mute
-		self.audio_mute = audio_mute
-		self.lamps = []
-	class HydrationMeta:
-		attributes = ['power_state', 'projector_name', 'manufacture_name', 'product_name', 'other_info', 'audio_mute', 'video_mute']
-		nodes = ['lamps']
-
 def projector_info(request, id):
+	"""Returns the projector's cached state, or the fresh state after a power or mute command"""
 	projector = get_object_or_404(Projector, pk=id)
-	controller = PJLinkController(projector.pjlink_host, projector.pjlink_port, projector.pjlink_password)
+	power = request.REQUEST.get('power', None)
+	mute = request.REQUEST.get('mute', None)
 	try:
-		if request.REQUEST.get('power', None) == PJLinkProtocol.POWER_ON_STATUS:
-			controller.power_on()
-		elif request.REQUEST.get('power', None) == PJLinkProtocol.POWER_OFF_STATUS:
-			controller.power_off()
-
-		if request.REQUEST.get('mute', None) == PJLinkProtocol.ON:
-			controller.set_mute(PJLinkProtocol.VIDEO_MUTE_ON)
-		elif request.REQUEST.get('mute', None) == PJLinkProtocol.OFF:
-			controller.set_mute(PJLinkProtocol.VIDEO_MUTE_OFF)
+		if power in (PJLinkProtocol.POWER_ON_STATUS, PJLinkProtocol.POWER_OFF_STATUS) or mute in (PJLinkProtocol.ON, PJLinkProtocol.OFF):
+			controller = projector_controller(projector)
+			controller.open_session()
+			try:
+				try:
+					if power == PJLinkProtocol.POWER_ON_STATUS:
+						controller.power_on()
+					elif power == PJLinkProtocol.POWER_OFF_STATUS:
+						controller.power_off()
+
+					if mute == PJLinkProtocol.ON:
+						controller.set_mute(PJLinkProtocol.VIDEO_MUTE_ON)
+					elif mute == PJLinkProtocol.OFF:
+						controller.set_mute(PJLinkProtocol.VIDEO_MUTE_OFF)
+				except:
+					logging.exception('Could not control the projector')
+				info = refresh_projector_info(projector, controller)
+			finally:
+				controller.close_session()
+		else:
+			info = get_projector_info(projector)
+			if not info.reachable: raise IOError('The projector could not be reached %s seconds ago' % info.age)
 	except:
-		logging.exception('Could not control the projector')
-	audio_mute, video_mute = controller.query_mute()
-	info = ProjectorInfo(controller.query_power(), controller.query_name(), controller.query_manufacture_name(), controller.query_product_name(), controller.query_other_info(), audio_mute, video_mute)
-	for lamp in controller.query_lamps():
-		info.lamps.append(LampInfo(lamp[0], lamp[1]))
+		logging.exception('Could not communicate with projector %s' % projector.id)
+		return HttpResponseServerError('Could not communicate with projector %s\n\n%s' % (projector.id, sys.exc_info()[1]))
 	return HttpResponse(dehydrate_to_xml(info), content_type="text/xml")
+
+HISTORY_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+def projector_history_view(request, id):
+	"""Returns the projector's samples or rollups between the start and end parameters (like 2011-06-01T12:00:00), oldest first.
+	The resolution parameter may be raw, hour or day and is otherwise picked from the length of the range.  The range defaults to the last day."""
+	projector = get_object_or_404(Projector, pk=id)
+	try:
+		if request.GET.get('end', None):
+			end = datetime.datetime.strptime(request.GET.get('end'), HISTORY_TIME_FORMAT)
+		else:
+			end = datetime.datetime.now()
+		if request.GET.get('start', None):
+			start = datetime.datetime.strptime(request.GET.get('start'), HISTORY_TIME_FORMAT)
+		else:
+			start = end - datetime.timedelta(days=1)
+		entries = projector_history.history(projector, start, end, request.GET.get('resolution', None))
+	except ValueError:
+		return HttpResponseBadRequest('Use start and end parameters like 2011-06-01T12:00:00 and a resolution of raw, hour or day', content_type="text/plain")
+	return HttpResponse(dehydrate_to_list_xml(entries), content_type="text/xml")
+
+def projector_groups(request):
+	return HttpResponse(dehydrate_to_list_xml(ProjectorGroup.objects.all()), content_type="text/xml")
+
+def projector_group(request, id):
+	"""Returns the status of each projector in the group, after powering or muting them all if there is a power or mute parameter.
+	The commands and queries go to the projectors in parallel."""
+	group = get_object_or_404(ProjectorGroup, pk=id)
+	projectors = list(group.projectors.all())
+	power = request.REQUEST.get('power', None)
+	mute = request.REQUEST.get('mute', None)
+	command_results = {}
+	if power == PJLinkProtocol.POWER_ON_STATUS:
+		command_results = pjlink_fleet.power_on_all(projectors)
+	elif power == PJLinkProtocol.POWER_OFF_STATUS:
+		command_results = pjlink_fleet.power_off_all(projectors)
+	if mute in (PJLinkProtocol.ON, PJLinkProtocol.OFF):
+		if mute == PJLinkProtocol.ON:
+			mute_results = pjlink_fleet.set_mute_all(projectors, PJLinkProtocol.VIDEO_MUTE_ON)
+		else:
+			mute_results = pjlink_fleet.set_mute_all(projectors, PJLinkProtocol.VIDEO_MUTE_OFF)
+		for projector_id, result in mute_results.items(): command_results[projector_id] = command_results.get(projector_id, True) and result
+
+	if command_results:
+		# the commands changed the state, so refresh the cache before reporting it
+		poll_results = poll_projectors(projectors)
+		infos = dict([(projector.id, poll_results.get(projector.id) and cached_projector_info(projector) or None) for projector in projectors])
+	else:
+		infos = get_projector_infos(projectors)
+	statuses = [ProjectorStatus(projector, infos.get(projector.id, None), command_results.get(projector.id, None)) for projector in projectors]
+	return HttpResponse(dehydrate_to_xml(ProjectorGroupInfo(group, statuses)), content_type="text/xml")
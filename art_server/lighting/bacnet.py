@@ -0,0 +1,815 @@
+#!/usr/bin/python
+"""An in-process BACnet/IP client for reading and writing the Present-Value of the lighting objects.
+
+Requests go out over one UDP socket which stays open for the life of the client, and the address each device gives in its I-Am is remembered,
+so after the first request to a device a read or write is a single datagram round trip.
+Only the parts of BACnet which the lights need are here: Who-Is/I-Am, ReadProperty, ReadPropertyMultiple, WriteProperty, WritePropertyMultiple and SubscribeCOV
+over BACnet/IP (Annex J), without segmentation.
+"""
+import time
+import select
+import socket
+import struct
+import logging
+import threading
+
+class BACnetProtocol:
+	"""Holds the constants for the BACnet protocol"""
+	DEFAULT_PORT = 47808
+
+	# BACNET VIRTUAL LINK CONTROL (Annex J)
+	BVLC_TYPE = 0x81
+	BVLC_FORWARDED_NPDU = 0x04
+	BVLC_ORIGINAL_UNICAST_NPDU = 0x0A
+	BVLC_ORIGINAL_BROADCAST_NPDU = 0x0B
+
+	# NETWORK LAYER
+	NPDU_VERSION = 0x01
+	NPDU_NETWORK_MESSAGE = 0x80
+	NPDU_DESTINATION_PRESENT = 0x20
+	NPDU_SOURCE_PRESENT = 0x08
+	NPDU_EXPECTING_REPLY = 0x04
+	GLOBAL_BROADCAST_NETWORK = 0xFFFF
+
+	# APPLICATION LAYER PDU TYPES
+	CONFIRMED_REQUEST = 0x0
+	UNCONFIRMED_REQUEST = 0x1
+	SIMPLE_ACK = 0x2
+	COMPLEX_ACK = 0x3
+	SEGMENT_ACK = 0x4
+	ERROR = 0x5
+	REJECT = 0x6
+	ABORT = 0x7
+	SEGMENTED_MESSAGE = 0x08
+	MAX_APDU_1476 = 0x05
+
+	# SERVICES
+	I_AM = 0
+	CONFIRMED_COV_NOTIFICATION = 1
+	UNCONFIRMED_COV_NOTIFICATION = 2
+	SUBSCRIBE_COV = 5
+	WHO_IS = 8
+	READ_PROPERTY = 12
+	READ_PROPERTY_MULTIPLE = 14
+	WRITE_PROPERTY = 15
+	WRITE_PROPERTY_MULTIPLE = 16
+
+	# OBJECT TYPES
+	ANALOG_INPUT = 0
+	ANALOG_OUTPUT = 1
+	ANALOG_VALUE = 2
+	DEVICE = 8
+
+	# PROPERTIES
+	PRESENT_VALUE = 85
+
+	# APPLICATION TAGS
+	NULL = 0
+	BOOLEAN = 1
+	UNSIGNED = 2
+	SIGNED = 3
+	REAL = 4
+	DOUBLE = 5
+	OCTET_STRING = 6
+	CHARACTER_STRING = 7
+	BIT_STRING = 8
+	ENUMERATED = 9
+	DATE = 10
+	TIME = 11
+	OBJECT_IDENTIFIER = 12
+
+	# SEGMENTATION
+	NO_SEGMENTATION = 3
+
+	# ERRORS AND REJECT REASONS
+	SERVICES_ERROR_CLASS = 5
+	UNRECOGNIZED_SERVICE = 9
+
+	# Each Present-Value takes about 20 bytes of a ReadPropertyMultiple-ACK, so this many fit in an unsegmented 1476 byte response with room to spare
+	READ_PROPERTY_MULTIPLE_BATCH_SIZE = 50
+	# A REAL Present-Value takes about 17 bytes of a WritePropertyMultiple request
+	WRITE_PROPERTY_MULTIPLE_BATCH_SIZE = 50
+
+	# The lights are Analog Value objects, which is what the bacrp/bacwp apps we used to run were pointed at
+	LIGHT_OBJECT_TYPE = ANALOG_VALUE
+
+class BACnetException(Exception):
+	pass
+
+class BACnetTimeoutException(BACnetException):
+	pass
+
+class BACnetErrorException(BACnetException):
+	"""Raised when a device answers a request with an Error, Reject or Abort PDU"""
+	def __init__(self, pdu_type, detail):
+		self.pdu_type = pdu_type
+		self.detail = detail
+		if pdu_type == BACnetProtocol.ERROR:
+			message = 'The device returned error class %s code %s' % detail
+		elif pdu_type == BACnetProtocol.REJECT:
+			message = 'The device rejected the request (reason %s)' % detail
+		else:
+			message = 'The device aborted the request (reason %s)' % detail
+		BACnetException.__init__(self, message)
+
+# TAG ENCODING
+
+OPENING = 'opening'
+CLOSING = 'closing'
+
+def object_identifier(object_type, instance): return (object_type << 22) | instance
+
+def split_object_identifier(value): return (value >> 22, value & 0x3FFFFF)
+
+def encode_unsigned(value):
+	if value < 0x100: return struct.pack('>B', value)
+	if value < 0x10000: return struct.pack('>H', value)
+	if value < 0x1000000: return struct.pack('>I', value)[1:]
+	return struct.pack('>I', value)
+
+def decode_unsigned(content):
+	value = 0
+	for character in content: value = (value << 8) | ord(character)
+	return value
+
+def encode_signed(value):
+	for length in (1, 2, 3):
+		if -(1 << (length * 8 - 1)) <= value < (1 << (length * 8 - 1)): return struct.pack('>i', value)[4 - length:]
+	return struct.pack('>i', value)
+
+def decode_signed(content):
+	value = decode_unsigned(content)
+	if content and ord(content[0]) & 0x80: value -= 1 << (len(content) * 8)
+	return value
+
+def encode_tag(tag_number, context, length):
+	header = tag_number << 4
+	if context: header |= 0x08
+	if length < 5: return chr(header | length)
+	if length < 254: return chr(header | 5) + chr(length)
+	return chr(header | 5) + chr(254) + struct.pack('>H', length)
+
+def opening_tag(tag_number): return chr((tag_number << 4) | 0x0E)
+
+def closing_tag(tag_number): return chr((tag_number << 4) | 0x0F)
+
+def encode_context(tag_number, content): return encode_tag(tag_number, True, len(content)) + content
+
+def encode_context_unsigned(tag_number, value): return encode_context(tag_number, encode_unsigned(value))
+
+def encode_context_object_identifier(tag_number, object_type, instance): return encode_context(tag_number, struct.pack('>I', object_identifier(object_type, instance)))
+
+def encode_application(tag_number, value):
+	"""Returns the value encoded with an application tag"""
+	if tag_number == BACnetProtocol.NULL: return chr(0)
+	if tag_number == BACnetProtocol.BOOLEAN: return chr((BACnetProtocol.BOOLEAN << 4) | (value and 1 or 0))
+	if tag_number == BACnetProtocol.UNSIGNED or tag_number == BACnetProtocol.ENUMERATED:
+		content = encode_unsigned(value)
+	elif tag_number == BACnetProtocol.SIGNED:
+		content = encode_signed(value)
+	elif tag_number == BACnetProtocol.REAL:
+		content = struct.pack('>f', value)
+	elif tag_number == BACnetProtocol.DOUBLE:
+		content = struct.pack('>d', value)
+	elif tag_number == BACnetProtocol.OBJECT_IDENTIFIER:
+		content = struct.pack('>I', object_identifier(value[0], value[1]))
+	elif tag_number == BACnetProtocol.CHARACTER_STRING:
+		content = chr(0) + value.encode('utf-8')
+	elif tag_number == BACnetProtocol.OCTET_STRING:
+		content = value
+	else:
+		raise ValueError('Can not encode application tag %s' % tag_number)
+	return encode_tag(tag_number, False, len(content)) + content
+
+def decode_tag(data, offset):
+	"""Returns (tag number, is context tag, length, offset of the content).
+	The length is OPENING or CLOSING for the tags around constructed values, and application booleans carry their value in the length."""
+	header = ord(data[offset])
+	offset += 1
+	tag_number = header >> 4
+	if tag_number == 0x0F:
+		tag_number = ord(data[offset])
+		offset += 1
+	is_context = header & 0x08 != 0
+	length = header & 0x07
+	if is_context and length == 6: return (tag_number, True, OPENING, offset)
+	if is_context and length == 7: return (tag_number, True, CLOSING, offset)
+	if length == 5:
+		length = ord(data[offset])
+		offset += 1
+		if length == 254:
+			length = struct.unpack('>H', data[offset:offset + 2])[0]
+			offset += 2
+		elif length == 255:
+			length = struct.unpack('>I', data[offset:offset + 4])[0]
+			offset += 4
+	return (tag_number, is_context, length, offset)
+
+def decode_application(tag_number, length, content):
+	if tag_number == BACnetProtocol.NULL: return None
+	if tag_number == BACnetProtocol.BOOLEAN: return length == 1
+	if tag_number == BACnetProtocol.UNSIGNED or tag_number == BACnetProtocol.ENUMERATED: return decode_unsigned(content)
+	if tag_number == BACnetProtocol.SIGNED: return decode_signed(content)
+	if tag_number == BACnetProtocol.REAL: return struct.unpack('>f', content)[0]
+	if tag_number == BACnetProtocol.DOUBLE: return struct.unpack('>d', content)[0]
+	if tag_number == BACnetProtocol.OBJECT_IDENTIFIER: return split_object_identifier(decode_unsigned(content))
+	if tag_number == BACnetProtocol.CHARACTER_STRING: return content[1:].decode('utf-8', 'replace')
+	return content
+
+def decode_values(data, offset, closing_tag_number):
+	"""Decodes application tagged values up to the closing tag, returning (values, offset after the closing tag).
+	Constructed values inside are returned as nested lists."""
+	values = []
+	while offset < len(data):
+		tag_number, is_context, length, offset = decode_tag(data, offset)
+		if length == CLOSING:
+			if tag_number != closing_tag_number: raise BACnetException('Expected closing tag %s but found %s' % (closing_tag_number, tag_number))
+			return (values, offset)
+		if length == OPENING:
+			nested, offset = decode_values(data, offset, tag_number)
+			values.append(nested)
+			continue
+		if tag_number == BACnetProtocol.BOOLEAN and not is_context:
+			values.append(length == 1)
+			continue
+		content = data[offset:offset + length]
+		offset += length
+		if is_context:
+			values.append(content)
+		else:
+			values.append(decode_application(tag_number, length, content))
+	raise BACnetException('Missing closing tag %s' % closing_tag_number)
+
+def decode_context_unsigned(data, offset, tag_number, optional=False):
+	"""Returns (value, offset after it) for the context tag, or (None, offset) if it's optional and missing"""
+	if offset < len(data):
+		found_number, is_context, length, content_offset = decode_tag(data, offset)
+		if is_context and found_number == tag_number and length not in (OPENING, CLOSING):
+			return (decode_unsigned(data[content_offset:content_offset + length]), content_offset + length)
+	if optional: return (None, offset)
+	raise BACnetException('Expected context tag %s' % tag_number)
+
+# NETWORK AND LINK LAYERS
+
+def encode_npdu(apdu, expecting_reply=False, network=None, mac=''):
+	"""Wraps the APDU in a network layer header, addressed to the remote network and MAC address if network isn't None"""
+	control = 0
+	if expecting_reply: control |= BACnetProtocol.NPDU_EXPECTING_REPLY
+	if network == None: return chr(BACnetProtocol.NPDU_VERSION) + chr(control) + apdu
+	control |= BACnetProtocol.NPDU_DESTINATION_PRESENT
+	return chr(BACnetProtocol.NPDU_VERSION) + chr(control) + struct.pack('>H', network) + chr(len(mac)) + mac + chr(255) + apdu
+
+def decode_npdu(npdu):
+	"""Returns (source network, source MAC address, APDU) or None if it's a network layer message"""
+	if len(npdu) < 2 or ord(npdu[0]) != BACnetProtocol.NPDU_VERSION: raise BACnetException('Unknown NPDU version')
+	control = ord(npdu[1])
+	offset = 2
+	source_network = None
+	source_mac = ''
+	if control & BACnetProtocol.NPDU_DESTINATION_PRESENT:
+		offset += 2
+		offset += 1 + ord(npdu[offset])
+	if control & BACnetProtocol.NPDU_SOURCE_PRESENT:
+		source_network = struct.unpack('>H', npdu[offset:offset + 2])[0]
+		source_length = ord(npdu[offset + 2])
+		source_mac = npdu[offset + 3:offset + 3 + source_length]
+		offset += 3 + source_length
+	if control & BACnetProtocol.NPDU_DESTINATION_PRESENT: offset += 1 # the hop count
+	if control & BACnetProtocol.NPDU_NETWORK_MESSAGE: return None
+	return (source_network, source_mac, npdu[offset:])
+
+def encode_bvlc(npdu, broadcast=False):
+	if broadcast:
+		function = BACnetProtocol.BVLC_ORIGINAL_BROADCAST_NPDU
+	else:
+		function = BACnetProtocol.BVLC_ORIGINAL_UNICAST_NPDU
+	return struct.pack('>BBH', BACnetProtocol.BVLC_TYPE, function, len(npdu) + 4) + npdu
+
+def decode_bvlc(data, address):
+	"""Returns (the address of the original sender, NPDU) or None if the datagram doesn't carry an NPDU"""
+	if len(data) < 4 or ord(data[0]) != BACnetProtocol.BVLC_TYPE: return None
+	function = ord(data[1])
+	if function == BACnetProtocol.BVLC_ORIGINAL_UNICAST_NPDU or function == BACnetProtocol.BVLC_ORIGINAL_BROADCAST_NPDU: return (address, data[4:])
+	if function == BACnetProtocol.BVLC_FORWARDED_NPDU: return ((socket.inet_ntoa(data[4:8]), struct.unpack('>H', data[8:10])[0]), data[10:])
+	return None
+
+# APPLICATION LAYER
+
+class BACnetAPDU:
+	"""Encoding and decoding methods for application layer messages.
+		The body is the service's encoded parameters.  For Error PDUs the detail is (error class, error code) and for Reject and Abort PDUs it's the reason.
+	"""
+	def __init__(self, pdu_type, service, invoke_id=None, body='', detail=None):
+		self.pdu_type = pdu_type
+		self.service = service
+		self.invoke_id = invoke_id
+		self.body = body
+		self.detail = detail
+
+	def encode(self):
+		if self.pdu_type == BACnetProtocol.CONFIRMED_REQUEST: return chr(BACnetProtocol.CONFIRMED_REQUEST << 4) + chr(BACnetProtocol.MAX_APDU_1476) + chr(self.invoke_id) + chr(self.service) + self.body
+		if self.pdu_type == BACnetProtocol.UNCONFIRMED_REQUEST: return chr(BACnetProtocol.UNCONFIRMED_REQUEST << 4) + chr(self.service) + self.body
+		if self.pdu_type == BACnetProtocol.SIMPLE_ACK: return chr(BACnetProtocol.SIMPLE_ACK << 4) + chr(self.invoke_id) + chr(self.service)
+		if self.pdu_type == BACnetProtocol.COMPLEX_ACK: return chr(BACnetProtocol.COMPLEX_ACK << 4) + chr(self.invoke_id) + chr(self.service) + self.body
+		if self.pdu_type == BACnetProtocol.ERROR: return chr(BACnetProtocol.ERROR << 4) + chr(self.invoke_id) + chr(self.service) + encode_application(BACnetProtocol.ENUMERATED, self.detail[0]) + encode_application(BACnetProtocol.ENUMERATED, self.detail[1])
+		return chr(self.pdu_type << 4) + chr(self.invoke_id) + chr(self.detail)
+
+	@classmethod
+	def decode(cls, apdu):
+		pdu_type = ord(apdu[0]) >> 4
+		if pdu_type in (BACnetProtocol.CONFIRMED_REQUEST, BACnetProtocol.COMPLEX_ACK) and ord(apdu[0]) & BACnetProtocol.SEGMENTED_MESSAGE:
+			raise BACnetException('Segmented messages are not supported')
+		if pdu_type == BACnetProtocol.CONFIRMED_REQUEST: return BACnetAPDU(pdu_type, ord(apdu[3]), ord(apdu[2]), apdu[4:])
+		if pdu_type == BACnetProtocol.UNCONFIRMED_REQUEST: return BACnetAPDU(pdu_type, ord(apdu[1]), None, apdu[2:])
+		if pdu_type == BACnetProtocol.SIMPLE_ACK: return BACnetAPDU(pdu_type, ord(apdu[2]), ord(apdu[1]))
+		if pdu_type == BACnetProtocol.COMPLEX_ACK: return BACnetAPDU(pdu_type, ord(apdu[2]), ord(apdu[1]), apdu[3:])
+		if pdu_type == BACnetProtocol.ERROR:
+			offset = 3
+			if apdu[3:4] == opening_tag(0): offset = 4 # a WritePropertyMultiple-Error wraps the class and code, followed by the first failed write
+			values, offset = decode_values(apdu + closing_tag(0), offset, 0)
+			return BACnetAPDU(pdu_type, ord(apdu[2]), ord(apdu[1]), detail=tuple(values[:2]))
+		if pdu_type == BACnetProtocol.REJECT or pdu_type == BACnetProtocol.ABORT: return BACnetAPDU(pdu_type, None, ord(apdu[1]), detail=ord(apdu[2]))
+		raise BACnetException('Unsupported PDU type %s' % pdu_type)
+
+def who_is_body(low_limit=None, high_limit=None):
+	if low_limit == None: return ''
+	return encode_context_unsigned(0, low_limit) + encode_context_unsigned(1, high_limit)
+
+def decode_who_is(body):
+	"""Returns the (low, high) device instance limits or (None, None) for every device"""
+	low_limit, offset = decode_context_unsigned(body, 0, 0, optional=True)
+	high_limit, offset = decode_context_unsigned(body, offset, 1, optional=True)
+	return (low_limit, high_limit)
+
+def i_am_body(device_id, vendor_id=0):
+	return encode_application(BACnetProtocol.OBJECT_IDENTIFIER, (BACnetProtocol.DEVICE, device_id)) + encode_application(BACnetProtocol.UNSIGNED, 1476) + encode_application(BACnetProtocol.ENUMERATED, BACnetProtocol.NO_SEGMENTATION) + encode_application(BACnetProtocol.UNSIGNED, vendor_id)
+
+def decode_i_am(body):
+	"""Returns the device instance from the body of an I-Am"""
+	values, offset = decode_values(body + closing_tag(0), 0, 0)
+	object_type, instance = values[0]
+	if object_type != BACnetProtocol.DEVICE: raise BACnetException('I-Am from an object which is not a device: %s' % object_type)
+	return instance
+
+def property_reference(object_type, instance, property_id, index=None):
+	"""The object identifier, property identifier and optional array index which start ReadProperty and WriteProperty requests"""
+	encoded = encode_context_object_identifier(0, object_type, instance) + encode_context_unsigned(1, property_id)
+	if index != None: encoded += encode_context_unsigned(2, index)
+	return encoded
+
+def decode_property_reference(body, offset=0):
+	"""Returns ((object type, instance), property id, index or None, offset after the reference)"""
+	identifier, offset = decode_context_unsigned(body, offset, 0)
+	property_id, offset = decode_context_unsigned(body, offset, 1)
+	index, offset = decode_context_unsigned(body, offset, 2, optional=True)
+	return (split_object_identifier(identifier), property_id, index, offset)
+
+def read_property_ack_body(object_type, instance, property_id, encoded_value, index=None):
+	return property_reference(object_type, instance, property_id, index) + opening_tag(3) + encoded_value + closing_tag(3)
+
+def decode_property_value(body):
+	"""Returns ((object type, instance), property id, index or None, [values], offset after the values) from a ReadProperty-ACK or WriteProperty"""
+	object_id, property_id, index, offset = decode_property_reference(body)
+	tag_number, is_context, length, offset = decode_tag(body, offset)
+	if tag_number != 3 or length != OPENING: raise BACnetException('Expected a property value')
+	values, offset = decode_values(body, offset, 3)
+	return (object_id, property_id, index, values, offset)
+
+def decode_read_property_ack(body):
+	"""Returns ((object type, instance), property id, index or None, [values])"""
+	return decode_property_value(body)[:4]
+
+def write_property_body(object_type, instance, property_id, encoded_value, priority=None, index=None):
+	"""The encoded_value is one or more application tagged values"""
+	encoded = property_reference(object_type, instance, property_id, index) + opening_tag(3) + encoded_value + closing_tag(3)
+	if priority != None: encoded += encode_context_unsigned(4, priority)
+	return encoded
+
+def decode_write_property(body):
+	"""Returns ((object type, instance), property id, index or None, [values], priority or None)"""
+	object_id, property_id, index, values, offset = decode_property_value(body)
+	priority, offset = decode_context_unsigned(body, offset, 4, optional=True)
+	return (object_id, property_id, index, values, priority)
+
+def read_property_multiple_body(references):
+	"""references is a list of (object type, instance, property id), which are grouped by object in the request"""
+	objects = []
+	properties = {}
+	for object_type, instance, property_id in references:
+		if (object_type, instance) not in properties:
+			objects.append((object_type, instance))
+			properties[(object_type, instance)] = []
+		properties[(object_type, instance)].append(property_id)
+	encoded = ''
+	for object_type, instance in objects:
+		encoded += encode_context_object_identifier(0, object_type, instance) + opening_tag(1)
+		for property_id in properties[(object_type, instance)]: encoded += encode_context_unsigned(0, property_id)
+		encoded += closing_tag(1)
+	return encoded
+
+def decode_read_property_multiple(body):
+	"""Returns the list of (object type, instance, property id) in a ReadPropertyMultiple request"""
+	references = []
+	offset = 0
+	while offset < len(body):
+		identifier, offset = decode_context_unsigned(body, offset, 0)
+		object_type, instance = split_object_identifier(identifier)
+		tag_number, is_context, length, offset = decode_tag(body, offset)
+		if tag_number != 1 or length != OPENING: raise BACnetException('Expected a list of property references')
+		while True:
+			tag_number, is_context, length, content_offset = decode_tag(body, offset)
+			if length == CLOSING:
+				offset = content_offset
+				break
+			property_id, offset = decode_context_unsigned(body, offset, 0)
+			index, offset = decode_context_unsigned(body, offset, 1, optional=True)
+			references.append((object_type, instance, property_id))
+	return references
+
+def read_property_multiple_ack_body(results):
+	"""results is a list of (object type, instance, property id, result) where the result is an encoded value or an (error class, error code) tuple"""
+	encoded = ''
+	current_object = None
+	for object_type, instance, property_id, result in results:
+		if current_object != (object_type, instance):
+			if current_object: encoded += closing_tag(1)
+			encoded += encode_context_object_identifier(0, object_type, instance) + opening_tag(1)
+			current_object = (object_type, instance)
+		encoded += encode_context_unsigned(2, property_id)
+		if isinstance(result, tuple):
+			encoded += opening_tag(5) + encode_application(BACnetProtocol.ENUMERATED, result[0]) + encode_application(BACnetProtocol.ENUMERATED, result[1]) + closing_tag(5)
+		else:
+			encoded += opening_tag(4) + result + closing_tag(4)
+	if current_object: encoded += closing_tag(1)
+	return encoded
+
+def decode_read_property_multiple_ack(body):
+	"""Returns a map of (object type, instance, property id) to the property's value (or list of values if there are several),
+	or to a BACnetErrorException if the device couldn't read that property"""
+	results = {}
+	offset = 0
+	while offset < len(body):
+		identifier, offset = decode_context_unsigned(body, offset, 0)
+		object_type, instance = split_object_identifier(identifier)
+		tag_number, is_context, length, offset = decode_tag(body, offset)
+		if tag_number != 1 or length != OPENING: raise BACnetException('Expected a list of results')
+		while True:
+			tag_number, is_context, length, content_offset = decode_tag(body, offset)
+			if length == CLOSING:
+				offset = content_offset
+				break
+			property_id, offset = decode_context_unsigned(body, offset, 2)
+			index, offset = decode_context_unsigned(body, offset, 3, optional=True)
+			tag_number, is_context, length, offset = decode_tag(body, offset)
+			if length != OPENING or tag_number not in (4, 5): raise BACnetException('Expected a property value or error')
+			values, offset = decode_values(body, offset, tag_number)
+			if tag_number == 5:
+				results[(object_type, instance, property_id)] = BACnetErrorException(BACnetProtocol.ERROR, tuple(values[:2]))
+			elif len(values) == 1:
+				results[(object_type, instance, property_id)] = values[0]
+			else:
+				results[(object_type, instance, property_id)] = values
+	return results
+
+def write_property_multiple_body(writes):
+	"""writes is a list of (object type, instance, property id, encoded value, priority or None), which are grouped by object in the request"""
+	objects = []
+	properties = {}
+	for object_type, instance, property_id, encoded_value, priority in writes:
+		if (object_type, instance) not in properties:
+			objects.append((object_type, instance))
+			properties[(object_type, instance)] = []
+		properties[(object_type, instance)].append((property_id, encoded_value, priority))
+	encoded = ''
+	for object_type, instance in objects:
+		encoded += encode_context_object_identifier(0, object_type, instance) + opening_tag(1)
+		for property_id, encoded_value, priority in properties[(object_type, instance)]:
+			encoded += encode_context_unsigned(0, property_id) + opening_tag(2) + encoded_value + closing_tag(2)
+			if priority != None: encoded += encode_context_unsigned(3, priority)
+		encoded += closing_tag(1)
+	return encoded
+
+def decode_write_property_multiple(body):
+	"""Returns the list of (object type, instance, property id, [values], priority or None) in a WritePropertyMultiple request"""
+	writes = []
+	offset = 0
+	while offset < len(body):
+		identifier, offset = decode_context_unsigned(body, offset, 0)
+		object_type, instance = split_object_identifier(identifier)
+		tag_number, is_context, length, offset = decode_tag(body, offset)
+		if tag_number != 1 or length != OPENING: raise BACnetException('Expected a list of property values')
+		while True:
+			tag_number, is_context, length, content_offset = decode_tag(body, offset)
+			if length == CLOSING:
+				offset = content_offset
+				break
+			property_id, offset = decode_context_unsigned(body, offset, 0)
+			index, offset = decode_context_unsigned(body, offset, 1, optional=True)
+			tag_number, is_context, length, offset = decode_tag(body, offset)
+			if tag_number != 2 or length != OPENING: raise BACnetException('Expected a property value')
+			values, offset = decode_values(body, offset, 2)
+			priority, offset = decode_context_unsigned(body, offset, 3, optional=True)
+			writes.append((object_type, instance, property_id, values, priority))
+	return writes
+
+def subscribe_cov_body(process_id, object_type, instance, lifetime=None, confirmed=False):
+	"""The subscription lasts lifetime seconds, or the existing subscription is cancelled if lifetime is None"""
+	encoded = encode_context_unsigned(0, process_id) + encode_context_object_identifier(1, object_type, instance)
+	if lifetime == None: return encoded
+	return encoded + encode_context(2, chr(confirmed and 1 or 0)) + encode_context_unsigned(3, lifetime)
+
+def decode_subscribe_cov(body):
+	"""Returns (process id, (object type, instance), confirmed, lifetime) where confirmed and lifetime are None for a cancellation"""
+	process_id, offset = decode_context_unsigned(body, 0, 0)
+	identifier, offset = decode_context_unsigned(body, offset, 1)
+	confirmed, offset = decode_context_unsigned(body, offset, 2, optional=True)
+	lifetime, offset = decode_context_unsigned(body, offset, 3, optional=True)
+	if confirmed != None: confirmed = confirmed == 1
+	return (process_id, split_object_identifier(identifier), confirmed, lifetime)
+
+def cov_notification_body(process_id, device_id, object_type, instance, time_remaining, encoded_values):
+	"""encoded_values is a list of (property id, application encoded value)"""
+	encoded = encode_context_unsigned(0, process_id) + encode_context_object_identifier(1, BACnetProtocol.DEVICE, device_id) + encode_context_object_identifier(2, object_type, instance) + encode_context_unsigned(3, time_remaining)
+	encoded += opening_tag(4)
+	for property_id, encoded_value in encoded_values: encoded += encode_context_unsigned(0, property_id) + opening_tag(2) + encoded_value + closing_tag(2)
+	return encoded + closing_tag(4)
+
+def decode_cov_notification(body):
+	"""Returns (process id, device id, (object type, instance), time remaining, a map of property id to value)"""
+	process_id, offset = decode_context_unsigned(body, 0, 0)
+	device_identifier, offset = decode_context_unsigned(body, offset, 1)
+	object_identifier, offset = decode_context_unsigned(body, offset, 2)
+	time_remaining, offset = decode_context_unsigned(body, offset, 3)
+	tag_number, is_context, length, offset = decode_tag(body, offset)
+	if tag_number != 4 or length != OPENING: raise BACnetException('Expected a list of values')
+	values = {}
+	while True:
+		tag_number, is_context, length, content_offset = decode_tag(body, offset)
+		if length == CLOSING: break
+		property_id, offset = decode_context_unsigned(body, offset, 0)
+		index, offset = decode_context_unsigned(body, offset, 1, optional=True)
+		tag_number, is_context, length, offset = decode_tag(body, offset)
+		if tag_number != 2 or length != OPENING: raise BACnetException('Expected a property value')
+		property_values, offset = decode_values(body, offset, 2)
+		priority, offset = decode_context_unsigned(body, offset, 3, optional=True)
+		if len(property_values) == 1:
+			values[property_id] = property_values[0]
+		else:
+			values[property_id] = property_values
+	return (process_id, split_object_identifier(device_identifier)[1], split_object_identifier(object_identifier), time_remaining, values)
+
+class BACnetBinding:
+	"""Where to send requests for a device: the IP address and port and, for devices behind a BACnet router, the remote network and MAC address"""
+	def __init__(self, address, network=None, mac=''):
+		self.address = address
+		self.network = network
+		self.mac = mac
+
+	def matches(self, address, network, mac): return self.address == address and self.network == network and (network == None or self.mac == mac)
+
+class BACnetClient:
+	"""Sends BACnet requests from a single UDP socket, binding to devices with Who-Is and remembering their addresses.
+		Requests are sent one at a time (callers in other threads wait on a lock) and retried with a fresh Who-Is when a device doesn't answer.
+		BACnet devices reply to whichever port a request came from, so requests go out from any free port (or local_port) and every process can have a client.
+		Some devices broadcast their I-Am to the BACnet port, so the client also listens on listen_port (by default the port it sends to) with SO_REUSEADDR,
+		which lets the clients in every process share the port and each receive the broadcasts.
+		Devices which can't be found with Who-Is can be given static addresses: device_addresses maps device ids to (host, port).
+		Requests from devices (like COV notifications) are passed to the notification_handler, if there is one, as they arrive.
+	"""
+	def __init__(self, port=BACnetProtocol.DEFAULT_PORT, broadcast_address='255.255.255.255', local_port=0, timeout=3, retries=2, device_addresses=None, listen_port=None):
+		self.port = port
+		self.broadcast_address = broadcast_address
+		self.local_port = local_port or 0
+		if listen_port == None:
+			self.listen_port = port
+		else:
+			self.listen_port = listen_port
+		self.timeout = timeout
+		self.retries = retries
+		self.static_bindings = {}
+		for device_id, address in (device_addresses or {}).items(): self.static_bindings[int(device_id)] = BACnetBinding((address[0], int(address[1])))
+		self.bindings = {}
+		self.single_read_devices = set() # devices which don't support ReadPropertyMultiple
+		self.single_write_devices = set() # devices which don't support WritePropertyMultiple
+		self.notification_handler = None # called with (address, BACnetAPDU) for each request a device sends us
+		self.sock = None
+		self.listen_sock = None
+		self.invoke_id = 0
+		self.lock = threading.RLock()
+
+	def open(self):
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+		self.sock.bind(('', self.local_port))
+		if not self.listen_port or self.listen_port == self.sock.getsockname()[1]: return
+		listen_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		if hasattr(socket, 'SO_REUSEPORT'): # BSDs only share broadcasts between sockets with SO_REUSEPORT
+			try:
+				listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+			except socket.error:
+				pass
+		try:
+			listen_sock.bind(('', self.listen_port))
+			self.listen_sock = listen_sock
+		except socket.error:
+			logging.warning('Could not listen on port %s so broadcast I-Am replies will be missed' % self.listen_port)
+			listen_sock.close()
+
+	def close(self):
+		if self.listen_sock != None:
+			try:
+				self.listen_sock.close()
+			finally:
+				self.listen_sock = None
+		if self.sock == None: return
+		try:
+			self.sock.close()
+		finally:
+			self.sock = None
+
+	def local_address(self): return self.sock.getsockname()
+
+	def forget_device(self, device_id):
+		self.lock.acquire()
+		try:
+			if device_id in self.bindings: del self.bindings[device_id]
+		finally:
+			self.lock.release()
+
+	def bind_device(self, device_id):
+		"""Returns the BACnetBinding for the device, broadcasting a Who-Is for it if it isn't known yet"""
+		if device_id in self.static_bindings: return self.static_bindings[device_id]
+		self.lock.acquire()
+		try:
+			if device_id in self.bindings: return self.bindings[device_id]
+			if self.sock == None: self.open()
+			who_is = BACnetAPDU(BACnetProtocol.UNCONFIRMED_REQUEST, BACnetProtocol.WHO_IS, body=who_is_body(device_id, device_id))
+			npdu = encode_npdu(who_is.encode(), network=BACnetProtocol.GLOBAL_BROADCAST_NETWORK)
+			for attempt in range(self.retries + 1):
+				self.sock.sendto(encode_bvlc(npdu, broadcast=True), (self.broadcast_address, self.port))
+				deadline = time.time() + self.timeout
+				while device_id not in self.bindings and time.time() < deadline:
+					self._receive(deadline - time.time())
+				if device_id in self.bindings: return self.bindings[device_id]
+			raise BACnetTimeoutException('Device %s did not answer a Who-Is' % device_id)
+		finally:
+			self.lock.release()
+
+	def _next_invoke_id(self):
+		self.invoke_id = (self.invoke_id + 1) % 256
+		return self.invoke_id
+
+	def _receive(self, timeout):
+		"""Waits up to timeout seconds for a datagram and returns (address, network, mac, BACnetAPDU), or None if nothing usable arrived.
+		I-Am announcements update the bindings as they go by."""
+		readable = select.select([sock for sock in (self.sock, self.listen_sock) if sock != None], [], [], max(0, timeout))[0]
+		if not readable: return None
+		data, address = readable[0].recvfrom(2048)
+		try:
+			link = decode_bvlc(data, address)
+			if link == None: return None
+			address, npdu = link
+			network = decode_npdu(npdu)
+			if network == None: return None
+			source_network, source_mac, encoded_apdu = network
+			apdu = BACnetAPDU.decode(encoded_apdu)
+			if apdu.pdu_type == BACnetProtocol.UNCONFIRMED_REQUEST and apdu.service == BACnetProtocol.I_AM:
+				self.bindings[decode_i_am(apdu.body)] = BACnetBinding(address, source_network, source_mac)
+			elif apdu.pdu_type == BACnetProtocol.UNCONFIRMED_REQUEST or apdu.pdu_type == BACnetProtocol.CONFIRMED_REQUEST:
+				self._handle_notification(address, source_network, source_mac, apdu)
+			return (address, source_network, source_mac, apdu)
+		except (BACnetException, IndexError, struct.error):
+			logging.exception('Could not decode a BACnet datagram from %s:%s' % address)
+			return None
+
+	def _handle_notification(self, address, network, mac, apdu):
+		if apdu.pdu_type == BACnetProtocol.CONFIRMED_REQUEST:
+			if apdu.service == BACnetProtocol.CONFIRMED_COV_NOTIFICATION:
+				response = BACnetAPDU(BACnetProtocol.SIMPLE_ACK, apdu.service, apdu.invoke_id)
+			else:
+				response = BACnetAPDU(BACnetProtocol.REJECT, None, apdu.invoke_id, detail=BACnetProtocol.UNRECOGNIZED_SERVICE)
+			self.sock.sendto(encode_bvlc(encode_npdu(response.encode(), network=network, mac=mac)), address)
+		if self.notification_handler == None: return
+		try:
+			self.notification_handler(address, apdu)
+		except:
+			logging.exception('The BACnet notification handler failed')
+
+	def receive_notifications(self, timeout):
+		"""Waits timeout seconds, passing any requests from devices to the notification_handler"""
+		self.lock.acquire()
+		try:
+			if self.sock == None: self.open()
+			deadline = time.time() + timeout
+			while time.time() < deadline: self._receive(deadline - time.time())
+		finally:
+			self.lock.release()
+
+	def confirmed_request(self, device_id, service, body):
+		"""Sends a confirmed request to the device and returns the BACnetAPDU of its Simple-ACK or Complex-ACK.
+		Raises a BACnetErrorException if the device refuses and a BACnetTimeoutException if it never answers."""
+		self.lock.acquire()
+		try:
+			if self.sock == None: self.open()
+			for attempt in range(self.retries + 1):
+				binding = self.bind_device(device_id)
+				invoke_id = self._next_invoke_id()
+				request = BACnetAPDU(BACnetProtocol.CONFIRMED_REQUEST, service, invoke_id, body)
+				self.sock.sendto(encode_bvlc(encode_npdu(request.encode(), True, binding.network, binding.mac)), binding.address)
+				deadline = time.time() + self.timeout
+				while time.time() < deadline:
+					received = self._receive(deadline - time.time())
+					if received == None: continue
+					address, network, mac, apdu = received
+					if apdu.pdu_type in (BACnetProtocol.UNCONFIRMED_REQUEST, BACnetProtocol.CONFIRMED_REQUEST) or apdu.invoke_id != invoke_id or not binding.matches(address, network, mac): continue
+					if apdu.pdu_type in (BACnetProtocol.ERROR, BACnetProtocol.REJECT, BACnetProtocol.ABORT): raise BACnetErrorException(apdu.pdu_type, apdu.detail)
+					return apdu
+				self.forget_device(device_id) # it may have moved, so look for it again
+			raise BACnetTimeoutException('Device %s did not answer' % device_id)
+		finally:
+			self.lock.release()
+
+	def read_property(self, device_id, object_type, instance, property_id, index=None):
+		"""Returns the property's value, or a list of values if it has more than one"""
+		ack = self.confirmed_request(device_id, BACnetProtocol.READ_PROPERTY, property_reference(object_type, instance, property_id, index))
+		values = decode_read_property_ack(ack.body)[3]
+		if len(values) == 1: return values[0]
+		return values
+
+	def read_property_multiple(self, device_id, references):
+		"""Reads every (object type, instance, property id) in references with one request, returning a map like decode_read_property_multiple_ack"""
+		ack = self.confirmed_request(device_id, BACnetProtocol.READ_PROPERTY_MULTIPLE, read_property_multiple_body(references))
+		return decode_read_property_multiple_ack(ack.body)
+
+	def write_property(self, device_id, object_type, instance, property_id, encoded_value, priority=None, index=None):
+		"""Writes the application encoded value (see encode_application) to the property"""
+		self.confirmed_request(device_id, BACnetProtocol.WRITE_PROPERTY, write_property_body(object_type, instance, property_id, encoded_value, priority, index))
+
+	def write_property_multiple(self, device_id, writes):
+		"""Writes every (object type, instance, property id, encoded value, priority or None) in writes with one request"""
+		self.confirmed_request(device_id, BACnetProtocol.WRITE_PROPERTY_MULTIPLE, write_property_multiple_body(writes))
+
+	def subscribe_cov(self, device_id, process_id, object_type, instance, lifetime, confirmed=False):
+		"""Asks the device to send COV notifications for the object for the next lifetime seconds"""
+		self.confirmed_request(device_id, BACnetProtocol.SUBSCRIBE_COV, subscribe_cov_body(process_id, object_type, instance, lifetime, confirmed))
+
+	def cancel_cov(self, device_id, process_id, object_type, instance):
+		self.confirmed_request(device_id, BACnetProtocol.SUBSCRIBE_COV, subscribe_cov_body(process_id, object_type, instance))
+
+	def read_analog_output(self, device_id, property_id):
+		"""Returns the Present-Value of a light as a float"""
+		return float(self.read_property(int(device_id), BACnetProtocol.LIGHT_OBJECT_TYPE, int(property_id), BACnetProtocol.PRESENT_VALUE))
+
+	def write_analog_output_int(self, device_id, property_id, value):
+		"""Sets the Present-Value of a light"""
+		self.write_property(int(device_id), BACnetProtocol.LIGHT_OBJECT_TYPE, int(property_id), BACnetProtocol.PRESENT_VALUE, encode_application(BACnetProtocol.REAL, float(value)))
+
+	def read_analog_outputs(self, device_id, property_ids):
+		"""Returns a map of property id to the Present-Value of each of the device's lights, or to None for lights the device couldn't read.
+		The lights are read with ReadPropertyMultiple in batches, or one by one for devices which don't support it."""
+		device_id = int(device_id)
+		property_ids = [int(property_id) for property_id in property_ids]
+		results = {}
+		for start in range(0, len(property_ids), BACnetProtocol.READ_PROPERTY_MULTIPLE_BATCH_SIZE):
+			batch = property_ids[start:start + BACnetProtocol.READ_PROPERTY_MULTIPLE_BATCH_SIZE]
+			if device_id not in self.single_read_devices:
+				try:
+					values = self.read_property_multiple(device_id, [(BACnetProtocol.LIGHT_OBJECT_TYPE, property_id, BACnetProtocol.PRESENT_VALUE) for property_id in batch])
+					for property_id in batch:
+						value = values.get((BACnetProtocol.LIGHT_OBJECT_TYPE, property_id, BACnetProtocol.PRESENT_VALUE), None)
+						if value == None or isinstance(value, BACnetErrorException):
+							results[property_id] = None
+						else:
+							results[property_id] = float(value)
+					continue
+				except BACnetErrorException, e:
+					if e.pdu_type == BACnetProtocol.ERROR and e.detail[0] != BACnetProtocol.SERVICES_ERROR_CLASS: raise
+					logging.info('BACnet device %s does not support ReadPropertyMultiple (%s), so reading its lights one at a time' % (device_id, e))
+					self.single_read_devices.add(device_id)
+			for property_id in batch:
+				try:
+					results[property_id] = self.read_analog_output(device_id, property_id)
+				except BACnetErrorException:
+					results[property_id] = None
+		return results
+
+	def write_analog_outputs(self, device_id, values):
+		"""Sets the Present-Value of several of the device's lights, given a map of property id to value.
+		The values are written with WritePropertyMultiple in batches, or one by one for devices which don't support it."""
+		device_id = int(device_id)
+		writes = [(BACnetProtocol.LIGHT_OBJECT_TYPE, int(property_id), BACnetProtocol.PRESENT_VALUE, encode_application(BACnetProtocol.REAL, float(value)), None) for property_id, value in sorted(values.items())]
+		for start in range(0, len(writes), BACnetProtocol.WRITE_PROPERTY_MULTIPLE_BATCH_SIZE):
+			batch = writes[start:start + BACnetProtocol.WRITE_PROPERTY_MULTIPLE_BATCH_SIZE]
+			if device_id not in self.single_write_devices:
+				try:
+					self.write_property_multiple(device_id, batch)
+					continue
+				except BACnetErrorException, e:
+					if e.pdu_type == BACnetProtocol.ERROR and e.detail[0] != BACnetProtocol.SERVICES_ERROR_CLASS: raise
+					logging.info('BACnet device %s does not support WritePropertyMultiple (%s), so writing its lights one at a time' % (device_id, e))
+					self.single_write_devices.add(device_id)
+			for object_type, instance, property_id, encoded_value, priority in batch:
+				self.write_property(device_id, object_type, instance, property_id, encoded_value, priority)
+
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
@@ -1,58 +1,137 @@
 #!/usr/bin/python
 
-"""These functions wrap the bacnet command line apps from http://bacnet.sourceforge.net/
-In your django settings you'll need a BACNET_BIN_DIR with the full path to the directory containing the compiled apps.
-Like so (no slash on the end, please):
-BACNET_BIN_DIR = '/usr/local/src/bacnet-stack-0.5.3/bin'
+"""These functions read and write the Present-Value of the BACNet lights through an in-process BACnet/IP client (see bacnet.py).
+Each process shares one client, so the UDP socket and the device addresses found with Who-Is are reused from request to request.
+In your django settings you can set the BACnet/IP port the devices use (the default is 47809) and the address to broadcast Who-Is to:
+BACNET_PORT = 47809
+BACNET_BROADCAST_ADDRESS = '255.255.255.255'
+Devices which don't answer a broadcast Who-Is can be given fixed addresses:
+BACNET_DEVICE_ADDRESSES = { 77000:('10.0.0.20', 47809) }
+With BACNET_COV_ENABLED each process also runs a BACnetCOVManager (see bacnet_cov.py) and reads are served from the values it keeps:
+BACNET_COV_ENABLED = True
+BACNET_COV_LIFETIME = 300 # seconds each subscription lasts before it is renewed
+BACNET_COV_POLL_INTERVAL = 10 # seconds between polls of devices which don't support COV
+BACNET_COV_MAX_AGE = 60 # seconds a value is served without a notification before the light is read again
 """
 
-import os, sys, subprocess
-import settings
+import os, sys
+import threading
 import logging
 
+from django.conf import settings
+
+from bacnet import BACnetClient, BACnetException
+from bacnet_cov import BACnetCOVManager
+
 USAGE_MESSAGE = 'usage: bacnet_control <read-ao|write-ao> <device id> <property id> [<value>]'
 
+_client = None
+_cov_manager = None
+_client_lock = threading.Lock()
+
+def client_from_settings(local_port=0):
+	return BACnetClient(port=getattr(settings, 'BACNET_PORT', 47809), broadcast_address=getattr(settings, 'BACNET_BROADCAST_ADDRESS', '255.255.255.255'), local_port=local_port, timeout=getattr(settings, 'BACNET_TIMEOUT', 3), device_addresses=getattr(settings, 'BACNET_DEVICE_ADDRESSES', {}))
+
+def shared_client():
+	"""Returns the process's BACnetClient, creating it from the settings the first time"""
+	global _client
+	_client_lock.acquire()
+	try:
+		if _client == None: _client = client_from_settings()
+		return _client
+	finally:
+		_client_lock.release()
+
+def shared_cov_manager():
+	"""Returns the process's running BACnetCOVManager, starting it the first time, or None if BACNET_COV_ENABLED is off.
+	The manager has a client of its own, starting with the shared client's bindings, so notifications aren't held up behind requests."""
+	global _cov_manager
+	if not getattr(settings, 'BACNET_COV_ENABLED', False): return None
+	client = shared_client()
+	_client_lock.acquire()
+	try:
+		if _cov_manager == None:
+			cov_client = client_from_settings()
+			cov_client.bindings.update(client.bindings)
+			_cov_manager = BACnetCOVManager(cov_client, lifetime=getattr(settings, 'BACNET_COV_LIFETIME', 300), poll_interval=getattr(settings, 'BACNET_COV_POLL_INTERVAL', 10), max_age=getattr(settings, 'BACNET_COV_MAX_AGE', 60))
+			_cov_manager.start()
+		return _cov_manager
+	finally:
+		_client_lock.release()
+
+class BACNetLightValue:
+	"""Wraps a BACNetLight and its Present-Value (None if it couldn't be read) for dehydration"""
+	def __init__(self, light, value):
+		self.id = light.id
+		self.name = light.name
+		self.device_id = light.device_id
+		self.property_id = light.property_id
+		self.value = value
+	class HydrationMeta:
+		attributes = ['id', 'name', 'device_id', 'property_id', 'value']
+
 class BacnetControl:
-	def __init__(self, bin_dir_path, bacnet_port=47809):
-		self.bin_dir_path = bin_dir_path
-		self.bacnet_port = bacnet_port
-	def run_command(self, args):
-		os.environ['BACNET_IP_PORT'] = '%s' % self.bacnet_port
-		#args = ['/var/www/Art-Server/art_server/bacnet_bins/bacrp 77000 2 1 85'] #[' '.join(args)]
-		proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=self.bin_dir_path)
-		output = ''
-		for line in proc.stdout:
-			#if line == '' and proc.poll() != None: break
-			output = '%s%s' % (output, line)
-		err_output = ''
-		for line in proc.stderr:
-			err_output = '%s%s' % (err_output, line)	
-		proc.wait()
-		return (proc.returncode, output, err_output)
-
-	def get_bin_path(self, bin_name):
-		bin_name = '%s%s' % (bin_name, settings.BACNET_EXECUTABLE_EXTENSION)
-		bin_path = os.path.join(self.bin_dir_path, bin_name)
-		if not os.path.exists(bin_path):
-			raise IOError('Bacnet bin does not exist: %s' % bin_path)
-		return bin_path
+	"""Reads and writes the lights, using the values kept by the cov_manager when it has them.
+	By default it uses the process's shared client and COV manager."""
+	def __init__(self, client=None, cov_manager=None):
+		if client == None:
+			client = shared_client()
+			if cov_manager == None: cov_manager = shared_cov_manager()
+		self.client = client
+		self.cov_manager = cov_manager
 
 	def read_analog_output(self, device_id, property_id):
 		"""Returns the Present-Value of an Analog Output property"""
-		bin_path = self.get_bin_path('bacrp')
-		# bacrp device-instance object-type object-instance property [index]
-		# bacrp 100 2 23 1 85
-		args = [bin_path, '%s' % int(device_id), '2', '%s' % int(property_id), '85']
-		return self.run_command(args)
+		if self.cov_manager:
+			value = self.cov_manager.cached_value(device_id, property_id)
+			if value != None: return value
+		value = self.client.read_analog_output(device_id, property_id)
+		if self.cov_manager: self.cov_manager.store_value(device_id, property_id, value)
+		return value
 
 	def write_analog_output_int(self, device_id, property_id, value):
-		"""Returns the Present-Value of an Analog Output property"""
-		bin_path = self.get_bin_path('bacwp')
-		# bacwp device-instance object-type object-instance property priority index tag value [tag value...]
-		# bacwp 77000 2 1 85 0 -1 4 99.0
-		args = [bin_path, '%s' % int(device_id), '2', '%s' % int(property_id), '85', '0', '-1', '4', '%s' % value]
-		print args
-		return self.run_command(args)
+		"""Sets the Present-Value of an Analog Output property"""
+		self.client.write_analog_output_int(device_id, property_id, value)
+		if self.cov_manager: self.cov_manager.store_value(device_id, property_id, float(value))
+
+	def read_light_values(self, lights):
+		"""Returns a map of light id to the light's Present-Value, or None if it couldn't be read.
+		The lights are grouped by device so that each device is asked for all of its lights at once."""
+		device_lights = {}
+		values = {}
+		for light in lights:
+			if self.cov_manager:
+				values[light.id] = self.cov_manager.cached_value(light.device_id, light.property_id)
+				if values[light.id] != None: continue
+			device_lights.setdefault(light.device_id, []).append(light)
+		for device_id, lights in device_lights.items():
+			try:
+				device_values = self.client.read_analog_outputs(device_id, [light.property_id for light in lights])
+			except BACnetException:
+				logging.exception('Could not read the analog outputs of bacnet device %s' % device_id)
+				device_values = {}
+			for light in lights:
+				values[light.id] = device_values.get(light.property_id, None)
+				if self.cov_manager and values[light.id] != None: self.cov_manager.store_value(light.device_id, light.property_id, values[light.id])
+		return values
+
+	def write_light_values(self, light_values):
+		"""Sets each light in the list of (light, value) pairs, returning a map of light id to whether its value was written.
+		The values are grouped by device so that each device gets all of its lights in one request."""
+		device_values = {}
+		for light, value in light_values: device_values.setdefault(light.device_id, []).append((light, value))
+		results = {}
+		for device_id, values in device_values.items():
+			try:
+				self.client.write_analog_outputs(device_id, dict([(light.property_id, value) for light, value in values]))
+				written = True
+			except BACnetException:
+				logging.exception('Could not write the analog outputs of bacnet device %s' % device_id)
+				written = False
+			for light, value in values:
+				results[light.id] = written
+				if written and self.cov_manager: self.cov_manager.store_value(light.device_id, light.property_id, float(value))
+		return results
 
 def main():
 	try:
@@ -63,7 +142,8 @@ def main():
 		print USAGE_MESSAGE
 		return
 
-	control = BacnetControl(settings.BACNET_BIN_DIR)
+	os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+	control = BacnetControl(shared_client()) # one-off reads don't need to subscribe to anything
 	if action == 'read-ao':
 		print control.read_analog_output(device_id, property_id)
 	elif action == 'write-ao':
@@ -72,7 +152,8 @@ def main():
 		except IndexError:
 			print USAGE_MESSAGE
 			return
-		print control.write_analog_output_int(device_id, property_id, value)
+		control.write_analog_output_int(device_id, property_id, value)
+		print control.read_analog_output(device_id, property_id)
 	else:
 		print USAGE_MESSAGE
 		return
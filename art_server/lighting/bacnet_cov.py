@@ -0,0 +1,157 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""Keeps the Present-Value of each watched light in memory using BACnet Change-Of-Value subscriptions.
+
+The BACnetCOVManager thread subscribes to each light it is asked to watch and stores the values the devices push whenever a light changes,
+including changes made from the building's own panels, so reads are served without a request to the device.
+Subscriptions are renewed before they lapse.  Devices which refuse COV subscriptions have their lights polled every poll_interval seconds,
+and a light which hasn't been heard from for max_age seconds is polled too, in case a notification was lost.
+Values older than max_age are never served, even while subscribed, since a device which reboots forgets its subscriptions without telling us.
+When a poll finds a subscribed light changed behind our back the light is subscribed to again.
+"""
+import os
+import time
+import logging
+import threading
+
+from bacnet import BACnetProtocol, BACnetException, BACnetErrorException, decode_cov_notification
+
+class WatchedLight:
+	"""The cached value of one light and the state of its subscription"""
+	def __init__(self, device_id, property_id):
+		self.device_id = device_id
+		self.property_id = property_id
+		self.value = None
+		self.updated = None # when the value was last pushed or read
+		self.subscribed_until = 0
+		self.next_subscribe = 0
+
+class BACnetCOVManager(threading.Thread):
+	"""Subscribes to COV notifications with its own BACnetClient and caches the Present-Values the devices push."""
+	def __init__(self, client, lifetime=300, poll_interval=10, max_age=None):
+		self.client = client
+		self.client.notification_handler = self.handle_notification
+		self.lifetime = lifetime
+		self.poll_interval = poll_interval
+		if max_age == None: max_age = min(lifetime, 60)
+		self.max_age = max_age
+		self.process_id = os.getpid() & 0xFFFF # identifies our subscriptions to the devices
+		self.lights = {}
+		self.polled_devices = set() # devices which refused a subscription
+		self.last_polls = {}
+		self.lock = threading.Lock()
+		self.running = False
+		self.notification_count = 0
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def watch(self, device_id, property_id):
+		"""Starts tracking the light if it isn't already, returning its WatchedLight"""
+		key = (int(device_id), int(property_id))
+		self.lock.acquire()
+		try:
+			if key not in self.lights: self.lights[key] = WatchedLight(key[0], key[1])
+			return self.lights[key]
+		finally:
+			self.lock.release()
+
+	def watch_lights(self, lights):
+		for light in lights: self.watch(light.device_id, light.property_id)
+
+	def cached_value(self, device_id, property_id):
+		"""Returns the light's value if it's being kept current, or None if it has to be read from the device.
+		Starts watching the light if it isn't being watched yet."""
+		light = self.watch(device_id, property_id)
+		if light.updated == None: return None
+		now = time.time()
+		if now - light.updated <= self.max_age: return light.value
+		return None
+
+	def store_value(self, device_id, property_id, value):
+		"""Records a value which was read from or written to the device"""
+		light = self.watch(device_id, property_id)
+		light.value = value
+		light.updated = time.time()
+
+	def handle_notification(self, address, apdu):
+		if apdu.service not in (BACnetProtocol.CONFIRMED_COV_NOTIFICATION, BACnetProtocol.UNCONFIRMED_COV_NOTIFICATION): return
+		process_id, device_id, object_id, time_remaining, values = decode_cov_notification(apdu.body)
+		if process_id != self.process_id or object_id[0] != BACnetProtocol.LIGHT_OBJECT_TYPE or BACnetProtocol.PRESENT_VALUE not in values: return
+		self.notification_count += 1
+		self.store_value(device_id, object_id[1], float(values[BACnetProtocol.PRESENT_VALUE]))
+
+	def stop(self):
+		self.running = False
+
+	def run(self):
+		self.running = True
+		while self.running:
+			try:
+				self.renew_subscriptions()
+				self.poll()
+				self.client.receive_notifications(1)
+			except:
+				logging.exception('The BACnet COV manager failed')
+				time.sleep(1)
+		self.cancel_subscriptions()
+
+	def renew_subscriptions(self):
+		"""Subscribes to the lights whose subscriptions are missing or have used up three quarters of their lifetime"""
+		now = time.time()
+		self.lock.acquire()
+		try:
+			lights = [light for light in self.lights.values() if light.device_id not in self.polled_devices and light.next_subscribe <= now]
+		finally:
+			self.lock.release()
+		unreachable = set()
+		for light in lights:
+			if light.device_id in self.polled_devices or light.device_id in unreachable: continue
+			try:
+				self.client.subscribe_cov(light.device_id, self.process_id, BACnetProtocol.LIGHT_OBJECT_TYPE, light.property_id, self.lifetime)
+				light.subscribed_until = time.time() + self.lifetime
+				light.next_subscribe = time.time() + self.lifetime * 3 / 4
+			except BACnetErrorException, e:
+				logging.info('BACnet device %s refused a COV subscription (%s), so polling its lights instead' % (light.device_id, e))
+				self.polled_devices.add(light.device_id)
+			except BACnetException:
+				logging.exception('Could not subscribe to bacnet device %s property %s' % (light.device_id, light.property_id))
+				unreachable.add(light.device_id)
+		for light in lights:
+			if light.device_id in unreachable: light.next_subscribe = time.time() + self.poll_interval
+
+	def poll(self):
+		"""Reads the lights on devices which refused subscriptions and any light which hasn't been heard from in max_age seconds, a device at a time"""
+		now = time.time()
+		device_lights = {}
+		self.lock.acquire()
+		try:
+			for light in self.lights.values():
+				if now - self.last_polls.get(light.device_id, 0) < self.poll_interval: continue
+				if light.device_id not in self.polled_devices:
+					if light.updated != None and now - light.updated <= self.max_age: continue
+					if light.updated == None and light.subscribed_until - self.lifetime > now - self.poll_interval: continue # the device sends the value right after a subscription
+				device_lights.setdefault(light.device_id, []).append(light)
+		finally:
+			self.lock.release()
+		for device_id, lights in device_lights.items():
+			self.last_polls[device_id] = now
+			try:
+				values = self.client.read_analog_outputs(device_id, [light.property_id for light in lights])
+			except BACnetException:
+				logging.exception('Could not poll bacnet device %s' % device_id)
+				continue
+			for light in lights:
+				if values.get(light.property_id, None) == None: continue
+				if light.subscribed_until > now and light.value != None and light.value != values[light.property_id]:
+					logging.info('Missed a COV notification from bacnet device %s property %s, so subscribing again' % (device_id, light.property_id))
+					light.next_subscribe = 0
+				self.store_value(device_id, light.property_id, values[light.property_id])
+
+	def cancel_subscriptions(self):
+		now = time.time()
+		for light in self.lights.values():
+			if light.subscribed_until <= now: continue
+			try:
+				self.client.cancel_cov(light.device_id, self.process_id, BACnetProtocol.LIGHT_OBJECT_TYPE, light.property_id)
+			except BACnetException:
+				pass # the subscription will lapse on its own
+			light.subscribed_until = 0
@@ -1,17 +1,186 @@
-"""This sets the values of the projector dimming control panel via the network"""
+"""This sets the values of the projector dimming control panel via the network
+
+Commands go over one long lived connection per controller (see shared_connection) instead of a connection per command.
+The controller answers each command with CRLF terminated lines, which are read in order, so several commands can be written at once
+and their responses read back together (see CrestonControl.send_commands).  An idle connection is kept open with a Ping every keepalive seconds
+and a dropped one is reopened on the next command, backing off for longer after each failed attempt.
+"""
 import sys
+import time
+import select
 import socket
+import logging
+import threading
 import traceback
 
-class CrestonControl(object):
-	"""The Crestron controller class. 
-	NOTE: This is not thread safe so use a controller in each thread."""
-	def __init__(self, host, port=1313, timeout=15):
+class CrestonException(Exception):
+	pass
+
+class CrestonConnection(object):
+	"""A thread safe connection to a Crestron controller.  Callers take turns: each sends its commands and reads their responses while holding the lock."""
+	STATUS_LINE_COUNT = 9 # the most lines the controller sends in response to Update
+	STATUS_KEYS = ('High', 'Low', 'Current', 'Wake', 'Sleep', 'Lamp1', 'Lamp2')
+
+	def __init__(self, host, port=1313, timeout=15, keepalive=30, min_backoff=1, max_backoff=60):
 		self.host = host
 		self.port = port
 		self.timeout = timeout
+		self.keepalive = keepalive
+		self.min_backoff = min_backoff
+		self.max_backoff = max_backoff
+		self.backoff = 0
+		self.retry_at = 0
 		self.sock = None
-		
+		self.buffer = ''
+		self.last_used = 0
+		self.connection_count = 0
+		self.lock = threading.RLock()
+		self.keepalive_thread = None
+
+	def is_open(self): return self.sock != None
+
+	def open(self):
+		"""Connects and reads the welcome banner, unless the last attempt failed too recently"""
+		if time.time() < self.retry_at: raise CrestonException('Not reconnecting to %s:%s for another %.1f seconds' % (self.host, self.port, self.retry_at - time.time()))
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.sock.settimeout(self.timeout)
+		self.buffer = ''
+		try:
+			self.sock.connect((self.host, self.port))
+			self.read_line() # the welcome banner
+			self.drain()
+		except:
+			self.close()
+			self.backoff = min(self.max_backoff, max(self.min_backoff, self.backoff * 2))
+			self.retry_at = time.time() + self.backoff
+			raise
+		self.backoff = 0
+		self.retry_at = 0
+		self.connection_count += 1
+		self.last_used = time.time()
+		if self.keepalive and (self.keepalive_thread == None or not self.keepalive_thread.isAlive()):
+			self.keepalive_thread = threading.Thread(target=self.keep_alive)
+			self.keepalive_thread.setDaemon(True)
+			self.keepalive_thread.start()
+
+	def close(self):
+		self.lock.acquire()
+		try:
+			if self.sock == None: return
+			try:
+				self.sock.shutdown(socket.SHUT_RDWR)
+			except socket.error:
+				pass
+			self.sock.close()
+			self.sock = None
+			self.buffer = ''
+		finally:
+			self.lock.release()
+
+	def read_line(self, timeout=None):
+		"""Returns the next non-empty line from the controller, without its line ending"""
+		if timeout == None: timeout = self.timeout
+		deadline = time.time() + timeout
+		while True:
+			lines = self.buffer.replace('\r', '\n').split('\n', 1)
+			if len(lines) == 2:
+				line, self.buffer = lines
+				if line.strip(): return line.strip()
+				continue
+			remaining = deadline - time.time()
+			if remaining <= 0 or not select.select([self.sock], [], [], remaining)[0]: raise socket.timeout('No response from %s:%s' % (self.host, self.port))
+			data = self.sock.recv(2048)
+			if not data: raise CrestonException('The controller at %s:%s closed the connection' % (self.host, self.port))
+			self.buffer += data
+
+	def read_status_lines(self):
+		"""Reads the response to an Update, which ends after STATUS_LINE_COUNT lines or once every status key has arrived and the controller goes quiet"""
+		lines = []
+		while len(lines) < self.STATUS_LINE_COUNT:
+			if lines and not [key for key in self.STATUS_KEYS if key not in self.parse_keys(lines)]:
+				try:
+					lines.append(self.read_line(0.05))
+				except socket.timeout:
+					break
+			else:
+				lines.append(self.read_line())
+		return lines
+
+	def parse_keys(self, lines): return [line.split('-', 1)[0] for line in lines]
+
+	def drain(self):
+		"""Discards anything the controller sent which nobody asked for, like the rest of a multi-line banner"""
+		while select.select([self.sock], [], [], 0.05)[0]:
+			data = self.sock.recv(2048)
+			if not data: raise CrestonException('The controller at %s:%s closed the connection' % (self.host, self.port))
+		self.buffer = ''
+
+	def send_commands(self, commands):
+		"""Writes every (command, line count) in commands at once and returns a list with the response lines of each (see read_status_lines for Update).
+		Raises an exception if the controller can't be reached or stops answering, after closing the connection so the next call reconnects."""
+		self.lock.acquire()
+		try:
+			if self.sock != None and select.select([self.sock], [], [], 0)[0]:
+				# an idle connection which is readable has either been dropped by the controller or holds output nobody asked for
+				try:
+					self.drain()
+				except (CrestonException, socket.error):
+					self.close()
+			if self.sock == None: self.open()
+			self.buffer = '' # lines left over from an earlier response would be taken for answers to these commands
+			try:
+				self.sock.sendall(''.join(['%s\r\n' % command for command, lines in commands]))
+				responses = []
+				for command, lines in commands:
+					if command == 'Update':
+						responses.append(self.read_status_lines())
+					else:
+						responses.append([self.read_line() for i in range(lines)])
+				self.last_used = time.time()
+				return responses
+			except:
+				self.close() # we can't tell which response the next line would belong to
+				raise
+		finally:
+			self.lock.release()
+
+	def keep_alive(self):
+		"""Pings the controller whenever the connection has been idle for keepalive seconds, until it's closed"""
+		while self.sock != None:
+			time.sleep(max(0.1, self.last_used + self.keepalive - time.time()))
+			self.lock.acquire()
+			try:
+				if self.sock == None: break
+				if time.time() - self.last_used < self.keepalive: continue
+				try:
+					if self.send_commands([('Ping', 1)])[0][0] != 'Pong': self.close()
+				except:
+					logging.info('The Crestron controller at %s:%s did not answer a keepalive Ping' % (self.host, self.port))
+			finally:
+				self.lock.release()
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+def shared_connection(host, port=1313, timeout=15):
+	"""Returns the process's CrestonConnection to the controller, creating it the first time"""
+	_connections_lock.acquire()
+	try:
+		if (host, port) not in _connections: _connections[(host, port)] = CrestonConnection(host, port, timeout)
+		return _connections[(host, port)]
+	finally:
+		_connections_lock.release()
+
+class CrestonControl(object):
+	"""The Crestron controller class.
+	Controls in any thread may share the process's connection to the controller, which is what they do unless they're given a connection."""
+	def __init__(self, host, port=1313, timeout=15, connection=None):
+		self.host = host
+		self.port = port
+		self.timeout = timeout
+		if connection == None: connection = shared_connection(host, port, timeout)
+		self.connection = connection
+
 	def can_connect(self): return self.ping() == 'Pong'
 
 	def ping(self): return self.send_command('Ping')
@@ -26,58 +195,52 @@ class CrestonControl(object):
 		"""
 		Returns a map of status values like so:
 		{'High': '55000', 'Current': '62965', 'Wake': '5:00 AM', 'Low': '62965', 'Lamp1': '2-1468', 'Sleep': '1:00 AM', 'Lamp2': '2-1469'}
+		Returns None if it can't control the device.
 		"""
-		lines = self.send_command('Update', lines=9)
+		lines = self.send_command('Update', lines=CrestonConnection.STATUS_LINE_COUNT)
+		if lines == None: return None
+		return self.parse_status(lines)
+
+	def send_and_query_status(self, command):
+		"""Sends the command and an Update together, returning (the command's response, the status map) or (None, None) if it can't control the device"""
+		responses = self.send_commands([(command, 1), ('Update', CrestonConnection.STATUS_LINE_COUNT)])
+		if responses == None: return (None, None)
+		return (responses[0][0], self.parse_status(responses[1]))
+
+	def parse_status(self, lines):
 		results = {}
 		for line in lines:
+			if '-' not in line: continue
 			key, val = line.split('-', 1)
 			results[key] = val
 		return results
 
-
 	def toggle_dim(self):
 		"""Returns True if enabled, False if disabled, and None if there is an error"""
 		result = self.send_command('EnableDim')
 		if result == None: return None
 		return result == 'DimEnabled'
 
-	def close(self):
-		if self.sock:
-			self.sock.shutdown(socket.SHUT_RDWR)
-			self.sock.close()
-			self.sock = None
-
-	def format_command(self, command): return '%s%s' % (command, '\r\n')
+	def close(self): self.connection.close()
 
-   	def send_command(self, command, lines=1):
+	def send_command(self, command, lines=1):
 		"""
 		Sends a command to the device.
 		If lines == 1: it returns a string
 		if lines > 1: it returns an array of strings
 		Returns None if it can't control the device.
 		"""
-		
-		self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		self.sock.settimeout(self.timeout)
+		responses = self.send_commands([(command, lines)])
+		if responses == None: return None
+		if lines == 1: return responses[0][0]
+		return responses[0]
+
+	def send_commands(self, commands):
+		"""Pipelines the (command, line count) pairs, returning a list of response lines for each or None if it can't control the device"""
 		try:
-			self.sock.connect((self.host, self.port))
-			welcome = self.sock.recv(1024)
-			msg = self.format_command(command)
-			self.sock.send(msg)
-			results = []
-			for i in range(lines):
-				value = self.sock.recv(2048)
-				if len(value.strip()) == 0: continue
-				results.append(value.strip())
-			if len(results) == 0:
-				self.close()
-				return None
-			self.close()
-			if lines == 1: return results[0]
-			return results
+			return self.connection.send_commands(commands)
 		except:
 			traceback.print_exc()
-		self.close()
 		return None
 
 def main(control):
@@ -108,7 +271,7 @@ if __name__ == '__main__':
 		if not control.can_connect(): raise(Exception('Could not connect to %s' % sys.argv[1]))
 		main(control)
 	except EOFError:
-		pass				
+		pass
 	except KeyboardInterrupt:
 		pass
 	if control: control.close()
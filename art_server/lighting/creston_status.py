@@ -0,0 +1,105 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""Shares the Crestron controller's status between every open control page, in every process.
+
+The status lives in the CACHE_BACKEND, so it needs to be shared (e.g. memcached) for the processes to see each other's queries.
+Each process runs a CrestonStatusPoller thread while its pages are asking for the status, and the poller only queries the controller
+when nobody has put a status in the cache in the last CRESTON_STATUS_INTERVAL seconds (2 by default), so however many pages and processes
+are watching the controller sees about one query per interval.  The pages poll the creston_status view, which answers straight from the cache.
+The version is a digest of the status, so it's the same in every process and changes whenever the status does.
+"""
+import time
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from creston_control import CrestonControl
+
+STATUS_CACHE_KEY = 'creston-status'
+
+def status_version(status):
+	return hashlib.md5(repr(status and sorted(status.items()))).hexdigest()[:12]
+
+def cached_status():
+	"""Returns (version, status, updated) from the cache, or (None, None, None) if no process has published a status recently"""
+	return cache.get(STATUS_CACHE_KEY, (None, None, None))
+
+class CrestonStatusPoller(threading.Thread):
+	"""Keeps the latest status of a Crestron controller in the cache while it's being asked for."""
+	def __init__(self, control, interval=2, idle_seconds=60):
+		self.control = control
+		self.interval = interval
+		self.idle_seconds = idle_seconds
+		self.last_request = 0
+		self.poll_count = 0 # how many times this poller queried the controller
+		self.condition = threading.Condition()
+		self.running = False
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def publish(self, status):
+		"""Puts a status (None when the controller can't be reached) in the cache for every process.  It expires once nobody has asked for it in idle_seconds."""
+		cache.set(STATUS_CACHE_KEY, (status_version(status), status, time.time()), self.idle_seconds)
+
+	def poll(self):
+		"""Queries the controller, unless another process did in the last interval"""
+		version, status, updated = cached_status()
+		if updated != None and time.time() - updated < self.interval: return
+		self.poll_count += 1
+		self.publish(self.control.query_status())
+
+	def request_status(self):
+		"""Returns the cached (version, status), waking the poller if it has been idle"""
+		self.condition.acquire()
+		try:
+			if time.time() - self.last_request > self.idle_seconds: self.condition.notifyAll()
+			self.last_request = time.time()
+		finally:
+			self.condition.release()
+		version, status, updated = cached_status()
+		return (version, status)
+
+	def stop(self):
+		self.condition.acquire()
+		try:
+			self.running = False
+			self.condition.notifyAll()
+		finally:
+			self.condition.release()
+
+	def run(self):
+		self.running = True
+		while self.running:
+			self.condition.acquire()
+			try:
+				while self.running and time.time() - self.last_request > self.idle_seconds: self.condition.wait()
+			finally:
+				self.condition.release()
+			if not self.running: break
+			started = time.time()
+			try:
+				self.poll()
+			except:
+				logging.exception('Could not poll the Crestron controller')
+			self.condition.acquire()
+			try:
+				while self.running and time.time() < started + self.interval: self.condition.wait(started + self.interval - time.time())
+			finally:
+				self.condition.release()
+
+_poller = None
+_poller_lock = threading.Lock()
+
+def shared_status_poller():
+	"""Returns the process's running CrestonStatusPoller for the CRESTON_CONTROL_HOST, starting it the first time"""
+	global _poller
+	_poller_lock.acquire()
+	try:
+		if _poller == None:
+			_poller = CrestonStatusPoller(CrestonControl(settings.CRESTON_CONTROL_HOST), interval=getattr(settings, 'CRESTON_STATUS_INTERVAL', 2))
+			_poller.start()
+		return _poller
+	finally:
+		_poller_lock.release()
@@ -0,0 +1,173 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""Fades the BACNet lights from their current levels to new ones over time, on the server.
+
+The FadeEngine thread computes every fading light's level for each frame (LIGHTING_FADE_FRAME_RATE frames a second, 20 by default)
+and writes the lights which changed with one WritePropertyMultiple per device, so a frame costs a request per device rather than per light.
+Levels follow the clock rather than the frame count, so a frame which runs late makes the next one jump ahead instead of stretching the fade.
+Starting a fade on a light which is already fading takes over from wherever that light has got to.
+"""
+import time
+import logging
+import threading
+
+from django.conf import settings
+
+from bacnet_control import BacnetControl
+
+class LightFade:
+	"""One light's change from start_value to end_value over duration seconds"""
+	def __init__(self, light, start_value, end_value, start_time, duration):
+		self.light = light
+		self.start_value = float(start_value)
+		self.end_value = float(end_value)
+		self.start_time = start_time
+		self.duration = duration
+
+	def finished(self, now): return now >= self.start_time + self.duration
+
+	def value_at(self, now):
+		if self.duration <= 0 or self.finished(now): return self.end_value
+		progress = max(0.0, (now - self.start_time) / self.duration)
+		return self.start_value + (self.end_value - self.start_value) * progress
+
+class LightSceneInfo:
+	"""Wraps a LightScene and its levels for dehydration"""
+	def __init__(self, scene):
+		self.id = scene.id
+		self.name = scene.name
+		self.levels = list(scene.levels.all())
+	class HydrationMeta:
+		attributes = ['id', 'name']
+		nodes = ['levels']
+
+class FadeEngine(threading.Thread):
+	"""Runs the fades, writing a frame of changed levels frame_rate times a second while any light is fading.
+	Lights whose level moved less than resolution since it was last written are left alone until the fade's final frame."""
+	def __init__(self, control=None, frame_rate=20, resolution=0.1):
+		if control == None: control = BacnetControl()
+		self.control = control
+		self.frame_rate = frame_rate
+		self.resolution = resolution
+		self.fades = {} # light id to LightFade
+		self.written = {} # light id to the last value written
+		self.condition = threading.Condition()
+		self.running = False
+		self.frame_count = 0
+		self.request_count = 0 # one per device per frame
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def fade(self, light_levels, duration):
+		"""Starts fading each light in the list of (light, level) pairs to its level over duration seconds.
+		Lights whose current level can't be read jump straight to their new level on the next frame."""
+		now = time.time()
+		self.condition.acquire()
+		try:
+			current = {}
+			unknown = []
+			for light, level in light_levels:
+				if light.id in self.fades:
+					current[light.id] = self.fades[light.id].value_at(now)
+				else:
+					unknown.append(light)
+		finally:
+			self.condition.release()
+		if unknown: current.update(self.control.read_light_values(unknown)) # outside the lock, as the devices may be slow to answer
+		self.condition.acquire()
+		try:
+			for light, level in light_levels:
+				start_value = current.get(light.id, None)
+				if start_value == None: start_value = level
+				self.fades[light.id] = LightFade(light, start_value, level, now, duration)
+				if light.id in self.written: del self.written[light.id]
+			self.condition.notify()
+		finally:
+			self.condition.release()
+
+	def fade_to_scene(self, scene, duration):
+		self.fade([(level.light, level.level) for level in scene.levels.select_related('light')], duration)
+
+	def is_fading(self, light=None):
+		if light == None: return len(self.fades) > 0
+		return light.id in self.fades
+
+	def wait(self, timeout=None):
+		"""Waits until every fade has finished or timeout seconds have passed, returning whether they finished"""
+		deadline = timeout != None and time.time() + timeout or None
+		self.condition.acquire()
+		try:
+			while self.fades:
+				if deadline != None and time.time() >= deadline: return False
+				self.condition.wait(deadline != None and min(0.1, deadline - time.time()) or 0.1)
+			return True
+		finally:
+			self.condition.release()
+
+	def stop(self):
+		self.condition.acquire()
+		try:
+			self.running = False
+			self.condition.notify()
+		finally:
+			self.condition.release()
+
+	def run(self):
+		self.running = True
+		period = 1.0 / self.frame_rate
+		while self.running:
+			self.condition.acquire()
+			try:
+				while self.running and not self.fades: self.condition.wait()
+			finally:
+				self.condition.release()
+			if not self.running: break
+			frame_start = time.time()
+			try:
+				self.frame(frame_start)
+			except:
+				logging.exception('Could not write a frame of light fades')
+			time.sleep(max(0, frame_start + period - time.time()))
+
+	def frame(self, now=None):
+		"""Writes each fading light's level for the time now, then drops the fades which have finished"""
+		if now == None: now = time.time()
+		self.condition.acquire()
+		try:
+			fades = self.fades.values()
+		finally:
+			self.condition.release()
+		light_values = []
+		for fade in fades:
+			value = fade.value_at(now)
+			last_written = self.written.get(fade.light.id, None)
+			if last_written != None and abs(value - last_written) < self.resolution and not (fade.finished(now) and value != last_written): continue
+			light_values.append((fade.light, value))
+		if light_values:
+			results = self.control.write_light_values(light_values)
+			self.request_count += len(set([light.device_id for light, value in light_values]))
+			for light, value in light_values:
+				if results.get(light.id, False): self.written[light.id] = value
+		self.frame_count += 1
+		self.condition.acquire()
+		try:
+			for fade in fades:
+				# a fade whose last write failed is dropped too, rather than hammering a device which isn't answering
+				if fade.finished(now) and self.fades.get(fade.light.id, None) is fade: del self.fades[fade.light.id]
+			self.condition.notifyAll()
+		finally:
+			self.condition.release()
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def shared_fade_engine():
+	"""Returns the process's running FadeEngine, starting it the first time"""
+	global _engine
+	_engine_lock.acquire()
+	try:
+		if _engine == None:
+			_engine = FadeEngine(frame_rate=getattr(settings, 'LIGHTING_FADE_FRAME_RATE', 20))
+			_engine.start()
+		return _engine
+	finally:
+		_engine_lock.release()
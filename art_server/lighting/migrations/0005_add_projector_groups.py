@@ -0,0 +1,101 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+
+        # Adding model 'ProjectorGroup'
+        db.create_table('lighting_projectorgroup', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('name', self.gf('django.db.models.fields.CharField')(max_length=1024)),
+        ))
+        db.send_create_signal('lighting', ['ProjectorGroup'])
+
+        # Adding M2M table for field projectors on 'ProjectorGroup'
+        db.create_table('lighting_projectorgroup_projectors', (
+            ('id', models.AutoField(verbose_name='ID', primary_key=True, auto_created=True)),
+            ('projectorgroup', models.ForeignKey(orm['lighting.projectorgroup'], null=False)),
+            ('projector', models.ForeignKey(orm['lighting.projector'], null=False))
+        ))
+        db.create_unique('lighting_projectorgroup_projectors', ['projectorgroup_id', 'projector_id'])
+
+        # Adding model 'ProjectorGroupEvent'
+        db.create_table('lighting_projectorgroupevent', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('active', self.gf('django.db.models.fields.BooleanField')(default=True)),
+            ('days', self.gf('django.db.models.fields.CommaSeparatedIntegerField')(max_length=32, null=True, blank=True)),
+            ('hours', self.gf('django.db.models.fields.CommaSeparatedIntegerField')(max_length=64, null=True, blank=True)),
+            ('minutes', self.gf('django.db.models.fields.CommaSeparatedIntegerField')(max_length=120, null=True, blank=True)),
+            ('last_run', self.gf('django.db.models.fields.DateTimeField')(null=True, blank=True)),
+            ('tries', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('command', self.gf('django.db.models.fields.CharField')(default='off', max_length=12)),
+            ('group', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['lighting.ProjectorGroup'])),
+        ))
+        db.send_create_signal('lighting', ['ProjectorGroupEvent'])
+
+
+    def backwards(self, orm):
+
+        # Deleting model 'ProjectorGroupEvent'
+        db.delete_table('lighting_projectorgroupevent')
+
+        # Removing M2M table for field projectors on 'ProjectorGroup'
+        db.delete_table('lighting_projectorgroup_projectors')
+
+        # Deleting model 'ProjectorGroup'
+        db.delete_table('lighting_projectorgroup')
+
+
+    models = {
+        'lighting.bacnetlight': {
+            'Meta': {'ordering': "['name']", 'object_name': 'BACNetLight'},
+            'device_id': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'property_id': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'})
+        },
+        'lighting.projector': {
+            'Meta': {'ordering': "['name']", 'object_name': 'Projector'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'pjlink_host': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'pjlink_password': ('django.db.models.fields.CharField', [], {'max_length': '512', 'null': 'True', 'blank': 'True'}),
+            'pjlink_port': ('django.db.models.fields.IntegerField', [], {'default': '4352'})
+        },
+        'lighting.projectorevent': {
+            'Meta': {'object_name': 'ProjectorEvent'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'command': ('django.db.models.fields.CharField', [], {'default': "'off'", 'max_length': '12'}),
+            'days': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'device': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['lighting.Projector']"}),
+            'hours': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_run': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'minutes': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '120', 'null': 'True', 'blank': 'True'}),
+            'tries': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        'lighting.projectorgroup': {
+            'Meta': {'ordering': "['name']", 'object_name': 'ProjectorGroup'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'projectors': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "'groups'", 'blank': 'True', 'to': "orm['lighting.Projector']"})
+        },
+        'lighting.projectorgroupevent': {
+            'Meta': {'object_name': 'ProjectorGroupEvent'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'command': ('django.db.models.fields.CharField', [], {'default': "'off'", 'max_length': '12'}),
+            'days': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'group': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['lighting.ProjectorGroup']"}),
+            'hours': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_run': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'minutes': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '120', 'null': 'True', 'blank': 'True'}),
+            'tries': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        }
+    }
+
+    complete_apps = ['lighting']
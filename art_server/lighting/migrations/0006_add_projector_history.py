@@ -0,0 +1,131 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+
+        # Adding model 'ProjectorSample'
+        db.create_table('lighting_projectorsample', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('projector', self.gf('django.db.models.fields.related.ForeignKey')(related_name='samples', to=orm['lighting.Projector'])),
+            ('created', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now)),
+            ('power_state', self.gf('django.db.models.fields.CharField')(max_length=4, null=True, blank=True)),
+            ('lamp_hours', self.gf('django.db.models.fields.CommaSeparatedIntegerField')(max_length=64, null=True, blank=True)),
+            ('max_lamp_hours', self.gf('django.db.models.fields.IntegerField')(null=True, blank=True)),
+            ('error_status', self.gf('django.db.models.fields.CharField')(max_length=5, null=True, blank=True)),
+        ))
+        db.send_create_signal('lighting', ['ProjectorSample'])
+
+        # Adding index on 'ProjectorSample', fields ['projector', 'created']
+        db.create_index('lighting_projectorsample', ['projector_id', 'created'])
+
+        # Adding model 'ProjectorRollup'
+        db.create_table('lighting_projectorrollup', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('projector', self.gf('django.db.models.fields.related.ForeignKey')(related_name='rollups', to=orm['lighting.Projector'])),
+            ('period', self.gf('django.db.models.fields.CharField')(max_length=8)),
+            ('start', self.gf('django.db.models.fields.DateTimeField')()),
+            ('sample_count', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('reachable_count', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('power_on_count', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('min_lamp_hours', self.gf('django.db.models.fields.IntegerField')(null=True, blank=True)),
+            ('max_lamp_hours', self.gf('django.db.models.fields.IntegerField')(null=True, blank=True)),
+            ('error_status', self.gf('django.db.models.fields.CharField')(max_length=5, null=True, blank=True)),
+        ))
+        db.send_create_signal('lighting', ['ProjectorRollup'])
+
+        # Adding unique constraint on 'ProjectorRollup', fields ['projector', 'period', 'start']
+        db.create_unique('lighting_projectorrollup', ['projector_id', 'period', 'start'])
+
+
+    def backwards(self, orm):
+
+        # Removing unique constraint on 'ProjectorRollup', fields ['projector', 'period', 'start']
+        db.delete_unique('lighting_projectorrollup', ['projector_id', 'period', 'start'])
+
+        # Deleting model 'ProjectorRollup'
+        db.delete_table('lighting_projectorrollup')
+
+        # Removing index on 'ProjectorSample', fields ['projector', 'created']
+        db.delete_index('lighting_projectorsample', ['projector_id', 'created'])
+
+        # Deleting model 'ProjectorSample'
+        db.delete_table('lighting_projectorsample')
+
+
+    models = {
+        'lighting.bacnetlight': {
+            'Meta': {'ordering': "['name']", 'object_name': 'BACNetLight'},
+            'device_id': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'property_id': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'})
+        },
+        'lighting.projector': {
+            'Meta': {'ordering': "['name']", 'object_name': 'Projector'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'pjlink_host': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'pjlink_password': ('django.db.models.fields.CharField', [], {'max_length': '512', 'null': 'True', 'blank': 'True'}),
+            'pjlink_port': ('django.db.models.fields.IntegerField', [], {'default': '4352'})
+        },
+        'lighting.projectorevent': {
+            'Meta': {'object_name': 'ProjectorEvent'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'command': ('django.db.models.fields.CharField', [], {'default': "'off'", 'max_length': '12'}),
+            'days': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'device': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['lighting.Projector']"}),
+            'hours': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_run': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'minutes': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '120', 'null': 'True', 'blank': 'True'}),
+            'tries': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        'lighting.projectorrollup': {
+            'Meta': {'ordering': "['-start']", 'unique_together': "(('projector', 'period', 'start'),)", 'object_name': 'ProjectorRollup'},
+            'error_status': ('django.db.models.fields.CharField', [], {'max_length': '5', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'max_lamp_hours': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'min_lamp_hours': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'period': ('django.db.models.fields.CharField', [], {'max_length': '8'}),
+            'power_on_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'projector': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'rollups'", 'to': "orm['lighting.Projector']"}),
+            'reachable_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'sample_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'start': ('django.db.models.fields.DateTimeField', [], {})
+        },
+        'lighting.projectorsample': {
+            'Meta': {'ordering': "['-created']", 'object_name': 'ProjectorSample'},
+            'created': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'error_status': ('django.db.models.fields.CharField', [], {'max_length': '5', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'lamp_hours': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'max_lamp_hours': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'power_state': ('django.db.models.fields.CharField', [], {'max_length': '4', 'null': 'True', 'blank': 'True'}),
+            'projector': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'samples'", 'to': "orm['lighting.Projector']"})
+        },
+        'lighting.projectorgroup': {
+            'Meta': {'ordering': "['name']", 'object_name': 'ProjectorGroup'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'projectors': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "'groups'", 'blank': 'True', 'to': "orm['lighting.Projector']"})
+        },
+        'lighting.projectorgroupevent': {
+            'Meta': {'object_name': 'ProjectorGroupEvent'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'command': ('django.db.models.fields.CharField', [], {'default': "'off'", 'max_length': '12'}),
+            'days': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'group': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['lighting.ProjectorGroup']"}),
+            'hours': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_run': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'minutes': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '120', 'null': 'True', 'blank': 'True'}),
+            'tries': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        }
+    }
+
+    complete_apps = ['lighting']
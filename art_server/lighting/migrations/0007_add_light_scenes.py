@@ -0,0 +1,155 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+
+        # Adding model 'LightScene'
+        db.create_table('lighting_lightscene', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('name', self.gf('django.db.models.fields.CharField')(max_length=1024)),
+        ))
+        db.send_create_signal('lighting', ['LightScene'])
+
+        # Adding model 'LightSceneLevel'
+        db.create_table('lighting_lightscenelevel', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('scene', self.gf('django.db.models.fields.related.ForeignKey')(related_name='levels', to=orm['lighting.LightScene'])),
+            ('light', self.gf('django.db.models.fields.related.ForeignKey')(related_name='scene_levels', to=orm['lighting.BACNetLight'])),
+            ('level', self.gf('django.db.models.fields.FloatField')(default=0)),
+        ))
+        db.send_create_signal('lighting', ['LightSceneLevel'])
+
+        # Adding unique constraint on 'LightSceneLevel', fields ['scene', 'light']
+        db.create_unique('lighting_lightscenelevel', ['scene_id', 'light_id'])
+
+        # Adding model 'LightSceneEvent'
+        db.create_table('lighting_lightsceneevent', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('active', self.gf('django.db.models.fields.BooleanField')(default=True)),
+            ('days', self.gf('django.db.models.fields.CommaSeparatedIntegerField')(max_length=32, null=True, blank=True)),
+            ('hours', self.gf('django.db.models.fields.CommaSeparatedIntegerField')(max_length=64, null=True, blank=True)),
+            ('minutes', self.gf('django.db.models.fields.CommaSeparatedIntegerField')(max_length=120, null=True, blank=True)),
+            ('last_run', self.gf('django.db.models.fields.DateTimeField')(null=True, blank=True)),
+            ('tries', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('scene', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['lighting.LightScene'])),
+            ('fade_seconds', self.gf('django.db.models.fields.FloatField')(default=0)),
+        ))
+        db.send_create_signal('lighting', ['LightSceneEvent'])
+
+
+    def backwards(self, orm):
+
+        # Deleting model 'LightSceneEvent'
+        db.delete_table('lighting_lightsceneevent')
+
+        # Removing unique constraint on 'LightSceneLevel', fields ['scene', 'light']
+        db.delete_unique('lighting_lightscenelevel', ['scene_id', 'light_id'])
+
+        # Deleting model 'LightSceneLevel'
+        db.delete_table('lighting_lightscenelevel')
+
+        # Deleting model 'LightScene'
+        db.delete_table('lighting_lightscene')
+
+
+    models = {
+        'lighting.bacnetlight': {
+            'Meta': {'ordering': "['name']", 'object_name': 'BACNetLight'},
+            'device_id': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'property_id': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'})
+        },
+        'lighting.lightscene': {
+            'Meta': {'ordering': "['name']", 'object_name': 'LightScene'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'})
+        },
+        'lighting.lightsceneevent': {
+            'Meta': {'object_name': 'LightSceneEvent'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'days': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'fade_seconds': ('django.db.models.fields.FloatField', [], {'default': '0'}),
+            'hours': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_run': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'minutes': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '120', 'null': 'True', 'blank': 'True'}),
+            'scene': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['lighting.LightScene']"}),
+            'tries': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        'lighting.lightscenelevel': {
+            'Meta': {'ordering': "['light__name']", 'unique_together': "(('scene', 'light'),)", 'object_name': 'LightSceneLevel'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'level': ('django.db.models.fields.FloatField', [], {'default': '0'}),
+            'light': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'scene_levels'", 'to': "orm['lighting.BACNetLight']"}),
+            'scene': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'levels'", 'to': "orm['lighting.LightScene']"})
+        },
+        'lighting.projector': {
+            'Meta': {'ordering': "['name']", 'object_name': 'Projector'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'pjlink_host': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'pjlink_password': ('django.db.models.fields.CharField', [], {'max_length': '512', 'null': 'True', 'blank': 'True'}),
+            'pjlink_port': ('django.db.models.fields.IntegerField', [], {'default': '4352'})
+        },
+        'lighting.projectorevent': {
+            'Meta': {'object_name': 'ProjectorEvent'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'command': ('django.db.models.fields.CharField', [], {'default': "'off'", 'max_length': '12'}),
+            'days': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'device': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['lighting.Projector']"}),
+            'hours': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_run': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'minutes': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '120', 'null': 'True', 'blank': 'True'}),
+            'tries': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        'lighting.projectorrollup': {
+            'Meta': {'ordering': "['-start']", 'unique_together': "(('projector', 'period', 'start'),)", 'object_name': 'ProjectorRollup'},
+            'error_status': ('django.db.models.fields.CharField', [], {'max_length': '5', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'max_lamp_hours': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'min_lamp_hours': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'period': ('django.db.models.fields.CharField', [], {'max_length': '8'}),
+            'power_on_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'projector': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'rollups'", 'to': "orm['lighting.Projector']"}),
+            'reachable_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'sample_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'start': ('django.db.models.fields.DateTimeField', [], {})
+        },
+        'lighting.projectorsample': {
+            'Meta': {'ordering': "['-created']", 'object_name': 'ProjectorSample'},
+            'created': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'error_status': ('django.db.models.fields.CharField', [], {'max_length': '5', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'lamp_hours': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'max_lamp_hours': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'power_state': ('django.db.models.fields.CharField', [], {'max_length': '4', 'null': 'True', 'blank': 'True'}),
+            'projector': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'samples'", 'to': "orm['lighting.Projector']"})
+        },
+        'lighting.projectorgroup': {
+            'Meta': {'ordering': "['name']", 'object_name': 'ProjectorGroup'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '1024'}),
+            'projectors': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "'groups'", 'blank': 'True', 'to': "orm['lighting.Projector']"})
+        },
+        'lighting.projectorgroupevent': {
+            'Meta': {'object_name': 'ProjectorGroupEvent'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'command': ('django.db.models.fields.CharField', [], {'default': "'off'", 'max_length': '12'}),
+            'days': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'group': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['lighting.ProjectorGroup']"}),
+            'hours': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_run': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'minutes': ('django.db.models.fields.CommaSeparatedIntegerField', [], {'max_length': '120', 'null': 'True', 'blank': 'True'}),
+            'tries': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        }
+    }
+
+    complete_apps = ['lighting']
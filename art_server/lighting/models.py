@@ -30,6 +30,8 @@ from django.core.urlresolvers import reverse
 
 from front.models import EventModel
 from pjlink import PJLinkController
+import pjlink_fleet
+import fades
 
 class BACNetLight(models.Model):
 	"""A lighting fixture which is controlled using the BACNet protocols.
@@ -47,6 +49,56 @@ class BACNetLight(models.Model):
 	class HydrationMeta:
 		attributes = ['id', 'name', 'device_id', 'property_id']
 
+class LightScene(models.Model):
+	"""A named set of levels for BACNet lights which can be faded to all at once."""
+	name = models.CharField(max_length=1024, null=False, blank=False)
+
+	def fade_to(self, seconds=0, engine=None):
+		"""Starts fading the scene's lights to their levels over the given number of seconds in the process's FadeEngine"""
+		if engine == None: engine = fades.shared_fade_engine()
+		engine.fade_to_scene(self, seconds)
+
+	def __unicode__(self): return '%s' % self.name
+	class Meta:
+		ordering = ['name']
+	class HydrationMeta:
+		attributes = ['id', 'name']
+
+class LightSceneLevel(models.Model):
+	"""The level (0 to 100) a light is set to by a LightScene"""
+	scene = models.ForeignKey(LightScene, blank=False, null=False, related_name='levels')
+	light = models.ForeignKey(BACNetLight, blank=False, null=False, related_name='scene_levels')
+	level = models.FloatField(blank=False, null=False, default=0)
+	def __unicode__(self): return '%s at %s in %s' % (self.light, self.level, self.scene)
+	class Meta:
+		ordering = ['light__name']
+		unique_together = (('scene', 'light'),)
+	class HydrationMeta:
+		attributes = ['id', 'light_id', 'level']
+
+class LightSceneEvent(EventModel):
+	"""Fades to a LightScene on a schedule."""
+	scene = models.ForeignKey(LightScene, blank=False, null=False)
+	fade_seconds = models.FloatField(blank=False, null=False, default=0)
+
+	def execute(self):
+		print 'running ', self
+		try:
+			self.scene.fade_to(self.fade_seconds)
+			print 'started the fade to', self.scene
+		except:
+			traceback.print_exc()
+			self.tries = self.tries + 1
+			self.save()
+			return False
+
+		self.last_run = datetime.datetime.now()
+		self.tries = 1
+		self.save()
+		return True
+
+	def __unicode__(self): return 'Light Scene Event: [%s],[%s],[%s]' % (self.days, self.hours, self.minutes)
+
 class Projector(models.Model):
 	"""A light projection system which is controlled via the net."""
 	name = models.CharField(max_length=1024, null=False, blank=False)
@@ -91,3 +143,81 @@ class ProjectorEvent(EventModel):
 		return True
 
 	def __unicode__(self): return 'Projector Event: [%s],[%s],[%s]' % (self.days, self.hours, self.minutes)
+
+class ProjectorSample(models.Model):
+	"""One reading of a projector's power, lamp and error status, taken by the ProjectorHistoryTask.
+	A sample with a null power_state means that the projector could not be reached."""
+	projector = models.ForeignKey(Projector, blank=False, null=False, related_name='samples')
+	created = models.DateTimeField(blank=False, null=False, default=datetime.datetime.now)
+	power_state = models.CharField(max_length=4, blank=True, null=True)
+	lamp_hours = models.CommaSeparatedIntegerField(max_length=64, blank=True, null=True, help_text='The lighting hours of each lamp')
+	max_lamp_hours = models.IntegerField(blank=True, null=True)
+	error_status = models.CharField(max_length=5, blank=True, null=True, help_text='The ERST fan, lamp, filter, cover and other status digits')
+	def __unicode__(self): return '%s sample at %s' % (self.projector, self.created)
+	class Meta:
+		ordering = ['-created']
+	class HydrationMeta:
+		attributes = ['id', 'created', 'power_state', 'lamp_hours', 'max_lamp_hours', 'error_status']
+
+class ProjectorRollup(models.Model):
+	"""A summary of a projector's samples over an hour or a day, which outlives the samples."""
+	PERIOD_CHOICES = (('hour', 'Hour'), ('day', 'Day'))
+	projector = models.ForeignKey(Projector, blank=False, null=False, related_name='rollups')
+	period = models.CharField(max_length=8, blank=False, null=False, choices=PERIOD_CHOICES)
+	start = models.DateTimeField(blank=False, null=False)
+	sample_count = models.IntegerField(blank=False, null=False, default=0)
+	reachable_count = models.IntegerField(blank=False, null=False, default=0)
+	power_on_count = models.IntegerField(blank=False, null=False, default=0)
+	min_lamp_hours = models.IntegerField(blank=True, null=True)
+	max_lamp_hours = models.IntegerField(blank=True, null=True)
+	error_status = models.CharField(max_length=5, blank=True, null=True, help_text='The worst ERST status seen for each of fan, lamp, filter, cover and other')
+	def __unicode__(self): return '%s %s from %s' % (self.projector, self.period, self.start)
+	class Meta:
+		ordering = ['-start']
+		unique_together = (('projector', 'period', 'start'),)
+	class HydrationMeta:
+		attributes = ['id', 'period', 'start', 'sample_count', 'reachable_count', 'power_on_count', 'min_lamp_hours', 'max_lamp_hours', 'error_status']
+
+class ProjectorGroup(models.Model):
+	"""A set of projectors which are controlled together, like the projectors making up a video wall."""
+	name = models.CharField(max_length=1024, null=False, blank=False)
+	projectors = models.ManyToManyField(Projector, blank=True, related_name='groups')
+	def __unicode__(self): return '%s' % self.name
+	class Meta:
+		ordering = ['name']
+	class HydrationMeta:
+		attributes = ['id', 'name']
+
+class ProjectorGroupEvent(EventModel):
+	"""Powers every projector in a group on or off, in parallel."""
+	COMMAND_CHOICES = (('on', 'Turn On'), ('off', 'Turn Off'))
+	command = models.CharField(max_length=12, blank=False, null=False, choices=COMMAND_CHOICES, default='off')
+	group = models.ForeignKey(ProjectorGroup, blank=False, null=False)
+
+	def execute(self):
+		print 'running ', self
+		try:
+			if self.command == 'on':
+				results = pjlink_fleet.power_on_all(self.group.projectors.all())
+			elif self.command == 'off':
+				results = pjlink_fleet.power_off_all(self.group.projectors.all())
+			else:
+				results = { None:False }
+			if False in results.values():
+				# the commands are idempotent, so the whole group is tried again
+				self.tries = self.tries + 1
+				self.save()
+				return False
+			print 'ran command', self.command
+		except:
+			traceback.print_exc()
+			self.tries = self.tries + 1
+			self.save()
+			return False
+
+		self.last_run = datetime.datetime.now()
+		self.tries = 1
+		self.save()
+		return True
+
+	def __unicode__(self): return 'Projector Group Event: [%s],[%s],[%s]' % (self.days, self.hours, self.minutes)
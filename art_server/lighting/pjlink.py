@@ -83,9 +83,9 @@ class PJLinkAuthenticationRequest:
 
 	def encode(self):
 		if self.seed:
-			return '%s %s %s' % (PJLinkProtocol.AUTHENTICATE, PJLinkProtocol.ON, self.seed)
+			return '%s %s %s\r' % (PJLinkProtocol.AUTHENTICATE, PJLinkProtocol.ON, self.seed)
 		else:
-			return '%s %s' % (PJLinkProtocol.AUTHENTICATE, PJLinkProtocol.OFF)
+			return '%s %s\r' % (PJLinkProtocol.AUTHENTICATE, PJLinkProtocol.OFF)
 
 	def authentication_hash_matches(self, auth_hash):
 		if auth_hash == None: return self.seed == None
@@ -96,7 +96,7 @@ class PJLinkAuthenticationRequest:
 	@classmethod
 	def decode(cls, encoded_request):
 		tokens = encoded_request.split(' ')
-		if tokens[1] == PJLinkProtocol.ON:
+		if tokens[1].strip() == PJLinkProtocol.ON:
 			return PJLinkAuthenticationRequest(seed=tokens[2].strip())
 		else:
 			return PJLinkAuthenticationRequest()
@@ -183,13 +183,115 @@ class PJLinkResponse:
 		if encoded_command_line.startswith('%s=%s' % (PJLinkProtocol.AUTHENTICATE, PJLinkProtocol.INVALID_PASSWORD_ERROR)):
 			return PJLinkResponse(PJLinkProtocol.AUTHENTICATE, PJLinkProtocol.INVALID_PASSWORD_ERROR)
 
+class PJLinkSession:
+	"""A single authenticated connection to a projector which carries any number of command lines.
+		The projector sends its authentication request once per connection and only the first command line needs the hash,
+		so sending several commands through one session saves a TCP connection, greeting and MD5 hash for each.
+		Projectors close the connection after about 30 seconds without a command, so sessions are meant for short bursts.
+		Command lines are sent one at a time, waiting for each response, as many projectors only handle one outstanding command.
+	"""
+	def __init__(self, host, port=4352, password=None, timeout=15):
+		self.host = host
+		self.port = port
+		self.password = password
+		self.timeout = timeout
+		self.sock = None
+		self.buffer = ''
+		self.authentication_hash = None
+		self.authenticated = False
+
+	def open(self):
+		self.sock = socket.create_connection((self.host, self.port), self.timeout)
+		self.buffer = ''
+		self.authenticated = False
+		auth_request = PJLinkAuthenticationRequest.decode(self._read_line())
+		if auth_request.seed:
+			if not self.password:
+				self.close()
+				raise PJLinkAuthenticationException('The Projector requires a password, but we have none')
+			self.authentication_hash = PJLinkAuthenticationRequest.generate_hash(auth_request.seed, self.password)
+		else:
+			self.authentication_hash = None
+
+	def close(self):
+		if self.sock == None: return
+		try:
+			self.sock.close()
+		finally:
+			self.sock = None
+
+	def __enter__(self):
+		if self.sock == None: self.open()
+		return self
+
+	def __exit__(self, exc_type, exc_value, exc_traceback):
+		self.close()
+		return False
+
+	def send_command_line(self, command_line):
+		"""Send a PJLinkCommandLine and return the PJLinkResponse, opening the session if necessary"""
+		if self.sock == None: self.open()
+		if self.authentication_hash and not self.authenticated: command_line.authentication_hash = self.authentication_hash
+		#print 'sending', command_line.encode()
+		self.sock.sendall(command_line.encode())
+		encoded_response = self._read_line()
+		#print 'received', encoded_response
+		response = PJLinkResponse.decode(encoded_response)
+		if response == None:
+			self.close()
+			raise IOError('Unrecognized response from the projector: %s' % repr(encoded_response))
+		if response.command == PJLinkProtocol.AUTHENTICATE and response.data == PJLinkProtocol.INVALID_PASSWORD_ERROR:
+			self.close()
+			raise PJLinkAuthenticationException('The projector rejected our password')
+		self.authenticated = True
+		return response
+
+	def send_command_lines(self, command_lines):
+		"""Send each PJLinkCommandLine in order and return a list of their PJLinkResponses"""
+		return [self.send_command_line(command_line) for command_line in command_lines]
+
+	def _read_line(self):
+		"""Return the next carriage return terminated line (including the carriage return) from the projector"""
+		while '\r' not in self.buffer:
+			data = self.sock.recv(512)
+			if not data:
+				self.close()
+				raise socket.error('The projector closed the connection')
+			self.buffer += data
+		line, self.buffer = self.buffer.split('\r', 1)
+		return line + '\r'
+
 class PJLinkController:
-	"""A command object for projectors which are controlled using the PJLink protocol"""
-	def __init__(self, host, port=4352, password=None, version=1):
+	"""A command object for projectors which are controlled using the PJLink protocol
+		Each command opens its own connection unless a session is open, for example:
+			controller.open_session()
+			try:
+				name = controller.query_name()
+				power = controller.query_power()
+			finally:
+				controller.close_session()
+	"""
+	def __init__(self, host, port=4352, password=None, version=1, timeout=15):
 		self.host = host
 		self.port = port
 		self.password = password
 		self.version = 1
+		self.timeout = timeout
+		self.session = None
+
+	def open_session(self):
+		"""Open a PJLinkSession which carries the following commands until close_session is called"""
+		self.close_session()
+		self.session = PJLinkSession(self.host, self.port, self.password, self.timeout)
+		self.session.open()
+		return self.session
+
+	def close_session(self):
+		if self.session == None: return
+		try:
+			self.session.close()
+		finally:
+			self.session = None
 
 	def power_on(self):
 		response = self._send_command_line(PJLinkCommandLine(PJLinkProtocol.POWER, PJLinkProtocol.ON, self.version))
@@ -223,9 +325,13 @@ class PJLinkController:
 	def query_mute(self):
 		"""Return a tuple of booleans: <audio is muted, video is muted>"""
 		response = self._send_command_line(PJLinkCommandLine(PJLinkProtocol.MUTE, PJLinkProtocol.QUERY, self.version))
-		if len(response.data) != 2: return (None, None)
-		audio_is_muted = response.data == PJLinkProtocol.AUDIO_MUTE_ON or response.data == PJLinkProtocol.AUDIO_VIDEO_MUTE_ON
-		video_is_muted = response.data == PJLinkProtocol.VIDEO_MUTE_ON or response.data == PJLinkProtocol.AUDIO_VIDEO_MUTE_ON
+		return PJLinkController.parse_mute(response.data)
+
+	@classmethod
+	def parse_mute(cls, data):
+		if len(data) != 2: return (None, None)
+		audio_is_muted = data == PJLinkProtocol.AUDIO_MUTE_ON or data == PJLinkProtocol.AUDIO_VIDEO_MUTE_ON
+		video_is_muted = data == PJLinkProtocol.VIDEO_MUTE_ON or data == PJLinkProtocol.AUDIO_VIDEO_MUTE_ON
 		return (audio_is_muted, video_is_muted)
 
 	def set_mute(self, mute_state):
@@ -236,15 +342,22 @@ class PJLinkController:
 	def query_error_status(self):
 		"""Return a set of error states: (fan status, lamp status, filter status, cover status, other status)"""
 		response = self._send_command_line(PJLinkCommandLine(PJLinkProtocol.ERROR_STATUS, PJLinkProtocol.QUERY, self.version))
-		if len(response.data) != 5: return (None, None, None, None, None)
-		return (response.data[0], response.data[1], response.data[2], response.data[3], response.data[4])
+		return PJLinkController.parse_error_status(response.data)
+
+	@classmethod
+	def parse_error_status(cls, data):
+		if len(data) != 5: return (None, None, None, None, None)
+		return (data[0], data[1], data[2], data[3], data[4])
 
 	def query_lamps(self):
 		"""Return an array of lamp lighting-hours and a boolean lamp-is-on value: [('100', True), ('142', False), (lighting-hours, is-on), ...]"""
 		response = self._send_command_line(PJLinkCommandLine(PJLinkProtocol.LAMP, PJLinkProtocol.QUERY, self.version))
+		return PJLinkController.parse_lamps(response.data)
 
-		results = [[int(lit_time)] for lit_time in response.data.split(' ')[::2]]
-		for index, lamp_id in enumerate(response.data.split(' ')[1::2]):
+	@classmethod
+	def parse_lamps(cls, data):
+		results = [[int(lit_time)] for lit_time in data.split(' ')[::2]]
+		for index, lamp_id in enumerate(data.split(' ')[1::2]):
 			results[index].append(int(lamp_id) == 1)
 		return results
 
@@ -255,28 +368,12 @@ class PJLinkController:
 	def query_class_info(self): return self._send_command_line(PJLinkCommandLine(PJLinkProtocol.CLASS_INFO, PJLinkProtocol.QUERY, self.version)).data
 
 	def _send_command_line(self, command_line):
-		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		sock.settimeout(15)
-		sock.connect((self.host, self.port))
-		encoded_auth_request = sock.recv(512)
-		auth_request = PJLinkAuthenticationRequest.decode(encoded_auth_request)
-		if auth_request.seed:
-			if self.password:
-				command_line.authentication_hash = PJLinkAuthenticationRequest.generate_hash(auth_request.seed, self.password)
-			else:
-				sock.close()
-				raise PJLinkAuthenticationException('The Projector requires a password, but we have none')
-			
-		#print 'sending', command_line.encode()
-		sock.send(command_line.encode())
-		encoded_response = sock.recv(512)
-		#print 'received', encoded_response
-		sock.close()
-		if encoded_response == '': encoded_response = None
-		response = PJLinkResponse.decode(encoded_response)
-		if response.command == PJLinkProtocol.AUTHENTICATE and response.data == PJLinkProtocol.INVALID_PASSWORD_ERROR:
-			raise PJLinkAuthenticationException('The projector rejected our password')
-		return response
+		if self.session: return self.session.send_command_line(command_line)
+		session = PJLinkSession(self.host, self.port, self.password, self.timeout)
+		try:
+			return session.send_command_line(command_line)
+		finally:
+			session.close()
 
 USAGE_MESSAGE = 'usage: pjlink [projector|name|on|off|mute|unmute|mute-status] <host> <password>'
 
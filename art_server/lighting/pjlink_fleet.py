@@ -0,0 +1,192 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""Runs PJLink commands against many projectors at once.
+
+Each PJLinkExchange is a non-blocking conversation with one projector (connect, read the authentication request, then send each command line and read its response)
+using the codecs in pjlink.py.  run_exchanges multiplexes the exchanges with select in the calling thread,
+keeping no more than concurrency connections open and giving each projector its own deadline, so one projector which is down doesn't hold up the rest.
+"""
+import time
+import errno
+import socket
+import select
+import logging
+
+from pjlink import PJLinkProtocol, PJLinkCommandLine, PJLinkResponse, PJLinkAuthenticationRequest, PJLinkAuthenticationException, PJLinkController
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 5
+
+class PJLinkExchange:
+	"""Sends a list of PJLinkCommandLines to one projector over a single connection, collecting a PJLinkResponse for each.
+	When the exchange is done either error is set or responses holds a response for each command line."""
+	CONNECTING = 'connecting'
+	GREETING = 'greeting'
+	SENDING = 'sending'
+	RECEIVING = 'receiving'
+	DONE = 'done'
+
+	def __init__(self, key, host, port, password, command_lines, timeout=DEFAULT_TIMEOUT):
+		self.key = key
+		self.host = host
+		self.port = port
+		self.password = password
+		self.command_lines = command_lines
+		self.timeout = timeout
+		self.sock = None
+		self.state = None
+		self.deadline = None
+		self.authentication_hash = None
+		self.read_buffer = ''
+		self.write_buffer = ''
+		self.responses = []
+		self.error = None
+
+	def fileno(self): return self.sock.fileno()
+
+	def is_done(self): return self.state == PJLinkExchange.DONE
+
+	def wants_write(self): return self.state == PJLinkExchange.CONNECTING or self.state == PJLinkExchange.SENDING
+
+	def start(self):
+		self.deadline = time.time() + self.timeout
+		try:
+			address = socket.getaddrinfo(self.host, self.port, socket.AF_INET, socket.SOCK_STREAM)[0][4]
+			self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			self.sock.setblocking(0)
+			result = self.sock.connect_ex(address)
+			if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK): raise socket.error(result, errno.errorcode.get(result, 'connect failed'))
+			self.state = PJLinkExchange.CONNECTING
+		except Exception, e:
+			self.finish(e)
+
+	def finish(self, error=None):
+		self.error = error
+		self.state = PJLinkExchange.DONE
+		if self.sock:
+			try:
+				self.sock.close()
+			except socket.error:
+				pass
+			self.sock = None
+
+	def check_deadline(self, now):
+		if now >= self.deadline: self.finish(socket.timeout('No response from %s:%s within %s seconds' % (self.host, self.port, self.timeout)))
+
+	def on_writable(self):
+		try:
+			if self.state == PJLinkExchange.CONNECTING:
+				result = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+				if result != 0: raise socket.error(result, errno.errorcode.get(result, 'connect failed'))
+				self.state = PJLinkExchange.GREETING
+			elif self.state == PJLinkExchange.SENDING:
+				sent = self.sock.send(self.write_buffer)
+				self.write_buffer = self.write_buffer[sent:]
+				if len(self.write_buffer) == 0: self.state = PJLinkExchange.RECEIVING
+		except Exception, e:
+			self.finish(e)
+
+	def on_readable(self):
+		try:
+			data = self.sock.recv(512)
+			if not data: raise socket.error('%s:%s closed the connection' % (self.host, self.port))
+			self.read_buffer += data
+			while '\r' in self.read_buffer and not self.is_done():
+				line, self.read_buffer = self.read_buffer.split('\r', 1)
+				self.handle_line(line + '\r')
+		except Exception, e:
+			self.finish(e)
+
+	def handle_line(self, line):
+		if self.state == PJLinkExchange.GREETING:
+			auth_request = PJLinkAuthenticationRequest.decode(line)
+			if auth_request.seed:
+				if not self.password: raise PJLinkAuthenticationException('The Projector requires a password, but we have none')
+				self.authentication_hash = PJLinkAuthenticationRequest.generate_hash(auth_request.seed, self.password)
+			self.send_next()
+		elif self.state == PJLinkExchange.RECEIVING:
+			response = PJLinkResponse.decode(line)
+			if response == None: raise IOError('Unrecognized response from the projector: %s' % repr(line))
+			if response.command == PJLinkProtocol.AUTHENTICATE and response.data == PJLinkProtocol.INVALID_PASSWORD_ERROR:
+				raise PJLinkAuthenticationException('The projector rejected our password')
+			self.responses.append(response)
+			self.send_next()
+
+	def send_next(self):
+		"""Queue the next command line or finish if every command line has a response"""
+		if len(self.responses) == len(self.command_lines):
+			self.finish()
+			return
+		command_line = self.command_lines[len(self.responses)]
+		if len(self.responses) == 0 and self.authentication_hash: command_line.authentication_hash = self.authentication_hash
+		self.write_buffer = command_line.encode()
+		self.state = PJLinkExchange.SENDING
+
+def run_exchanges(exchanges, concurrency=DEFAULT_CONCURRENCY):
+	"""Runs the exchanges with up to concurrency connections open at once and returns them once all are done"""
+	waiting = list(exchanges)
+	waiting.reverse()
+	active = []
+	while waiting or active:
+		while waiting and len(active) < concurrency:
+			exchange = waiting.pop()
+			exchange.start()
+			if not exchange.is_done(): active.append(exchange)
+		if not active: continue
+
+		now = time.time()
+		timeout = max(0, min([exchange.deadline for exchange in active]) - now)
+		readers = [exchange for exchange in active if not exchange.wants_write()]
+		writers = [exchange for exchange in active if exchange.wants_write()]
+		readable, writable, errored = select.select(readers, writers, [], timeout)
+		for exchange in writable: exchange.on_writable()
+		for exchange in readable: exchange.on_readable()
+
+		now = time.time()
+		for exchange in active:
+			if not exchange.is_done(): exchange.check_deadline(now)
+		active = [exchange for exchange in active if not exchange.is_done()]
+	return exchanges
+
+def projector_exchanges(projectors, command_lines_function, timeout=DEFAULT_TIMEOUT):
+	"""Returns an exchange for each projector, calling command_lines_function() for a fresh list of command lines for each"""
+	return [PJLinkExchange(projector.id, projector.pjlink_host, projector.pjlink_port, projector.pjlink_password, command_lines_function(), timeout) for projector in projectors]
+
+def run_projector_commands(projectors, command_lines_function, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+	"""Runs the command lines against each projector and returns a map of projector id to its finished PJLinkExchange"""
+	results = {}
+	for exchange in run_exchanges(projector_exchanges(projectors, command_lines_function, timeout), concurrency):
+		if exchange.error: logging.error('Could not communicate with projector %s: %s' % (exchange.key, exchange.error))
+		results[exchange.key] = exchange
+	return results
+
+def set_power_all(projectors, power_on, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+	"""Powers the projectors on (or off) and returns a map of projector id to True if the projector accepted the command"""
+	if power_on:
+		data = PJLinkProtocol.ON
+	else:
+		data = PJLinkProtocol.OFF
+	exchanges = run_projector_commands(projectors, lambda: [PJLinkCommandLine(PJLinkProtocol.POWER, data)], concurrency, timeout)
+	return dict([(key, exchange.error == None and exchange.responses[0].data == PJLinkProtocol.OK) for key, exchange in exchanges.items()])
+
+def power_on_all(projectors, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT): return set_power_all(projectors, True, concurrency, timeout)
+def power_off_all(projectors, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT): return set_power_all(projectors, False, concurrency, timeout)
+
+def set_mute_all(projectors, mute_state, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+	"""Sets the mute state (a PJLinkProtocol constant) and returns a map of projector id to True if the projector accepted the command"""
+	exchanges = run_projector_commands(projectors, lambda: [PJLinkCommandLine(PJLinkProtocol.MUTE, mute_state)], concurrency, timeout)
+	return dict([(key, exchange.error == None and exchange.responses[0].data == PJLinkProtocol.OK) for key, exchange in exchanges.items()])
+
+def query_lamps_all(projectors, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+	"""Returns a map of projector id to lamp info like PJLinkController.query_lamps returns, or None if the projector couldn't be queried"""
+	exchanges = run_projector_commands(projectors, lambda: [PJLinkCommandLine(PJLinkProtocol.LAMP, PJLinkProtocol.QUERY)], concurrency, timeout)
+	results = {}
+	for key, exchange in exchanges.items():
+		if exchange.error:
+			results[key] = None
+			continue
+		try:
+			results[key] = PJLinkController.parse_lamps(exchange.responses[0].data)
+		except ValueError:
+			logging.exception('Could not parse the lamp info from projector %s: %s' % (key, exchange.responses[0].data))
+			results[key] = None
+	return results
@@ -0,0 +1,153 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""Records the power, lamp hours and error status of every projector over time.
+
+collect_samples appends a ProjectorSample per projector.  roll_up summarizes finished hours of samples into hourly ProjectorRollups
+and finished days of hourly rollups into daily ones, then prunes samples older than PROJECTOR_SAMPLE_RETENTION_DAYS
+and hourly rollups older than PROJECTOR_HOURLY_RETENTION_DAYS.  Daily rollups are kept.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+
+from pjlink import PJLinkProtocol, PJLinkCommandLine, PJLinkController
+from pjlink_fleet import run_projector_commands
+from models import Projector, ProjectorSample, ProjectorRollup
+
+ERROR_FIELDS = ('fan', 'lamp', 'filter', 'cover', 'other')
+
+def sample_command_lines():
+	return [PJLinkCommandLine(PJLinkProtocol.POWER, PJLinkProtocol.QUERY), PJLinkCommandLine(PJLinkProtocol.LAMP, PJLinkProtocol.QUERY), PJLinkCommandLine(PJLinkProtocol.ERROR_STATUS, PJLinkProtocol.QUERY)]
+
+def collect_samples(projectors, timeout=5):
+	"""Queries the projectors concurrently and saves and returns a ProjectorSample for each"""
+	projectors = list(projectors)
+	exchanges = run_projector_commands(projectors, sample_command_lines, timeout=timeout)
+	now = datetime.datetime.now()
+	samples = []
+	for projector in projectors:
+		sample = ProjectorSample(projector=projector, created=now)
+		exchange = exchanges[projector.id]
+		if not exchange.error:
+			power, lamps, error_status = [response.data for response in exchange.responses]
+			sample.power_state = power
+			try:
+				lamp_hours = [lamp[0] for lamp in PJLinkController.parse_lamps(lamps)]
+				sample.lamp_hours = ','.join([str(hours) for hours in lamp_hours])
+				if lamp_hours: sample.max_lamp_hours = max(lamp_hours)
+			except ValueError:
+				logging.error('Could not parse the lamp info from projector %s: %s' % (projector.id, lamps))
+			if None not in PJLinkController.parse_error_status(error_status): sample.error_status = error_status
+		sample.save()
+		samples.append(sample)
+	return samples
+
+def worst_error_status(statuses):
+	"""Returns the highest value for each digit of the ERST status strings, or None if there are none"""
+	statuses = [status for status in statuses if status]
+	if not statuses: return None
+	return ''.join([max([status[index] for status in statuses]) for index in range(len(ERROR_FIELDS))])
+
+def previous_sample(sample, field='power_state'):
+	"""Returns the latest sample before this one which has a value for the field, skipping the ones taken while the projector was unreachable"""
+	samples = list(ProjectorSample.objects.filter(projector=sample.projector, created__lt=sample.created, **{'%s__isnull' % field: False}).order_by('-created')[:1])
+	if len(samples) == 0: return None
+	return samples[0]
+
+def sample_alerts(samples, thresholds=None):
+	"""Returns a list of messages for samples whose lamp hours crossed one of the thresholds or which show a newly failed component"""
+	if thresholds == None: thresholds = getattr(settings, 'PROJECTOR_LAMP_HOURS_ALERTS', [2000, 3000])
+	messages = []
+	for sample in samples:
+		if sample.max_lamp_hours != None:
+			previous = previous_sample(sample, 'max_lamp_hours')
+			previous_hours = previous and previous.max_lamp_hours or 0
+			for threshold in thresholds:
+				if previous_hours < threshold <= sample.max_lamp_hours:
+					messages.append('%s has a lamp at %s hours, past the %s hour threshold' % (sample.projector, sample.max_lamp_hours, threshold))
+		if sample.error_status:
+			previous = previous_sample(sample, 'error_status')
+			previous_status = previous and previous.error_status or '0' * len(ERROR_FIELDS)
+			for index, field in enumerate(ERROR_FIELDS):
+				if sample.error_status[index] == PJLinkProtocol.ERROR_STATUS_ERROR and previous_status[index] != PJLinkProtocol.ERROR_STATUS_ERROR:
+					messages.append('%s reports a %s error' % (sample.projector, field))
+	return messages
+
+def period_start(timestamp, period):
+	if period == 'day': return datetime.datetime(timestamp.year, timestamp.month, timestamp.day)
+	return datetime.datetime(timestamp.year, timestamp.month, timestamp.day, timestamp.hour)
+
+def period_length(period):
+	if period == 'day': return datetime.timedelta(days=1)
+	return datetime.timedelta(hours=1)
+
+def roll_up_projector(projector, period, now):
+	"""Creates the missing rollups for each finished period since the projector's last rollup, returning how many were created.
+	Hourly rollups summarize samples and daily rollups summarize hourly rollups."""
+	length = period_length(period)
+	if period == 'day':
+		sources = ProjectorRollup.objects.filter(projector=projector, period='hour')
+		time_field = 'start'
+	else:
+		sources = ProjectorSample.objects.filter(projector=projector)
+		time_field = 'created'
+	latest = list(ProjectorRollup.objects.filter(projector=projector, period=period).order_by('-start')[:1])
+	if latest:
+		sources = sources.filter(**{ '%s__gte' % time_field:latest[0].start + length })
+	end = period_start(now, period) # only finished periods are rolled up
+	created = 0
+	rollup = None
+	for source in sources.filter(**{ '%s__lt' % time_field:end }).order_by(time_field).iterator():
+		start = period_start(getattr(source, time_field), period)
+		if rollup == None or rollup.start != start:
+			if rollup: finish_rollup(rollup, statuses)
+			rollup = ProjectorRollup(projector=projector, period=period, start=start)
+			statuses = []
+			created += 1
+		if period == 'day':
+			rollup.sample_count += source.sample_count
+			rollup.reachable_count += source.reachable_count
+			rollup.power_on_count += source.power_on_count
+			lamp_hours = [source.min_lamp_hours, source.max_lamp_hours]
+		else:
+			rollup.sample_count += 1
+			if source.power_state != None: rollup.reachable_count += 1
+			if source.power_state == PJLinkProtocol.POWER_ON_STATUS: rollup.power_on_count += 1
+			lamp_hours = [source.max_lamp_hours]
+		lamp_hours = [hours for hours in lamp_hours if hours != None]
+		if lamp_hours:
+			rollup.min_lamp_hours = min([hours for hours in [rollup.min_lamp_hours] + lamp_hours if hours != None])
+			rollup.max_lamp_hours = max([hours for hours in [rollup.max_lamp_hours] + lamp_hours if hours != None])
+		statuses.append(source.error_status)
+	if rollup: finish_rollup(rollup, statuses)
+	return created
+
+def finish_rollup(rollup, statuses):
+	rollup.error_status = worst_error_status(statuses)
+	rollup.save()
+
+def roll_up(now=None):
+	"""Rolls up every projector's finished hours and days and prunes the old samples and hourly rollups"""
+	if now == None: now = datetime.datetime.now()
+	for projector in Projector.objects.all():
+		roll_up_projector(projector, 'hour', now)
+		roll_up_projector(projector, 'day', now)
+	# samples are only pruned once their hour has been rolled up, which is always the case well before the retention period
+	sample_cutoff = period_start(now - datetime.timedelta(days=getattr(settings, 'PROJECTOR_SAMPLE_RETENTION_DAYS', 7)), 'hour')
+	ProjectorSample.objects.filter(created__lt=sample_cutoff).delete()
+	hourly_cutoff = period_start(now - datetime.timedelta(days=getattr(settings, 'PROJECTOR_HOURLY_RETENTION_DAYS', 90)), 'day')
+	ProjectorRollup.objects.filter(period='hour', start__lt=hourly_cutoff).delete()
+
+def history(projector, start, end, resolution=None):
+	"""Returns the samples or rollups for the projector between start and end, oldest first.
+	The resolution is 'raw', 'hour' or 'day', or chosen from the length of the range if it's None."""
+	if resolution == None:
+		if end - start <= datetime.timedelta(days=2):
+			resolution = 'raw'
+		elif end - start <= datetime.timedelta(days=60):
+			resolution = 'hour'
+		else:
+			resolution = 'day'
+	if resolution == 'raw': return ProjectorSample.objects.filter(projector=projector, created__gte=start, created__lt=end).order_by('created')
+	if resolution not in ('hour', 'day'): raise ValueError('Unknown resolution: %s' % resolution)
+	return ProjectorRollup.objects.filter(projector=projector, period=resolution, start__gte=start, start__lt=end).order_by('start')
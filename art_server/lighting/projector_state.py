@@ -0,0 +1,205 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""A cache of the state reported by each projector.
+
+The ProjectorPollTask refreshes the cache in the background, and the views serve from it immediately instead of talking PJLink on every request.
+When the cached state is older than PROJECTOR_STATE_MAX_AGE seconds it is still served, but a refresh is started in a background thread.
+A projector which can't be reached is cached too (see unreachable_info), so the views don't wait on it again until the entry goes stale.
+The cache lives in the CACHE_BACKEND, so it needs to be shared (e.g. memcached) for the scheduler's polls to reach the web workers.
+"""
+import datetime
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from pjlink import PJLinkController, PJLinkCommandLine, PJLinkProtocol
+from pjlink_fleet import run_projector_commands, DEFAULT_CONCURRENCY
+
+STATE_CACHE_PREFIX = 'projector-state-'
+
+class LampInfo:
+	"""Wraps the projector's lamp info for dehydration"""
+	def __init__(self, lighting_hours, is_on):
+		self.lighting_hours = lighting_hours
+		self.is_on = is_on
+	class HydrationMeta:
+		attributes = ['lighting_hours', 'is_on']
+
+class ProjectorInfo:
+	"""Used to wrap the projector information for dehydration"""
+	def __init__(self, power_state, projector_name, manufacture_name, product_name, other_info, audio_mute, video_mute):
+		self.power_state = power_state
+		self.projector_name = projector_name
+		self.manufacture_name = manufacture_name
+		self.product_name = product_name
+		self.other_info = other_info
+		self.video_mute = video_mute
+		self.audio_mute = audio_mute
+		self.lamps = []
+		self.reachable = True
+		self.fetched = datetime.datetime.now()
+		self.age = 0
+	class HydrationMeta:
+		attributes = ['power_state', 'projector_name', 'manufacture_name', 'product_name', 'other_info', 'audio_mute', 'video_mute', 'fetched', 'age']
+		nodes = ['lamps']
+
+class ProjectorStatus:
+	"""A projector's identity, its cached ProjectorInfo (if any) and the result of a bulk command, for dehydration"""
+	def __init__(self, projector, info, command_ok=None):
+		self.id = projector.id
+		self.name = projector.name
+		self.reachable = info != None and info.reachable
+		self.command_ok = command_ok
+		for attribute in ProjectorInfo.HydrationMeta.attributes: setattr(self, attribute, getattr(info, attribute, None))
+		if self.reachable:
+			self.lamps = info.lamps
+		else:
+			self.lamps = []
+	class HydrationMeta:
+		attributes = ['id', 'name', 'reachable', 'command_ok'] + ProjectorInfo.HydrationMeta.attributes
+		nodes = ['lamps']
+
+class ProjectorGroupInfo:
+	"""Used to wrap a ProjectorGroup and the status of its projectors for dehydration"""
+	def __init__(self, group, statuses):
+		self.id = group.id
+		self.name = group.name
+		self.projectors = statuses
+	class HydrationMeta:
+		attributes = ['id', 'name']
+		nodes = ['projectors']
+
+def query_projector_info(controller):
+	"""Returns a ProjectorInfo, querying the projector over the controller's session (opening one if there isn't one)"""
+	opened_session = controller.session == None
+	if opened_session: controller.open_session()
+	try:
+		audio_mute, video_mute = controller.query_mute()
+		info = ProjectorInfo(controller.query_power(), controller.query_name(), controller.query_manufacture_name(), controller.query_product_name(), controller.query_other_info(), audio_mute, video_mute)
+		for lamp in controller.query_lamps():
+			info.lamps.append(LampInfo(lamp[0], lamp[1]))
+	finally:
+		if opened_session: controller.close_session()
+	return info
+
+def unreachable_info():
+	"""Returns a ProjectorInfo which records that the projector couldn't be reached as of now"""
+	info = ProjectorInfo(None, None, None, None, None, None, None)
+	info.reachable = False
+	return info
+
+def info_command_lines():
+	"""The command lines which query everything in a ProjectorInfo, in the order info_from_responses expects"""
+	return [PJLinkCommandLine(command, PJLinkProtocol.QUERY) for command in (PJLinkProtocol.MUTE, PJLinkProtocol.POWER, PJLinkProtocol.NAME, PJLinkProtocol.MANUFACTURE_NAME, PJLinkProtocol.PRODUCT_NAME, PJLinkProtocol.OTHER_INFO, PJLinkProtocol.LAMP)]
+
+def info_from_responses(responses):
+	"""Returns a ProjectorInfo made from the responses to the info_command_lines"""
+	mute, power, name, manufacture_name, product_name, other_info, lamps = [response.data for response in responses]
+	audio_mute, video_mute = PJLinkController.parse_mute(mute)
+	info = ProjectorInfo(power, name, manufacture_name, product_name, other_info, audio_mute, video_mute)
+	for lamp in PJLinkController.parse_lamps(lamps):
+		info.lamps.append(LampInfo(lamp[0], lamp[1]))
+	return info
+
+def max_age(): return getattr(settings, 'PROJECTOR_STATE_MAX_AGE', 60)
+
+def state_cache_key(projector_id): return '%s%s' % (STATE_CACHE_PREFIX, projector_id)
+
+def projector_controller(projector):
+	return PJLinkController(projector.pjlink_host, projector.pjlink_port, projector.pjlink_password)
+
+def cached_projector_info(projector):
+	"""Returns the cached ProjectorInfo with its age set, or None if there is none"""
+	info = cache.get(state_cache_key(projector.id))
+	if info == None: return None
+	delta = datetime.datetime.now() - info.fetched
+	info.age = delta.days * 86400 + delta.seconds
+	return info
+
+def store_projector_info(projector_id, info):
+	cache.set(state_cache_key(projector_id), info, getattr(settings, 'PROJECTOR_STATE_CACHE_SECONDS', 24 * 60 * 60))
+
+def refresh_projector_info(projector, controller=None):
+	"""Queries the projector (using the controller's session if it has one), caches the result and returns it.
+	If the projector can't be reached an unreachable_info is cached before the error is raised."""
+	if controller == None: controller = projector_controller(projector)
+	try:
+		info = query_projector_info(controller)
+	except:
+		store_projector_info(projector.id, unreachable_info())
+		raise
+	store_projector_info(projector.id, info)
+	return info
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+def refresh_in_background(projector):
+	"""Starts a thread to refresh the projector's state unless one is already running, returning the thread or None"""
+	_refreshing_lock.acquire()
+	try:
+		if projector.id in _refreshing: return None
+		_refreshing.add(projector.id)
+	finally:
+		_refreshing_lock.release()
+	def refresh():
+		try:
+			refresh_projector_info(projector)
+		except:
+			logging.exception('Could not refresh the state of projector %s' % projector.id)
+		finally:
+			_refreshing_lock.acquire()
+			try:
+				_refreshing.discard(projector.id)
+			finally:
+				_refreshing_lock.release()
+	thread = threading.Thread(target=refresh)
+	thread.setDaemon(True)
+	thread.start()
+	return thread
+
+def get_projector_info(projector):
+	"""Returns the projector's state, from the cache when there is an entry and otherwise by querying the projector.
+	Entries older than PROJECTOR_STATE_MAX_AGE are returned as is while a background refresh brings them up to date.
+	The info's reachable is False if the projector couldn't be reached when it was last queried."""
+	info = cached_projector_info(projector)
+	if info == None: return refresh_projector_info(projector)
+	if info.age > max_age(): refresh_in_background(projector)
+	return info
+
+def get_projector_infos(projectors, concurrency=DEFAULT_CONCURRENCY, timeout=5):
+	"""Like get_projector_info for many projectors at once: returns a map of projector id to ProjectorInfo.
+	Projectors without a cache entry are polled concurrently and stale entries are refreshed in a background thread."""
+	infos = {}
+	missing = []
+	stale = []
+	for projector in projectors:
+		infos[projector.id] = cached_projector_info(projector)
+		if infos[projector.id] == None:
+			missing.append(projector)
+		elif infos[projector.id].age > max_age():
+			stale.append(projector)
+	if missing:
+		poll_projectors(missing, concurrency, timeout)
+		for projector in missing: infos[projector.id] = cached_projector_info(projector)
+	if stale:
+		thread = threading.Thread(target=poll_projectors, args=(stale, concurrency, timeout))
+		thread.setDaemon(True)
+		thread.start()
+	return infos
+
+def poll_projectors(projectors, concurrency=DEFAULT_CONCURRENCY, timeout=5):
+	"""Refreshes the cached state of the projectors concurrently, returning a map of projector id to True if the refresh worked.
+	The projectors which couldn't be reached are cached as unreachable."""
+	results = {}
+	for projector_id, exchange in run_projector_commands(projectors, info_command_lines, concurrency, timeout).items():
+		results[projector_id] = False
+		if not exchange.error:
+			try:
+				store_projector_info(projector_id, info_from_responses(exchange.responses))
+				results[projector_id] = True
+			except:
+				logging.exception('Could not poll projector %s' % projector_id)
+		if not results[projector_id]: store_projector_info(projector_id, unreachable_info())
+	return results
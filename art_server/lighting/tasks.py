@@ -11,7 +11,77 @@ class ProjectorEventTask(Task):
 	def __init__(self, loopdelay=60, initdelay=1):
 		Task.__init__(self, self.do_it, loopdelay, initdelay)
 
-	def do_it(self):
-		from models import ProjectorEvent
+	def do_it(self, timestamp=None):
+		from models import ProjectorEvent, ProjectorGroupEvent
 		for event in ProjectorEvent.objects.all():
+			if event.due_for_execution(timestamp): event.execute()
+		for event in ProjectorGroupEvent.objects.all():
+			if event.due_for_execution(timestamp): event.execute()
+
+class LightSceneEventTask(Task):
+	"""The task which starts the scheduled fades to light scenes.  The fades run on in the background after each event."""
+	def __init__(self, loopdelay=60, initdelay=1):
+		Task.__init__(self, self.do_it, loopdelay, initdelay)
+
+	def do_it(self):
+		from models import LightSceneEvent
+		for event in LightSceneEvent.objects.all():
 			if event.due_for_execution(): event.execute()
+
+class ProjectorPollTask(Task):
+	"""The task which refreshes the cached state of every projector."""
+	def __init__(self, loopdelay=60, initdelay=5):
+		Task.__init__(self, self.do_it, loopdelay, initdelay)
+
+	def do_it(self):
+		from models import Projector
+		from projector_state import poll_projectors
+		poll_projectors(Projector.objects.all())
+
+class ProjectorHistoryTask(Task):
+	"""The task which samples every projector's lamp hours and error status, rolls up the history and alerts on lamp hour thresholds and errors.
+	The sample which raises an alert won't raise it again, so alerts which fall within 10 minutes of the last are held and sent together afterwards rather than dropped."""
+	def __init__(self, loopdelay=300, initdelay=30):
+		Task.__init__(self, self.do_it, loopdelay, initdelay)
+		self.held_alerts = []
+
+	def alert_suppressed(self):
+		return self.last_alert_datetime and self.last_alert_datetime > datetime.now() - timedelta(minutes=10)
+
+	def send_alert(self, subject, message):
+		if self.alert_suppressed():
+			print 'Holding an alert because there was one sent in the last 10 minutes: %s' % subject
+			if (subject, message) not in self.held_alerts: self.held_alerts.append((subject, message))
+			return
+		self.deliver_alert(subject, message)
+
+	def deliver_alert(self, subject, message):
+		"""Returns True if the alert was sent"""
+		last_alert_datetime = self.last_alert_datetime
+		Task.send_alert(self, subject, message)
+		return self.last_alert_datetime != last_alert_datetime
+
+	def send_held_alerts(self):
+		"""Sends the held alerts as one alert once 10 minutes have passed since the last, keeping them held if they could not be sent"""
+		if not self.held_alerts or self.alert_suppressed(): return
+		alerts = self.held_alerts
+		self.held_alerts = []
+		if len(alerts) == 1:
+			subject, message = alerts[0]
+		else:
+			subject = '%s (and %s more alerts)' % (alerts[0][0], len(alerts) - 1)
+			message = '\n\n'.join(['%s\n%s' % alert for alert in alerts])
+		if not self.deliver_alert(subject, message): self.held_alerts = alerts + self.held_alerts
+
+	def do_it(self):
+		from models import Projector
+		import projector_history
+		try:
+			samples = projector_history.collect_samples(Projector.objects.all())
+			messages = projector_history.sample_alerts(samples)
+			if messages: self.send_alert('Projector maintenance needed', '\n'.join(messages))
+			projector_history.roll_up()
+		except:
+			traceback.print_exc()
+			logging.exception('Could not record the projector history')
+		self.send_held_alerts()
@@ -1,2 +1,5 @@
 """Tests for the lighting module"""
-from test_lighting import *
\ No newline at end of file
+from django.conf import settings
+
+from test_lighting import *
+if getattr(settings, 'RUN_BENCHMARKS', False): from benchmark_lighting import *
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""Benchmarks of the lighting stack against a fleet of mock projectors.
+
+They only run when RUN_BENCHMARKS is True in the settings, on a small fleet.  Set LIGHTING_BENCHMARK_PROJECTORS (e.g. 300) and LIGHTING_BENCHMARK_LATENCY (seconds per response)
+in the settings to measure a realistic installation.  Each timing is written to stderr as a 'benchmark' line.
+"""
+import sys
+import time
+import datetime
+
+from django.conf import settings
+from django.test import TestCase
+from django.test.client import Client
+from django.core.cache import cache
+
+from lighting.models import *
+from lighting.tasks import ProjectorEventTask
+from lighting import pjlink_fleet
+from lighting.pjlink import PJLinkProtocol
+from lighting.projector_state import poll_projectors
+from lighting.tests.mock_pjlink import MockPJLinkFleet, REFUSE, SILENT
+
+def report(name, size, seconds):
+	sys.stderr.write('benchmark %-40s %5s projectors %8.3f seconds\n' % (name, size, seconds))
+
+class LightingBenchmark(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.client = Client()
+		self.fleet = MockPJLinkFleet(getattr(settings, 'LIGHTING_BENCHMARK_PROJECTORS', 20), latency=getattr(settings, 'LIGHTING_BENCHMARK_LATENCY', 0.005), random_seed=1)
+		self.fleet.start()
+		self.entries = self.fleet.create_projectors()
+		self.failure_count = max(1, len(self.fleet) / 10)
+
+	def tearDown(self):
+		self.fleet.stop()
+
+	def timed(self, name, function, *args, **kwargs):
+		start = time.time()
+		result = function(*args, **kwargs)
+		report(name, len(self.fleet), time.time() - start)
+		return result
+
+	def test_projector_info(self):
+		def get_all():
+			for entry in self.entries:
+				response = self.client.get('/api/projector/%s/info/' % entry.id)
+				self.failUnlessEqual(response.status_code, 200, 'status was %s' % response.status_code)
+		self.timed('projector_info uncached', get_all)
+		connection_count = self.fleet.connection_count()
+		self.timed('projector_info cached', get_all)
+		self.failUnlessEqual(self.fleet.connection_count(), connection_count)
+
+	def test_event_sweep(self):
+		timestamp = datetime.datetime(2011, 6, 1, 12, 30, 30)
+		for entry in self.entries: ProjectorEvent.objects.create(device=entry, command='on', minutes='%s' % timestamp.minute)
+		failing = self.fleet.inject_failures(self.failure_count, REFUSE)
+		self.timed('ProjectorEvent sweep', ProjectorEventTask().do_it, timestamp)
+		for projector in self.fleet.projectors:
+			if projector in failing:
+				self.failUnlessEqual(projector.power_state, PJLinkProtocol.POWER_OFF_STATUS)
+			else:
+				self.failUnlessEqual(projector.power_state, PJLinkProtocol.POWER_ON_STATUS)
+
+	def test_group_operations(self):
+		group = ProjectorGroup.objects.create(name='Everything')
+		for entry in self.entries: group.projectors.add(entry)
+
+		event = ProjectorGroupEvent.objects.create(group=group, command='on')
+		self.failUnless(self.timed('ProjectorGroupEvent on', event.execute))
+		self.failUnlessEqual(self.fleet.power_states(), [PJLinkProtocol.POWER_ON_STATUS] * len(self.fleet))
+
+		response = self.timed('projector-group POST power off', self.client.post, '/api/projector-group/%s/' % group.id, {'power':PJLinkProtocol.POWER_OFF_STATUS})
+		self.failUnlessEqual(response.status_code, 200, 'status was %s' % response.status_code)
+		self.failUnlessEqual(self.fleet.power_states(), [PJLinkProtocol.POWER_OFF_STATUS] * len(self.fleet))
+
+		# projectors which never answer cost no more than one timeout
+		self.fleet.inject_failures(self.failure_count, SILENT)
+		results = self.timed('power_on_all with silent projectors', pjlink_fleet.power_on_all, self.entries, timeout=1)
+		self.failUnlessEqual(results.values().count(False), self.failure_count)
+
+	def test_lossy_poll(self):
+		for projector in self.fleet.projectors: projector.loss = 0.02
+		results = self.timed('poll_projectors with 2% response loss', poll_projectors, self.entries, timeout=1)
+		lost = [projector for projector in self.fleet.projectors if projector.lost_count > 0]
+		self.failUnlessEqual(results.values().count(False), len(lost))
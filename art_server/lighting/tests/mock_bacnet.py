@@ -0,0 +1,140 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""A simulated BACnet/IP lighting controller for the tests."""
+import time
+import select
+import socket
+import logging
+import threading
+
+from lighting.bacnet import *
+
+class MockBACnetDevice(threading.Thread):
+	"""This creates a localhost UDP socket which answers BACnet/IP requests as if it were a lighting controller.
+	values maps the instance number of each Analog Value object to its Present-Value."""
+	def __init__(self, device_id=77000, values=None):
+		self.device_id = device_id
+		if values == None: values = { 1:0.0, 2:50.0, 3:100.0 }
+		self.values = values
+		self.ignore_requests = False # set to True to act as if the device were unplugged
+		self.supports_read_property_multiple = True
+		self.supports_write_property_multiple = True
+		self.supports_cov = True
+		self.subscriptions = {} # (address, process id, instance) to when the subscription lapses
+		self.notification_count = 0
+		self.who_is_count = 0
+		self.request_count = 0
+		self.running = False
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.bind(('127.0.0.1', 0))
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def address(self): return self.sock.getsockname()
+
+	def stop(self):
+		self.running = False
+
+	def set_value(self, instance, value):
+		"""Changes a Present-Value as if it were set from a panel in the building, notifying the subscribers"""
+		self.values[instance] = value
+		self._notify(instance)
+
+	def run(self):
+		self.running = True
+		while self.running:
+			if not select.select([self.sock], [], [], 0.1)[0]: continue
+			data, address = self.sock.recvfrom(2048)
+			if self.ignore_requests: continue
+			try:
+				self._handle_datagram(data, address)
+			except:
+				logging.exception('The mock BACnet device could not handle a request')
+		self.sock.close()
+
+	def _send(self, apdu, address):
+		self.sock.sendto(encode_bvlc(encode_npdu(apdu.encode())), address)
+
+	def _handle_datagram(self, data, address):
+		address, npdu = decode_bvlc(data, address)
+		source_network, source_mac, encoded_apdu = decode_npdu(npdu)
+		request = BACnetAPDU.decode(encoded_apdu)
+		if request.pdu_type == BACnetProtocol.UNCONFIRMED_REQUEST:
+			if request.service == BACnetProtocol.WHO_IS:
+				self.who_is_count += 1
+				low_limit, high_limit = decode_who_is(request.body)
+				if low_limit == None or low_limit <= self.device_id <= high_limit:
+					self._send(BACnetAPDU(BACnetProtocol.UNCONFIRMED_REQUEST, BACnetProtocol.I_AM, body=i_am_body(self.device_id)), address)
+			return
+		if request.pdu_type != BACnetProtocol.CONFIRMED_REQUEST: return
+		self.request_count += 1
+		self._send(self._handle_confirmed_request(request, address), address)
+		if request.service == BACnetProtocol.WRITE_PROPERTY:
+			self._notify(decode_write_property(request.body)[0][1])
+		elif request.service == BACnetProtocol.WRITE_PROPERTY_MULTIPLE and self.supports_write_property_multiple:
+			for object_type, instance, property_id, values, priority in decode_write_property_multiple(request.body): self._notify(instance)
+		elif request.service == BACnetProtocol.SUBSCRIBE_COV and self.supports_cov:
+			process_id, object_id, confirmed, lifetime = decode_subscribe_cov(request.body)
+			if lifetime != None: self._notify(object_id[1], [(address, process_id, object_id[1])]) # the current value goes out right after a subscription
+
+	def _notify(self, instance, subscribers=None):
+		"""Sends an Unconfirmed-COV-Notification of the instance's Present-Value to each of its subscribers"""
+		now = time.time()
+		if subscribers == None: subscribers = [key for key, expires in self.subscriptions.items() if key[2] == instance and expires > now]
+		for address, process_id, instance in subscribers:
+			values = [(BACnetProtocol.PRESENT_VALUE, encode_application(BACnetProtocol.REAL, self.values[instance]))]
+			body = cov_notification_body(process_id, self.device_id, BACnetProtocol.ANALOG_VALUE, instance, int(self.subscriptions.get((address, process_id, instance), now) - now), values)
+			self.notification_count += 1
+			self._send(BACnetAPDU(BACnetProtocol.UNCONFIRMED_REQUEST, BACnetProtocol.UNCONFIRMED_COV_NOTIFICATION, body=body), address)
+
+	def _handle_confirmed_request(self, request, address):
+		"""Returns the BACnetAPDU which answers the request"""
+		if request.service == BACnetProtocol.READ_PROPERTY:
+			object_id, property_id, index, offset = decode_property_reference(request.body)
+			error = self._check_property(object_id, property_id)
+			if error: return BACnetAPDU(BACnetProtocol.ERROR, request.service, request.invoke_id, detail=error)
+			body = read_property_ack_body(object_id[0], object_id[1], property_id, encode_application(BACnetProtocol.REAL, self.values[object_id[1]]))
+			return BACnetAPDU(BACnetProtocol.COMPLEX_ACK, request.service, request.invoke_id, body)
+
+		if request.service == BACnetProtocol.READ_PROPERTY_MULTIPLE and self.supports_read_property_multiple:
+			results = []
+			for object_type, instance, property_id in decode_read_property_multiple(request.body):
+				error = self._check_property((object_type, instance), property_id)
+				if error:
+					results.append((object_type, instance, property_id, error))
+				else:
+					results.append((object_type, instance, property_id, encode_application(BACnetProtocol.REAL, self.values[instance])))
+			return BACnetAPDU(BACnetProtocol.COMPLEX_ACK, request.service, request.invoke_id, read_property_multiple_ack_body(results))
+
+		if request.service == BACnetProtocol.WRITE_PROPERTY:
+			object_id, property_id, index, values, priority = decode_write_property(request.body)
+			error = self._check_property(object_id, property_id)
+			if error: return BACnetAPDU(BACnetProtocol.ERROR, request.service, request.invoke_id, detail=error)
+			self.values[object_id[1]] = values[0]
+			return BACnetAPDU(BACnetProtocol.SIMPLE_ACK, request.service, request.invoke_id)
+
+		if request.service == BACnetProtocol.WRITE_PROPERTY_MULTIPLE and self.supports_write_property_multiple:
+			writes = decode_write_property_multiple(request.body)
+			for object_type, instance, property_id, values, priority in writes:
+				error = self._check_property((object_type, instance), property_id)
+				if error: return BACnetAPDU(BACnetProtocol.ERROR, request.service, request.invoke_id, detail=error) # real devices also say which write failed
+			for object_type, instance, property_id, values, priority in writes: self.values[instance] = values[0]
+			return BACnetAPDU(BACnetProtocol.SIMPLE_ACK, request.service, request.invoke_id)
+
+		if request.service == BACnetProtocol.SUBSCRIBE_COV and self.supports_cov:
+			process_id, object_id, confirmed, lifetime = decode_subscribe_cov(request.body)
+			error = self._check_property(object_id, BACnetProtocol.PRESENT_VALUE)
+			if error: return BACnetAPDU(BACnetProtocol.ERROR, request.service, request.invoke_id, detail=error)
+			key = (address, process_id, object_id[1])
+			if lifetime == None:
+				if key in self.subscriptions: del self.subscriptions[key]
+			else:
+				self.subscriptions[key] = time.time() + lifetime
+			return BACnetAPDU(BACnetProtocol.SIMPLE_ACK, request.service, request.invoke_id)
+
+		return BACnetAPDU(BACnetProtocol.REJECT, None, request.invoke_id, detail=BACnetProtocol.UNRECOGNIZED_SERVICE)
+
+	def _check_property(self, object_id, property_id):
+		"""Returns the (error class, error code) for a property we don't have or None if it's one of the Present-Values"""
+		if object_id[0] != BACnetProtocol.ANALOG_VALUE or object_id[1] not in self.values: return (1, 31) # object, unknown-object
+		if property_id != BACnetProtocol.PRESENT_VALUE: return (2, 32) # property, unknown-property
+		return None
@@ -0,0 +1,104 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""A simulated Crestron dimming controller for the tests."""
+import time
+import select
+import socket
+import threading
+
+class MockCrestonController(threading.Thread):
+	"""This creates a localhost server socket which answers the dimming commands as if it were the Crestron controller.
+	Each client connection is served in its own thread.  With fragment set responses trickle out a few bytes at a time."""
+	LEVEL_STEP = 1000
+
+	def __init__(self):
+		self.high = 55000
+		self.low = 62965
+		self.dim_enabled = False
+		self.fragment = False
+		self.connection_count = 0
+		self.command_count = 0
+		self.clients = []
+		self.lock = threading.Lock()
+		self.running = False
+		self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.server.bind(('127.0.0.1', 0))
+		self.server.listen(5)
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def address(self): return self.server.getsockname()
+
+	def status_lines(self):
+		return ['Current-%s' % (self.dim_enabled and self.low or self.high), 'Low-%s' % self.low, 'High-%s' % self.high, 'Lamp1-1-1468', 'Lamp1-2-1468', 'Lamp2-1-1469', 'Lamp2-2-1469', 'Wake-5:00 AM', 'Sleep-1:00 AM']
+
+	def response(self, command):
+		"""Returns the lines which answer the command"""
+		if command == 'Ping': return ['Pong']
+		if command == 'Update': return self.status_lines()
+		if command in ('HighLvlUp', 'HighLvlDown'):
+			self.high += command == 'HighLvlUp' and self.LEVEL_STEP or -self.LEVEL_STEP
+			return ['High-%s' % self.high]
+		if command in ('DimLvlUp', 'DimLvlDown'):
+			self.low += command == 'DimLvlUp' and self.LEVEL_STEP or -self.LEVEL_STEP
+			return ['Low-%s' % self.low]
+		if command == 'EnableDim':
+			self.dim_enabled = not self.dim_enabled
+			return [self.dim_enabled and 'DimEnabled' or 'DimDisabled']
+		return ['Unknown']
+
+	def drop_connections(self):
+		"""Hangs up on every client, as the controller does when it restarts"""
+		self.lock.acquire()
+		try:
+			for client in self.clients:
+				try:
+					client.shutdown(socket.SHUT_RDWR)
+				except socket.error:
+					pass
+			self.clients = []
+		finally:
+			self.lock.release()
+
+	def stop(self):
+		self.running = False
+
+	def run(self):
+		self.running = True
+		while self.running:
+			if not select.select([self.server], [], [], 0.1)[0]: continue
+			client, address = self.server.accept()
+			self.lock.acquire()
+			try:
+				self.connection_count += 1
+				self.clients.append(client)
+			finally:
+				self.lock.release()
+			thread = threading.Thread(target=self.serve, args=(client,))
+			thread.setDaemon(True)
+			thread.start()
+		self.drop_connections()
+		self.server.close()
+
+	def send(self, client, data):
+		if not self.fragment: return client.sendall(data)
+		for index in range(0, len(data), 3):
+			client.sendall(data[index:index + 3])
+			time.sleep(0.001)
+
+	def serve(self, client):
+		try:
+			self.send(client, 'Crestron Dimming Control\r\n')
+			buffer = ''
+			while self.running:
+				if not select.select([client], [], [], 0.1)[0]: continue
+				data = client.recv(1024)
+				if not data: break
+				buffer += data
+				while '\r\n' in buffer:
+					command, buffer = buffer.split('\r\n', 1)
+					self.command_count += 1
+					self.send(client, ''.join(['%s\r\n' % line for line in self.response(command.strip())]))
+		except socket.error:
+			pass
+		client.close()
@@ -0,0 +1,342 @@
+# Copyright 2011 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""Simulated PJLink projectors for the tests and benchmarks.
+
+A MockPJLinkProjector serves each client connection in its own thread and can be slowed down (latency), made to lose responses (loss)
+or made to fail in one of the FAILURE_MODES.  A MockPJLinkFleet runs many of them on localhost at once.
+"""
+import time
+import random
+import select
+import socket
+import threading
+
+from lighting.models import Projector
+from lighting.pjlink import PJLinkCommandLine, PJLinkResponse, PJLinkAuthenticationRequest, PJLinkProtocol
+
+REFUSE = 'refuse' # close each connection as soon as it is accepted
+SILENT = 'silent' # accept connections but never send a byte
+DISCONNECT = 'disconnect' # greet the client and then hang up when the first command line arrives
+UNAVAILABLE = 'unavailable' # answer every command with ERR3, as projectors do while warming up or cooling down
+FAILURE_MODES = (REFUSE, SILENT, DISCONNECT, UNAVAILABLE)
+
+class MockPJLinkProjector(threading.Thread):
+	"""This creates a localhost server socket which speaks the PJLink protocol as if it were a projector"""
+	def __init__(self, latency=0, loss=0, failure=None, random_seed=None):
+		self.backlog = 5 
+		self.buffer_size = 1024
+		self.server = None
+		self.running = False
+		self.stopped = False
+
+		self.port = 0 # 0 indicates that the server should use any open socket
+		
+		self.projector_name = "The Projector in the Blue Room"
+		self.manufacture_name = "2038 Problems, Inc."
+		self.product_name = "Big Bad Projector 1900"
+		self.other_info = "This Thing Rocks (tm)"
+		self.class_info = "1"
+
+		self.password = 'squarePusher' # or None if the projector should use no auth
+
+		self.power_state = PJLinkProtocol.POWER_OFF_STATUS
+		self.input = [PJLinkProtocol.RGB_INPUT, PJLinkProtocol.INPUT_1]
+		self.available_inputs = [[PJLinkProtocol.RGB_INPUT, PJLinkProtocol.INPUT_1], [PJLinkProtocol.VIDEO_INPUT, PJLinkProtocol.INPUT_2]]
+		self.audio_mute = False
+		self.video_mute = False
+		
+		self.errors = [['fan', PJLinkProtocol.ERROR_STATUS_OK], ['lamp', PJLinkProtocol.ERROR_STATUS_OK], ['filter', PJLinkProtocol.ERROR_STATUS_OK], ['cover', PJLinkProtocol.ERROR_STATUS_OK], ['other', PJLinkProtocol.ERROR_STATUS_OK]]
+		
+		# an array of arrays [[lighting time, lamp is on], ...]
+		self.lamps = [[100, False], [500, False], [0, False]]
+
+		self.latency = latency # seconds to wait before the greeting and each response
+		self.loss = loss # the chance (0 to 1) that a response is never sent
+		self.failure = failure # None or one of the FAILURE_MODES
+		self.random = random.Random(random_seed)
+
+		self.connection_count = 0
+		self.command_count = 0
+		self.lost_count = 0
+		self.clients = []
+		self.lock = threading.Lock()
+
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def _set_mute_state(self, state):
+		if state == PJLinkProtocol.AUDIO_VIDEO_MUTE_ON:
+			self.audio_mute = True
+			self.video_mute = True
+		elif state == PJLinkProtocol.AUDIO_MUTE_ON:
+			self.audio_mute = True
+		elif state == PJLinkProtocol.VIDEO_MUTE_ON:
+			self.video_mute = True
+		elif state == PJLinkProtocol.AUDIO_MUTE_OFF:
+			self.audio_mute = False
+		elif state == PJLinkProtocol.VIDEO_MUTE_OFF:
+			self.video_mute = False
+		elif state == PJLinkProtocol.AUDIO_VIDEO_MUTE_OFF:
+			self.audio_mute = False
+			self.video_mute = False
+		else:
+			return False
+		return True
+		
+	def _get_mute_state(self):
+		if self.audio_mute and self.video_mute:
+			return PJLinkProtocol.AUDIO_VIDEO_MUTE_ON
+		elif self.audio_mute: 
+			return PJLinkProtocol.AUDIO_MUTE_ON
+		elif self.video_mute:
+			return PJLinkProtocol.VIDEO_MUTE_ON
+		else:
+			return PJLinkProtocol.AUDIO_VIDEO_MUTE_OFF
+
+	mute_state = property(_get_mute_state, _set_mute_state)
+			
+	def stop_server(self):
+		"""Stops accepting connections and hangs up on the connected clients"""
+		self.stopped = True
+		self.running = False
+		if self.server: self.server.close()
+		self.lock.acquire()
+		try:
+			clients = list(self.clients)
+		finally:
+			self.lock.release()
+		for client in clients:
+			try:
+				client.shutdown(socket.SHUT_RDWR)
+			except socket.error:
+				pass
+
+	def wait_until_running(self, seconds_to_wait=5):
+		deadline = time.time() + seconds_to_wait
+		while self.running == False and time.time() < deadline: time.sleep(0.01)
+		return self.running
+
+	def address(self): return self.server.getsockname()
+
+	def run(self): 
+		if self.running or self.stopped: return
+		self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM) 
+		self.server.bind(('127.0.0.1',self.port)) 
+		self.server.listen(self.backlog)
+		self.running = not self.stopped # stop_server may have been called before the thread got this far
+		while self.running:
+			try:
+				# poll so that stop_server ends the loop instead of leaving it blocked in accept
+				readable = select.select([self.server], [], [], 0.1)[0]
+				if not readable: continue
+				client, address = self.server.accept()
+			except (select.error, socket.error):
+				if self.running: continue
+				break
+			self.connection_count += 1
+			if self.failure == REFUSE:
+				client.close()
+				continue
+			thread = threading.Thread(target=self._serve_client, args=(client,))
+			thread.setDaemon(True)
+			thread.start()
+		try:
+			self.server.close()
+		except socket.error:
+			pass
+
+	def _serve_client(self, client):
+		self.lock.acquire()
+		try:
+			self.clients.append(client)
+		finally:
+			self.lock.release()
+		try:
+			self._serve_session(client)
+		except socket.error:
+			pass
+		finally:
+			self.lock.acquire()
+			try:
+				self.clients.remove(client)
+			finally:
+				self.lock.release()
+			client.close()
+
+	def _count(self, name):
+		self.lock.acquire()
+		try:
+			setattr(self, name, getattr(self, name) + 1)
+		finally:
+			self.lock.release()
+
+	def _respond(self, client, response):
+		"""Sends the encoded response after the latency unless it is lost"""
+		if self.latency: time.sleep(self.latency)
+		if self.loss and self.random.random() < self.loss:
+			self._count('lost_count')
+			return
+		client.send(response.encode())
+
+	def _serve_session(self, client):
+		"""Answers command lines until the client hangs up, as projectors keep the connection open between commands"""
+		if self.failure == SILENT:
+			while self.running and client.recv(self.buffer_size): pass
+			return
+		auth_request = PJLinkAuthenticationRequest(self.password)
+		if self.latency: time.sleep(self.latency)
+		client.send(auth_request.encode())
+		authenticated = False
+		buffer = ''
+		while self.running:
+			if '\r' not in buffer:
+				data = client.recv(self.buffer_size) 
+				if not data: return
+				buffer += data
+				continue
+			encoded_command_line, buffer = buffer.split('\r', 1)
+			if self.failure == DISCONNECT: return
+			command_line = PJLinkCommandLine.decode(encoded_command_line + '\r')
+			self._count('command_count')
+
+			# only the first command line of a connection carries the authentication hash
+			if not authenticated:
+				if not auth_request.authentication_hash_matches(command_line.authentication_hash):
+					response = PJLinkResponse(PJLinkProtocol.AUTHENTICATE, PJLinkProtocol.INVALID_PASSWORD_ERROR, version=None)
+					client.send(response.encode())
+					return
+				authenticated = True
+			if self.failure == UNAVAILABLE:
+				self._respond(client, PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_3))
+			else:
+				self._respond(client, self._handle_command_line(command_line))
+
+	def _handle_command_line(self, command_line):
+		response = None 
+		if command_line.command == PJLinkProtocol.POWER:
+			if command_line.data == PJLinkProtocol.ON or command_line.data == PJLinkProtocol.OFF:
+				self.power_state = command_line.data
+				for lamp in self.lamps: lamp[1] = command_line.data == PJLinkProtocol.ON
+				response = PJLinkResponse(PJLinkProtocol.POWER, PJLinkProtocol.OK)
+			elif command_line.data == PJLinkProtocol.QUERY:
+				response = PJLinkResponse(PJLinkProtocol.POWER, self.power_state)
+			else:
+				response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
+
+		elif command_line.command == PJLinkProtocol.INPUT:
+			if command_line.data == PJLinkProtocol.QUERY:
+				response = PJLinkResponse(command_line.command, '%s%s' % (self.input[0], self.input[1]))
+			elif len(command_line.data) == 2:
+				self.input = [command_line.data[0], command_line.data[1]]
+				response = PJLinkResponse(command_line.command, PJLinkProtocol.OK)
+			else:
+				response = PJLinkResponse(command_line.commands, PJLinkProtocol.ERROR_2)
+				
+		elif command_line.command == PJLinkProtocol.AVAILABLE_INPUTS:
+			if command_line.data == PJLinkProtocol.QUERY:
+				data = ' '.join(['%s%s' % (input[0], input[1]) for input in self.available_inputs])
+				response = PJLinkResponse(command_line.command, data)
+			else:
+				response = PJLinkResponse(command_line.commands, PJLinkProtocol.ERROR_2)
+				
+		elif command_line.command == PJLinkProtocol.MUTE:
+			if command_line.data == PJLinkProtocol.QUERY:
+				response = PJLinkResponse(command_line.command, self.mute_state)
+			elif command_line.data == PJLinkProtocol.AUDIO_VIDEO_MUTE_ON or command_line.data == PJLinkProtocol.AUDIO_VIDEO_MUTE_OFF or command_line.data == PJLinkProtocol.VIDEO_MUTE_ON or command_line.data == PJLinkProtocol.VIDEO_MUTE_OFF or command_line.data == PJLinkProtocol.AUDIO_MUTE_ON or command_line.data == PJLinkProtocol.AUDIO_MUTE_OFF:
+				self.mute_state = command_line.data
+				response = PJLinkResponse(command_line.command, PJLinkProtocol.OK)
+			else:
+				response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
+
+		elif command_line.command == PJLinkProtocol.NAME:
+			if command_line.data == PJLinkProtocol.QUERY:
+				response = PJLinkResponse(command_line.command, self.projector_name)
+			else:
+				response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
+
+		elif command_line.command == PJLinkProtocol.MANUFACTURE_NAME:
+			if command_line.data == PJLinkProtocol.QUERY:
+				response = PJLinkResponse(command_line.command, self.manufacture_name)
+			else:
+				response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
+
+		elif command_line.command == PJLinkProtocol.PRODUCT_NAME:
+			if command_line.data == PJLinkProtocol.QUERY:
+				response = PJLinkResponse(command_line.command, self.product_name)
+			else:
+				response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
+
+		elif command_line.command == PJLinkProtocol.OTHER_INFO:
+			if command_line.data == PJLinkProtocol.QUERY:
+				response = PJLinkResponse(command_line.command, self.other_info)
+			else:
+				response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
+
+		elif command_line.command == PJLinkProtocol.CLASS_INFO:
+			if command_line.data == PJLinkProtocol.QUERY:
+				response = PJLinkResponse(command_line.command, self.class_info)
+			else:
+				response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
+
+		elif command_line.command == PJLinkProtocol.ERROR_STATUS:
+			if command_line.data == PJLinkProtocol.QUERY:
+				data = ''.join([error[1] for error in self.errors])
+				response = PJLinkResponse(command_line.command, data)
+			else:
+				response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
+
+		elif command_line.command == PJLinkProtocol.LAMP:
+			if command_line.data == PJLinkProtocol.QUERY:
+				data = ' '.join(['%s %s' % (lamp[0], '1' if lamp[1] == True else '0') for lamp in self.lamps])
+				response = PJLinkResponse(command_line.command, data)
+			else:
+				response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
+
+		else:
+			response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_1)
+			
+		return response
+
+class MockPJLinkFleet:
+	"""Runs size MockPJLinkProjectors on localhost, all with the same password, latency and loss.
+	Seeding makes the lost responses the same from run to run."""
+	def __init__(self, size, password='squarePusher', latency=0, loss=0, random_seed=None):
+		self.projectors = []
+		for index in range(size):
+			if random_seed == None:
+				seed = None
+			else:
+				seed = random_seed + index
+			projector = MockPJLinkProjector(latency=latency, loss=loss, random_seed=seed)
+			projector.password = password
+			self.projectors.append(projector)
+		self.entries = []
+
+	def __len__(self): return len(self.projectors)
+
+	def start(self, seconds_to_wait=5):
+		for projector in self.projectors: projector.start()
+		for projector in self.projectors:
+			if not projector.wait_until_running(seconds_to_wait): raise Exception('A mock projector did not start within %s seconds' % seconds_to_wait)
+
+	def stop(self):
+		for projector in self.projectors: projector.stop_server()
+		for projector in self.projectors: projector.join(5)
+
+	def inject_failures(self, count, failure):
+		"""Sets the failure mode of the last count projectors, returning them"""
+		if failure not in FAILURE_MODES: raise ValueError('Unknown failure mode: %s' % failure)
+		failing = self.projectors[len(self.projectors) - count:]
+		for projector in failing: projector.failure = failure
+		return failing
+
+	def create_projectors(self, name_prefix='Mock Projector'):
+		"""Creates and returns a Projector for each mock projector, in the same order"""
+		self.entries = []
+		for index, projector in enumerate(self.projectors):
+			host, port = projector.address()
+			self.entries.append(Projector.objects.create(name='%s %s' % (name_prefix, index), pjlink_host=host, pjlink_port=port, pjlink_password=projector.password))
+		return self.entries
+
+	def connection_count(self): return sum([projector.connection_count for projector in self.projectors])
+
+	def power_states(self): return [projector.power_state for projector in self.projectors]
@@ -2,198 +2,38 @@ from django.test import TestCase
 from django.test.client import Client
 from django.contrib.auth.models import User
 from django.core import mail
+from django.core.cache import cache
 import socket, select
+import datetime
+import time
 import threading
 import pprint
 from lxml import etree
 
 from lighting.models import *
-from lighting.pjlink import PJLinkCommandLine, PJLinkResponse, PJLinkAuthenticationRequest, PJLinkAuthenticationException, PJLinkProtocol, PJLinkController
+from lighting import projector_state, pjlink_fleet, projector_history
+from lighting.projector_state import get_projector_info, cached_projector_info, state_cache_key, poll_projectors
+from lighting.pjlink import PJLinkCommandLine, PJLinkResponse, PJLinkAuthenticationRequest, PJLinkAuthenticationException, PJLinkProtocol, PJLinkController, PJLinkSession
+from lighting.tests.mock_pjlink import MockPJLinkProjector
+from lighting.bacnet import BACnetClient, BACnetProtocol, BACnetAPDU, encode_bvlc, encode_npdu, BACnetErrorException, BACnetTimeoutException, encode_application, decode_values, opening_tag, closing_tag, who_is_body, decode_who_is, i_am_body, decode_i_am, write_property_body, decode_write_property, read_property_multiple_body, decode_read_property_multiple, read_property_multiple_ack_body, decode_read_property_multiple_ack, subscribe_cov_body, decode_subscribe_cov, cov_notification_body, decode_cov_notification, write_property_multiple_body, decode_write_property_multiple
+from lighting.bacnet_control import BacnetControl
+from lighting.tasks import ProjectorHistoryTask
+from lighting.bacnet_cov import BACnetCOVManager
+from lighting.fades import FadeEngine, LightFade
+from lighting.tests.mock_bacnet import MockBACnetDevice
+from lighting.creston_control import CrestonControl, CrestonConnection
+from lighting.creston_status import CrestonStatusPoller, status_version, cached_status
+from lighting.tests.mock_creston import MockCrestonController
 
 APP_PATH = '/lighting/'
 
-class MockPJLinkProjector(threading.Thread):
-	"""This creates a localhost server socket which speaks the PJLink protocol as if it were a projector"""
-	def __init__(self):
-		self.backlog = 5 
-		self.buffer_size = 1024
-		self.server = None
-		self.running = False
-
-		self.port = 0 # 0 indicates that the server should use any open socket
-		
-		self.projector_name = "The Projector in the Blue Room"
-		self.manufacture_name = "2038 Problems, Inc."
-		self.product_name = "Big Bad Projector 1900"
-		self.other_info = "This Thing Rocks (tm)"
-		self.class_info = "1"
-
-		self.password = 'squarePusher' # or None if the projector should use no auth
-
-		self.power_state = PJLinkProtocol.POWER_OFF_STATUS
-		self.input = [PJLinkProtocol.RGB_INPUT, PJLinkProtocol.INPUT_1]
-		self.available_inputs = [[PJLinkProtocol.RGB_INPUT, PJLinkProtocol.INPUT_1], [PJLinkProtocol.VIDEO_INPUT, PJLinkProtocol.INPUT_2]]
-		self.audio_mute = False
-		self.video_mute = False
-		
-		self.errors = [['fan', PJLinkProtocol.ERROR_STATUS_OK], ['lamp', PJLinkProtocol.ERROR_STATUS_OK], ['filter', PJLinkProtocol.ERROR_STATUS_OK], ['cover', PJLinkProtocol.ERROR_STATUS_OK], ['other', PJLinkProtocol.ERROR_STATUS_OK]]
-		
-		# an array of arrays [[lighting time, lamp is on], ...]
-		self.lamps = [[100, False], [500, False], [0, False]]
-
-		threading.Thread.__init__(self)
-
-	def _set_mute_state(self, state):
-		if state == PJLinkProtocol.AUDIO_VIDEO_MUTE_ON:
-			self.audio_mute = True
-			self.video_mute = True
-		elif state == PJLinkProtocol.AUDIO_MUTE_ON:
-			self.audio_mute = True
-		elif state == PJLinkProtocol.VIDEO_MUTE_ON:
-			self.video_mute = True
-		elif state == PJLinkProtocol.AUDIO_MUTE_OFF:
-			self.audio_mute = False
-		elif state == PJLinkProtocol.VIDEO_MUTE_OFF:
-			self.video_mute = False
-		elif state == PJLinkProtocol.AUDIO_VIDEO_MUTE_OFF:
-			self.audio_mute = False
-			self.video_mute = False
-		else:
-			return False
-		return True
-		
-	def _get_mute_state(self):
-		if self.audio_mute and self.video_mute:
-			return PJLinkProtocol.AUDIO_VIDEO_MUTE_ON
-		elif self.audio_mute: 
-			return PJLinkProtocol.AUDIO_MUTE_ON
-		elif self.video_mute:
-			return PJLinkProtocol.VIDEO_MUTE_ON
-		else:
-			return PJLinkProtocol.AUDIO_VIDEO_MUTE_OFF
-
-	mute_state = property(_get_mute_state, _set_mute_state)
-			
-	def stop_server(self):
-		self.running = False
-		if self.server: self.server.close()
-	
-	def run(self): 
-		if self.running: return
-		self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM) 
-		self.server.bind(('127.0.0.1',self.port)) 
-		self.server.listen(self.backlog)
-		self.running = True
-		while self.running:
-			client, address = self.server.accept()
-			auth_request = PJLinkAuthenticationRequest(self.password)
-			client.send(auth_request.encode())
-			data = client.recv(self.buffer_size) 
-			if not data:
-				client.close()
-				continue
-
-			response = None 
-			command_line = PJLinkCommandLine.decode(data)
-
-			if not auth_request.authentication_hash_matches(command_line.authentication_hash):
-				response = PJLinkResponse(PJLinkProtocol.AUTHENTICATE, PJLinkProtocol.INVALID_PASSWORD_ERROR, version=None)
-				client.send(response.encode())
-				client.close()
-				continue
-				
-			if command_line.command == PJLinkProtocol.POWER:
-				if command_line.data == PJLinkProtocol.ON or command_line.data == PJLinkProtocol.OFF:
-					self.power_state = command_line.data
-					for lamp in self.lamps: lamp[1] = command_line.data == PJLinkProtocol.ON
-					response = PJLinkResponse(PJLinkProtocol.POWER, PJLinkProtocol.OK)
-				elif command_line.data == PJLinkProtocol.QUERY:
-					response = PJLinkResponse(PJLinkProtocol.POWER, self.power_state)
-				else:
-					response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
-
-			elif command_line.command == PJLinkProtocol.INPUT:
-				if command_line.data == PJLinkProtocol.QUERY:
-					response = PJLinkResponse(command_line.command, '%s%s' % (self.input[0], self.input[1]))
-				elif len(command_line.data) == 2:
-					self.input = [command_line.data[0], command_line.data[1]]
-					response = PJLinkResponse(command_line.command, PJLinkProtocol.OK)
-				else:
-					response = PJLinkResponse(command_line.commands, PJLinkProtocol.ERROR_2)
-					
-			elif command_line.command == PJLinkProtocol.AVAILABLE_INPUTS:
-				if command_line.data == PJLinkProtocol.QUERY:
-					data = ' '.join(['%s%s' % (input[0], input[1]) for input in self.available_inputs])
-					response = PJLinkResponse(command_line.command, data)
-				else:
-					response = PJLinkResponse(command_line.commands, PJLinkProtocol.ERROR_2)
-					
-			elif command_line.command == PJLinkProtocol.MUTE:
-				if command_line.data == PJLinkProtocol.QUERY:
-					response = PJLinkResponse(command_line.command, self.mute_state)
-				elif command_line.data == PJLinkProtocol.AUDIO_VIDEO_MUTE_ON or command_line.data == PJLinkProtocol.AUDIO_VIDEO_MUTE_OFF or command_line.data == PJLinkProtocol.VIDEO_MUTE_ON or command_line.data == PJLinkProtocol.VIDEO_MUTE_OFF or command_line.data == PJLinkProtocol.AUDIO_MUTE_ON or command_line.data == PJLinkProtocol.AUDIO_MUTE_OFF:
-					self.mute_state = command_line.data
-					response = PJLinkResponse(command_line.command, PJLinkProtocol.OK)
-				else:
-					response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
-
-			elif command_line.command == PJLinkProtocol.NAME:
-				if command_line.data == PJLinkProtocol.QUERY:
-					response = PJLinkResponse(command_line.command, self.projector_name)
-				else:
-					response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
-
-			elif command_line.command == PJLinkProtocol.MANUFACTURE_NAME:
-				if command_line.data == PJLinkProtocol.QUERY:
-					response = PJLinkResponse(command_line.command, self.manufacture_name)
-				else:
-					response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
-
-			elif command_line.command == PJLinkProtocol.PRODUCT_NAME:
-				if command_line.data == PJLinkProtocol.QUERY:
-					response = PJLinkResponse(command_line.command, self.product_name)
-				else:
-					response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
-
-			elif command_line.command == PJLinkProtocol.OTHER_INFO:
-				if command_line.data == PJLinkProtocol.QUERY:
-					response = PJLinkResponse(command_line.command, self.other_info)
-				else:
-					response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
-
-			elif command_line.command == PJLinkProtocol.CLASS_INFO:
-				if command_line.data == PJLinkProtocol.QUERY:
-					response = PJLinkResponse(command_line.command, self.class_info)
-				else:
-					response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
-
-			elif command_line.command == PJLinkProtocol.ERROR_STATUS:
-				if command_line.data == PJLinkProtocol.QUERY:
-					data = ''.join([error[1] for error in self.errors])
-					response = PJLinkResponse(command_line.command, data)
-				else:
-					response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
-
-			elif command_line.command == PJLinkProtocol.LAMP:
-				if command_line.data == PJLinkProtocol.QUERY:
-					data = ' '.join(['%s %s' % (lamp[0], '1' if lamp[1] == True else '0') for lamp in self.lamps])
-					response = PJLinkResponse(command_line.command, data)
-				else:
-					response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_2)
-
-			else:
-				response = PJLinkResponse(command_line.command, PJLinkProtocol.ERROR_1)
-				
-			client.send(response.encode())
-			client.close()
-			
-		self.server.close()
-
 class PJLinkAPITest(TestCase):
 	def setUp(self):
+		cache.clear()
 		self.client = Client()
 		self.projector = MockPJLinkProjector()
 		self.projector.start()
+		self.failUnless(self.projector.wait_until_running())
 		
 	def tearDown(self):
 		self.projector.stop_server()
@@ -214,8 +54,10 @@ class PJLinkAPITest(TestCase):
 		self.failUnlessEqual(proj_element.get('name'), self.projector.projector_name)
 
 		projector_info_url = '/api/projector/%s/info/' % proj_entry.id
+		connection_count = self.projector.connection_count
 		response = self.client.get(projector_info_url)
 		self.failUnlessEqual(response.status_code, 200, 'status was %s' % response.status_code)
+		self.failUnlessEqual(self.projector.connection_count, connection_count + 1) # all of the queries share one session
 		info_element = etree.fromstring(response.content)
 		self.failUnlessEqual(info_element.get('power_state'), self.projector.power_state)
 		self.failUnlessEqual(info_element.get('projector_name'), self.projector.projector_name)
@@ -239,6 +81,280 @@ class PJLinkAPITest(TestCase):
 		self.failUnlessEqual(self.projector.power_state, PJLinkProtocol.POWER_OFF_STATUS)
 		
 		
+class ProjectorStateTest(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.projector = MockPJLinkProjector()
+		self.projector.start()
+		seconds_to_wait = 5
+		while self.projector.running == False and seconds_to_wait > 0:
+			time.sleep(1)
+			seconds_to_wait -= 1
+		host, port = self.projector.server.getsockname()
+		self.proj_entry = Projector.objects.create(name=self.projector.projector_name, pjlink_host=host, pjlink_port=port, pjlink_password=self.projector.password)
+
+	def tearDown(self):
+		self.projector.stop_server()
+
+	def test_cache(self):
+		self.failUnlessEqual(cached_projector_info(self.proj_entry), None)
+		info = get_projector_info(self.proj_entry)
+		self.failUnlessEqual(info.projector_name, self.projector.projector_name)
+		self.failUnlessEqual(info.age, 0)
+		self.failUnlessEqual(len(info.lamps), len(self.projector.lamps))
+		connection_count = self.projector.connection_count
+
+		# fresh entries are served without talking to the projector
+		original_name = self.projector.projector_name
+		self.projector.projector_name = 'Renamed'
+		info = get_projector_info(self.proj_entry)
+		self.failUnlessEqual(info.projector_name, original_name)
+		self.failUnlessEqual(self.projector.connection_count, connection_count)
+
+		# stale entries are served while a background refresh brings them up to date
+		info.fetched = datetime.datetime.now() - datetime.timedelta(seconds=projector_state.max_age() + 10)
+		cache.set(state_cache_key(self.proj_entry.id), info)
+		stale_info = get_projector_info(self.proj_entry)
+		self.failUnlessEqual(stale_info.projector_name, original_name)
+		self.failUnless(stale_info.age > projector_state.max_age())
+		seconds_to_wait = 5
+		while cached_projector_info(self.proj_entry).projector_name != 'Renamed' and seconds_to_wait > 0:
+			time.sleep(0.1)
+			seconds_to_wait -= 0.1
+		self.failUnlessEqual(cached_projector_info(self.proj_entry).projector_name, 'Renamed')
+
+	def test_poll(self):
+		down_entry = Projector.objects.create(name='Down', pjlink_host='127.0.0.1', pjlink_port=1, pjlink_password=None)
+		results = poll_projectors([self.proj_entry, down_entry])
+		self.failUnlessEqual(results, { self.proj_entry.id:True, down_entry.id:False })
+		self.failUnlessEqual(cached_projector_info(self.proj_entry).power_state, self.projector.power_state)
+		self.failIf(cached_projector_info(down_entry).reachable)
+
+		# a projector which is down is served from the cache rather than queried on every request
+		cache.clear()
+		self.failUnlessRaises(Exception, get_projector_info, down_entry)
+		self.failIf(cached_projector_info(down_entry).reachable)
+		start = time.time()
+		self.failIf(get_projector_info(down_entry).reachable)
+		self.failUnless(time.time() - start < 0.5)
+		response = Client().get('/api/projector/%s/info/' % down_entry.id)
+		self.failUnlessEqual(response.status_code, 500)
+
+class PJLinkFleetTest(TestCase):
+	def setUp(self):
+		self.projectors = [MockPJLinkProjector() for i in range(4)]
+		self.projectors[1].password = None
+		for projector in self.projectors: projector.start()
+		for projector in self.projectors:
+			seconds_to_wait = 5
+			while projector.running == False and seconds_to_wait > 0:
+				time.sleep(0.1)
+				seconds_to_wait -= 0.1
+		self.entries = []
+		for index, projector in enumerate(self.projectors):
+			host, port = projector.server.getsockname()
+			self.entries.append(Projector.objects.create(name='Projector %s' % index, pjlink_host=host, pjlink_port=port, pjlink_password=projector.password))
+
+		# a projector which accepts connections but never speaks
+		self.silent_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.silent_server.bind(('127.0.0.1', 0))
+		self.silent_server.listen(5)
+		self.silent_entry = Projector.objects.create(name='Silent', pjlink_host='127.0.0.1', pjlink_port=self.silent_server.getsockname()[1], pjlink_password='pass')
+
+	def tearDown(self):
+		for projector in self.projectors: projector.stop_server()
+		self.silent_server.close()
+
+	def test_fleet(self):
+		start = time.time()
+		results = pjlink_fleet.power_on_all(self.entries + [self.silent_entry], concurrency=3, timeout=1)
+		self.failUnless(time.time() - start < 3)
+		self.failUnlessEqual(results, dict([(entry.id, True) for entry in self.entries] + [(self.silent_entry.id, False)]))
+		for projector in self.projectors: self.failUnlessEqual(projector.power_state, PJLinkProtocol.POWER_ON_STATUS)
+
+		self.projectors[2].lamps = [[1234, True]]
+		lamps = pjlink_fleet.query_lamps_all(self.entries, timeout=1)
+		self.failUnlessEqual(lamps[self.entries[2].id], [[1234, True]])
+		self.failUnlessEqual(lamps[self.entries[0].id], [[lamp[0], lamp[1]] for lamp in self.projectors[0].lamps])
+
+		self.failUnlessEqual(pjlink_fleet.set_mute_all(self.entries[:2], PJLinkProtocol.VIDEO_MUTE_ON).values(), [True, True])
+		self.failUnless(self.projectors[0].video_mute)
+		self.failIf(self.projectors[2].video_mute)
+
+		# a bad password fails that projector alone
+		self.entries[3].pjlink_password = 'badPassword'
+		results = pjlink_fleet.power_off_all(self.entries, timeout=1)
+		self.failIf(results[self.entries[3].id])
+		self.failUnless(results[self.entries[0].id])
+		self.failUnlessEqual(self.projectors[3].power_state, PJLinkProtocol.POWER_ON_STATUS)
+
+		# polling fills the state cache
+		cache.clear()
+		results = poll_projectors(self.entries[:3] + [self.silent_entry], timeout=1)
+		self.failUnlessEqual(results[self.silent_entry.id], False)
+		self.failUnlessEqual(cached_projector_info(self.entries[2]).lamps[0].lighting_hours, 1234)
+		self.failUnlessEqual(cached_projector_info(self.entries[0]).video_mute, True)
+
+class ProjectorGroupTest(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.client = Client()
+		self.projectors = [MockPJLinkProjector() for i in range(3)]
+		for projector in self.projectors: projector.start()
+		self.group = ProjectorGroup.objects.create(name='Video Wall')
+		for index, projector in enumerate(self.projectors):
+			seconds_to_wait = 5
+			while projector.running == False and seconds_to_wait > 0:
+				time.sleep(0.1)
+				seconds_to_wait -= 0.1
+			host, port = projector.server.getsockname()
+			self.group.projectors.add(Projector.objects.create(name='Projector %s' % index, pjlink_host=host, pjlink_port=port, pjlink_password=projector.password))
+
+	def tearDown(self):
+		for projector in self.projectors: projector.stop_server()
+
+	def test_group_event(self):
+		event = ProjectorGroupEvent.objects.create(group=self.group, command='on')
+		self.failUnless(event.execute())
+		for projector in self.projectors: self.failUnlessEqual(projector.power_state, PJLinkProtocol.POWER_ON_STATUS)
+		self.failUnlessEqual(event.tries, 1)
+
+		self.group.projectors.add(Projector.objects.create(name='Down', pjlink_host='127.0.0.1', pjlink_port=1))
+		event.command = 'off'
+		self.failIf(event.execute())
+		self.failUnlessEqual(event.tries, 2)
+		for projector in self.projectors: self.failUnlessEqual(projector.power_state, PJLinkProtocol.POWER_OFF_STATUS)
+
+	def test_group_api(self):
+		response = self.client.get('/api/projector-group/')
+		self.failUnlessEqual(response.status_code, 200, 'status was %s' % response.status_code)
+		element = etree.fromstring(response.content)
+		self.failUnlessEqual(len(element), 1)
+		self.failUnlessEqual(element[0].get('name'), self.group.name)
+
+		group_url = '/api/projector-group/%s/' % self.group.id
+		response = self.client.get(group_url)
+		self.failUnlessEqual(response.status_code, 200, 'status was %s' % response.status_code)
+		group_element = etree.fromstring(response.content)
+		projector_elements = group_element.find('projectors')
+		self.failUnlessEqual(len(projector_elements), len(self.projectors))
+		for index, projector_element in enumerate(projector_elements):
+			self.failUnlessEqual(projector_element.get('reachable'), 'True')
+			self.failUnlessEqual(projector_element.get('power_state'), PJLinkProtocol.POWER_OFF_STATUS)
+			self.failUnlessEqual(projector_element.get('projector_name'), self.projectors[index].projector_name)
+
+		response = self.client.post(group_url, {'power':PJLinkProtocol.POWER_ON_STATUS, 'mute':PJLinkProtocol.ON})
+		self.failUnlessEqual(response.status_code, 200, 'status was %s' % response.status_code)
+		for projector_element in etree.fromstring(response.content).find('projectors'):
+			self.failUnlessEqual(projector_element.get('command_ok'), 'True')
+			self.failUnlessEqual(projector_element.get('power_state'), PJLinkProtocol.POWER_ON_STATUS)
+		for projector in self.projectors:
+			self.failUnlessEqual(projector.power_state, PJLinkProtocol.POWER_ON_STATUS)
+			self.failUnless(projector.video_mute)
+
+class ProjectorHistoryTest(TestCase):
+	def setUp(self):
+		self.projector = MockPJLinkProjector()
+		self.projector.start()
+		seconds_to_wait = 5
+		while self.projector.running == False and seconds_to_wait > 0:
+			time.sleep(0.1)
+			seconds_to_wait -= 0.1
+		host, port = self.projector.server.getsockname()
+		self.proj_entry = Projector.objects.create(name=self.projector.projector_name, pjlink_host=host, pjlink_port=port, pjlink_password=self.projector.password)
+
+	def tearDown(self):
+		self.projector.stop_server()
+
+	def test_samples(self):
+		down_entry = Projector.objects.create(name='Down', pjlink_host='127.0.0.1', pjlink_port=1)
+		samples = projector_history.collect_samples([self.proj_entry, down_entry], timeout=1)
+		self.failUnlessEqual(samples[0].power_state, self.projector.power_state)
+		self.failUnlessEqual(samples[0].lamp_hours, '100,500,0')
+		self.failUnlessEqual(samples[0].max_lamp_hours, 500)
+		self.failUnlessEqual(samples[0].error_status, '00000')
+		self.failUnlessEqual(samples[1].power_state, None)
+		self.failUnlessEqual(samples[1].max_lamp_hours, None)
+		self.failUnlessEqual(ProjectorSample.objects.count(), 2)
+		self.failUnlessEqual(projector_history.sample_alerts(samples), [])
+
+		# alerts fire once, when a lamp crosses a threshold or a component starts failing
+		self.projector.lamps[1][0] = 2001
+		self.projector.errors[1][1] = PJLinkProtocol.ERROR_STATUS_ERROR
+		samples = projector_history.collect_samples([self.proj_entry], timeout=1)
+		alerts = projector_history.sample_alerts(samples)
+		self.failUnlessEqual(len(alerts), 2, alerts)
+		self.failUnless('2000 hour threshold' in alerts[0])
+		self.failUnless('lamp error' in alerts[1])
+		samples = projector_history.collect_samples([self.proj_entry], timeout=1)
+		self.failUnlessEqual(projector_history.sample_alerts(samples), [])
+
+		# an unreachable sample in between does not make them fire again
+		port = self.proj_entry.pjlink_port
+		self.proj_entry.pjlink_port = 1
+		projector_history.collect_samples([self.proj_entry], timeout=1)
+		self.proj_entry.pjlink_port = port
+		samples = projector_history.collect_samples([self.proj_entry], timeout=1)
+		self.failUnlessEqual(projector_history.sample_alerts(samples), [])
+
+	def test_held_alerts(self):
+		task = ProjectorHistoryTask()
+		sent = []
+		task.deliver_alert = lambda subject, message: sent.append((subject, message)) or True
+		task.send_alert('First', 'one')
+		task.last_alert_datetime = datetime.datetime.now()
+		task.send_alert('Second', 'two')
+		task.send_alert('Third', 'three')
+		task.send_alert('Third', 'three')
+		task.send_held_alerts()
+		self.failUnlessEqual(sent, [('First', 'one')])
+		task.last_alert_datetime = datetime.datetime.now() - datetime.timedelta(minutes=11)
+		task.send_held_alerts()
+		self.failUnlessEqual(len(sent), 2)
+		self.failUnless('Second' in sent[1][0] and 'three' in sent[1][1], sent)
+		self.failUnlessEqual(task.held_alerts, [])
+
+	def test_roll_up(self):
+		day = datetime.datetime(2011, 6, 1)
+		for hour in range(48):
+			for minute in (0, 20, 40):
+				created = day + datetime.timedelta(hours=hour, minutes=minute)
+				power_state = hour % 2 and PJLinkProtocol.POWER_ON_STATUS or PJLinkProtocol.POWER_OFF_STATUS
+				error_status = hour == 30 and '01000' or '00000'
+				ProjectorSample.objects.create(projector=self.proj_entry, created=created, power_state=power_state, max_lamp_hours=1000 + hour, error_status=error_status)
+		ProjectorSample.objects.create(projector=self.proj_entry, created=day + datetime.timedelta(hours=10, minutes=1))
+
+		# the unfinished hour and day are left alone
+		projector_history.roll_up(day + datetime.timedelta(hours=47, minutes=50))
+		hourly = ProjectorRollup.objects.filter(projector=self.proj_entry, period='hour').order_by('start')
+		self.failUnlessEqual(hourly.count(), 47)
+		self.failUnlessEqual(hourly[10].sample_count, 4)
+		self.failUnlessEqual(hourly[10].reachable_count, 3)
+		self.failUnlessEqual(hourly[11].power_on_count, 3)
+		self.failUnlessEqual(hourly[11].min_lamp_hours, 1011)
+		daily = ProjectorRollup.objects.filter(projector=self.proj_entry, period='day')
+		self.failUnlessEqual(daily.count(), 1)
+		self.failUnlessEqual(daily[0].sample_count, 73)
+		self.failUnlessEqual(daily[0].power_on_count, 36)
+		self.failUnlessEqual((daily[0].min_lamp_hours, daily[0].max_lamp_hours), (1000, 1023))
+		self.failUnlessEqual(daily[0].error_status, '00000')
+
+		# rolling up again only adds the newly finished periods, and old samples and hourly rollups are pruned
+		projector_history.roll_up(day + datetime.timedelta(days=9))
+		self.failUnlessEqual(ProjectorRollup.objects.filter(projector=self.proj_entry, period='hour').count(), 48)
+		daily = ProjectorRollup.objects.filter(projector=self.proj_entry, period='day').order_by('start')
+		self.failUnlessEqual(daily.count(), 2)
+		self.failUnlessEqual(daily[1].error_status, '01000')
+		self.failUnlessEqual(ProjectorSample.objects.filter(projector=self.proj_entry).count(), 0)
+		projector_history.roll_up(day + datetime.timedelta(days=100))
+		self.failUnlessEqual(ProjectorRollup.objects.filter(projector=self.proj_entry, period='hour').count(), 0)
+		self.failUnlessEqual(ProjectorRollup.objects.filter(projector=self.proj_entry, period='day').count(), 2)
+
+		self.failUnlessEqual(projector_history.history(self.proj_entry, day, day + datetime.timedelta(days=365)).count(), 2)
+		self.failUnlessEqual(projector_history.history(self.proj_entry, day, day + datetime.timedelta(days=1), 'day').count(), 1)
+		self.failUnlessEqual(projector_history.history(self.proj_entry, day, day + datetime.timedelta(days=1)).count(), 0)
+		self.failUnlessRaises(ValueError, projector_history.history, self.proj_entry, day, day, 'week')
+
 class PJLinkTest(TestCase):
 	def setUp(self):
 		self.projector = MockPJLinkProjector()
@@ -372,6 +488,51 @@ class PJLinkTest(TestCase):
 		self.failUnlessEqual(controller.query_other_info(), self.projector.other_info)
 		self.failUnlessEqual(controller.query_class_info(), self.projector.class_info)
 		
+	def test_session(self):
+		seconds_to_wait = 5
+		while self.projector.running == False and seconds_to_wait > 0:
+			time.sleep(1)
+			seconds_to_wait -= 1
+		self.failUnless(self.projector.running)
+		host, port = self.projector.server.getsockname()
+
+		bad_controller = PJLinkController(host, port, password='badPassword')
+		try:
+			bad_controller.open_session()
+			bad_controller.query_name()
+			self.fail() # should have thrown an authentication exception
+		except PJLinkAuthenticationException:
+			pass
+		self.failUnlessEqual(bad_controller.session.sock, None)
+		bad_controller.close_session()
+
+		controller = PJLinkController(host, port, password=self.projector.password)
+		connection_count = self.projector.connection_count
+		controller.open_session()
+		try:
+			self.failUnlessEqual(controller.query_name(), self.projector.projector_name)
+			self.failUnless(controller.power_on())
+			self.failUnlessEqual(controller.query_power(), PJLinkProtocol.POWER_ON_STATUS)
+			self.failUnlessEqual(controller.query_mute(), (False, False))
+			self.failUnlessEqual(len(controller.query_lamps()), len(self.projector.lamps))
+		finally:
+			controller.close_session()
+		self.failUnlessEqual(self.projector.connection_count, connection_count + 1)
+
+		# without a session each command has its own connection
+		controller.query_name()
+		controller.query_power()
+		self.failUnlessEqual(self.projector.connection_count, connection_count + 3)
+
+		session = PJLinkSession(host, port, self.projector.password)
+		session.__enter__()
+		try:
+			responses = session.send_command_lines([PJLinkCommandLine(PJLinkProtocol.NAME, PJLinkProtocol.QUERY), PJLinkCommandLine(PJLinkProtocol.CLASS_INFO, PJLinkProtocol.QUERY)])
+		finally:
+			session.__exit__(None, None, None)
+		self.failUnlessEqual([response.data for response in responses], [self.projector.projector_name, self.projector.class_info])
+		self.failUnlessEqual(session.sock, None)
+
 	def test_codecs(self):
 		command1 = PJLinkCommandLine(PJLinkProtocol.POWER, PJLinkProtocol.ON)
 		self.failUnlessEqual(command1.version, 1)
@@ -395,4 +556,311 @@ class PJLinkTest(TestCase):
 		self.failUnlessEqual(response1.command, response2.command)
 		self.failUnlessEqual(response1.data, response2.data)
 
+class BACnetTest(TestCase):
+	def setUp(self):
+		self.device = MockBACnetDevice()
+		self.device.start()
+		self.client = BACnetClient(port=self.device.address()[1], broadcast_address='127.0.0.1', timeout=0.5, retries=1, listen_port=0)
+
+	def tearDown(self):
+		self.client.close()
+		self.device.stop()
+
+	def test_client(self):
+		control = BacnetControl(self.client)
+		self.failUnlessEqual(control.read_analog_output(self.device.device_id, 2), 50.0)
+		self.failUnlessEqual(self.device.who_is_count, 1)
+		control.write_analog_output_int(self.device.device_id, '1', '75')
+		self.failUnlessEqual(self.device.values[1], 75.0)
+		self.failUnlessEqual(control.read_analog_output(self.device.device_id, 1), 75.0)
+		# the device's address is remembered, so each request is one datagram each way
+		self.failUnlessEqual(self.device.who_is_count, 1)
+		self.failUnlessEqual(self.device.request_count, 3)
+
+		try:
+			control.read_analog_output(self.device.device_id, 42)
+			self.fail('Reading an unknown object should raise an exception')
+		except BACnetErrorException, e:
+			self.failUnlessEqual(e.detail, (1, 31))
+
+		self.device.ignore_requests = True
+		self.failUnlessRaises(BACnetTimeoutException, control.read_analog_output, self.device.device_id, 1)
+		self.failIf(self.device.device_id in self.client.bindings)
+		self.device.ignore_requests = False
+		self.failUnlessEqual(control.read_analog_output(self.device.device_id, 1), 75.0)
+		self.failUnlessEqual(self.device.who_is_count, 2)
+
+		# devices with static addresses are never looked up
+		static_client = BACnetClient(port=1, broadcast_address='127.0.0.1', local_port=0, timeout=0.5, device_addresses={ self.device.device_id:self.device.address() })
+		try:
+			self.failUnlessEqual(static_client.read_analog_output(self.device.device_id, 3), 100.0)
+		finally:
+			static_client.close()
+		self.failUnlessEqual(self.device.who_is_count, 2)
+		self.failUnlessRaises(BACnetTimeoutException, self.client.read_analog_output, 12345, 1)
+
+	def test_shared_listen_port(self):
+		# clients in several processes listen on the BACnet port together and each learn the I-Am announcements sent to it
+		probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		probe.bind(('127.0.0.1', 0))
+		listen_port = probe.getsockname()[1]
+		probe.close()
+		clients = [BACnetClient(port=self.device.address()[1], broadcast_address='127.0.0.1', timeout=0.5, listen_port=listen_port) for i in range(2)]
+		try:
+			for client in clients: client.open()
+			self.failIfEqual(clients[0].local_address(), clients[1].local_address())
+			for client in clients: self.failIfEqual(client.listen_sock, None)
+			announcer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			i_am = BACnetAPDU(BACnetProtocol.UNCONFIRMED_REQUEST, BACnetProtocol.I_AM, body=i_am_body(88000))
+			announcer.sendto(encode_bvlc(encode_npdu(i_am.encode())), ('127.0.0.1', listen_port))
+			announcer.close()
+			for client in clients: client.receive_notifications(0.2)
+			self.failUnless(88000 in clients[0].bindings or 88000 in clients[1].bindings)
+		finally:
+			for client in clients: client.close()
+
+	def test_read_property_multiple(self):
+		for index in range(4, 80): self.device.values[index] = float(index)
+		control = BacnetControl(self.client)
+		lights = [BACNetLight.objects.create(name='Light %s' % index, device_id=self.device.device_id, property_id=index) for index in range(1, 80)]
+		lights.append(BACNetLight.objects.create(name='Missing', device_id=self.device.device_id, property_id=500))
+		values = control.read_light_values(lights)
+		self.failUnlessEqual(self.device.request_count, 2) # two batches of ReadPropertyMultiple
+		self.failUnlessEqual(values[lights[1].id], 50.0)
+		self.failUnlessEqual(values[lights[40].id], 41.0)
+		self.failUnlessEqual(values[lights[-1].id], None)
+
+		# devices without ReadPropertyMultiple are read one light at a time
+		self.device.supports_read_property_multiple = False
+		self.device.request_count = 0
+		self.failUnlessEqual(control.read_light_values(lights[:3]), { lights[0].id:0.0, lights[1].id:50.0, lights[2].id:100.0 })
+		self.failUnlessEqual(self.device.request_count, 4)
+		self.failUnless(self.device.device_id in self.client.single_read_devices)
+
+		# a device which doesn't answer gives no values, without holding up the others
+		unplugged = BACNetLight.objects.create(name='Unplugged', device_id=999, property_id=1)
+		values = control.read_light_values([unplugged, lights[0]])
+		self.failUnlessEqual(values, { unplugged.id:None, lights[0].id:0.0 })
+
+	def test_light_value_api(self):
+		light = BACNetLight.objects.create(name='Lobby', device_id=self.device.device_id, property_id=2)
+		client = Client()
+		response = client.post('/api/bnlight/%s/value/' % light.id, { 'value':'75', 'fade':'slowly' })
+		self.failUnlessEqual(response.status_code, 400, 'status was %s' % response.status_code)
+		response = client.post('/api/bnlight/%s/value/' % light.id, { 'value':'bright' })
+		self.failUnlessEqual(response.status_code, 400, 'status was %s' % response.status_code)
+		self.failUnlessEqual(self.device.request_count, 0)
+
+	def test_cov(self):
+		manager = BACnetCOVManager(self.client, lifetime=60, poll_interval=0)
+		light = BACNetLight.objects.create(name='Lobby', device_id=self.device.device_id, property_id=2)
+		manager.watch_lights([light])
+		manager.renew_subscriptions()
+		self.failUnlessEqual(len(self.device.subscriptions), 1)
+		self.client.receive_notifications(0.2)
+		self.failUnlessEqual(manager.cached_value(light.device_id, light.property_id), 50.0)
+
+		# a change made at the panel is pushed to us, so reads don't go to the device
+		self.device.set_value(2, 20.0)
+		self.client.receive_notifications(0.2)
+		self.device.request_count = 0
+		control = BacnetControl(self.client, manager)
+		self.failUnlessEqual(control.read_analog_output(light.device_id, light.property_id), 20.0)
+		self.failUnlessEqual(control.read_light_values([light]), { light.id:20.0 })
+		self.failUnlessEqual(self.device.request_count, 0)
+
+		# a value which hasn't been confirmed for max_age isn't served, and a change we weren't told about means subscribing again
+		self.device.values[2] = 30.0
+		manager.lights[(light.device_id, light.property_id)].updated -= manager.max_age + 1
+		self.failUnlessEqual(manager.cached_value(light.device_id, light.property_id), None)
+		manager.poll()
+		self.failUnlessEqual(manager.cached_value(light.device_id, light.property_id), 30.0)
+		self.failUnlessEqual(manager.lights[(light.device_id, light.property_id)].next_subscribe, 0)
+		manager.cancel_subscriptions()
+		self.failUnlessEqual(self.device.subscriptions, {})
+
+		# devices which refuse subscriptions are polled instead
+		self.device.supports_cov = False
+		polled = BACnetCOVManager(self.client, lifetime=60, poll_interval=0)
+		self.client.notification_handler = polled.handle_notification
+		polled.watch(light.device_id, light.property_id)
+		polled.renew_subscriptions()
+		self.failUnless(self.device.device_id in polled.polled_devices)
+		self.failUnlessEqual(polled.cached_value(light.device_id, light.property_id), None)
+		polled.poll()
+		self.failUnlessEqual(polled.cached_value(light.device_id, light.property_id), 30.0)
+
+	def test_fades(self):
+		second_device = MockBACnetDevice(device_id=77001, values=dict([(index, 0.0) for index in range(1, 25)]))
+		second_device.start()
+		try:
+			for index in range(4, 25): self.device.values[index] = 0.0
+			lights = []
+			for device in (self.device, second_device):
+				lights.extend([BACNetLight.objects.create(name='Light %s %s' % (device.device_id, index), device_id=device.device_id, property_id=index) for index in range(1, 25)])
+			scene = LightScene.objects.create(name='Evening')
+			for light in lights: LightSceneLevel.objects.create(scene=scene, light=light, level=80)
+
+			fade_client = BACnetClient(port=1, local_port=0, timeout=0.5, device_addresses={ self.device.device_id:self.device.address(), second_device.device_id:second_device.address() })
+			control = BacnetControl(fade_client)
+			engine = FadeEngine(control, frame_rate=20)
+			engine.start()
+			try:
+				start = time.time()
+				scene.fade_to(1, engine)
+				self.failUnless(engine.wait(5))
+				elapsed = time.time() - start
+			finally:
+				engine.stop()
+			self.failUnlessEqual(sorted(set(self.device.values.values() + second_device.values.values())), [80.0])
+			# dozens of lights on two devices keep up with 10 frames a second, with one write per device per frame
+			self.failUnless(engine.frame_count >= 10 * elapsed * 0.8, '%s frames in %s seconds' % (engine.frame_count, elapsed))
+			self.failUnless(engine.request_count <= engine.frame_count * 2)
+		finally:
+			fade_client.close()
+			second_device.stop()
+
+		fade = LightFade(lights[0], 20, 80, 100.0, 10)
+		self.failUnlessEqual((fade.value_at(99.0), fade.value_at(105.0), fade.value_at(200.0)), (20.0, 50.0, 80.0))
+
+		# a fade which is interrupted carries on from where it got to
+		control = BacnetControl(self.client)
+		engine = FadeEngine(control, frame_rate=20)
+		engine.fade([(lights[0], 0)], 100)
+		engine.frame(time.time() + 50)
+		self.failUnless(35 < self.device.values[1] < 45, self.device.values[1])
+		engine.fade([(lights[0], 100)], 0)
+		engine.frame()
+		self.failUnlessEqual(self.device.values[1], 100.0)
+		self.failIf(engine.is_fading())
+
+		# devices without WritePropertyMultiple are written one light at a time
+		self.device.supports_write_property_multiple = False
+		self.failUnlessEqual(control.write_light_values([(lights[0], 10), (lights[1], 20)]), { lights[0].id:True, lights[1].id:True })
+		self.failUnlessEqual((self.device.values[1], self.device.values[2]), (10.0, 20.0))
+		self.failUnless(self.device.device_id in self.client.single_write_devices)
+
+	def test_codecs(self):
+		for tag_number, value in [(BACnetProtocol.NULL, None), (BACnetProtocol.BOOLEAN, True), (BACnetProtocol.UNSIGNED, 70000), (BACnetProtocol.SIGNED, -300), (BACnetProtocol.REAL, 12.5), (BACnetProtocol.ENUMERATED, 3), (BACnetProtocol.OBJECT_IDENTIFIER, (BACnetProtocol.ANALOG_VALUE, 12)), (BACnetProtocol.CHARACTER_STRING, u'Lobby')]:
+			self.failUnlessEqual(decode_values(encode_application(tag_number, value) + closing_tag(0), 0, 0)[0], [value])
+		self.failUnlessEqual(decode_who_is(who_is_body(5, 500)), (5, 500))
+		self.failUnlessEqual(decode_who_is(who_is_body()), (None, None))
+		self.failUnlessEqual(decode_i_am(i_am_body(4194302)), 4194302)
+		body = write_property_body(BACnetProtocol.ANALOG_VALUE, 7, BACnetProtocol.PRESENT_VALUE, encode_application(BACnetProtocol.REAL, 20.0), priority=8)
+		self.failUnlessEqual(decode_write_property(body), ((BACnetProtocol.ANALOG_VALUE, 7), BACnetProtocol.PRESENT_VALUE, None, [20.0], 8))
+		references = [(BACnetProtocol.ANALOG_VALUE, 1, BACnetProtocol.PRESENT_VALUE), (BACnetProtocol.ANALOG_VALUE, 1, 77), (BACnetProtocol.ANALOG_VALUE, 2, BACnetProtocol.PRESENT_VALUE)]
+		self.failUnlessEqual(decode_read_property_multiple(read_property_multiple_body(references)), references)
+		results = decode_read_property_multiple_ack(read_property_multiple_ack_body([(2, 1, 85, encode_application(BACnetProtocol.REAL, 1.5)), (2, 1, 77, (2, 32)), (2, 2, 85, encode_application(BACnetProtocol.REAL, 3.0) + encode_application(BACnetProtocol.REAL, 4.0))]))
+		self.failUnlessEqual(results[(2, 1, 85)], 1.5)
+		self.failUnlessEqual(results[(2, 1, 77)].detail, (2, 32))
+		self.failUnlessEqual(results[(2, 2, 85)], [3.0, 4.0])
+		error = BACnetAPDU.decode(BACnetAPDU(BACnetProtocol.ERROR, BACnetProtocol.READ_PROPERTY, 9, detail=(2, 32)).encode())
+		self.failUnlessEqual((error.pdu_type, error.service, error.invoke_id, error.detail), (BACnetProtocol.ERROR, BACnetProtocol.READ_PROPERTY, 9, (2, 32)))
+		writes = [(BACnetProtocol.ANALOG_VALUE, 1, BACnetProtocol.PRESENT_VALUE, encode_application(BACnetProtocol.REAL, 10.0), None), (BACnetProtocol.ANALOG_VALUE, 2, BACnetProtocol.PRESENT_VALUE, encode_application(BACnetProtocol.REAL, 20.0), 8)]
+		error = BACnetAPDU.decode(chr(BACnetProtocol.ERROR << 4) + chr(4) + chr(BACnetProtocol.WRITE_PROPERTY_MULTIPLE) + opening_tag(0) + encode_application(BACnetProtocol.ENUMERATED, 2) + encode_application(BACnetProtocol.ENUMERATED, 32) + closing_tag(0))
+		self.failUnlessEqual(error.detail, (2, 32))
+		self.failUnlessEqual(decode_write_property_multiple(write_property_multiple_body(writes)), [(BACnetProtocol.ANALOG_VALUE, 1, BACnetProtocol.PRESENT_VALUE, [10.0], None), (BACnetProtocol.ANALOG_VALUE, 2, BACnetProtocol.PRESENT_VALUE, [20.0], 8)])
+		self.failUnlessEqual(decode_subscribe_cov(subscribe_cov_body(17, BACnetProtocol.ANALOG_VALUE, 3, 300)), (17, (BACnetProtocol.ANALOG_VALUE, 3), False, 300))
+		self.failUnlessEqual(decode_subscribe_cov(subscribe_cov_body(17, BACnetProtocol.ANALOG_VALUE, 3)), (17, (BACnetProtocol.ANALOG_VALUE, 3), None, None))
+		body = cov_notification_body(17, 77000, BACnetProtocol.ANALOG_VALUE, 3, 120, [(BACnetProtocol.PRESENT_VALUE, encode_application(BACnetProtocol.REAL, 42.5))])
+		self.failUnlessEqual(decode_cov_notification(body), (17, 77000, (BACnetProtocol.ANALOG_VALUE, 3), 120, { BACnetProtocol.PRESENT_VALUE:42.5 }))
+
+class CrestonTest(TestCase):
+	def setUp(self):
+		self.controller = MockCrestonController()
+		self.controller.start()
+		host, port = self.controller.address()
+		self.connection = CrestonConnection(host, port, timeout=2, keepalive=0.3)
+		self.control = CrestonControl(host, port, connection=self.connection)
+
+	def tearDown(self):
+		self.connection.close()
+		self.controller.stop()
+
+	def test_connection(self):
+		self.failUnless(self.control.can_connect())
+		self.failUnlessEqual(self.control.query_status()['High'], '55000')
+		self.failUnlessEqual(self.control.raise_high(), 'High-56000')
+		self.failUnlessEqual(self.control.send_and_query_status('DimLvlDown'), ('Low-61965', { 'High':'56000', 'Low':'61965', 'Current':'56000', 'Wake':'5:00 AM', 'Sleep':'1:00 AM', 'Lamp1':'2-1468', 'Lamp2':'2-1469' }))
+		self.failUnlessEqual(self.control.toggle_dim(), True)
+		self.controller.fragment = True
+		self.failUnlessEqual(self.control.query_status()['Current'], '61965')
+		self.controller.fragment = False
+		self.failUnlessEqual(self.controller.connection_count, 1)
+
+		# commands from many threads take turns on the one connection
+		def press():
+			for i in range(5):
+				self.control.raise_high()
+				self.control.lower_high()
+		threads = [threading.Thread(target=press) for i in range(8)]
+		for thread in threads: thread.start()
+		for thread in threads: thread.join()
+		self.failUnlessEqual(self.controller.high, 56000)
+		self.failUnlessEqual(self.controller.connection_count, 1)
+
+		# an idle connection is pinged and a dropped one is reopened
+		command_count = self.controller.command_count
+		time.sleep(0.8)
+		self.failUnless(self.controller.command_count > command_count)
+		self.controller.drop_connections()
+		self.failUnlessEqual(self.control.ping(), 'Pong')
+		self.failUnlessEqual(self.controller.connection_count, 2)
+
+		# lines left over from an earlier response aren't taken for the next one
+		self.connection.buffer = 'Low-61965\r\nLamp2-2-1469\r\n'
+		self.failUnlessEqual(self.control.ping(), 'Pong')
+
+		# once the controller is gone, reconnecting waits for the backoff
+		self.controller.stop()
+		self.controller.join()
+		self.connection.close()
+		self.failUnlessEqual(self.control.query_status(), None)
+		start = time.time()
+		self.failUnlessEqual(self.control.ping(), None)
+		self.failUnless(time.time() - start < 0.5)
+		self.failUnless(self.connection.retry_at > time.time())
+
+	def test_status_poller(self):
+		cache.clear()
+		poller = CrestonStatusPoller(self.control, interval=0.2, idle_seconds=0.5)
+		poller.start()
+		try:
+			def wait_for_status(version):
+				deadline = time.time() + 2
+				while time.time() < deadline:
+					new_version, status = poller.request_status()
+					if new_version != version: return (new_version, status)
+					time.sleep(0.05)
+				self.fail('The status did not change')
+
+			# however many pages are asking, the controller is queried once per interval
+			self.failUnlessEqual(poller.request_status(), (None, None))
+			version, status = wait_for_status(None)
+			self.failUnlessEqual(status['High'], '55000')
+			self.failUnlessEqual(version, status_version(status))
+			self.failUnlessEqual(poller.poll_count, 1)
+
+			# a poller in another process uses the status in the cache instead of asking the controller again
+			other = CrestonStatusPoller(self.control, interval=0.2, idle_seconds=0.5)
+			other.poll()
+			self.failUnlessEqual(other.poll_count, 0)
+			self.failUnlessEqual(other.request_status(), (version, status))
+
+			self.controller.high = 58000 # as if someone used the panel
+			start = time.time()
+			version, status = wait_for_status(version)
+			self.failUnlessEqual(status['High'], '58000')
+			self.failUnless(time.time() - start < 0.5)
+			self.failUnless(poller.poll_count <= 2 + (time.time() - start) / 0.2)
+
+			# nobody is watching, so the controller is left alone and the status expires
+			time.sleep(0.8)
+			poll_count = poller.poll_count
+			time.sleep(0.5)
+			self.failUnlessEqual(poller.poll_count, poll_count)
+			self.failUnlessEqual(cached_status(), (None, None, None))
+		finally:
+			poller.stop()
+
 # Copyright 2009 GORBET + BANERJEE (http://www.gorbetbanerjee.com/) Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
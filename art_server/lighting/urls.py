@@ -8,5 +8,6 @@ urlpatterns = patterns('',
 	(r'^bnlight/(?P<id>[\d]+)/$', 'lighting.views.bacnet_light'),
 	(r'^projector/(?P<id>[\d]+)/$', 'lighting.views.projector'),
 	(r'^creston/$', 'lighting.views.creston'),
+	(r'^creston/status/$', 'lighting.views.creston_status'),
 	(r'^$', 'lighting.views.index'),
 )
@@ -3,6 +3,7 @@ import sys
 import datetime
 import calendar
 import traceback
+import logging
 import simplejson as json
 
 from django.conf import settings
@@ -25,41 +26,42 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.template.loader import render_to_string
 from django.utils import feedgenerator
 
-from bacnet_control import BacnetControl
+from bacnet_control import BacnetControl, BACNetLightValue
 from creston_control import CrestonControl
+from creston_status import shared_status_poller
 from pjlink import PJLinkController, PJLinkProtocol
-from api_views import ProjectorInfo, LampInfo
+from projector_state import ProjectorInfo, LampInfo, get_projector_info, refresh_projector_info, projector_controller
 
 from models import *
 from forms import *
 
 @staff_member_required
 def index(request):
-	return render_to_response('lighting/index.html', { 'bacnet_lights':BACNetLight.objects.all(), 'projectors':Projector.objects.all() }, context_instance=RequestContext(request))
+	lights = BACNetLight.objects.all()
+	values = BacnetControl().read_light_values(lights)
+	light_values = [BACNetLightValue(light, values[light.id]) for light in lights]
+	return render_to_response('lighting/index.html', { 'bacnet_lights':light_values, 'projectors':Projector.objects.all() }, context_instance=RequestContext(request))
+
+CRESTON_ACTION_COMMANDS = { 'high-up':'HighLvlUp', 'high-down':'HighLvlDown', 'low-up':'DimLvlUp', 'low-down':'DimLvlDown' }
 
 @staff_member_required
 def creston(request):
 	control = CrestonControl(settings.CRESTON_CONTROL_HOST)
 	message = None
 	control_info = None
-	return_json = False
 	try:
 		if request.method == 'POST':
 			command_form = CrestonCommandForm(request.POST)
 			if request.POST.get('action', None): 
 				action = request.POST.get('action')
-				if action == 'high-up':
-					control.raise_high()
-				elif action == 'high-down':
-					control.lower_high()
-				elif action == 'low-up':
-					control.raise_low()
-				elif action == 'low-down':
-					control.lower_low()
-				else:
+				if action not in CRESTON_ACTION_COMMANDS:
 					print "Error: unknown action: %s" % action
-					raise HttpResponseServeError('unknown action: %s' % action)
-				return_json = True
+					return HttpResponseServerError('unknown action: %s' % action)
+				# the command and the status query go to the controller together
+				result, control_info = control.send_and_query_status(CRESTON_ACTION_COMMANDS[action])
+				if control_info == None: return HttpResponseServerError('Could not communicate with the controller.')
+				shared_status_poller().publish(control_info) # so the other open pages see the change right away
+				return HttpResponse(json.dumps(control_info), mimetype='application/json')
 			elif request.POST.get('command', None):
 				if command_form.is_valid():
 					command = command_form.cleaned_data['command']
@@ -76,20 +78,26 @@ def creston(request):
 		else:
 			command_form = CrestonCommandForm()
 			
-		try:
-			control_info = control.query_status()
-			#control_info = {'High': '55000', 'Current': '63098', 'Wake': '5:00 AM', 'Low': '63098', 'Lamp1': '2-1468', 'Sleep': '1:00 AM', 'Lamp2': '2-1469'}
-		except:
-			message = 'Could not communicate with the controller.'
-		if return_json: return HttpResponse(json.dumps(control_info), mimetype='application/json')
-		return render_to_response('lighting/creston.html', {'command_form':command_form, 'control_info':control_info}, context_instance=RequestContext(request))
+		# the page shows the status every process shares through the cache and polls creston_status for changes
+		status_version, control_info = shared_status_poller().request_status()
+		#control_info = {'High': '55000', 'Current': '63098', 'Wake': '5:00 AM', 'Low': '63098', 'Lamp1': '2-1468', 'Sleep': '1:00 AM', 'Lamp2': '2-1469'}
+		if status_version != None and control_info == None: message = 'Could not communicate with the controller.'
+		status_interval = int(getattr(settings, 'CRESTON_STATUS_INTERVAL', 2) * 1000)
+		return render_to_response('lighting/creston.html', {'command_form':command_form, 'control_info':control_info, 'status_version':status_version, 'status_interval':status_interval, 'message':message}, context_instance=RequestContext(request))
 	except:
 		traceback.print_exc()
 		
+@staff_member_required
+def creston_status(request):
+	"""Returns the controller's cached status as JSON like {"version":"9f86d081884c", "status":{"High":"55000", ...}} without waiting on the controller.
+	The version changes whenever the status does.  The status is null when the controller can't be reached and both are null until the first query."""
+	version, status = shared_status_poller().request_status()
+	return HttpResponse(json.dumps({ 'version':version, 'status':status }), mimetype='application/json')
+
 @staff_member_required
 def bacnet_light(request, id):
 	light = get_object_or_404(BACNetLight, pk=id)
-	control = BacnetControl(settings.BACNET_BIN_DIR)
+	control = BacnetControl()
 	if request.method == 'POST':
 		light_control_form = LightControlForm(request.POST)
 		if light_control_form.is_valid():
@@ -100,7 +108,7 @@ def bacnet_light(request, id):
 				logging.exception('Could not write the posted value (%s) for bacnet device %s property %s' % (new_value, light.device_id, light.property_id))
 				return HttpResponseServerError('Could not write the posted value (%s) for bacnet device %s property %s\n\n%s' % (new_value, light.device_id, light.property_id, sys.exc_info()[1]))
 	try:
-		light_value = control.read_analog_output(light.device_id, light.property_id)[1]
+		light_value = control.read_analog_output(light.device_id, light.property_id)
 		light_control_form = LightControlForm(data={'light_value':light_value})
 	except:
 		logging.exception('Could not read the analog output for bacnet device %s property %s' % (light.device_id, light.property_id))
@@ -111,15 +119,20 @@ def bacnet_light(request, id):
 @staff_member_required
 def projector(request, id):
 	projector = get_object_or_404(Projector, pk=id)
-	controller = PJLinkController(projector.pjlink_host, projector.pjlink_port, projector.pjlink_password)
+	controller = projector_controller(projector)
+	info = None
 	try:
 		if request.method == 'POST':
 			new_event_form = ProjectorEventForm(request.POST)
 			if request.POST.get('power', None) == PJLinkProtocol.POWER_ON_STATUS:
+				controller.open_session() # shared by the command and the refresh below
 				controller.power_on()
+				info = refresh_projector_info(projector, controller)
 				new_event_form = ProjectorEventForm(initial={ 'device':projector.id })
 			elif request.POST.get('power', None) == PJLinkProtocol.POWER_OFF_STATUS:
+				controller.open_session()
 				controller.power_off()
+				info = refresh_projector_info(projector, controller)
 				new_event_form = ProjectorEventForm(initial={ 'device':projector.id })
 			elif request.POST.get('action', None) == 'delete' and request.POST.get('event_id', None):
 				event = ProjectorEvent.objects.get(pk=int(request.POST.get('event_id', None)))
@@ -131,11 +144,10 @@ def projector(request, id):
 		else:
 			new_event_form = ProjectorEventForm(initial={ 'device':projector.id })
 			
-		audio_mute, video_mute = controller.query_mute()
-		info = ProjectorInfo(controller.query_power(), controller.query_name(), controller.query_manufacture_name(), controller.query_product_name(), controller.query_other_info(), audio_mute, video_mute)
-		for lamp in controller.query_lamps(): info.lamps.append(LampInfo(lamp[0], lamp[1]))
+		if info == None: info = get_projector_info(projector)
 	except:
 		logging.exception('Could not communicate with the projector')
 		info = None
+	controller.close_session()
 
 	return render_to_response('lighting/projector.html', { 'events':ProjectorEvent.objects.filter(device=projector), 'new_event_form':new_event_form, 'projector':projector, 'projector_info':info }, context_instance=RequestContext(request))
@@ -19,11 +19,17 @@ urlpatterns = patterns('',
 	(r'^api/artcam/(?P<artcam_id>[\d]+)/photo/latest/$', 'artcam.api_views.latest_photo'),
 
 	(r'^api/bnlight/$', 'lighting.api_views.bacnet_lights'),
+	(r'^api/bnlight/values/$', 'lighting.api_views.bacnet_light_values'),
 	(r'^api/bnlight/(?P<id>[\d]+)/$', 'lighting.api_views.bacnet_light'),
 	(r'^api/bnlight/(?P<id>[\d]+)/value/$', 'lighting.api_views.bacnet_light_value'),
+	(r'^api/light-scene/$', 'lighting.api_views.light_scenes'),
+	(r'^api/light-scene/(?P<id>[\d]+)/$', 'lighting.api_views.light_scene'),
 	(r'^api/projector/$', 'lighting.api_views.projectors'),
 	(r'^api/projector/(?P<id>[\d]+)/$', 'lighting.api_views.projector'),
 	(r'^api/projector/(?P<id>[\d]+)/info/$', 'lighting.api_views.projector_info'),
+	(r'^api/projector/(?P<id>[\d]+)/history/$', 'lighting.api_views.projector_history_view'),
+	(r'^api/projector-group/$', 'lighting.api_views.projector_groups'),
+	(r'^api/projector-group/(?P<id>[\d]+)/$', 'lighting.api_views.projector_group'),
 
 	(r'^api/aodb/$', 'airport.views.snapshot_list'),
 	(r'^api/aodb/latest\.xml$', 'airport.views.latest_snapshot'),
@@ -32,15 +38,20 @@ urlpatterns = patterns('',
 
 	(r'^api/audio/ab-device/$', 'incus.api_views.ab_devices'),
 	(r'^api/audio/ab-device/(?P<id>[\d]+)/$', 'incus.api_views.ab_device'),
+	(r'^api/audio/ab-device/(?P<id>[\d]+)/state/$', 'incus.api_views.ab_device_state'),
 	(r'^api/audio/ab-group/(?P<id>[\d]+)/$', 'incus.api_views.ab_group'),
 	(r'^api/audio/ab-group/(?P<id>[\d]+)/gain/$', 'incus.api_views.ab_group_gain'),
 	(r'^api/audio/ab-channel/(?P<id>[\d]+)/gain/$', 'incus.api_views.ab_channel_gain'),
 	(r'^api/audio/ab-channel/(?P<id>[\d]+)/mute/$', 'incus.api_views.ab_channel_mute'),
 	(r'^api/audio/emergency/$', 'incus.api_views.emergency'),
+	(r'^api/audio/ab-preset/$', 'incus.api_views.ab_presets'),
+	(r'^api/audio/ab-preset/(?P<id>[\d]+)/$', 'incus.api_views.ab_preset'),
+	(r'^api/audio/restore/$', 'incus.api_views.ab_restore'),
 	(r'^audio/', include('incus.urls')),
 
 	(r'^status/', include('flock.urls')),
 	(r'^epoxy/', include('epoxy.urls')),
+	(r'^api/iboot/$', 'iboot.api_views.iboots'),
 	(r'^iboot/', include('iboot.urls')),
 	(r'^artcam/', include('artcam.urls')),
 	(r'^lighting/', include('lighting.urls')),